@@ -1,8 +1,12 @@
 from types import NoneType
 import base64
+import httplib
 import locale
 import logging
 import os
+import socket
+import threading
+import time
 import urllib
 try:
     import oauth2 as oauth
@@ -11,6 +15,7 @@ except ImportError:
     oauth = None
 
 from M2Crypto import httpslib, m2, SSL
+from M2Crypto import threading as m2_threading
 
 from pulp.bindings import exceptions
 from pulp.bindings.responses import Response, Task
@@ -19,6 +24,32 @@ from pulp.common.constants import DEFAULT_CA_PATH
 from pulp.common.util import ensure_utf_8, encode_unicode
 
 
+# The maximum number of idle connections a PooledHTTPSServerWrapper keeps open.
+DEFAULT_POOL_SIZE = 10
+# The number of seconds an idle connection is kept open. It is kept below the default
+# keep-alive timeout of Apache so that connections are rarely closed by the server
+# while idle.
+MAX_IDLE_TIME = 4
+# The HTTP methods that can safely be sent again when a reused connection fails
+# after the request has been sent.
+IDEMPOTENT_METHODS = frozenset(['DELETE', 'GET', 'HEAD', 'OPTIONS', 'PUT'])
+
+_m2_threading_lock = threading.Lock()
+_m2_threading_initialized = False
+
+
+def _init_m2_threading():
+    """
+    Set up the OpenSSL locking callbacks, which OpenSSL needs to be used by
+    several threads at once. This is done once per process.
+    """
+    global _m2_threading_initialized
+    with _m2_threading_lock:
+        if not _m2_threading_initialized:
+            m2_threading.init()
+            _m2_threading_initialized = True
+
+
 class PulpConnection(object):
     """
     Stub for invoking methods against the Pulp server. By default, the
@@ -27,6 +58,10 @@ class PulpConnection(object):
     parameter can be used to pass in another mechanism to make the actual
     call to the server. The likely use of this is a duck-typed mock object
     for unit testing purposes.
+
+    By default, a new connection is made for each request. When pool_connections
+    is True, requests are made using a pool of persistent connections that is safe
+    to share across threads.
     """
 
     def __init__(self,
@@ -46,7 +81,8 @@ class PulpConnection(object):
                  verify_ssl=True,
                  ca_path=DEFAULT_CA_PATH,
                  proxy_host=None,
-                 proxy_port=3128):
+                 proxy_port=3128,
+                 pool_connections=False):
 
         self.host = host
         self.port = port
@@ -83,6 +119,8 @@ class PulpConnection(object):
         # Server Wrapper
         if server_wrapper:
             self.server_wrapper = server_wrapper
+        elif pool_connections:
+            self.server_wrapper = PooledHTTPSServerWrapper(self)
         else:
             self.server_wrapper = HTTPSServerWrapper(self)
 
@@ -287,8 +325,29 @@ class HTTPSServerWrapper(object):
                        returned as a string.
         :rtype:        tuple
         """
-        headers = dict(self.pulp_connection.headers)  # copy so we don't affect the calling method
+        ssl_context = self._ssl_context()
+        headers = self._headers(method, url)
+        connection = self._connection(ssl_context)
+
+        try:
+            response = self._send(connection, method, url, body, headers)
+        except SSL.SSLError, err:
+            self._raise_ssl_error(err)
+
+        # Attempt to deserialize the body (should pass unless the server is busted)
+        response_body = response.read()
+        return response.status, self._deserialize(response_body)
 
+    # protected request utilities ---------------------------------------------
+
+    def _ssl_context(self):
+        """
+        Create the SSL context used for connections to the server.
+
+        :return: A configured SSL context.
+        :rtype:  M2Crypto.SSL.Context
+        :raises MissingCAPathException: if the ca_path is neither a file nor a directory
+        """
         # Despite the confusing name, 'sslv23' configures m2crypto to use any available protocol in
         # the underlying openssl implementation.
         ssl_context = SSL.Context('sslv23')
@@ -311,12 +370,29 @@ class HTTPSServerWrapper(object):
                 raise exceptions.MissingCAPathException(self.pulp_connection.ca_path)
         ssl_context.set_session_timeout(self.pulp_connection.timeout)
 
+        if not (self.pulp_connection.username and self.pulp_connection.password) and \
+                self.pulp_connection.cert_filename:
+            ssl_context.load_cert(self.pulp_connection.cert_filename)
+
+        return ssl_context
+
+    def _headers(self, method, url):
+        """
+        Build the headers for a request, including the credentials.
+
+        :param method: The HTTP method to be used for the request (GET, POST, etc.)
+        :type  method: str
+        :param url:    The Pulp URL to make the request against
+        :type  url:    str
+        :return:       The request headers.
+        :rtype:        dict
+        """
+        headers = dict(self.pulp_connection.headers)  # copy so we don't affect the calling method
+
         if self.pulp_connection.username and self.pulp_connection.password:
             raw = ':'.join((self.pulp_connection.username, self.pulp_connection.password))
             encoded = base64.b64encode(raw)
             headers['Authorization'] = 'Basic ' + encoded
-        elif self.pulp_connection.cert_filename:
-            ssl_context.load_cert(self.pulp_connection.cert_filename)
 
         # oauth configuration. This block is only True if oauth is not None, so it won't run on RHEL
         # 5.
@@ -337,41 +413,282 @@ class HTTPSServerWrapper(object):
             headers.update(oauth_header)
             headers['pulp-user'] = self.pulp_connection.oauth_user
 
-        proxy_requested = self.pulp_connection.proxy_host and self.pulp_connection.proxy_port
+        return headers
+
+    def _proxy_requested(self):
+        """
+        :return: True if requests are made through a proxy.
+        :rtype:  bool
+        """
+        return bool(self.pulp_connection.proxy_host and self.pulp_connection.proxy_port)
+
+    def _connection(self, ssl_context):
+        """
+        Create a (not yet connected) connection to the server, or to the proxy.
+
+        :param ssl_context: The SSL context used by the connection.
+        :type  ssl_context: M2Crypto.SSL.Context
+        :return: A new connection.
+        :rtype:  M2Crypto.httpslib.HTTPSConnection
+        """
+        if self._proxy_requested():
+            return httpslib.ProxyHTTPSConnection(self.pulp_connection.proxy_host,
+                                                 self.pulp_connection.proxy_port,
+                                                 ssl_context=ssl_context)
+        else:
+            return httpslib.HTTPSConnection(self.pulp_connection.host,
+                                            self.pulp_connection.port,
+                                            ssl_context=ssl_context)
+
+    def _send(self, connection, method, url, body, headers):
+        """
+        Send a request using the connection.
+
+        :param connection: The connection to use.
+        :type  connection: M2Crypto.httpslib.HTTPSConnection
+        :param method: The HTTP method to be used for the request (GET, POST, etc.)
+        :type  method: str
+        :param url:    The Pulp URL to make the request against
+        :type  url:    str
+        :param body:   The body to pass with the request
+        :type  body:   str
+        :param headers: The request headers.
+        :type  headers: dict
+        :return: The response, which has not been read.
+        :rtype:  httplib.HTTPResponse
+        """
+        self._write(connection, method, url, body, headers)
+        return connection.getresponse()
+
+    def _write(self, connection, method, url, body, headers):
+        """
+        Send a request using the connection, without reading the response.
+
+        :param connection: The connection to use.
+        :type  connection: M2Crypto.httpslib.HTTPSConnection
+        :param method: The HTTP method to be used for the request (GET, POST, etc.)
+        :type  method: str
+        :param url:    The Pulp URL to make the request against
+        :type  url:    str
+        :param body:   The body to pass with the request
+        :type  body:   str
+        :param headers: The request headers.
+        :type  headers: dict
+        """
+        # Request against the server
+        if self._proxy_requested():
+            request_url = 'https://%s:%d%s' % (self.pulp_connection.host,
+                                               self.pulp_connection.port, url)
+        else:
+            request_url = url
+        connection.request(method, request_url, body=body, headers=headers)
+
+    def _raise_ssl_error(self, err):
+        """
+        Translate an SSL error into a bindings exception and raise it.
 
-        if proxy_requested:
-            connection = httpslib.ProxyHTTPSConnection(self.pulp_connection.proxy_host,
-                                                       self.pulp_connection.proxy_port,
-                                                       ssl_context=ssl_context)
+        :param err: An SSL error raised while making a request.
+        :type  err: M2Crypto.SSL.SSLError
+        """
+        # Translate stale login certificate to an auth exception
+        if 'sslv3 alert certificate expired' == str(err):
+            raise exceptions.ClientCertificateExpiredException(
+                self.pulp_connection.cert_filename)
+        elif 'certificate verify failed' in str(err):
+            raise exceptions.CertificateVerificationException()
         else:
-            connection = httpslib.HTTPSConnection(self.pulp_connection.host,
-                                                  self.pulp_connection.port,
-                                                  ssl_context=ssl_context)
+            raise exceptions.ConnectionException(None, str(err), None)
 
+    @staticmethod
+    def _deserialize(response_body):
+        """
+        :param response_body: The body of a response.
+        :type  response_body: str
+        :return: The json decoded body, or the body itself if it is not valid json.
+        """
         try:
-            # Request against the server
-            if proxy_requested:
-                request_url = 'https://%s:%d%s' % (self.pulp_connection.host,
-                                                   self.pulp_connection.port, url)
-            else:
-                request_url = url
-            connection.request(method, request_url, body=body, headers=headers)
-            response = connection.getresponse()
+            return json.loads(response_body)
+        except Exception:
+            return response_body
+
+
+class PooledHTTPSServerWrapper(HTTPSServerWrapper):
+    """
+    Makes requests against the server using a pool of persistent (keep-alive) connections.
+
+    The SSL context is created once, and again when the client certificate changes, and
+    new connections resume the TLS session of earlier connections. An instance is safe
+    to share across threads; each request uses a connection no other thread is using,
+    and OpenSSL is set up for use by several threads. Requests made through a proxy use
+    a new connection for each request, as the HTTPSServerWrapper does.
+
+    :ivar pool_size: The maximum number of idle connections kept open.
+    :type pool_size: int
+    """
+
+    def __init__(self, pulp_connection, pool_size=DEFAULT_POOL_SIZE):
+        """
+        :param pulp_connection: A pulp connection object.
+        :type pulp_connection: PulpConnection
+        :param pool_size: The maximum number of idle connections kept open.
+        :type pool_size: int
+        """
+        super(PooledHTTPSServerWrapper, self).__init__(pulp_connection)
+        _init_m2_threading()
+        self.pool_size = pool_size
+        self._lock = threading.RLock()
+        self._context = None
+        self._context_key = None
+        self._session = None
+        # (connection, when it was released)
+        self._idle = []
+
+    def request(self, method, url, body):
+        """
+        Make the request against the Pulp server, returning a tuple of (status_code, respose_body).
+        An idle connection is used when there is one. When the server has closed an idle
+        connection, the request is made again using a new connection, but only if the
+        request was not sent or the method is idempotent.
+
+        :param method: The HTTP method to be used for the request (GET, POST, etc.)
+        :type  method: str
+        :param url:    The Pulp URL to make the request against
+        :type  url:    str
+        :param body:   The body to pass with the request
+        :type  body:   str
+        :return:       A 2-tuple of the status_code and response_body.
+        :rtype:        tuple
+        """
+        if self._proxy_requested():
+            return super(PooledHTTPSServerWrapper, self).request(method, url, body)
+
+        headers = self._headers(method, url)
+        connection, reused = self._acquire()
+        try:
+            sent = False
+            try:
+                self._write(connection, method, url, body, headers)
+                sent = True
+                response = connection.getresponse()
+            except (SSL.SSLError, httplib.HTTPException, socket.error):
+                if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                    raise
+                # The server closed the idle connection.
+                connection.close()
+                connection = self._connection(self._ssl_context())
+                response = self._send(connection, method, url, body, headers)
+            response_body = response.read()
         except SSL.SSLError, err:
-            # Translate stale login certificate to an auth exception
-            if 'sslv3 alert certificate expired' == str(err):
-                raise exceptions.ClientCertificateExpiredException(
-                    self.pulp_connection.cert_filename)
-            elif 'certificate verify failed' in str(err):
-                raise exceptions.CertificateVerificationException()
-            else:
-                raise exceptions.ConnectionException(None, str(err), None)
+            connection.close()
+            self._raise_ssl_error(err)
+        except Exception:
+            connection.close()
+            raise
 
-        # Attempt to deserialize the body (should pass unless the server is busted)
-        response_body = response.read()
+        self._release(connection, response)
+        return response.status, self._deserialize(response_body)
+
+    def close(self):
+        """
+        Close the idle connections.
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for connection, released in idle:
+            connection.close()
 
+    # protected request utilities ---------------------------------------------
+
+    def _ssl_context(self):
+        """
+        Get the SSL context, which is created on first use and created again when
+        the client certificate file changes. The idle connections and the saved TLS
+        session of the previous context are dropped.
+
+        :return: A configured SSL context.
+        :rtype:  M2Crypto.SSL.Context
+        """
+        cert_filename = self.pulp_connection.cert_filename
+        try:
+            mtime = os.stat(cert_filename).st_mtime if cert_filename else None
+        except OSError:
+            mtime = None
+        key = (cert_filename, mtime)
+        idle = []
+        with self._lock:
+            if self._context is not None and self._context_key != key:
+                # The TLS session and connections belong to the previous certificate.
+                self._context = None
+                self._session = None
+                idle = self._idle
+                self._idle = []
+            if self._context is None:
+                self._context = super(PooledHTTPSServerWrapper, self)._ssl_context()
+                self._context_key = key
+            context = self._context
+        for connection, released in idle:
+            connection.close()
+        return context
+
+    def _connection(self, ssl_context):
+        """
+        Create a connection that resumes the last TLS session.
+        """
+        connection = super(PooledHTTPSServerWrapper, self)._connection(ssl_context)
+        with self._lock:
+            session = self._session
+        if session is not None:
+            connection.set_session(session)
+        return connection
+
+    def _acquire(self):
+        """
+        Get a connection for a request. Idle connections that have been idle for
+        more than MAX_IDLE_TIME seconds are closed rather than used.
+
+        :return: A tuple of: (connection, reused), where reused is True if the
+            connection is an idle connection that has been used before.
+        :rtype:  tuple
+        """
+        ssl_context = self._ssl_context()
+        expired = []
+        connection = None
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                idle, released = self._idle.pop()
+                if now - released < MAX_IDLE_TIME:
+                    connection = idle
+                    break
+                expired.append(idle)
+        for idle in expired:
+            idle.close()
+        if connection is not None:
+            return connection, True
+        return self._connection(ssl_context), False
+
+    def _release(self, connection, response):
+        """
+        Return a connection to the pool after its response has been read.
+        The connection is closed when the server will close it or the pool is full.
+
+        :param connection: A connection.
+        :type  connection: M2Crypto.httpslib.HTTPSConnection
+        :param response: The response that has been read.
+        :type  response: httplib.HTTPResponse
+        """
+        if response.will_close:
+            connection.close()
+            return
         try:
-            response_body = json.loads(response_body)
+            session = connection.get_session()
         except Exception:
-            pass
-        return response.status, response_body
+            session = None
+        with self._lock:
+            if session is not None:
+                self._session = session
+            if len(self._idle) < self.pool_size:
+                self._idle.append((connection, time.time()))
+                return
+        connection.close()
@@ -27,7 +27,7 @@ class UploadAPI(PulpAPI):
         return self.server.DELETE(url)
 
     def import_upload(self, upload_id, repo_id, unit_type_id, unit_key, unit_metadata,
-                      override_config=None):
+                      override_config=None, checksum_type=None, checksum=None):
         url = '/v2/repositories/%s/actions/import_upload/' % repo_id
         body = {
             'upload_id': upload_id,
@@ -36,4 +36,8 @@ class UploadAPI(PulpAPI):
             'unit_metadata': unit_metadata,
             'override_config': override_config,
         }
+        if checksum is not None:
+            # the server verifies the uploaded file against it before importing it
+            body['checksum_type'] = checksum_type
+            body['checksum'] = checksum
         return self.server.POST(url, body)
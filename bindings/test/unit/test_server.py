@@ -1,8 +1,10 @@
 """
 This module contains tests for the pulp.bindings.server module.
 """
+import httplib
 import locale
 import logging
+import socket
 import unittest
 
 from M2Crypto import m2, SSL
@@ -173,6 +175,237 @@ class TestHTTPSServerWrapper(unittest.TestCase):
         load_verify_locations.assert_called_once_with(cafile=ca_path)
 
 
+class FakeResponse(object):
+    """
+    This class is used to fake the response from httpslib.
+    """
+    def __init__(self, will_close=False):
+        self.will_close = will_close
+
+    def read(self):
+        return '{}'
+
+    status = 200
+
+
+@mock.patch('pulp.bindings.server.httpslib.HTTPSConnection.get_session')
+@mock.patch('pulp.bindings.server.httpslib.HTTPSConnection.set_session')
+@mock.patch('pulp.bindings.server.httpslib.HTTPSConnection.close')
+@mock.patch('pulp.bindings.server.httpslib.HTTPSConnection.getresponse')
+@mock.patch('pulp.bindings.server.httpslib.HTTPSConnection.request')
+class TestPooledHTTPSServerWrapper(unittest.TestCase):
+    """
+    This class contains tests for the PooledHTTPSServerWrapper class.
+    """
+    def setUp(self):
+        self.conn = server.PulpConnection('host', verify_ssl=False)
+        self.wrapper = server.PooledHTTPSServerWrapper(self.conn, pool_size=1)
+
+    def test_request_reuses_connection(self, request, getresponse, close, set_session,
+                                       get_session):
+        """
+        Assert that the connection and SSL context are reused and the TLS session is saved.
+        """
+        getresponse.return_value = FakeResponse()
+
+        with mock.patch('pulp.bindings.server.SSL.Context.__init__',
+                        side_effect=server.SSL.Context.__init__, autospec=True) as Context:
+            self.assertEqual(self.wrapper.request('GET', '/awesome/api/', ''), (200, {}))
+            connection = self.wrapper._idle[0][0]
+            self.assertEqual(self.wrapper.request('GET', '/awesome/api/', ''), (200, {}))
+
+        self.assertEqual([c for c, released in self.wrapper._idle], [connection])
+        self.assertEqual(Context.call_count, 1)
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(close.call_count, 0)
+        self.assertEqual(self.wrapper._session, get_session.return_value)
+        # the first connection has no session to resume
+        self.assertEqual(set_session.call_count, 0)
+
+    def test_request_resumes_session(self, request, getresponse, close, set_session,
+                                     get_session):
+        """
+        Assert that new connections resume the saved TLS session.
+        """
+        getresponse.return_value = FakeResponse()
+        self.wrapper._session = 'session'
+
+        self.wrapper.request('GET', '/awesome/api/', '')
+
+        set_session.assert_called_once_with('session')
+
+    def test_request_retries_stale_connection(self, request, getresponse, close, set_session,
+                                              get_session):
+        """
+        Assert that the request is made again with a new connection when an idle
+        connection has been closed by the server.
+        """
+        getresponse.side_effect = [FakeResponse(), httplib.BadStatusLine(''), FakeResponse()]
+        self.wrapper.request('GET', '/awesome/api/', '')
+        stale = self.wrapper._idle[0][0]
+
+        self.assertEqual(self.wrapper.request('GET', '/awesome/api/', ''), (200, {}))
+
+        self.assertEqual(request.call_count, 3)
+        self.assertEqual(close.call_count, 1)
+        self.assertEqual(len(self.wrapper._idle), 1)
+        self.assertFalse(self.wrapper._idle[0][0] is stale)
+
+    def test_request_retries_unsent_post(self, request, getresponse, close, set_session,
+                                         get_session):
+        """
+        Assert that a POST is made again with a new connection when sending it on an
+        idle connection fails.
+        """
+        getresponse.return_value = FakeResponse()
+        request.side_effect = [None, socket.error(32, 'Broken pipe'), None]
+        self.wrapper.request('GET', '/awesome/api/', '')
+
+        self.assertEqual(self.wrapper.request('POST', '/awesome/api/', '{}'), (200, {}))
+
+        self.assertEqual(request.call_count, 3)
+        self.assertEqual(close.call_count, 1)
+
+    def test_request_sent_post_not_retried(self, request, getresponse, close, set_session,
+                                           get_session):
+        """
+        Assert that a POST is not made again once it has been sent, as the server
+        may have acted on it.
+        """
+        getresponse.side_effect = [FakeResponse(), httplib.BadStatusLine('')]
+        self.wrapper.request('GET', '/awesome/api/', '')
+
+        self.assertRaises(httplib.BadStatusLine, self.wrapper.request,
+                          'POST', '/awesome/api/', '{}')
+
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(close.call_count, 1)
+        self.assertEqual(self.wrapper._idle, [])
+
+    @mock.patch('pulp.bindings.server.time.time')
+    def test_request_expired_connection(self, mock_time, request, getresponse, close,
+                                        set_session, get_session):
+        """
+        Assert that connections idle for longer than MAX_IDLE_TIME are closed, not used.
+        """
+        getresponse.return_value = FakeResponse()
+        mock_time.return_value = 100
+        self.wrapper.request('GET', '/awesome/api/', '')
+        stale = self.wrapper._idle[0][0]
+        mock_time.return_value = 100 + server.MAX_IDLE_TIME
+
+        self.wrapper.request('GET', '/awesome/api/', '')
+
+        self.assertEqual(close.call_count, 1)
+        self.assertFalse(self.wrapper._idle[0][0] is stale)
+
+    @mock.patch('pulp.bindings.server.os.stat')
+    def test_ssl_context_cert_changed(self, stat, request, getresponse, close, set_session,
+                                      get_session):
+        """
+        Assert that the SSL context is created again, and the idle connections and TLS
+        session are dropped, when the client certificate changes.
+        """
+        getresponse.return_value = FakeResponse()
+        self.conn.cert_filename = '/path/to/cert'
+        stat.return_value.st_mtime = 1
+        with mock.patch('pulp.bindings.server.SSL.Context.load_cert'):
+            self.wrapper.request('GET', '/awesome/api/', '')
+            context = self.wrapper._ssl_context()
+            self.assertEqual(self.wrapper._ssl_context(), context)
+            stat.return_value.st_mtime = 2
+
+            self.assertFalse(self.wrapper._ssl_context() is context)
+
+        stat.assert_called_with('/path/to/cert')
+        self.assertEqual(close.call_count, 1)
+        self.assertEqual(self.wrapper._idle, [])
+        self.assertEqual(self.wrapper._session, None)
+
+    def test_request_new_connection_not_retried(self, request, getresponse, close, set_session,
+                                                get_session):
+        """
+        Assert that errors on a new connection are not retried.
+        """
+        request.side_effect = SSL.SSLError('certificate verify failed')
+
+        self.assertRaises(exceptions.CertificateVerificationException, self.wrapper.request,
+                          'GET', '/awesome/api/', '')
+
+        self.assertEqual(request.call_count, 1)
+        self.assertEqual(close.call_count, 1)
+        self.assertEqual(self.wrapper._idle, [])
+
+    def test_request_will_close(self, request, getresponse, close, set_session, get_session):
+        """
+        Assert that connections the server will close are not pooled.
+        """
+        getresponse.return_value = FakeResponse(will_close=True)
+
+        self.wrapper.request('GET', '/awesome/api/', '')
+
+        self.assertEqual(close.call_count, 1)
+        self.assertEqual(self.wrapper._idle, [])
+
+    def test_request_pool_full(self, request, getresponse, close, set_session, get_session):
+        """
+        Assert that connections are closed when the pool is full.
+        """
+        ssl_context = self.wrapper._ssl_context()
+        first = self.wrapper._connection(ssl_context)
+        second = self.wrapper._connection(ssl_context)
+
+        self.wrapper._release(first, FakeResponse())
+        self.wrapper._release(second, FakeResponse())
+
+        self.assertEqual([c for c, released in self.wrapper._idle], [first])
+        self.assertEqual(close.call_count, 1)
+
+    @mock.patch('pulp.bindings.server.httpslib.ProxyHTTPSConnection')
+    def test_request_proxy(self, ProxyHTTPSConnection, request, getresponse, close, set_session,
+                           get_session):
+        """
+        Assert that requests through a proxy use a new connection for each request.
+        """
+        self.conn.proxy_host = 'proxy'
+        proxy_connection = ProxyHTTPSConnection.return_value
+        proxy_connection.getresponse.return_value = FakeResponse()
+
+        self.wrapper.request('GET', '/awesome/api/', '')
+
+        proxy_connection.request.assert_called_once_with(
+            'GET', 'https://host:443/awesome/api/', body='', headers=mock.ANY)
+        self.assertEqual(self.wrapper._idle, [])
+
+    def test_close(self, request, getresponse, close, set_session, get_session):
+        """
+        Assert that close() closes the idle connections.
+        """
+        getresponse.return_value = FakeResponse()
+        self.wrapper.request('GET', '/awesome/api/', '')
+
+        self.wrapper.close()
+
+        self.assertEqual(close.call_count, 1)
+        self.assertEqual(self.wrapper._idle, [])
+
+
+class TestInitM2Threading(unittest.TestCase):
+    """
+    This class contains tests for the _init_m2_threading() function.
+    """
+    @mock.patch('pulp.bindings.server._m2_threading_initialized', False)
+    @mock.patch('pulp.bindings.server.m2_threading.init')
+    def test_init_once(self, init):
+        """
+        Assert that OpenSSL is set up for threads once per process.
+        """
+        server._init_m2_threading()
+        server._init_m2_threading()
+
+        init.assert_called_once_with()
+
+
 class TestPulpConnection(unittest.TestCase):
     """
     This class contains tests for the PulpConnection object.
@@ -210,7 +443,7 @@ class TestPulpConnection(unittest.TestCase):
         expected_headers = {'Accept': 'application/json', 'Accept-Language': expected_locale,
                             'Content-Type': 'application/json'}
         self.assertEqual(connection.headers, expected_headers)
-        self.assertTrue(isinstance(connection.server_wrapper, server.HTTPSServerWrapper))
+        self.assertTrue(type(connection.server_wrapper) is server.HTTPSServerWrapper)
         self.assertEqual(connection.server_wrapper.pulp_connection, connection)
         self.assertEqual(connection.verify_ssl, True)
         self.assertTrue(connection.ca_path in DEFAULT_CA_PATH_LIST)
@@ -243,6 +476,24 @@ class TestPulpConnection(unittest.TestCase):
 
         self.assertEqual(connection.verify_ssl, True)
 
+    def test___init___pool_connections_false(self):
+        """
+        Test __init__() with pool_connections set to False.
+        """
+        connection = server.PulpConnection('host', pool_connections=False)
+
+        self.assertTrue(type(connection.server_wrapper) is server.HTTPSServerWrapper)
+
+    @mock.patch('pulp.bindings.server.m2_threading.init')
+    def test___init___pool_connections_true(self, init):
+        """
+        Test __init__() with pool_connections set to True.
+        """
+        connection = server.PulpConnection('host', pool_connections=True)
+
+        self.assertTrue(isinstance(connection.server_wrapper, server.PooledHTTPSServerWrapper))
+        self.assertEqual(connection.server_wrapper.pulp_connection, connection)
+
     def test___init___proxy_set(self):
         """
         Test __init__() with the proxy_host & proxy_port arguments explicitly set.
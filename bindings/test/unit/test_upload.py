@@ -38,3 +38,11 @@ class TestUploadAPI(unittest.TestCase):
         self.api.server.POST.assert_called_once_with('/v2/repositories/%s/actions/import_upload/'
                                                      % 'repo_id', expected_body)
         self.assertEqual(ret, self.api.server.POST.return_value)
+
+    def test_import_upload_with_checksum(self):
+        self.api.import_upload('upload_id', 'repo_id', 'unit_type_id', unit_key={},
+                               unit_metadata={}, checksum_type='sha256', checksum='abc')
+        body = self.api.server.POST.call_args[0][1]
+
+        self.assertEqual(body['checksum_type'], 'sha256')
+        self.assertEqual(body['checksum'], 'abc')
@@ -13,6 +13,7 @@ DEFAULT = {
         'verify_ssl': 'true',
         'ca_path': DEFAULT_CA_PATH,
         'upload_chunk_size': '1048576',
+        'upload_concurrency': '1',
         'proxy_host': None,
         'proxy_port': '3128',
     },
@@ -43,6 +44,7 @@ SCHEMA = (
             ('verify_ssl', REQUIRED, BOOL),
             ('ca_path', REQUIRED, ANY),
             ('upload_chunk_size', REQUIRED, NUMBER),
+            ('upload_concurrency', OPTIONAL, NUMBER),
             ('proxy_host', OPTIONAL, ANY),
             ('proxy_port', OPTIONAL, NUMBER),
         )
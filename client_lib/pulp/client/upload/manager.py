@@ -7,13 +7,21 @@ client-side tracking of upload requests on the server.
 
 import copy
 import errno
+import hashlib
 import os
 import pickle
+import Queue
+import sys
+import threading
 
 from pulp.common.lock import LockFile
 
 
 DEFAULT_CHUNKSIZE = 1048576  # 1 MB per upload call
+DEFAULT_CONCURRENCY = 1  # number of upload calls in flight at once
+
+# Checksum calculated while uploading, which the server verifies the upload against
+CHECKSUM_TYPE = 'sha256'
 
 
 class ManagerUninitializedException(Exception):
@@ -71,7 +79,8 @@ class UploadManager(object):
     on disk state files.
     """
 
-    def __init__(self, upload_working_dir, bindings, chunk_size=DEFAULT_CHUNKSIZE):
+    def __init__(self, upload_working_dir, bindings, chunk_size=DEFAULT_CHUNKSIZE,
+                 concurrency=DEFAULT_CONCURRENCY):
         """
         @param upload_working_dir: directory in which to store client-side files
                to track upload requests; if it doesn't exist it will be created
@@ -84,10 +93,16 @@ class UploadManager(object):
         @param chunk_size: size in bytes of data to upload on each call to the
                server
         @type  chunk_size: int
+
+        @param concurrency: number of upload calls to the server that may be in
+               progress at once; the bindings must be safe to use from several
+               threads when this is more than 1
+        @type  concurrency: int
         """
         self.upload_working_dir = upload_working_dir
         self.bindings = bindings
         self.chunk_size = chunk_size
+        self.concurrency = concurrency
 
         # Internal state
         self.tracker_files = {}
@@ -111,7 +126,9 @@ class UploadManager(object):
         upload_working_dir = os.path.join(context.config['filesystem']['upload_working_dir'],
                                           'default')
         upload_working_dir = os.path.expanduser(upload_working_dir)
-        return cls(upload_working_dir, context.server)
+        concurrency = context.config.get('server', {}).get('upload_concurrency')
+        concurrency = int(concurrency) if concurrency else DEFAULT_CONCURRENCY
+        return cls(upload_working_dir, context.server, concurrency=concurrency)
 
     def initialize(self):
         """
@@ -196,6 +213,15 @@ class UploadManager(object):
 
         The callback_func should have a signature of (int, int).
 
+        When the concurrency of this instance is more than 1, that many segments
+        are uploaded at once. The offset stored in the tracker file, and passed
+        to the callback_func, is then the end of the segments that have all been
+        uploaded, so a resumed upload starts after it.
+
+        The checksum of the file is calculated as it is read and stored in the
+        tracker file, so that the server can verify the upload when it is
+        imported.
+
         This call will raise an exception if an upload is already in progress
         for the given upload_id. If that isn't the case and the tracker file's
         running flag is stale, the force parameter will bypass this check and
@@ -236,22 +262,41 @@ class UploadManager(object):
             source_file_size = os.path.getsize(tracker_file.source_filename)
 
             f = open(tracker_file.source_filename, 'r')
-            while True:
-                # Load the chunk to upload
-                f.seek(tracker_file.offset)
-                data = f.read(self.chunk_size)
-                if not data:
-                    break
-
-                # Server request
-                self.bindings.uploads.upload_segment(upload_id, tracker_file.offset, data)
-
-                # Status update and callback notification
-                tracker_file.offset = min(tracker_file.offset + self.chunk_size, source_file_size)
-                tracker_file.save()
-
-                callback_func(tracker_file.offset, source_file_size)
-
+            try:
+                # A resumed upload needs the checksum of what was already uploaded
+                checksum = hashlib.new(CHECKSUM_TYPE)
+                while f.tell() < tracker_file.offset:
+                    data = f.read(min(self.chunk_size, tracker_file.offset - f.tell()))
+                    if not data:
+                        break
+                    checksum.update(data)
+
+                if self.concurrency > 1:
+                    self._upload_concurrently(tracker_file, f, source_file_size, checksum,
+                                              callback_func)
+                else:
+                    while True:
+                        # Load the chunk to upload
+                        data = f.read(self.chunk_size)
+                        if not data:
+                            break
+                        checksum.update(data)
+
+                        # Server request
+                        self.bindings.uploads.upload_segment(upload_id, tracker_file.offset,
+                                                             data)
+
+                        # Status update and callback notification
+                        tracker_file.offset = min(tracker_file.offset + self.chunk_size,
+                                                  source_file_size)
+                        tracker_file.save()
+
+                        callback_func(tracker_file.offset, source_file_size)
+            finally:
+                f.close()
+
+            tracker_file.checksum_type = CHECKSUM_TYPE
+            tracker_file.checksum = checksum.hexdigest()
             tracker_file.is_finished_uploading = True
         finally:
             # Regardless of how this ends, it's no longer running, so make sure
@@ -259,6 +304,97 @@ class UploadManager(object):
             tracker_file.is_running = False
             tracker_file.save()
 
+    def _upload_concurrently(self, tracker_file, source_file, source_file_size, checksum,
+                             callback_func):
+        """
+        Uploads the rest of the source file with a pool of threads, each
+        uploading one segment at a time. The file is read, and its checksum
+        updated, in order by the calling thread, which keeps no more than twice
+        as many segments in memory as there are threads.
+
+        The tracker file is saved, and the callback_func called, whenever the
+        segments up to a new offset have all been uploaded. If uploading a
+        segment fails, no more segments are started and the error is raised
+        once the segments already started have finished.
+
+        @param tracker_file: tracker of the upload, positioned at the offset to
+               resume from
+        @type  tracker_file: UploadTracker
+
+        @param source_file: the file being uploaded, positioned at the offset
+               of the tracker file
+        @type  source_file: file
+
+        @param source_file_size: size of the file being uploaded
+        @type  source_file_size: int
+
+        @param checksum: checksum of the file up to the offset of the tracker file
+        @type  checksum: hashlib.HASH
+
+        @param callback_func: method called with the new offset and the file size
+        @type  callback_func: func
+        """
+        segments = Queue.Queue()
+        results = Queue.Queue()
+        # offset -> size of the segments that finished past the tracker offset
+        uploaded = {}
+        state = {'in_flight': 0, 'error': None}
+
+        def worker():
+            while True:
+                segment = segments.get()
+                if segment is None:
+                    return
+                offset, data = segment
+                try:
+                    self.bindings.uploads.upload_segment(tracker_file.upload_id, offset, data)
+                    results.put((offset, len(data), None))
+                except Exception:
+                    results.put((offset, len(data), sys.exc_info()))
+
+        def collect():
+            offset, size, exc_info = results.get()
+            state['in_flight'] -= 1
+            if exc_info is not None:
+                if state['error'] is None:
+                    state['error'] = exc_info
+                return
+            uploaded[offset] = size
+            if tracker_file.offset not in uploaded:
+                return
+            while tracker_file.offset in uploaded:
+                tracker_file.offset += uploaded.pop(tracker_file.offset)
+            tracker_file.save()
+            callback_func(tracker_file.offset, source_file_size)
+
+        threads = [threading.Thread(target=worker) for i in range(self.concurrency)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            offset = tracker_file.offset
+            while state['error'] is None:
+                while state['in_flight'] >= self.concurrency * 2:
+                    collect()
+                data = source_file.read(self.chunk_size)
+                if not data:
+                    break
+                checksum.update(data)
+                segments.put((offset, data))
+                state['in_flight'] += 1
+                offset += len(data)
+            while state['in_flight']:
+                collect()
+        finally:
+            for thread in threads:
+                segments.put(None)
+            for thread in threads:
+                thread.join()
+
+        if state['error'] is not None:
+            exc_type, exc_value, tb = state['error']
+            raise exc_type, exc_value, tb
+
     def import_upload(self, upload_id):
         """
         Once the file is finished uploading, this call will request the server
@@ -281,9 +417,12 @@ class UploadManager(object):
         if tracker.source_filename and not tracker.is_finished_uploading:
             raise IncompleteUploadException()
 
+        # Trackers saved by older versions have no checksum
         response = self.bindings.uploads.import_upload(
             upload_id, tracker.repo_id, tracker.unit_type_id, tracker.unit_key,
-            tracker.unit_metadata, tracker.override_config)
+            tracker.unit_metadata, tracker.override_config,
+            checksum_type=getattr(tracker, 'checksum_type', None),
+            checksum=getattr(tracker, 'checksum', None))
 
         return response
 
@@ -399,6 +538,8 @@ class UploadTracker(object):
         self.location = None  # URL to the upload request on the server
         self.offset = None  # start of next chunk to upload
         self.source_filename = None  # path on disk to the file to upload
+        self.checksum_type = None
+        self.checksum = None  # checksum of the uploaded file, once it is uploaded
 
         # Import call information
         self.repo_id = None
@@ -1,4 +1,5 @@
 import errno
+import hashlib
 import math
 import os
 import shutil
@@ -289,6 +290,86 @@ class UploadManagerTests(unittest.TestCase):
         tracker = self.upload_manager._get_tracker_file_by_id(upload_id)
         self.assertEqual(rpm_size, tracker.offset)
 
+    def test_upload_checksum(self):
+        self.upload_manager.chunk_size = 100
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1',
+                                                          {'k': 'v'}, 'm-1')
+
+        self.upload_manager.upload(upload_id, mock.Mock())
+
+        with open(TEST_RPM_FILENAME) as rpm_file:
+            expected = hashlib.sha256(rpm_file.read()).hexdigest()
+        tf_filename = self.upload_manager._tracker_filename(upload_id)
+        tracker = upload_util.UploadTracker.load(tf_filename)
+        self.assertEqual(tracker.checksum_type, 'sha256')
+        self.assertEqual(tracker.checksum, expected)
+
+    def test_upload_resumed_checksum(self):
+        self.upload_manager.chunk_size = 100
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1',
+                                                          {'k': 'v'}, 'm-1')
+        tracker = self.upload_manager._get_tracker_file_by_id(upload_id)
+        tracker.offset = 250
+
+        self.upload_manager.upload(upload_id, mock.Mock())
+
+        with open(TEST_RPM_FILENAME) as rpm_file:
+            expected = hashlib.sha256(rpm_file.read()).hexdigest()
+        self.assertEqual(tracker.checksum, expected)
+        first_call = self.mock_upload_bindings.upload_segment.call_args_list[0]
+        self.assertEqual(first_call[0][1], 250)
+
+    def test_upload_concurrently(self):
+        self.upload_manager.chunk_size = 100
+        self.upload_manager.concurrency = 4
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1',
+                                                          {'k': 'v'}, 'm-1')
+        mock_callback = mock.Mock()
+
+        self.upload_manager.upload(upload_id, mock_callback)
+
+        with open(TEST_RPM_FILENAME) as rpm_file:
+            content = rpm_file.read()
+        rpm_size = len(content)
+        segments = {}
+        for single_call_args in self.mock_upload_bindings.upload_segment.call_args_list:
+            self.assertEqual(single_call_args[0][0], upload_id)
+            segments[single_call_args[0][1]] = single_call_args[0][2]
+        self.assertEqual(''.join(segments[offset] for offset in sorted(segments)), content)
+        self.assertEqual(len(segments), int(math.ceil(float(rpm_size) / 100)))
+
+        # The callback is only called with offsets up to which everything was uploaded
+        offsets = [c[0][0] for c in mock_callback.call_args_list]
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertEqual(offsets[-1], rpm_size)
+
+        tracker = self.upload_manager._get_tracker_file_by_id(upload_id)
+        self.assertEqual(tracker.offset, rpm_size)
+        self.assertEqual(tracker.checksum, hashlib.sha256(content).hexdigest())
+        self.assertTrue(tracker.is_finished_uploading)
+        self.assertFalse(tracker.is_running)
+
+    def test_upload_concurrently_error(self):
+        self.upload_manager.chunk_size = 100
+        self.upload_manager.concurrency = 2
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1',
+                                                          {'k': 'v'}, 'm-1')
+
+        def upload_segment(upload_id, offset, data):
+            if offset == 200:
+                raise NotFoundException({})
+            return Response(200, {})
+
+        self.mock_upload_bindings.upload_segment.side_effect = upload_segment
+
+        self.assertRaises(NotFoundException, self.upload_manager.upload, upload_id, mock.Mock())
+
+        tracker = self.upload_manager._get_tracker_file_by_id(upload_id)
+        self.assertEqual(tracker.offset, 200)
+        self.assertFalse(tracker.is_finished_uploading)
+        self.assertFalse(tracker.is_running)
+        self.assertTrue(self.mock_upload_bindings.upload_segment.call_count < 10)
+
     def test_upload_concurrent_upload(self):
         # Setup
         self.upload_manager.initialize()
@@ -393,6 +474,18 @@ class UploadManagerTests(unittest.TestCase):
         self.assertEqual(args[3], {'k': 'v'})
         self.assertEqual(args[4], 'm')
 
+    def test_import_upload_checksum(self):
+        upload_id = self.upload_manager.initialize_upload('f', 'r', 't', {'k': 'v'}, 'm')
+        tracker = self.upload_manager._get_tracker_file_by_id(upload_id)
+        tracker.is_finished_uploading = True
+        tracker.checksum_type = 'sha256'
+        tracker.checksum = 'abc'
+
+        self.upload_manager.import_upload(upload_id)
+
+        kwargs = self.mock_upload_bindings.import_upload.call_args[1]
+        self.assertEqual(kwargs, {'checksum_type': 'sha256', 'checksum': 'abc'})
+
     def test_import_upload_incomplete_upload(self):
         # Setup
         self.upload_manager.initialize()
@@ -0,0 +1,86 @@
+"""
+Process level caches.
+"""
+
+from collections import OrderedDict
+from threading import RLock
+from time import time
+
+
+class ExpiringCache(object):
+    """
+    A thread-safe, size limited cache of values that expire.
+
+    When the cache is full, expired entries are dropped first and then the
+    entries that were added the earliest.
+
+    :ivar size: The maximum number of entries.
+    :type size: int
+    """
+
+    def __init__(self, size):
+        """
+        :param size: The maximum number of entries.
+        :type size: int
+        """
+        self.size = size
+        self._lock = RLock()
+        # key: (value, expiration)
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """
+        Get a cached value.
+
+        :param key: The key of the value.
+        :type key: hashable
+        :return: The value, or None when it is not cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expiration = entry
+            if expiration <= time():
+                del self._entries[key]
+                return None
+            return value
+
+    def put(self, key, value, expiration):
+        """
+        Cache a value.
+
+        :param key: The key of the value.
+        :type key: hashable
+        :param value: The value to cache.
+        :param expiration: When the value expires (seconds since epoch).
+        :type expiration: float
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.size:
+                self._prune()
+            self._entries[key] = (value, expiration)
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _prune(self):
+        """
+        Drop the expired entries, then the earliest added entries until there
+        is room for a new entry.
+        """
+        now = time()
+        for key, (value, expiration) in self._entries.items():
+            if expiration <= now:
+                del self._entries[key]
+        while len(self._entries) >= self.size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,84 @@
+from unittest import TestCase
+
+from mock import patch
+
+from pulp.common.cache import ExpiringCache
+
+
+MODULE = 'pulp.common.cache'
+
+
+@patch(MODULE + '.time')
+class TestExpiringCache(TestCase):
+
+    def test_get(self, time):
+        time.return_value = 1000
+        cache = ExpiringCache(10)
+        cache.put('a', 1, 1010)
+
+        # test and validation
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+
+    def test_get_expired(self, time):
+        time.return_value = 1000
+        cache = ExpiringCache(10)
+        cache.put('a', 1, 1010)
+        time.return_value = 1010
+
+        # test and validation
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(len(cache), 0)
+
+    def test_put_replaces(self, time):
+        time.return_value = 1000
+        cache = ExpiringCache(10)
+        cache.put('a', 1, 1010)
+        cache.put('a', 2, 1010)
+
+        # test and validation
+        self.assertEqual(cache.get('a'), 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_put_full_drops_expired(self, time):
+        time.return_value = 1000
+        cache = ExpiringCache(3)
+        cache.put('a', 1, 1010)
+        cache.put('b', 2, 1005)
+        cache.put('c', 3, 1010)
+        time.return_value = 1005
+
+        # test
+        cache.put('d', 4, 1020)
+
+        # validation
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('d'), 4)
+
+    def test_put_full_drops_earliest(self, time):
+        time.return_value = 1000
+        cache = ExpiringCache(2)
+        cache.put('a', 1, 1010)
+        cache.put('b', 2, 1010)
+
+        # test
+        cache.put('c', 3, 1010)
+
+        # validation
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_clear(self, time):
+        time.return_value = 1000
+        cache = ExpiringCache(10)
+        cache.put('a', 1, 1010)
+
+        # test
+        cache.clear()
+
+        # validation
+        self.assertEqual(len(cache), 0)
@@ -1,10 +1,35 @@
+from gettext import gettext as _
+
+from pulp.server.controllers.units import get_unit_key_fields_for_type
+
 from pulp_node import constants
+from pulp_node.conduit import sort_value
+
+
+UNITS_NOT_SORTED = _('Units not sorted by unit key: %(k)s follows %(p)s')
+
+
+class UnitsNotSorted(ValueError):
+    """
+    The units being compared are not sorted by unit key.
+    """
+
+    def __init__(self, key, previous):
+        """
+        :param key: The out of order key.
+        :type key: UniqueKey
+        :param previous: The key that precedes it.
+        :type previous: UniqueKey
+        """
+        ValueError.__init__(self, UNITS_NOT_SORTED % {'k': key.uid, 'p': previous.uid})
 
 
 class UniqueKey(object):
     """
     A unique unit key consisting of a unit's type_id & unit_key.
-    The unit key is sorted to ensure consistency.
+    The unit key values are ordered by the unit key fields when the unit
+    includes them and by field name otherwise.  Keys are ordered the same
+    way the units are sorted when published and queried.
     :ivar uid: The unique ID.
     :type uid: A tuple of: (type_id, unit_key)
     """
@@ -15,7 +40,9 @@ class UniqueKey(object):
         :type unit: dict
         """
         type_id = unit['type_id']
-        unit_key = tuple(sorted(unit['unit_key'].items()))
+        unit_key = unit['unit_key']
+        fields = unit.get(constants.UNIT_KEY_FIELDS) or sorted(unit_key)
+        unit_key = tuple((f, sort_value(unit_key.get(f))) for f in fields)
         self.uid = (type_id, unit_key)
 
     def __hash__(self):
@@ -27,75 +54,182 @@ class UniqueKey(object):
     def __ne__(self, other):
         return self.uid != other.uid
 
+    def __lt__(self, other):
+        return self.uid < other.uid
+
+
+def sort_units(units):
+    """
+    Sort published units that were not published sorted by unit key.
+    The units are loaded into memory and the unit key fields defined by each
+    type are added to the units so that they are ordered the same way as the
+    units of the child.  The unit metadata is dropped because it is not used
+    when comparing units.
+    :param units: The published units as (unit, ref).
+    :type units: iterable
+    :return: The units as (unit, ref) sorted by {UniqueKey}.
+    :rtype: list
+    """
+    unit_key_fields = {}
+    keyed = []
+    for unit, ref in units:
+        unit.pop('metadata', None)
+        type_id = unit['type_id']
+        if type_id not in unit_key_fields:
+            try:
+                unit_key_fields[type_id] = list(get_unit_key_fields_for_type(type_id))
+            except ValueError:
+                # not a type known to the child
+                unit_key_fields[type_id] = None
+        if unit_key_fields[type_id]:
+            unit[constants.UNIT_KEY_FIELDS] = unit_key_fields[type_id]
+        keyed.append((UniqueKey(unit), unit, ref))
+    keyed.sort(key=lambda item: item[0].uid)
+    return [(unit, ref) for _key, unit, ref in keyed]
+
 
 class UnitInventory(object):
     """
     The unit inventory contains both the parent and child inventory
-    of content units associated with a specific repository.  Each is contained
-    within a dictionary keyed by {UnitKey} to ensure uniqueness.
+    of content units associated with a specific repository.  Both are
+    iterables of units sorted by {UniqueKey} and are compared using a
+    merge join so that neither is loaded into memory.  Each listing
+    iterates both inventories again.
     """
 
     @staticmethod
-    def _import_parent_units(units):
-        _units = {}
-        for unit, ref in units:
-            unit.pop('metadata', None)
-            key = UniqueKey(unit)
-            _units[key] = (unit, ref)
-        return _units
-
-    @staticmethod
-    def _import_child_units(units):
-        _units = {}
-        for unit in units:
+    def _keyed(units, get_unit):
+        """
+        Get the units keyed by {UniqueKey}.
+        Units with the same key as the preceding unit are skipped.
+        :param units: Units sorted by key.
+        :type units: iterable
+        :param get_unit: Gets the content unit from an item in units.
+        :type get_unit: callable
+        :return: A generator of (key, item).
+        :rtype: generator
+        :raise UnitsNotSorted: when the units are not sorted.
+        """
+        previous = None
+        for item in units:
+            unit = get_unit(item)
             unit.pop('metadata', None)
             key = UniqueKey(unit)
-            _units[key] = unit
-        return _units
+            if previous is not None:
+                if key == previous:
+                    continue
+                if key < previous:
+                    raise UnitsNotSorted(key, previous)
+            previous = key
+            yield key, item
 
     def __init__(self, base_URL, parent_units, child_units):
         """
         :param base_URL: The base URL for downloading parent units.
-        :param parent_units: The content units in the parent node.
+        :param parent_units: The content units in the parent node as (unit, ref)
+            sorted by unit key.
         :type parent_units: iterable
-        :param child_units: The content units in the child node.
+        :param child_units: The content units in the child node sorted by unit key.
         :type child_units: iterable
         """
         self.base_URL = base_URL
-        self.parent_units = self._import_parent_units(parent_units)
-        self.child_units = self._import_child_units(child_units)
+        self.parent_units = parent_units
+        self.child_units = child_units
+
+    def join(self):
+        """
+        Merge join the parent and child inventory.
+        :return: A generator of (parent, child) where parent is (unit, ref) and
+            child is a unit.  Either is None when the unit is contained only
+            in the other inventory.
+        :rtype: generator
+        :raise UnitsNotSorted: when either inventory is not sorted.
+        """
+        parent_units = self._keyed(self.parent_units, lambda item: item[0])
+        child_units = self._keyed(self.child_units, lambda item: item)
+        parent = next(parent_units, None)
+        child = next(child_units, None)
+        while parent is not None or child is not None:
+            if child is None or (parent is not None and parent[0] < child[0]):
+                yield parent[1], None
+                parent = next(parent_units, None)
+            elif parent is None or child[0] < parent[0]:
+                yield None, child[1]
+                child = next(child_units, None)
+            else:
+                yield parent[1], child[1]
+                parent = next(parent_units, None)
+                child = next(child_units, None)
 
     def units_on_parent_only(self):
         """
         Listing of units contained in the parent inventory
         but not contained in the child inventory.
-        :return: List of (unit, ref).
-        :rtype: list
+        :return: Iterable of (unit, ref).
+        :rtype: Listing
         """
-        return [r for k, r in self.parent_units.items() if k not in self.child_units]
+        return Listing(self, self._on_parent_only)
 
     def units_on_child_only(self):
         """
         Listing of units contained in the child inventory
         but not contained in the parent inventory.
-        :return: List of units that need to be purged.
-        :rtype: list
+        :return: Iterable of units that need to be purged.
+        :rtype: Listing
         """
-        return [u for k, u in self.child_units.items() if k not in self.parent_units]
+        return Listing(self, self._on_child_only)
 
     def updated_units(self):
         """
         Listing of units updated on the parent.
-        :return: List of (unit, ref).
-        :rtype: list
-        """
-        updated = []
-        for key, (unit, ref) in self.parent_units.items():
-            child_unit = self.child_units.get(key)
-            if child_unit is None:
-                continue
-            parent_last_updated = unit.get(constants.LAST_UPDATED, 0)
-            child_last_updated = child_unit.get(constants.LAST_UPDATED, 0)
-            if parent_last_updated > child_last_updated:
-                updated.append((unit, ref))
-        return updated
+        :return: Iterable of (unit, ref).
+        :rtype: Listing
+        """
+        return Listing(self, self._updated)
+
+    @staticmethod
+    def _on_parent_only(parent, child):
+        if child is None:
+            return parent
+
+    @staticmethod
+    def _on_child_only(parent, child):
+        if parent is None:
+            return child
+
+    @staticmethod
+    def _updated(parent, child):
+        if parent is None or child is None:
+            return
+        unit = parent[0]
+        parent_last_updated = unit.get(constants.LAST_UPDATED, 0)
+        child_last_updated = child.get(constants.LAST_UPDATED, 0)
+        if parent_last_updated > child_last_updated:
+            return parent
+
+
+class Listing(object):
+    """
+    A listing of units selected from the merge join of a unit inventory.
+    Each iteration (and len()) performs the merge join again.
+    """
+
+    def __init__(self, inventory, select):
+        """
+        :param inventory: A unit inventory.
+        :type inventory: UnitInventory
+        :param select: Called with each (parent, child) in the join and returns
+            the item to be listed or None.
+        :type select: callable
+        """
+        self.inventory = inventory
+        self.select = select
+
+    def __iter__(self):
+        for parent, child in self.inventory.join():
+            item = self.select(parent, child)
+            if item is not None:
+                yield item
+
+    def __len__(self):
+        return sum(1 for _item in self)
@@ -19,7 +19,7 @@ from pulp_node import constants
 from pulp_node import pathlib
 from pulp_node.conduit import NodesConduit
 from pulp_node.manifest import Manifest, RemoteManifest
-from pulp_node.importers.inventory import UnitInventory
+from pulp_node.importers.inventory import UnitInventory, sort_units
 from pulp_node.importers.download import ContentDownloadListener
 from pulp_node.error import (NodeError, GetChildUnitsError, GetParentUnitsError, AddUnitError,
                              DeleteUnitError, InvalidManifestError, CaughtException)
@@ -199,6 +199,8 @@ class ImporterStrategy(object):
 
         # build the inventory
         parent_units = manifest.get_units()
+        if not manifest.units_sorted():
+            parent_units = sort_units(parent_units)
         base_URL = manifest.publishing_details[constants.BASE_URL]
         inventory = UnitInventory(base_URL, parent_units, child_units)
         return inventory
@@ -240,6 +242,7 @@ class ImporterStrategy(object):
         """
         download_list = []
         units = unit_inventory.units_on_parent_only()
+        # counting the units is a separate pass over the inventory
         request.progress.begin_adding_units(len(units))
         listener = ContentDownloadListener(self, request)
         for unit, unit_ref in units:
@@ -1,3 +1,9 @@
+import cPickle
+import heapq
+import tempfile
+
+from pymongo import ASCENDING
+
 from pulp.plugins.types.database import type_units_collection
 from pulp.plugins.util.misc import paginate
 from pulp.server.controllers.units import get_unit_key_fields_for_type
@@ -5,41 +11,69 @@ from pulp.server.db.model.repository import RepoContentUnit
 from pulp.server.config import config as pulp_conf
 
 
+# The number of associated units sorted by each database query.
+SORT_CHUNK_SIZE = 10000
+
+
+def sort_value(value):
+    """
+    Get a sortable representation of a unit key value.
+    Values of different types are ordered the way the database orders them
+    so that units compare in the order they are sorted by the database.
+    :param value: A unit key value.
+    :return: A tuple of: (type_rank, value)
+    :rtype: tuple
+    """
+    if value is None:
+        return 0, value
+    if isinstance(value, bool):
+        return 5, value
+    if isinstance(value, (int, long, float)):
+        return 1, value
+    if isinstance(value, basestring):
+        return 2, value
+    if isinstance(value, dict):
+        return 3, value
+    if isinstance(value, (list, tuple)):
+        return 4, value
+    return 6, value
+
+
 class NodesConduit(object):
 
     @staticmethod
     def get_units(repo_id):
         """
         Get all units associated with a repository.
+        The units are sorted by type_id and then by unit key.
         :param repo_id: The repository ID used to query the units.
         :type repo_id: str
         :return: unit iterator
         :rtype: UnitsIterator
         """
-        unit_ids = {}
-        associations = {}
-        collection = RepoContentUnit.get_collection()
-        for association in collection.find({'repo_id': repo_id}):
-            unit_id = association['unit_id']
-            type_id = association['unit_type_id']
-            associations[unit_id] = association
-            id_list = unit_ids.setdefault(type_id, [])
-            id_list.append(unit_id)
-        return UnitsIterator(associations, unit_ids)
+        return UnitsIterator(repo_id)
 
 
 class UnitsIterator(object):
     """
     Provides a memory efficient iterator of associated content units.
+    The units are sorted by type_id and then by the values of the unit key fields
+    in the order defined by the type.  This is the order of the unique unit key index.
+    The associated units are sorted by the database in chunks and the sorted chunks
+    are spooled to temporary files and merged, so they are never all loaded into memory
+    and no database cursor is held open while the units are consumed.  Each iteration
+    queries the database again.
     """
 
     @staticmethod
-    def associated_unit(association, unit):
+    def associated_unit(type_id, unit_key_fields, unit):
         """
         Create a dictionary that is a composite of a unit association and the unit.
 
-        :param association: A unit association DB record.
-        :type association: dict
+        :param type_id: The unit type ID.
+        :type type_id: str
+        :param unit_key_fields: The names of the unit key fields.
+        :type unit_key_fields: tuple
         :param unit: A DB unit record.
         :type unit: dict
         :return: A composite of the unit association and the unit.
@@ -47,8 +81,7 @@ class UnitsIterator(object):
         """
         unit_key = {}
         unit_id = unit.pop('_id')
-        type_id = association['unit_type_id']
-        for key in get_unit_key_fields_for_type(type_id):
+        for key in unit_key_fields:
             unit_key[key] = unit.pop(key, None)
         storage_dir = pulp_conf.get('server', 'storage_dir')
         storage_path = unit.pop('_storage_path', None)
@@ -61,60 +94,156 @@ class UnitsIterator(object):
             unit_id=unit_id,
             type_id=type_id,
             unit_key=unit_key,
+            unit_key_fields=list(unit_key_fields),
             storage_path=storage_path,
             relative_path=relative_path,
             last_updated=last_updated,
             metadata=unit)
 
     @staticmethod
-    def open_cursors(unit_ids):
+    def sorted_units(repo_id, type_id, unit_key_fields):
+        """
+        Get a generator of the units of the specified type associated with the
+        repository, sorted by unit key.
+
+        The IDs of the associated units are read in chunks of SORT_CHUNK_SIZE.  The unit
+        keys of each chunk are sorted by the database, spooled to a temporary file and the
+        sorted chunks are merged.
+        The units are then fetched in pages in the merged order.  Only the units associated
+        with the repository are read.
+
+        :param repo_id: The repository ID.
+        :type repo_id: str
+        :param type_id: The unit type ID.
+        :type type_id: str
+        :param unit_key_fields: The names of the unit key fields.
+        :type unit_key_fields: tuple
+        :return: DB unit records.
+        :rtype: generator
+        """
+        collection = type_units_collection(type_id)
+        keys = heapq.merge(*UnitsIterator.sorted_unit_keys(repo_id, type_id, unit_key_fields))
+        for page in paginate(keys):
+            page_ids = [unit_id for _key, _chunk, unit_id in page]
+            units = dict((u['_id'], u) for u in collection.find({'_id': {'$in': page_ids}}))
+            for unit_id in page_ids:
+                unit = units.get(unit_id)
+                if unit is not None:
+                    yield unit
+
+    @staticmethod
+    def sorted_unit_keys(repo_id, type_id, unit_key_fields):
+        """
+        Get the unit keys of the units of the specified type associated with the
+        repository, sorted by the database in chunks of SORT_CHUNK_SIZE units.
+
+        The sorted unit keys of each chunk are read completely and written to a
+        temporary file before the next chunk is sorted, so only one chunk is held
+        in memory and no cursor is left open while the chunks are merged.
+
+        :param repo_id: The repository ID.
+        :type repo_id: str
+        :param type_id: The unit type ID.
+        :type type_id: str
+        :param unit_key_fields: The names of the unit key fields.
+        :type unit_key_fields: tuple
+        :return: A generator of (sort_key, chunk, unit_id) sorted by sort_key
+            for each chunk.
+        :rtype: list
+        """
+        associations = RepoContentUnit.get_collection()
+        query = {'repo_id': repo_id, 'unit_type_id': type_id}
+        unit_ids = (a['unit_id'] for a in associations.find(query, projection=['unit_id']))
+        collection = type_units_collection(type_id)
+        sort = [(f, ASCENDING) for f in unit_key_fields]
+        chunks = []
+        for n, chunk in enumerate(paginate(unit_ids, SORT_CHUNK_SIZE)):
+            keys = collection.find({'_id': {'$in': list(chunk)}}, projection=list(unit_key_fields))
+            keys.sort(sort)
+            decorated = UnitsIterator._decorated(keys, n, unit_key_fields)
+            chunks.append(UnitsIterator._spooled(decorated))
+        return chunks
+
+    @staticmethod
+    def _decorated(keys, chunk, unit_key_fields):
+        """
+        Decorate unit keys for merging.
+
+        :param keys: DB unit records containing the unit key fields.
+        :type keys: iterable
+        :param chunk: The chunk number, which orders units with equal keys.
+        :type chunk: int
+        :param unit_key_fields: The names of the unit key fields.
+        :type unit_key_fields: tuple
+        :return: A generator of (sort_key, chunk, unit_id).
+        :rtype: generator
+        """
+        for key in keys:
+            sort_key = tuple(sort_value(key.get(f)) for f in unit_key_fields)
+            yield sort_key, chunk, key['_id']
+
+    @staticmethod
+    def _spooled(keys):
         """
-        Get a generator of unit cursors.
+        Write decorated unit keys to a temporary file.
 
-        :param unit_ids: A dictionary of unit_ids keyed by type_id.
-        :type unit_ids: dict
-        :return: A list of open cursors.
+        :param keys: Decorated unit keys.
+        :type keys: iterable
+        :return: A generator of the unit keys read back from the file, which is
+            closed and removed once they have all been read.
         :rtype: generator
         """
-        for type_id, id_list in unit_ids.items():
-            for page in paginate(id_list):
-                query = {'_id': {'$in': page}}
-                collection = type_units_collection(type_id)
-                cursor = collection.find(query)
-                yield cursor
+        fp = tempfile.TemporaryFile()
+        try:
+            for key in keys:
+                cPickle.dump(key, fp, cPickle.HIGHEST_PROTOCOL)
+            fp.seek(0)
+        except Exception:
+            fp.close()
+            raise
+        return UnitsIterator._unspooled(fp)
 
-    def get_units(self, associations, unit_ids):
+    @staticmethod
+    def _unspooled(fp):
+        """
+        Read the decorated unit keys written by _spooled().
+
+        :param fp: An open temporary file positioned at its start.
+        :type fp: file
+        :return: A generator of the unit keys.
+        :rtype: generator
+        """
+        with fp:
+            while True:
+                try:
+                    yield cPickle.load(fp)
+                except EOFError:
+                    return
+
+    def get_units(self):
         """
         Get units generator.
 
-        :param associations: A dictionary of unit associates keyed by type_id.
-        :type associations: dict
-        :param unit_ids: A dictionary of unit_ids keyed by type_id.
-        :type unit_ids: dict
         :return: A composite association and unit.
         :rtype: generator
         """
-        for cursor in UnitsIterator.open_cursors(unit_ids):
-            for unit in cursor:
-                unit_id = unit['_id']
-                association = associations[unit_id]
-                yield self.associated_unit(association, unit)
+        collection = RepoContentUnit.get_collection()
+        type_ids = collection.find({'repo_id': self.repo_id}).distinct('unit_type_id')
+        for type_id in sorted(type_ids):
+            unit_key_fields = get_unit_key_fields_for_type(type_id)
+            for unit in self.sorted_units(self.repo_id, type_id, unit_key_fields):
+                yield self.associated_unit(type_id, unit_key_fields, unit)
 
-    def __init__(self, associations, unit_ids):
+    def __init__(self, repo_id):
         """
-        :param associations: A dictionary of unit associates keyed by type_id.
-        :type associations: dict
-        :param unit_ids: A dictionary of unit_ids keyed by type_id.
-        :type unit_ids: dict
+        :param repo_id: The repository ID used to query the units.
+        :type repo_id: str
         """
-        self.length = len(associations)
-        self.unit_generator = self.get_units(associations, unit_ids)
-
-    def next(self):
-        return self.unit_generator.next()
+        self.repo_id = repo_id
+        self.length = RepoContentUnit.get_collection().find({'repo_id': repo_id}).count()
 
     def __iter__(self):
-        return self
+        return self.get_units()
 
     def __len__(self):
         return self.length
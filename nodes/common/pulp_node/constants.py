@@ -49,6 +49,7 @@ SKIP_CONTENT_UPDATE_KEYWORD = 'skip_content_update'
 
 TYPE_ID = 'type_id'
 UNIT_KEY = 'unit_key'
+UNIT_KEY_FIELDS = 'unit_key_fields'
 BASE_URL = 'base_url'
 STORAGE_PATH = 'storage_path'
 RELATIVE_PATH = 'relative_path'
@@ -14,6 +14,10 @@ Provides classes for managing the content unit manifest.
 The manifest is a json encoded file that defines content units
 associated with repository.  The units themselves are stored in a separate
 json encoded file.  For performance reasons, the unit files are compressed.
+The units are written sorted by type_id and unit key so that child nodes
+can compare them to their own units in a single pass.  The units of manifests
+published by older parents (version 2) are not sorted, so they are sorted by
+the child when read.
 """
 
 import os
@@ -36,7 +40,11 @@ log = getLogger(__name__)
 
 # --- constants -------------------------------------------------------------------------
 
-MANIFEST_VERSION = 2
+MANIFEST_VERSION = 3
+# The oldest version of manifest that can be read.
+MIN_MANIFEST_VERSION = 2
+# The first version of manifest with sorted units.
+SORTED_UNITS_VERSION = 3
 MANIFEST_FILE_NAME = 'manifest.json'
 UNITS_FILE_NAME = 'units.json.gz'
 
@@ -180,10 +188,18 @@ class Manifest(object):
         :rtype: bool
         """
         try:
-            return self.version == MANIFEST_VERSION
+            return MIN_MANIFEST_VERSION <= self.version <= MANIFEST_VERSION
         except AttributeError:
             return False
 
+    def units_sorted(self):
+        """
+        Get whether the units were published sorted by type_id and unit key.
+        :return: True if sorted.
+        :rtype: bool
+        """
+        return self.version >= SORTED_UNITS_VERSION
+
     def has_valid_units(self):
         """
         Validate the associated units file by comparing the size of the
@@ -373,7 +389,8 @@ class UnitIterator:
     """
     Used to iterate content units inventory file associated with a manifest.
     The file contains (1) json encoded unit per line.  The total number
-    of units in the file is reported by __len__().
+    of units in the file is reported by __len__().  Each iteration reads
+    the file from the beginning.
     """
 
     @staticmethod
@@ -398,14 +415,11 @@ class UnitIterator:
         :param total_units: The number of units contained in the units file.
         :type total_units: int
         """
-        self.unit_generator = UnitIterator.get_units(path)
+        self.path = path
         self.total_units = total_units
 
-    def next(self):
-        return self.unit_generator.next()
-
     def __iter__(self):
-        return self
+        return UnitIterator.get_units(self.path)
 
     def __len__(self):
         return self.total_units
@@ -0,0 +1,128 @@
+from unittest import TestCase
+
+import mock
+
+from pulp_node import constants
+from pulp_node.importers.inventory import UniqueKey, UnitInventory, UnitsNotSorted, sort_units
+
+
+def unit(name, version, last_updated=0):
+    return {
+        'type_id': 'T',
+        'unit_key': {'name': name, 'version': version},
+        constants.UNIT_KEY_FIELDS: ['version', 'name'],
+        constants.LAST_UPDATED: last_updated,
+        'metadata': {}
+    }
+
+
+class TestUniqueKey(TestCase):
+
+    def test_order(self):
+        # ordered by the unit key fields
+        self.assertTrue(UniqueKey(unit('b', 1)) < UniqueKey(unit('a', 2)))
+        self.assertFalse(UniqueKey(unit('a', 2)) < UniqueKey(unit('b', 1)))
+        # ordered by type
+        self.assertTrue(UniqueKey(unit('a', None)) < UniqueKey(unit('a', 1)))
+        self.assertTrue(UniqueKey(unit('a', 1)) < UniqueKey(unit('a', '1')))
+        self.assertTrue(UniqueKey(unit('a', '1')) < UniqueKey(unit('a', True)))
+
+    def test_order_without_fields(self):
+        a = {'type_id': 'T', 'unit_key': {'name': 'b', 'version': 1}}
+        b = {'type_id': 'T', 'unit_key': {'name': 'a', 'version': 2}}
+        self.assertTrue(UniqueKey(b) < UniqueKey(a))
+
+    def test_equal(self):
+        a = unit('a', 1)
+        b = {'type_id': 'T', 'unit_key': {'version': 1, 'name': 'a'}}
+        self.assertEqual(UniqueKey(a), UniqueKey(unit('a', 1)))
+        self.assertNotEqual(UniqueKey(a), UniqueKey(unit('a', 2)))
+        self.assertEqual(hash(UniqueKey(a)), hash(UniqueKey(unit('a', 1))))
+        self.assertNotEqual(UniqueKey(a), UniqueKey(b))
+
+
+class TestSortUnits(TestCase):
+
+    @mock.patch('pulp_node.importers.inventory.get_unit_key_fields_for_type')
+    def test_sort_units(self, get_unit_key_fields):
+        get_unit_key_fields.side_effect = [('version', 'name'), ValueError()]
+        units = [
+            {'type_id': 'T', 'unit_key': {'name': 'a', 'version': 2}, 'metadata': {}},
+            {'type_id': 'T', 'unit_key': {'name': 'b', 'version': 1}, 'metadata': {}},
+            {'type_id': 'S', 'unit_key': {'name': 'c', 'version': 3}, 'metadata': {}},
+        ]
+
+        sorted_units = sort_units([(u, u['unit_key']['name']) for u in units])
+
+        self.assertEqual([ref for u, ref in sorted_units], ['c', 'b', 'a'])
+        self.assertEqual(sorted_units[1][0][constants.UNIT_KEY_FIELDS], ['version', 'name'])
+        self.assertFalse(constants.UNIT_KEY_FIELDS in sorted_units[0][0])
+        self.assertFalse('metadata' in sorted_units[0][0])
+        # the types are looked up once
+        self.assertEqual(get_unit_key_fields.call_count, 2)
+
+    @mock.patch('pulp_node.importers.inventory.get_unit_key_fields_for_type')
+    def test_sort_units_matches_child(self, get_unit_key_fields):
+        get_unit_key_fields.return_value = ('version', 'name')
+        parent = [
+            {'type_id': 'T', 'unit_key': {'name': 'a', 'version': 2}},
+            {'type_id': 'T', 'unit_key': {'name': 'b', 'version': 1}},
+        ]
+        child = [unit('b', 1), unit('a', 2)]
+
+        parent = sort_units([(u, None) for u in parent])
+        inventory = UnitInventory('http://host', parent, child)
+
+        self.assertEqual(len(inventory.units_on_parent_only()), 0)
+        self.assertEqual(len(inventory.units_on_child_only()), 0)
+
+
+class TestUnitInventory(TestCase):
+
+    def setUp(self):
+        parent = [unit('a', 1, 10), unit('b', 1), unit('c', 2, 10), unit('a', 3)]
+        child = [unit('z', 0), unit('a', 1, 5), unit('c', 2, 10), unit('b', 3)]
+        self.parent = [(u, 'ref-%s-%s' % (u['unit_key']['name'], u['unit_key']['version']))
+                       for u in parent]
+        self.child = child
+        self.inventory = UnitInventory('http://host', self.parent, self.child)
+
+    def test_units_on_parent_only(self):
+        units = self.inventory.units_on_parent_only()
+        self.assertEqual(len(units), 2)
+        self.assertEqual([ref for u, ref in units], ['ref-b-1', 'ref-a-3'])
+
+    def test_units_on_child_only(self):
+        units = self.inventory.units_on_child_only()
+        self.assertEqual(len(units), 2)
+        self.assertEqual([u['unit_key']['name'] for u in units], ['z', 'b'])
+
+    def test_updated_units(self):
+        units = self.inventory.updated_units()
+        self.assertEqual(len(units), 1)
+        self.assertEqual([ref for u, ref in units], ['ref-a-1'])
+
+    def test_metadata_removed(self):
+        list(self.inventory.join())
+        for u, ref in self.parent:
+            self.assertFalse('metadata' in u)
+        for u in self.child:
+            self.assertFalse('metadata' in u)
+
+    def test_empty(self):
+        inventory = UnitInventory('http://host', [], [])
+        self.assertEqual(list(inventory.join()), [])
+        inventory = UnitInventory('http://host', [], self.child)
+        self.assertEqual(len(inventory.units_on_child_only()), len(self.child))
+        inventory = UnitInventory('http://host', self.parent, [])
+        self.assertEqual(len(inventory.units_on_parent_only()), len(self.parent))
+
+    def test_duplicates_skipped(self):
+        child = [unit('a', 1), unit('a', 1), unit('b', 1)]
+        inventory = UnitInventory('http://host', [], child)
+        self.assertEqual(len(inventory.units_on_child_only()), 2)
+
+    def test_not_sorted(self):
+        child = [unit('a', 2), unit('a', 1)]
+        inventory = UnitInventory('http://host', [], child)
+        self.assertRaises(UnitsNotSorted, list, inventory.units_on_child_only())
@@ -11,6 +11,7 @@
 
 from base import ServerTests
 from operator import itemgetter
+from unittest import TestCase
 
 import mock
 
@@ -23,7 +24,7 @@ from pulp.server.db.model.content import ContentType
 
 from pulp_node import constants
 from pulp_node.importers.http.importer import NodesHttpImporter
-from pulp_node.conduit import NodesConduit
+from pulp_node.conduit import NodesConduit, UnitsIterator
 
 
 # --- constants ---------------------------------------------------------------
@@ -117,3 +118,95 @@ class QueryTests(ServerTests):
             self.assertEqual(unit_key['N'], n)
             self.assertEqual(u['storage_path'], create_storage_path(unit_id))
             n += 1
+
+    def test_query_sorted(self):
+        num_units = 5
+        populate(num_units)
+        conduit = NodesConduit()
+        units = conduit.get_units(REPO_ID)
+        unit_list = list(units)
+        keys = [(u['type_id'], [u['unit_key'][f] for f in u[constants.UNIT_KEY_FIELDS]])
+                for u in unit_list]
+        self.assertEqual(len(unit_list), len(units))
+        self.assertEqual(keys, sorted(keys))
+        # iterable more than once
+        self.assertEqual([u['unit_id'] for u in units], [u['unit_id'] for u in unit_list])
+
+    @mock.patch('pulp_node.conduit.SORT_CHUNK_SIZE', 2)
+    def test_query_sorted_chunks(self):
+        num_units = 5
+        populate(num_units)
+        conduit = NodesConduit()
+        unit_list = list(conduit.get_units(REPO_ID))
+        keys = [(u['type_id'], [u['unit_key'][f] for f in u[constants.UNIT_KEY_FIELDS]])
+                for u in unit_list]
+        self.assertEqual(len(unit_list), num_units * len(ALL_TYPES))
+        self.assertEqual(keys, sorted(keys))
+
+
+class FakeCursor(list):
+
+    def sort(self, fields):
+        for field, direction in reversed(fields):
+            list.sort(self, key=itemgetter(field))
+        return self
+
+
+class TestUnitsIterator(TestCase):
+
+    UNITS = [
+        {'_id': 1, 'name': 'd', 'extra': 1},
+        {'_id': 2, 'name': 'b', 'extra': 2},
+        {'_id': 3, 'name': 'a', 'extra': 3},
+        {'_id': 4, 'name': 'e', 'extra': 4},
+        {'_id': 5, 'name': 'c', 'extra': 5},
+    ]
+
+    def find(self, query, projection=None):
+        ids = query['_id']['$in']
+        units = [dict(u) for u in self.UNITS if u['_id'] in ids]
+        if projection:
+            units = [dict((k, u[k]) for k in ['_id'] + projection) for u in units]
+        return FakeCursor(units)
+
+    @mock.patch('pulp_node.conduit.SORT_CHUNK_SIZE', 2)
+    @mock.patch('pulp_node.conduit.type_units_collection')
+    @mock.patch('pulp_node.conduit.RepoContentUnit')
+    def test_sorted_units(self, repo_content_unit, type_units_collection):
+        associations = repo_content_unit.get_collection.return_value
+        # unit 4 is not associated with the repository
+        associations.find.return_value = [{'unit_id': i} for i in (1, 2, 3, 5)]
+        type_units_collection.return_value.find.side_effect = self.find
+
+        units = list(UnitsIterator.sorted_units(REPO_ID, TYPE_A, ('name',)))
+
+        self.assertEqual([u['name'] for u in units], ['a', 'b', 'c', 'd'])
+        self.assertEqual([u['extra'] for u in units], [3, 2, 5, 1])
+        associations.find.assert_called_once_with(
+            {'repo_id': REPO_ID, 'unit_type_id': TYPE_A}, projection=['unit_id'])
+        # (2) sorted chunks of unit keys and (1) page of units
+        self.assertEqual(type_units_collection.return_value.find.call_count, 3)
+
+    @mock.patch('pulp_node.conduit.SORT_CHUNK_SIZE', 2)
+    @mock.patch('pulp_node.conduit.type_units_collection')
+    @mock.patch('pulp_node.conduit.RepoContentUnit')
+    def test_sorted_unit_keys_consumed(self, repo_content_unit, type_units_collection):
+        associations = repo_content_unit.get_collection.return_value
+        associations.find.return_value = [{'unit_id': i} for i in (1, 2, 3, 4, 5)]
+        cursors = []
+
+        def find(query, projection=None):
+            cursor = iter(self.find(query, projection).sort([('name', 1)]))
+            cursors.append(cursor)
+            return mock.Mock(__iter__=lambda s: cursor)
+
+        type_units_collection.return_value.find.side_effect = find
+
+        chunks = UnitsIterator.sorted_unit_keys(REPO_ID, TYPE_A, ('name',))
+
+        # every chunk is read before the keys are merged
+        self.assertEqual(len(cursors), 3)
+        for cursor in cursors:
+            self.assertRaises(StopIteration, next, cursor)
+        self.assertEqual([[unit_id for _key, _chunk, unit_id in chunk] for chunk in chunks],
+                         [[2, 1], [3, 4], [5]])
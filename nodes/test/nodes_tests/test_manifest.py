@@ -35,10 +35,22 @@ class TestManifest(TestCase):
         m = manifest.Manifest(manifest_path, self.MANIFEST_ID)
         # Test valid
         self.assertTrue(m.is_valid())
+        self.assertTrue(m.units_sorted())
         # Test version mismatch
         m.version += 1
         self.assertFalse(m.is_valid())
 
+    def test_validation_unsorted(self):
+        manifest_path = os.path.join(self.tmp_dir, manifest.MANIFEST_FILE_NAME)
+        m = manifest.Manifest(manifest_path, self.MANIFEST_ID)
+        # Published by an older parent
+        m.version = manifest.MIN_MANIFEST_VERSION
+        self.assertTrue(m.is_valid())
+        self.assertFalse(m.units_sorted())
+        # Too old
+        m.version -= 1
+        self.assertFalse(m.is_valid())
+
     def test_publishing(self):
         # Setup
         units = []
@@ -0,0 +1,75 @@
+"""
+Process level cache of files used to avoid reading them for every request.
+"""
+
+import os
+from threading import RLock
+from time import time
+
+
+class FileCache(object):
+    """
+    A thread-safe cache of file contents.
+
+    A file is read again when its modification time, size or inode changes.
+    Files are checked for changes at most once per interval.
+
+    :ivar interval: The minimum number of seconds between checks of a file.
+    :type interval: int
+    """
+
+    def __init__(self, interval):
+        """
+        :param interval: The minimum number of seconds between checks of a file.
+        :type interval: int
+        """
+        self.interval = interval
+        self._lock = RLock()
+        # path: (checked, stat, contents)
+        self._files = {}
+
+    def read(self, path):
+        """
+        Get the contents of a file.
+
+        The same string object is returned for as long as the file has not
+        changed, so callers can cache values derived from the contents and
+        compare them by identity.
+
+        :param path: The absolute path to the file.
+        :type path: str
+        :return: The contents of the file, or None when it does not exist or
+            cannot be read.
+        :rtype: str
+        """
+        now = time()
+        with self._lock:
+            entry = self._files.get(path)
+        if entry is not None and now - entry[0] < self.interval:
+            return entry[2]
+        try:
+            st = os.stat(path)
+            stat = (st.st_mtime, st.st_size, st.st_ino)
+        except OSError:
+            stat = None
+        if entry is not None and entry[1] == stat:
+            contents = entry[2]
+        elif stat is None:
+            contents = None
+        else:
+            try:
+                with open(path) as fp:
+                    contents = fp.read()
+            except IOError:
+                stat = None
+                contents = None
+        with self._lock:
+            self._files[path] = (now, stat, contents)
+        return contents
+
+    def clear(self):
+        """
+        Forget all files.
+        """
+        with self._lock:
+            self._files.clear()
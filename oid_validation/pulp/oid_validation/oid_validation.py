@@ -11,21 +11,49 @@ The OID structure follows the Red Hat model. Download URLs are found at:
   1.3.6.1.4.1.2312.9.2.*.1.6
 
 The * represents the product ID and is not used as part of this calculation.
+
+Unless a configuration is passed in, requests are validated using a process level
+AuthEngine that caches the configuration, protected repo listings, CA certificates,
+parsed client certificates and verdicts.
 '''
 
+import calendar
+import hashlib
 import os
 from gettext import gettext as _
 from ConfigParser import NoOptionError, SafeConfigParser, NoSectionError
+from StringIO import StringIO
+from threading import RLock
+from time import time
 
+from M2Crypto import X509
 from rhsm import certificate
 
-from pulp.repoauth.protected_repo_utils import ProtectedRepoUtils
+from pulp.common.cache import ExpiringCache
+from pulp.oid_validation.cache import FileCache
+from pulp.repoauth.protected_repo_utils import (ProtectedRepoIndex, ProtectedRepoListingFile,
+                                                ProtectedRepoUtils)
 from pulp.repoauth.repo_cert_utils import RepoCertUtils
 
 # This needs to be accessible on both Pulp and the CDS instances, so a
 # separate config file for repo auth purposes is used.
 CONFIG_FILENAME = '/etc/pulp/repo_auth.conf'
 
+# The minimum number of seconds between checks for changes to the configuration,
+# the protected repo listings and the CA certificates.
+RELOAD_INTERVAL = 10
+# The maximum number of cached client certificates and of cached verdicts.
+CACHE_SIZE = 10000
+# The maximum number of seconds a parsed client certificate is cached.
+CERTIFICATE_TTL = 300
+# The default maximum number of seconds a verdict is cached, unless the verdict_ttl
+# option is set in the configuration. Nothing is cached past the expiration of the
+# client certificate.
+DEFAULT_VERDICT_TTL = 30
+
+_engine = None
+_engine_lock = RLock()
+
 
 def authenticate(environ, config=None):
     '''
@@ -36,8 +64,10 @@ def authenticate(environ, config=None):
     # information, see PEP333.
     wsgi_error_logger = environ["wsgi.errors"].write
 
+    engine = None
     if config is None:
-        config = _config()
+        engine = get_engine()
+        config = engine.config()
 
     # Attempt to retrieve the client certificate, and if it isn't available, reject.
     cert_pem = ''
@@ -56,15 +86,141 @@ def authenticate(environ, config=None):
             wsgi_error_logger(error)
         return False
 
-    validator = OidValidator(config)
+    if engine is None:
+        validator = OidValidator(config)
+    else:
+        validator = engine.validator()
     valid = validator.is_valid(environ["REQUEST_URI"], cert_pem, wsgi_error_logger)
     return valid
 
 
-def _config():
-    config = SafeConfigParser()
-    config.read(CONFIG_FILENAME)
-    return config
+def get_engine():
+    """
+    Get the process level authentication engine.
+
+    :return: The engine, created on first use.
+    :rtype:  AuthEngine
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AuthEngine(CONFIG_FILENAME)
+        return _engine
+
+
+def fingerprint(cert_pem):
+    """
+    Get a key that identifies a client certificate.
+
+    :param cert_pem: PEM encoded client certificate
+    :type  cert_pem: str
+    :return: The SHA-256 digest of the PEM
+    :rtype:  str
+    """
+    return hashlib.sha256(cert_pem).hexdigest()
+
+
+def expiration(cert_pem, ttl):
+    """
+    Get when values derived from a client certificate expire: after the given
+    number of seconds, or when the certificate expires if that is sooner.
+
+    :param cert_pem: PEM encoded client certificate
+    :type  cert_pem: str
+    :param ttl: The maximum number of seconds the values are cached
+    :type  ttl: int
+    :return: The expiration (seconds since epoch)
+    :rtype:  float
+    """
+    expires = time() + ttl
+    try:
+        not_after = X509.load_cert_string(cert_pem).get_not_after().get_datetime()
+    except (X509.X509Error, ValueError):
+        return expires
+    return min(expires, calendar.timegm(not_after.utctimetuple()))
+
+
+def verdict_ttl(config):
+    """
+    Get the maximum number of seconds a verdict is cached.
+
+    :param config: The repo auth configuration.
+    :type  config: SafeConfigParser
+    :return: The verdict_ttl option, or DEFAULT_VERDICT_TTL when it is not set.
+        Verdicts are not cached when it is 0.
+    :rtype:  int
+    """
+    try:
+        return config.getint('main', 'verdict_ttl')
+    except (NoSectionError, NoOptionError, ValueError):
+        return DEFAULT_VERDICT_TTL
+
+
+class AuthEngine(object):
+    """
+    The process level state shared by all requests.
+
+    The configuration, the protected repo listings and the CA certificates are
+    read once and read again when their files change. Parsed client certificates
+    and the verdicts of certificate verification and extension checks are cached
+    by certificate fingerprint.
+
+    :ivar path: The absolute path to the configuration file.
+    :type path: str
+    :ivar files: The cached files.
+    :type files: FileCache
+    :ivar certificates: Parsed client certificates keyed by fingerprint.
+    :type certificates: ExpiringCache
+    :ivar verdicts: Verdicts keyed by fingerprint and what was checked.
+    :type verdicts: ExpiringCache
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The absolute path to the configuration file.
+        :type path: str
+        """
+        self.path = path
+        self.files = FileCache(RELOAD_INTERVAL)
+        self.certificates = ExpiringCache(CACHE_SIZE)
+        self.verdicts = ExpiringCache(CACHE_SIZE)
+        self._lock = RLock()
+        self._contents = None
+        self._config = None
+        self._validator = None
+
+    def config(self):
+        """
+        Get the configuration.
+        The configuration is parsed again (and the verdicts dropped) when the
+        configuration file has changed.
+
+        :return: The configuration.
+        :rtype:  SafeConfigParser
+        """
+        contents = self.files.read(self.path)
+        with self._lock:
+            if self._config is None or contents is not self._contents:
+                config = SafeConfigParser()
+                config.readfp(StringIO(contents or ''), self.path)
+                self.verdicts.clear()
+                self._config = config
+                self._contents = contents
+            return self._config
+
+    def validator(self):
+        """
+        Get the validator for the current configuration.
+
+        :return: A validator.
+        :rtype:  CachedOidValidator
+        """
+        config = self.config()
+        with self._lock:
+            if self._validator is None or self._validator.config is not config:
+                self._validator = CachedOidValidator(
+                    config, self.files, self.certificates, self.verdicts)
+            return self._validator
 
 
 class OidValidator:
@@ -146,7 +302,7 @@ class OidValidator:
     def _matching_repo_bundle(self, dest, repo_url_prefixes):
 
         # Load the path -> repo ID mappings
-        prot_repos = self.protected_repo_utils.read_protected_repo_listings()
+        prot_repos = self.protected_repo_utils.read_protected_repo_index()
 
         repo_id = None
         for prefix in repo_url_prefixes:
@@ -155,16 +311,9 @@ class OidValidator:
             #   Repo Portion: /my-repo/pulp/fedora-13/i386/repodata/repomd.xml
             repo_url = dest[dest.find(prefix) + len(prefix):]
 
-            # If the repo portion of the URL starts with any of the protected relative URLs,
+            # If the repo portion of the URL contains any of the protected relative URLs,
             # it is considered to be a request against that protected repo
-            for relative_repo_url in prot_repos.keys():
-
-                # Relative URL is inconsistent in Pulp, so a simple "startswith" tends to
-                # break. Changing this to a find helps remove issues where the leading /
-                # is missing, present, or duplicated.
-                if repo_url.find(relative_repo_url) != -1:
-                    repo_id = prot_repos[relative_repo_url]
-                    break
+            repo_id = prot_repos.find(repo_url)
 
             # break out of checking URLs once we find a matching repo id
             if repo_id:
@@ -191,7 +340,7 @@ class OidValidator:
         :return: True iff request is authorized, else False
         :rtype:  bool
         """
-        cert = certificate.create_from_pem(cert_pem)
+        cert = self._certificate(cert_pem)
 
         valid = False
         for prefix in repo_url_prefixes:
@@ -213,6 +362,17 @@ class OidValidator:
 
         return valid
 
+    def _certificate(self, cert_pem):
+        """
+        Parse a client certificate.
+
+        :param cert_pem: certificate as PEM
+        :type  cert_pem: str
+        :return: The parsed certificate
+        :rtype:  rhsm.certificate2.Certificate
+        """
+        return certificate.create_from_pem(cert_pem)
+
     def _get_repo_url_prefixes_from_config(self, config):
         """
         Obtain the list of repo URLs prefixes from the conf file. If none
@@ -224,3 +384,128 @@ class OidValidator:
             prefixes = ["/pulp/repos", "/pulp/ostree/web"]
 
         return prefixes
+
+
+class CachedRepoCertUtils(RepoCertUtils):
+    """
+    Reads the cert bundles from a file cache and caches certificate verification verdicts.
+    """
+
+    def __init__(self, config, files, verdicts):
+        """
+        :param config: The repo auth configuration.
+        :type config: SafeConfigParser
+        :param files: The cached files.
+        :type files: FileCache
+        :param verdicts: The cached verdicts.
+        :type verdicts: ExpiringCache
+        """
+        RepoCertUtils.__init__(self, config)
+        self.files = files
+        self.verdicts = verdicts
+        self.verdict_ttl = verdict_ttl(config)
+
+    def validate_certificate_pem(self, cert_pem, ca_pem, log_func=None):
+        if self.verdict_ttl <= 0:
+            return RepoCertUtils.validate_certificate_pem(self, cert_pem, ca_pem, log_func)
+        key = ('verify', fingerprint(cert_pem), ca_pem)
+        valid = self.verdicts.get(key)
+        if valid is None:
+            valid = RepoCertUtils.validate_certificate_pem(self, cert_pem, ca_pem, log_func)
+            self.verdicts.put(key, valid, expiration(cert_pem, self.verdict_ttl))
+        return valid
+
+    def _read_file(self, filename):
+        return self.files.read(filename)
+
+
+class CachedProtectedRepoUtils(ProtectedRepoUtils):
+    """
+    Reads the protected repo listings from a file cache.
+    The listings and their index are built again only when the file has changed.
+    """
+
+    def __init__(self, config, files):
+        """
+        :param config: The repo auth configuration.
+        :type config: SafeConfigParser
+        :param files: The cached files.
+        :type files: FileCache
+        """
+        ProtectedRepoUtils.__init__(self, config)
+        self.files = files
+        self._lock = RLock()
+        self._contents = None
+        self._listings = {}
+        self._index = ProtectedRepoIndex({})
+
+    def read_protected_repo_listings(self):
+        return self._load()[0]
+
+    def read_protected_repo_index(self):
+        return self._load()[1]
+
+    def _load(self):
+        """
+        Load the listings when the file has changed.
+
+        :return: The listings and their index.
+        :rtype:  tuple
+        """
+        filename = self.config.get('repos', 'protected_repo_listing_file')
+        contents = self.files.read(filename)
+        with self._lock:
+            if contents is not self._contents:
+                listing_file = ProtectedRepoListingFile(filename)
+                listing_file.parse(contents or '')
+                self._contents = contents
+                self._listings = listing_file.listings
+                self._index = ProtectedRepoIndex(self._listings)
+            return self._listings, self._index
+
+
+class CachedOidValidator(OidValidator):
+    """
+    A validator that caches the files it reads, the parsed client certificates
+    and the verdicts of certificate verification and extension checks.
+    """
+
+    def __init__(self, config, files, certificates, verdicts):
+        """
+        :param config: The repo auth configuration.
+        :type config: SafeConfigParser
+        :param files: The cached files.
+        :type files: FileCache
+        :param certificates: The cached client certificates.
+        :type certificates: ExpiringCache
+        :param verdicts: The cached verdicts.
+        :type verdicts: ExpiringCache
+        """
+        OidValidator.__init__(self, config)
+        self.repo_cert_utils = CachedRepoCertUtils(config, files, verdicts)
+        self.protected_repo_utils = CachedProtectedRepoUtils(config, files)
+        self.certificates = certificates
+        self.verdicts = verdicts
+        self.verdict_ttl = verdict_ttl(config)
+
+    def _check_extensions(self, cert_pem, dest, log_func, repo_url_prefixes):
+        if self.verdict_ttl <= 0:
+            return OidValidator._check_extensions(
+                self, cert_pem, dest, log_func, repo_url_prefixes)
+        key = ('extensions', fingerprint(cert_pem), dest, tuple(repo_url_prefixes))
+        valid = self.verdicts.get(key)
+        if valid is None:
+            valid = OidValidator._check_extensions(
+                self, cert_pem, dest, log_func, repo_url_prefixes)
+            self.verdicts.put(key, valid, expiration(cert_pem, self.verdict_ttl))
+        elif not valid:
+            log_func('Request denied to destination [%s]' % dest)
+        return valid
+
+    def _certificate(self, cert_pem):
+        key = fingerprint(cert_pem)
+        cert = self.certificates.get(key)
+        if cert is None:
+            cert = OidValidator._certificate(self, cert_pem)
+            self.certificates.put(key, cert, expiration(cert_pem, CERTIFICATE_TTL))
+        return cert
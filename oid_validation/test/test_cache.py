@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from pulp.oid_validation.cache import FileCache
+
+
+MODULE = 'pulp.oid_validation.cache'
+
+
+class TestFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'file')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, contents):
+        with open(self.path, 'w') as fp:
+            fp.write(contents)
+
+    def test_read(self):
+        self.write('abc')
+        cache = FileCache(0)
+        contents = cache.read(self.path)
+        self.assertEqual(contents, 'abc')
+        # not changed, the same contents are returned
+        self.assertTrue(cache.read(self.path) is contents)
+
+    def test_read_missing(self):
+        cache = FileCache(0)
+        self.assertEqual(cache.read(self.path), None)
+        self.write('abc')
+        self.assertEqual(cache.read(self.path), 'abc')
+        os.unlink(self.path)
+        self.assertEqual(cache.read(self.path), None)
+
+    def test_read_changed(self):
+        self.write('abc')
+        cache = FileCache(0)
+        cache.read(self.path)
+        self.write('abcd')
+        self.assertEqual(cache.read(self.path), 'abcd')
+
+    @mock.patch(MODULE + '.time')
+    def test_read_interval(self, _time):
+        _time.return_value = 100
+        self.write('abc')
+        cache = FileCache(10)
+        cache.read(self.path)
+        self.write('abcd')
+        # not checked again within the interval
+        _time.return_value = 109
+        self.assertEqual(cache.read(self.path), 'abc')
+        _time.return_value = 110
+        self.assertEqual(cache.read(self.path), 'abcd')
+
+    def test_clear(self):
+        self.write('abc')
+        cache = FileCache(10)
+        cache.read(self.path)
+        self.write('abcd')
+        cache.clear()
+        self.assertEqual(cache.read(self.path), 'abcd')
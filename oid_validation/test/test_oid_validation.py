@@ -8,14 +8,18 @@
 #
 
 from ConfigParser import SafeConfigParser, NoOptionError
+from datetime import datetime
 import shutil
 import os
+import tempfile
+import time
 import unittest
 import urlparse
 
 from M2Crypto import X509
 import mock
 
+from pulp.common.dateutils import utc_tz
 import pulp.oid_validation.oid_validation as oid_validation
 from pulp.repoauth.repo_cert_utils import RepoCertUtils
 
@@ -694,23 +698,19 @@ class TestOidValidation(unittest.TestCase):
         self.assertTrue(response_y)
         self.assertTrue(response_xx)
 
-    @mock.patch("pulp.oid_validation.oid_validation._config")
+    @mock.patch("pulp.oid_validation.oid_validation.get_engine")
     @mock.patch("pulp.oid_validation.oid_validation.OidValidator")
-    def test_authenticate_loads_config(self, mock_validator, mock_config):
+    def test_authenticate_uses_engine(self, mock_validator, mock_get_engine):
         environ = mock_environ(E_FULL, 'https://nowhere/path/to')
+        engine = mock_get_engine.return_value
 
-        oid_validation.authenticate(environ)
+        valid = oid_validation.authenticate(environ)
 
-        mock_config.assert_called_once_with()
-
-    @mock.patch("pulp.oid_validation.oid_validation.SafeConfigParser")
-    def test_config(self, mock_config_parser):
-        mock_config_parser_instance = mock.Mock()
-        mock_config_parser.return_value = mock_config_parser_instance
-
-        oid_validation._config()
-
-        mock_config_parser_instance.read.assert_called_once_with('/etc/pulp/repo_auth.conf')
+        engine.config.assert_called_once_with()
+        engine.validator.return_value.is_valid.assert_called_once_with(
+            '/path/to', E_FULL, environ['wsgi.errors'].write)
+        self.assertEqual(valid, engine.validator.return_value.is_valid.return_value)
+        self.assertFalse(mock_validator.called)
 
     def test_get_repo_url_prefixes_from_config(self):
         mock_config = mock.Mock()
@@ -748,8 +748,8 @@ class TestOidValidation(unittest.TestCase):
             'Authentication failed; no client certificate provided in request.\n'
         )
 
-    @mock.patch('pulp.oid_validation.oid_validation.OidValidator')
-    def test_ssl_client_cert_set(self, mock_oid_validation):
+    @mock.patch('pulp.oid_validation.oid_validation.get_engine')
+    def test_ssl_client_cert_set(self, mock_get_engine):
         """
         Test that if the client cert is in SSL_CLIENT_CERT, that certificate is used.
 
@@ -763,10 +763,11 @@ class TestOidValidation(unittest.TestCase):
         )
         environ['SSL_CLIENT_CERT'] = E_FULL
         environ.pop('mod_ssl.var_lookup')
-        mock_oid_validation.return_value.is_valid.return_value = True
+        mock_validator = mock_get_engine.return_value.validator.return_value
+        mock_validator.is_valid.return_value = True
 
         self.assertTrue(oid_validation.authenticate(environ))
-        mock_oid_validation.return_value.is_valid.assert_called_once_with(
+        mock_validator.is_valid.assert_called_once_with(
             '/some/repo/package.rpm', E_FULL, environ['wsgi.errors'].write)
 
     @mock.patch('pulp.oid_validation.oid_validation.certificate')
@@ -788,3 +789,166 @@ class TestOidValidation(unittest.TestCase):
 
         for call in mock_cert.check_path.call_args_list:
             self.assertEqual(unprefixed_path, call[0][0])
+
+
+class TestAuthEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'repo_auth.conf')
+        self.listing_path = os.path.join(self.tmp_dir, 'listing')
+        self.write_config('false')
+        self.engine = oid_validation.AuthEngine(self.path)
+        self.engine.files.interval = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_config(self, verify_ssl, verdict_ttl=None):
+        with open(self.path, 'w') as fp:
+            fp.write('[main]\nverify_ssl: %s\n' % verify_ssl)
+            if verdict_ttl is not None:
+                fp.write('verdict_ttl: %s\n' % verdict_ttl)
+            fp.write('[repos]\n')
+            fp.write('cert_location: %s\n' % self.tmp_dir)
+            fp.write('global_cert_location: %s\n' % self.tmp_dir)
+            fp.write('protected_repo_listing_file: %s\n' % self.listing_path)
+
+    def test_config(self):
+        config = self.engine.config()
+
+        self.assertFalse(config.getboolean('main', 'verify_ssl'))
+        self.assertTrue(self.engine.config() is config)
+        self.assertTrue(self.engine.validator() is self.engine.validator())
+        self.assertTrue(self.engine.validator().config is config)
+
+    def test_config_changed(self):
+        validator = self.engine.validator()
+        self.engine.verdicts.put('a', True, time.time() + 100)
+
+        self.write_config('true')
+
+        self.assertTrue(self.engine.config().getboolean('main', 'verify_ssl'))
+        self.assertFalse(self.engine.validator() is validator)
+        self.assertEqual(len(self.engine.verdicts), 0)
+
+    def test_config_missing(self):
+        os.unlink(self.path)
+        config = self.engine.config()
+        self.assertEqual(config.sections(), [])
+
+    def test_protected_repo_listings(self):
+        utils = self.engine.validator().protected_repo_utils
+        self.assertEqual(utils.read_protected_repo_listings(), {})
+
+        with open(self.listing_path, 'w') as fp:
+            fp.write('/pulp/pulp/fedora-14/x86_64,repo-x\n')
+        listings = utils.read_protected_repo_listings()
+
+        self.assertEqual(listings, {'/pulp/pulp/fedora-14/x86_64': 'repo-x'})
+        self.assertTrue(utils.read_protected_repo_listings() is listings)
+        index = utils.read_protected_repo_index()
+        self.assertEqual(index.find('/repos/pulp/pulp/fedora-14/x86_64/a.rpm'), 'repo-x')
+        self.assertTrue(utils.read_protected_repo_index() is index)
+
+    def test_read_global_cert_bundle(self):
+        utils = self.engine.validator().repo_cert_utils
+        self.assertEqual(utils.read_global_cert_bundle(pieces=['ca']), None)
+
+        utils.write_global_repo_cert_bundle({'ca': VALID_CA, 'cert': CERT})
+        bundle = utils.read_global_cert_bundle(pieces=['ca'])
+
+        self.assertEqual(bundle, {'ca': VALID_CA})
+        self.assertTrue(utils.read_global_cert_bundle(pieces=['ca'])['ca'] is bundle['ca'])
+
+    @mock.patch('pulp.oid_validation.oid_validation.expiration')
+    @mock.patch('pulp.oid_validation.oid_validation.RepoCertUtils.validate_certificate_pem')
+    def test_validate_certificate_pem_cached(self, mock_validate, mock_expiration):
+        mock_expiration.return_value = time.time() + 100
+        mock_validate.return_value = False
+        utils = self.engine.validator().repo_cert_utils
+
+        self.assertFalse(utils.validate_certificate_pem(E_FULL, VALID_CA))
+        self.assertFalse(utils.validate_certificate_pem(E_FULL, VALID_CA))
+        utils.validate_certificate_pem(E_FULL, OTHER_CA)
+        utils.validate_certificate_pem(E_LIMITED, VALID_CA)
+
+        self.assertEqual(mock_validate.call_count, 3)
+
+    @mock.patch('pulp.oid_validation.oid_validation.RepoCertUtils.validate_certificate_pem')
+    def test_validate_certificate_pem_not_cached(self, mock_validate):
+        self.write_config('true', verdict_ttl=0)
+        utils = self.engine.validator().repo_cert_utils
+
+        utils.validate_certificate_pem(E_FULL, VALID_CA)
+        utils.validate_certificate_pem(E_FULL, VALID_CA)
+
+        self.assertEqual(mock_validate.call_count, 2)
+        self.assertEqual(len(self.engine.verdicts), 0)
+
+    @mock.patch('pulp.oid_validation.oid_validation.expiration')
+    @mock.patch('pulp.oid_validation.oid_validation.RepoCertUtils.validate_certificate_pem')
+    def test_validate_certificate_pem_expired(self, mock_validate, mock_expiration):
+        mock_expiration.return_value = time.time() - 1
+        utils = self.engine.validator().repo_cert_utils
+
+        utils.validate_certificate_pem(E_FULL, VALID_CA)
+        utils.validate_certificate_pem(E_FULL, VALID_CA)
+
+        self.assertEqual(mock_validate.call_count, 2)
+
+    @mock.patch('pulp.oid_validation.oid_validation.expiration')
+    @mock.patch('pulp.oid_validation.oid_validation.certificate')
+    def test_check_extensions_cached(self, mock_certificate, mock_expiration):
+        mock_expiration.return_value = time.time() + 100
+        mock_cert = mock_certificate.create_from_pem.return_value
+        mock_cert.check_path.return_value = True
+        validator = self.engine.validator()
+        prefixes = ['/pulp/repos']
+        log_func = mock.Mock()
+
+        for i in range(2):
+            self.assertTrue(validator._check_extensions(
+                E_FULL, '/pulp/repos/a/repomd.xml', log_func, prefixes))
+        validator._check_extensions(E_FULL, '/pulp/repos/b/repomd.xml', log_func, prefixes)
+
+        mock_certificate.create_from_pem.assert_called_once_with(E_FULL)
+        self.assertEqual(mock_cert.check_path.call_count, 2)
+        mock_expiration.assert_called_with(E_FULL, oid_validation.DEFAULT_VERDICT_TTL)
+
+    @mock.patch('pulp.oid_validation.oid_validation.certificate')
+    def test_check_extensions_not_cached(self, mock_certificate):
+        self.write_config('false', verdict_ttl=0)
+        mock_cert = mock_certificate.create_from_pem.return_value
+        mock_cert.check_path.return_value = False
+        validator = self.engine.validator()
+        prefixes = ['/pulp/repos']
+
+        for i in range(2):
+            self.assertFalse(validator._check_extensions(
+                E_FULL, '/pulp/repos/a/repomd.xml', mock.Mock(), prefixes))
+
+        self.assertEqual(mock_cert.check_path.call_count, 2)
+        self.assertEqual(len(self.engine.verdicts), 0)
+
+    def test_verdict_ttl(self):
+        self.assertEqual(oid_validation.verdict_ttl(self.engine.config()),
+                         oid_validation.DEFAULT_VERDICT_TTL)
+
+        self.write_config('false', verdict_ttl=5)
+        self.assertEqual(oid_validation.verdict_ttl(self.engine.config()), 5)
+
+        self.write_config('false', verdict_ttl='soon')
+        self.assertEqual(oid_validation.verdict_ttl(self.engine.config()),
+                         oid_validation.DEFAULT_VERDICT_TTL)
+
+    @mock.patch('pulp.oid_validation.oid_validation.X509')
+    @mock.patch('pulp.oid_validation.oid_validation.time')
+    def test_expiration(self, mock_time, mock_x509):
+        mock_time.return_value = 1000
+        not_after = mock_x509.load_cert_string.return_value.get_not_after.return_value
+        not_after.get_datetime.return_value = datetime(1970, 1, 1, 0, 1, tzinfo=utc_tz())
+        self.assertEqual(oid_validation.expiration(E_FULL, 30), 60)
+
+        not_after.get_datetime.return_value = datetime(2100, 1, 1, tzinfo=utc_tz())
+        self.assertEqual(oid_validation.expiration(E_FULL, 30), 1030)
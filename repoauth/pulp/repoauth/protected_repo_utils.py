@@ -4,6 +4,7 @@ repo information.
 '''
 
 import os
+import urllib
 from threading import RLock
 
 # -- constants ----------------------------------------------------------------------
@@ -78,6 +79,16 @@ class ProtectedRepoUtils:
         f.load()
         return f.listings
 
+    def read_protected_repo_index(self):
+        '''
+        Reads in the protected repo listings as an index used to find the repo
+        a request path belongs to.
+
+        @return: index of the protected repos
+        @rtype:  ProtectedRepoIndex
+        '''
+        return ProtectedRepoIndex(self.read_protected_repo_listings())
+
 
 # -- classes -------------------------------------------------------------------------
 
@@ -123,7 +134,15 @@ class ProtectedRepoListingFile:
         contents = f.read()
         f.close()
 
-        # Parse into data structure
+        self.parse(contents)
+
+    def parse(self, contents):
+        '''
+        Parses the contents of a repo file into the listings.
+
+        @param contents: contents of a repo file
+        @type  contents: str
+        '''
         for line in contents.split('\n'):
             pieces = line.split(',')
             if len(pieces) == 2:
@@ -173,3 +192,86 @@ class ProtectedRepoListingFile:
         @type  relative_path_url: str
         '''
         self.listings.pop(relative_path_url, None)  # will not error if key isn't present
+
+
+class ProtectedRepoIndex:
+    '''
+    Index of the protected repo listings used to find the repo a request path
+    belongs to. The relative paths are stored in a trie of path segments, so
+    the cost of a lookup depends on the depth of the path and not on the
+    number of protected repos.
+
+    Relative paths are inconsistent in Pulp, so they match any contiguous run
+    of segments in the request path, and leading, trailing and duplicated
+    slashes are ignored. The query string and the parameters of each segment
+    are ignored too, and the segments are percent-decoded, so they are compared
+    the way the web server maps the request to a file.
+    '''
+
+    # trie node key under which the repo ID is stored; never a path segment
+    REPO_ID = None
+
+    def __init__(self, listings):
+        '''
+        @param listings: mapping of relative path URL to repo ID
+        @type  listings: dict {str, str}
+        '''
+        self.root = {}
+        for relative_path_url, repo_id in listings.items():
+            self.add(relative_path_url, repo_id)
+
+    @staticmethod
+    def segments(path):
+        '''
+        @param path: URL path, which may include a query string and segment parameters
+        @type  path: str
+
+        @return: the non-empty, percent-decoded segments of the path, without parameters
+        @rtype:  list of str
+        '''
+        path = path.split('?', 1)[0].split('#', 1)[0]
+        segments = (segment.split(';', 1)[0] for segment in path.split('/'))
+        return [urllib.unquote(segment) for segment in segments if segment]
+
+    def add(self, relative_path_url, repo_id):
+        '''
+        Adds a protected repo to the index. Empty relative paths are ignored.
+
+        @param relative_path_url: relative path for the repo
+        @type  relative_path_url: str
+
+        @param repo_id: id of the repo
+        @type  repo_id: str
+        '''
+        segments = self.segments(relative_path_url)
+        if not segments:
+            return
+        node = self.root
+        for segment in segments:
+            node = node.setdefault(segment, {})
+        node[self.REPO_ID] = repo_id
+
+    def find(self, path):
+        '''
+        Finds the repo a request path belongs to. When the relative paths of
+        several repos are found in the path, the one found closest to the start
+        of the path wins, and then the longest one.
+
+        @param path: request path
+        @type  path: str
+
+        @return: id of the repo; None if the path does not belong to a protected repo
+        @rtype:  str
+        '''
+        segments = self.segments(path)
+        for start in range(len(segments)):
+            node = self.root
+            repo_id = None
+            for segment in segments[start:]:
+                node = node.get(segment)
+                if node is None:
+                    break
+                repo_id = node.get(self.REPO_ID, repo_id)
+            if repo_id is not None:
+                return repo_id
+        return None
@@ -123,10 +123,8 @@ class RepoCertUtils:
         for suffix in pieces:
             filename = os.path.join(cert_dir, '%s.%s' % (GLOBAL_BUNDLE_PREFIX, suffix))
 
-            if os.path.exists(filename):
-                f = open(filename, 'r')
-                contents = f.read()
-                f.close()
+            contents = self._read_file(filename)
+            if contents is not None:
                 result = result or {}
                 result[suffix] = contents
             elif self.log_failed_cert_verbose and log_func:
@@ -176,10 +174,8 @@ class RepoCertUtils:
         for suffix in pieces:
             filename = os.path.join(cert_dir, 'consumer-%s.%s' % (repo_id, suffix))
 
-            if os.path.exists(filename):
-                f = open(filename, 'r')
-                contents = f.read()
-                f.close()
+            contents = self._read_file(filename)
+            if contents is not None:
                 result = result or {}
                 result[suffix] = contents
 
@@ -433,6 +429,24 @@ class RepoCertUtils:
 
     # -- private ----------------------------------------------------------------------------
 
+    def _read_file(self, filename):
+        '''
+        Reads the contents of a cert bundle file.
+
+        @param filename: absolute path to the file
+        @type  filename: str
+
+        @return: the contents of the file; None if the file does not exist
+        @rtype:  str
+        '''
+        if not os.path.exists(filename):
+            return None
+        f = open(filename, 'r')
+        try:
+            return f.read()
+        finally:
+            f.close()
+
     def _write_cert_bundle(self, file_prefix, cert_dir, bundle):
         '''
         Writes the files represented by the cert bundle to a directory on the
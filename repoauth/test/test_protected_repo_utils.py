@@ -5,7 +5,8 @@ import os
 import shutil
 import unittest
 
-from pulp.repoauth.protected_repo_utils import ProtectedRepoListingFile, ProtectedRepoUtils
+from pulp.repoauth.protected_repo_utils import (ProtectedRepoIndex, ProtectedRepoListingFile,
+                                                ProtectedRepoUtils)
 
 
 # -- constants -----------------------------------------------------------------------
@@ -68,6 +69,21 @@ class TestProtectedRepoUtils(unittest.TestCase):
 
         self.assertEqual(0, len(listings))
 
+    def test_read_protected_repo_index(self):
+        """
+        Tests reading the listings as an index.
+        """
+
+        # Setup
+        self.utils.add_protected_repo('/pulp/fedora-14/x86_64', 'repo-x')
+
+        # Test
+        index = self.utils.read_protected_repo_index()
+
+        # Verify
+        self.assertEqual(index.find('/repos/pulp/fedora-14/x86_64/repodata/repomd.xml'), 'repo-x')
+        self.assertEqual(index.find('/repos/pulp/fedora-13/x86_64/repodata/repomd.xml'), None)
+
 
 class TestProtectedRepoListingFile(unittest.TestCase):
     def setUp(self):
@@ -166,3 +182,56 @@ class TestProtectedRepoListingFile(unittest.TestCase):
 
         # Verify
         self.assertEqual(1, len(f.listings))
+
+
+class TestProtectedRepoIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = ProtectedRepoIndex({
+            '/pulp/fedora-14/x86_64': 'repo-x',
+            'pulp/fedora-14/x86_64/updates/': 'repo-x-updates',
+            'pulp//fedora-13': 'repo-y',
+            'i386': 'repo-z',
+            '/': 'repo-empty',
+        })
+
+    def test_find_prefix(self):
+        self.assertEqual(self.index.find('/pulp/fedora-14/x86_64/a.rpm'), 'repo-x')
+        self.assertEqual(self.index.find('pulp/fedora-14/x86_64'), 'repo-x')
+        self.assertEqual(self.index.find('//pulp/fedora-13/x86_64/a.rpm'), 'repo-y')
+
+    def test_find_within(self):
+        self.assertEqual(self.index.find('/repos/pulp/fedora-14/x86_64/a.rpm'), 'repo-x')
+        self.assertEqual(self.index.find('/a/b/i386/a.rpm'), 'repo-z')
+
+    def test_find_longest(self):
+        self.assertEqual(
+            self.index.find('/pulp/fedora-14/x86_64/updates/a.rpm'), 'repo-x-updates')
+
+    def test_find_earliest(self):
+        self.assertEqual(self.index.find('/pulp/fedora-13/i386/a.rpm'), 'repo-y')
+
+    def test_find_segments(self):
+        # relative paths only match whole segments
+        self.assertEqual(self.index.find('/pulp/fedora-14/x86_64_v2/a.rpm'), None)
+        self.assertEqual(self.index.find('/i386-updates/a.rpm'), None)
+
+    def test_find_query(self):
+        self.assertEqual(self.index.find('/repos/pulp/fedora-13?x=1'), 'repo-y')
+        self.assertEqual(self.index.find('/repos/pulp/fedora-13/?x=1/i386'), 'repo-y')
+        self.assertEqual(self.index.find('/pulp/fedora-14/x86_64/a.rpm?x=/i386'), 'repo-x')
+        self.assertEqual(self.index.find('/repos/pulp/fedora-13#x'), 'repo-y')
+
+    def test_find_params(self):
+        self.assertEqual(self.index.find('/repos/pulp/fedora-13;x=1'), 'repo-y')
+        self.assertEqual(self.index.find('/repos/pulp;x=1/fedora-13/a.rpm'), 'repo-y')
+        self.assertEqual(self.index.find('/pulp/fedora-14/x86_64;/a.rpm;x'), 'repo-x')
+
+    def test_find_quoted(self):
+        self.assertEqual(self.index.find('/repos/pulp/fedora%2D13/a.rpm'), 'repo-y')
+        self.assertEqual(self.index.find('/repos/%70ulp/fedora-14/x86_64'), 'repo-x')
+
+    def test_find_none(self):
+        self.assertEqual(self.index.find('/pulp/fedora-12/x86_64/a.rpm'), None)
+        self.assertEqual(self.index.find('/'), None)
+        self.assertEqual(self.index.find(''), None)
@@ -5,6 +5,7 @@ import sys
 from pymongo.errors import DuplicateKeyError
 
 from pulp.plugins.model import Unit, PublishReport
+from pulp.plugins.util.misc import paginate
 from pulp.server.async.tasks import get_current_task_id
 from pulp.server.controllers import units as units_controller
 from pulp.server.db import model
@@ -501,6 +502,34 @@ class AddUnitMixin(object):
             _logger.exception(_('Content unit association failed [%s]' % str(unit)))
             raise ImporterConduitException(e), None, sys.exc_info()[2]
 
+    def save_units(self, units):
+        """
+        Performs the same steps as save_unit for many units. Rather than one at
+        a time, the units are associated to the repository in bulk, which saves
+        several database writes per unit.
+
+        :param units: unit objects returned from the init_unit call
+        :type  units: iterable of Unit
+
+        :return: object references to the provided units, their state updated from the call
+        :rtype:  list of Unit
+        """
+        # Circular import avoidance, since the repository controller imports the conduits
+        from pulp.server.controllers import repository as repo_controller
+        saved = []
+        try:
+            for chunk in paginate(units, repo_controller.UNIT_CHUNK_SIZE):
+                for unit in chunk:
+                    pulp_unit = common_utils.to_pulp_unit(unit)
+                    unit.id = self._update_unit(unit, pulp_unit)
+                repo_controller.associate_units_by_id(
+                    self.repo_id, [(unit.type_id, unit.id) for unit in chunk])
+                saved.extend(chunk)
+            return saved
+        except Exception, e:
+            _logger.exception(_('Content unit association failed'))
+            raise ImporterConduitException(e), None, sys.exc_info()[2]
+
     def _update_unit(self, unit, pulp_unit):
         """
         Update a unit. If it is not found, add it.
@@ -241,3 +241,37 @@ class Profiler(object):
         :rtype:               list of str
         """
         raise NotImplementedError()
+
+    def calculate_applicable_units_delta(self, unit_profile, bound_repo_id, added, removed,
+                                         config, conduit):
+        """
+        Calculate and return which of the content units added to the bound repository since
+        applicability was last calculated are applicable to consumers with given unit_profile.
+        The result is merged into the previously calculated applicability, from which the content
+        units removed from the bound repository are dropped.
+
+        Profilers that do not implement this method, or that raise NotImplementedError because
+        the change cannot be applied incrementally, have applicability recalculated against all
+        content units belonging to the bound repository instead.
+
+        :param unit_profile:  a consumer unit profile
+        :type  unit_profile:  object
+        :param bound_repo_id: repo id of a repository to be used to calculate applicability
+                              against the given consumer profile
+        :type  bound_repo_id: str
+        :param added:         a dictionary mapping content type ids to lists of ids of the
+                              content units added to the bound repository
+        :type  added:         dict
+        :param removed:       a dictionary mapping content type ids to lists of ids of the
+                              previously applicable content units removed from the bound
+                              repository
+        :type  removed:       dict
+        :param config:        plugin configuration
+        :type  config:        pulp.server.plugins.config.PluginCallConfiguration
+        :param conduit:       provides access to relevant Pulp functionality
+        :type  conduit:       pulp.plugins.conduits.profile.ProfilerConduit
+        :return:              a dictionary mapping content type ids to lists of ids of the added
+                              content units that are applicable
+        :rtype:               dict
+        """
+        raise NotImplementedError()
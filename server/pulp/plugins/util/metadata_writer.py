@@ -3,7 +3,9 @@ import glob
 import gzip
 import logging
 import os
+import Queue
 import shutil
+import threading
 import traceback
 
 
@@ -15,11 +17,69 @@ from pulp.server.util import CHECKSUM_FUNCTIONS
 from pulp.plugins.util import misc
 _LOG = logging.getLogger(__name__)
 BUFFER_SIZE = 1024
+# the number of units that may be waiting to be written by each writer of a MetadataFanOut
+FAN_OUT_QUEUE_SIZE = 100
+
+
+class ChecksumWriter(object):
+    """
+    File-like object that writes through to another file object, and counts and optionally
+    checksums the data as it is written.
+
+    Any other attribute is looked up on the wrapped file object.
+
+    :ivar file_object: the wrapped file object
+    :type file_object: file
+    :ivar checksum: the checksum of the data written, or None
+    :type checksum: hashlib.HASH
+    :ivar size: the number of bytes written
+    :type size: int
+    """
+
+    def __init__(self, file_object, checksum_constructor=None):
+        """
+        :param file_object: the file object to write to
+        :type  file_object: file
+        :param checksum_constructor: constructor of the checksum to calculate, such as
+                                     hashlib.sha256. If None, no checksum is calculated.
+        :type  checksum_constructor: callable or None
+        """
+        self.file_object = file_object
+        self.checksum = checksum_constructor() if checksum_constructor is not None else None
+        self.size = 0
+
+    def __getattr__(self, name):
+        return getattr(self.file_object, name)
+
+    def write(self, data):
+        """
+        Write data to the wrapped file object.
+
+        :param data: the data to write
+        :type  data: str
+        """
+        self.file_object.write(data)
+        if self.checksum is not None:
+            self.checksum.update(data)
+        self.size += len(data)
+
+    def hexdigest(self):
+        """
+        :return: the hex digest of the data written, or None if no checksum is calculated
+        :rtype:  str or None
+        """
+        if self.checksum is None:
+            return None
+        return self.checksum.hexdigest()
 
 
 class MetadataFileContext(object):
     """
     Context manager class for metadata file generation.
+
+    The checksum of the file is calculated as it is written. After the file is finalized, the
+    checksum and size of the file are available as the checksum and size attributes, and the
+    checksum and size of its uncompressed content as the open_checksum and open_size attributes.
     """
 
     def __init__(self, metadata_file_path, checksum_type=None):
@@ -36,6 +96,12 @@ class MetadataFileContext(object):
         self.metadata_file_handle = None
         self.checksum_type = checksum_type
         self.checksum = None
+        self.size = None
+        self.open_checksum = None
+        self.open_size = None
+        self.checksum_constructor = None
+        # the writer of the file on disk, which may be wrapped by a gzip file handle
+        self._file_writer = None
         if self.checksum_type is not None:
             checksum_function = CHECKSUM_FUNCTIONS.get(checksum_type)
             if not checksum_function:
@@ -93,14 +159,21 @@ class MetadataFileContext(object):
         except Exception, e:
             _LOG.exception(e)
 
+        if self._file_writer is not None:
+            self.checksum = self._file_writer.hexdigest()
+            self.size = self._file_writer.size
+            if isinstance(self.metadata_file_handle, ChecksumWriter):
+                self.open_checksum = self.metadata_file_handle.hexdigest()
+                self.open_size = self.metadata_file_handle.size
+
         # Add calculated checksum to the filename
         file_name = os.path.basename(self.metadata_file_path)
         if self.checksum_type is not None:
-            with open(self.metadata_file_path, 'rb') as file_handle:
-                content = file_handle.read()
-                checksum = self.checksum_constructor(content).hexdigest()
+            if self.checksum is None:
+                # the file handle was not opened by _open_metadata_file_handle()
+                self.checksum = self._calculate_checksum()
 
-            self.checksum = checksum
+            checksum = self.checksum
             file_name_with_checksum = checksum + '-' + file_name
             new_file_path = os.path.join(os.path.dirname(self.metadata_file_path),
                                          file_name_with_checksum)
@@ -109,6 +182,20 @@ class MetadataFileContext(object):
 
         # Set the metadata_file_handle to None so we don't double call finalize
         self.metadata_file_handle = None
+        self._file_writer = None
+
+    def _calculate_checksum(self):
+        """
+        Calculate the checksum of the metadata file by reading it.
+
+        :return: the hex digest of the metadata file
+        :rtype:  str
+        """
+        checksum = self.checksum_constructor()
+        with open(self.metadata_file_path, 'rb') as file_handle:
+            for content in iter(lambda: file_handle.read(BUFFER_SIZE), ''):
+                checksum.update(content)
+        return checksum.hexdigest()
 
     def _open_metadata_file_handle(self):
         """
@@ -142,11 +229,16 @@ class MetadataFileContext(object):
         msg = _('Opening metadata file handle for [%(p)s]')
         _LOG.debug(msg % {'p': self.metadata_file_path})
 
+        self._file_writer = ChecksumWriter(open(self.metadata_file_path, 'wb'),
+                                           self.checksum_constructor)
         if self.metadata_file_path.endswith('.gz'):
-            self.metadata_file_handle = gzip.open(self.metadata_file_path, 'w')
+            gzip_handle = gzip.GzipFile(self.metadata_file_path, 'wb', fileobj=self._file_writer)
+            # close the file along with the gzip file handle, as gzip.open() does
+            gzip_handle.myfileobj = self._file_writer
+            self.metadata_file_handle = ChecksumWriter(gzip_handle, self.checksum_constructor)
 
         else:
-            self.metadata_file_handle = open(self.metadata_file_path, 'w')
+            self.metadata_file_handle = self._file_writer
 
     def _write_file_header(self):
         """
@@ -437,3 +529,130 @@ class FastForwardXmlFileContext(XmlFileContext):
                 self.original_file_handle.close()
             # We will always have renamed the original file so remove it
             os.unlink(self.existing_file)
+
+
+class MetadataFanOut(object):
+    """
+    Writes each unit to several metadata files at once, with one thread per metadata file.
+
+    Every context is initialized, passed each unit through its add_unit_metadata() method, and
+    finalized on its own thread, so that the generation of one file overlaps the serialization,
+    compression and disk I/O of the others while the units are only iterated once. Each thread is
+    fed through a bounded queue, so no more than queue_size units are held in memory for a writer
+    that falls behind. Use as a context manager, which waits for all the files to be finalized on
+    exit.
+
+    The same unit object is passed to every context, from different threads at the same time, so
+    the add_unit_metadata() method of the contexts must not modify the unit.
+
+    If a context raises an exception, the remaining units are discarded by its thread and the
+    context is finalized so that its file handle is closed. The first exception is raised by the
+    next call to add_unit() or by close().
+
+    :ivar contexts: the contexts the units are written to
+    :type contexts: list of MetadataFileContext
+    :ivar queues: the queue of units of each context
+    :type queues: list
+    :ivar threads: the threads writing the contexts
+    :type threads: list
+    :ivar error: the first exception raised by a context
+    :type error: Exception
+    """
+
+    def __init__(self, contexts, queue_size=FAN_OUT_QUEUE_SIZE):
+        """
+        :param contexts: the contexts to write the units to. Each must implement
+                         add_unit_metadata(unit) without modifying the unit.
+        :type  contexts: list of MetadataFileContext
+        :param queue_size: the number of units that may be waiting to be written by each context
+        :type  queue_size: int
+        """
+        self.contexts = list(contexts)
+        self.queues = [Queue.Queue(maxsize=queue_size) for _i in self.contexts]
+        self.threads = [threading.Thread(target=self._run, args=(context, queue))
+                        for context, queue in zip(self.contexts, self.queues)]
+        self.error = None
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(raise_error=exc_type is None)
+
+    def add_unit(self, unit):
+        """
+        Queue a unit to be written to every context, blocking while any of them is behind.
+
+        :param unit: the unit to write, which is shared by the contexts and must not be modified
+                     until they are closed
+        :type  unit: object
+        :raises Exception: the first exception raised by a context
+        """
+        if self.error is not None:
+            raise self.error
+        for queue in self.queues:
+            queue.put(unit)
+
+    def close(self, raise_error=True):
+        """
+        Wait for all the queued units to be written and the contexts to be finalized, and stop
+        the threads.
+
+        :param raise_error: raise the first exception raised by a context
+        :type  raise_error: bool
+        """
+        for queue in self.queues:
+            queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if raise_error and self.error is not None:
+            raise self.error
+
+    def _run(self, context, queue):
+        """
+        Initialize the context, write the units in the queue to it until None is found, and
+        finalize it.
+
+        :param context: the context to write to
+        :type  context: MetadataFileContext
+        :param queue: the queue of units
+        :type  queue: Queue.Queue
+        """
+        failed = False
+        try:
+            context.initialize()
+        except Exception, e:
+            failed = True
+            self._fail(context, e)
+        while True:
+            unit = queue.get()
+            if unit is None:
+                break
+            if failed:
+                continue
+            try:
+                context.add_unit_metadata(unit)
+            except Exception, e:
+                failed = True
+                self._fail(context, e)
+        try:
+            context.finalize()
+        except Exception, e:
+            self._fail(context, e)
+
+    def _fail(self, context, e):
+        """
+        Log and record an exception raised by a context.
+
+        :param context: the context that raised the exception
+        :type  context: MetadataFileContext
+        :param e: the exception
+        :type  e: Exception
+        """
+        _LOG.exception(_('Writing metadata file [%(p)s] failed') %
+                       {'p': context.metadata_file_path})
+        if self.error is None:
+            self.error = e
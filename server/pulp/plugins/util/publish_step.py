@@ -5,9 +5,11 @@ import hashlib
 import itertools
 import logging
 import os
+import Queue
 import shutil
 import sys
 import tarfile
+import threading
 import time
 import traceback
 import uuid
@@ -19,6 +21,7 @@ from pulp.common import error_codes
 from pulp.common.plugins import reporting_constants, importer_constants
 from pulp.common.util import encode_unicode
 from pulp.plugins.util import manifest_writer, misc
+from pulp.plugins.util.metadata_writer import FAN_OUT_QUEUE_SIZE, MetadataFanOut
 from pulp.plugins.util.nectar_config import importer_config_to_nectar_config
 from pulp.server.controllers import repository as repo_controller
 from pulp.server.db.model.criteria import Criteria, UnitAssociationCriteria
@@ -49,6 +52,75 @@ def _post_order(step):
     yield step
 
 
+class ProgressReporter(object):
+    """
+    Throttles the writes of a step tree's progress report to its status conduit.
+
+    A report that is not forced is only written once the minimum interval has passed since the
+    previous write, and only if a step in the tree has changed since then. A change to the number
+    of items a step has processed only counts once it amounts to the minimum delta of the step's
+    total. Any other change to a step, such as to its state, its number of failures or its
+    progress details, always counts.
+    """
+
+    def __init__(self, interval=None, delta=None):
+        """
+        :param interval: minimum number of seconds between two writes that are not forced;
+                         defaults to the progress_report_interval setting
+        :type  interval: float
+        :param delta:    minimum percentage of a step's items that must have been processed for
+                         the step to count as changed; defaults to the progress_report_delta setting
+        :type  delta:    float
+        """
+        if interval is None:
+            interval = pulp_config.getfloat('tasks', 'progress_report_interval')
+        if delta is None:
+            delta = pulp_config.getfloat('tasks', 'progress_report_delta')
+        self.interval = interval
+        self.delta = delta / 100.0
+        self.last_report_time = 0
+        # step uuid -> progress snapshot of the step at the last write
+        self._reported = {}
+
+    def report(self, step, force=False):
+        """
+        Write the progress report of the step tree if it is forced or due.
+
+        :param step:  root of the step tree
+        :type  step:  Step
+        :param force: whether the report should be written regardless of the throttle
+        :type  force: bool
+        :return:      whether the report was written
+        :rtype:       bool
+        """
+        current_time = time.time()
+        if not force:
+            if current_time - self.last_report_time < self.interval or not self.changed(step):
+                return False
+        step.get_status_conduit().set_progress(step.get_progress_report())
+        self.last_report_time = current_time
+        self._reported = dict((s.uuid, s._progress_snapshot()) for s in _post_order(step))
+        return True
+
+    def changed(self, step):
+        """
+        :param step: root of the step tree
+        :type  step: Step
+        :return:     whether any step in the tree changed enough since the last write to be
+                     reported again
+        :rtype:      bool
+        """
+        for s in _post_order(step):
+            previous = self._reported.get(s.uuid)
+            current = s._progress_snapshot()
+            if previous is None or previous[1:] != current[1:]:
+                return True
+            processed = abs(current[0] - previous[0])
+            if processed and processed >= self.delta * max(s.total_units, 1):
+                return True
+        return False
+
+
 class Step(object):
     """
     Base class for step processing. The only tie to the platform is an assumption of
@@ -59,7 +131,8 @@ class Step(object):
     Override the process_main() method and do your work there.
 
     If you are iterating over items and doing the same work on each, also override the
-    get_iterator() and get_total() methods.
+    get_iterator() and get_total() methods. If that work is safe to do for several items at once,
+    pass max_workers to have process_main() called from a pool of threads.
 
     A partial map of the execution flow:
 
@@ -67,10 +140,12 @@ class Step(object):
     |
     +-- initialize()
     |
-    +-- _process_block()
+    +-- _process_block() or _process_concurrently()
     |   |
     |   +-- process_main()
     |   |
+    |   +-- on_item_processed()
+    |   |
     |   +-- report_progress()
     |
     +-- finalize()
@@ -80,7 +155,7 @@ class Step(object):
     """
 
     def __init__(self, step_type, status_conduit=None, non_halting_exceptions=None,
-                 disable_reporting=False):
+                 disable_reporting=False, max_workers=1, ordered=True):
         """
         :param step_type: The id of the step this processes
         :type step_type: str
@@ -90,6 +165,14 @@ class Step(object):
         :type non_halting_exceptions: list of Exception
         :param disable_reporting: Disable progress reporting for this step or any child steps
         :type disable_reporting: bool
+        :param max_workers: The number of threads process_main() is called from for the items of
+                            get_iterator(). Only use more than 1 if process_main() is thread safe
+                            and does not update the progress of the step itself.
+        :type max_workers: int
+        :param ordered: Whether on_item_processed() is called for the items in the order of
+                        get_iterator() when they are processed by multiple threads, rather than in
+                        the order they finish in
+        :type ordered: bool
         """
         self.status_conduit = status_conduit
         self.uuid = str(uuid.uuid4())
@@ -104,12 +187,16 @@ class Step(object):
         self.error_details = []
         self.total_units = 1
         self.children = []
-        self.last_report_time = 0
         self.last_reported_state = self.state
+        self.progress_reporter = None
+        # (snapshot, child reports, report) of the last progress report built by this step
+        self._report_cache = None
         self.timestamp = str(time.time())
         self.non_halting_exceptions = non_halting_exceptions or []
         self.exceptions = []
         self.disable_reporting = disable_reporting
+        self.max_workers = max_workers
+        self.ordered = ordered
 
     def add_child(self, step):
         """
@@ -231,7 +318,13 @@ class Step(object):
                 self.initialize()
                 self.report_progress()
                 item_iterator = self.get_iterator()
-                if item_iterator is not None:
+                if item_iterator is not None and self.max_workers > 1:
+                    self._process_concurrently(item_iterator)
+                    self.progress_details = ""
+                    if self.exceptions:
+                        raise PulpCodedTaskFailedException(error_code=error_codes.PLP0032,
+                                                           task_id=self.status_conduit.task_id)
+                elif item_iterator is not None:
                     # We are using a generator and will call _process_block for each item
                     for item in item_iterator:
                         if self.canceled:
@@ -239,14 +332,7 @@ class Step(object):
                         try:
                             self._process_block(item=item)
                         except Exception as e:
-                            raise_exception = True
-                            for exception in self.non_halting_exceptions:
-                                if isinstance(e, exception):
-                                    raise_exception = False
-                                    self._record_failure(e=e)
-                                    self.exceptions.append(e)
-                                    break
-                            if raise_exception:
+                            if not self._handle_non_halting_exception(e):
                                 raise
                         # Clean out the progress_details for the individual item
                         self.progress_details = ""
@@ -290,6 +376,35 @@ class Step(object):
         """
         pass
 
+    def on_item_processed(self, item, result):
+        """
+        Called with the value returned by process_main() for each item it processed successfully.
+        This is always called from the thread running the step, so it is the place to write the
+        results of items that were processed concurrently.
+
+        :param item: The item that was processed or None if this get_iterator is not defined
+        :type item: object or None
+        :param result: The value returned by process_main()
+        :type result: object
+        """
+        pass
+
+    def _handle_non_halting_exception(self, e):
+        """
+        Record the failure of an item if its exception is one of the non halting exceptions.
+
+        :param e: The exception raised while processing the item
+        :type e: Exception
+        :return: Whether the exception is non halting
+        :rtype: bool
+        """
+        for exception in self.non_halting_exceptions:
+            if isinstance(e, exception):
+                self._record_failure(e=e)
+                self.exceptions.append(e)
+                return True
+        return False
+
     def _process_block(self, item=None):
         """
         This is part of the workflow internals that should not be overridden unless you are sure of
@@ -299,14 +414,117 @@ class Step(object):
         failures = self.progress_failures
         # Need to keep backwards compatibility
         if item:
-            self.process_main(item=item)
+            result = self.process_main(item=item)
+        else:
+            result = self.process_main()
+        if failures == self.progress_failures:
+            self._item_processed(item, result)
         else:
-            self.process_main()
-        if failures == self.progress_failures and \
-                self.progress_successes + failures < self.get_total():
+            self.report_progress()
+
+    def _item_processed(self, item, result):
+        """
+        Count an item as processed successfully and report the progress of the step.
+        """
+        if self.progress_successes + self.progress_failures < self.get_total():
             self.progress_successes += 1
+        self.on_item_processed(item, result)
         self.report_progress()
 
+    def _process_concurrently(self, item_iterator):
+        """
+        Call process_main() for each item from a pool of max_workers threads.
+
+        Items are fed to the threads as they become available, while no more than twice as many
+        items as there are threads are waiting or being processed. The progress of the step is
+        updated from the thread running the step. An item that raises one of the non halting
+        exceptions is recorded as a failure. Any other exception, or canceling the step, stops the
+        processing of the items that have not been started yet; the exception is raised once the
+        items being processed have finished.
+
+        :param item_iterator: The items to process
+        :type item_iterator: iterator
+        """
+        items = Queue.Queue()
+        results = Queue.Queue()
+        stop = threading.Event()
+        skipped = object()
+        window = self.max_workers * 2
+        # index of an item -> (item, result, exc_info), for results that cannot be delivered yet
+        pending = {}
+        state = {'submitted': 0, 'delivered': 0, 'error': None}
+
+        def worker():
+            while True:
+                work = items.get()
+                if work is None:
+                    return
+                index, item = work
+                if stop.is_set():
+                    results.put((index, item, skipped, None))
+                    continue
+                try:
+                    results.put((index, item, self.process_main(item=item), None))
+                except Exception:
+                    results.put((index, item, None, sys.exc_info()))
+
+        def deliver(item, result, exc_info):
+            state['delivered'] += 1
+            if result is skipped:
+                return
+            if exc_info is None:
+                self._item_processed(item, result)
+            elif self._handle_non_halting_exception(exc_info[1]):
+                self.report_progress()
+            elif state['error'] is None:
+                state['error'] = exc_info
+                stop.set()
+            # Clean out the progress_details for the individual item
+            self.progress_details = ""
+
+        def collect(block):
+            try:
+                index, item, result, exc_info = results.get(block)
+            except Queue.Empty:
+                return False
+            if not self.ordered:
+                deliver(item, result, exc_info)
+                return True
+            pending[index] = (item, result, exc_info)
+            while state['delivered'] in pending:
+                deliver(*pending.pop(state['delivered']))
+            return True
+
+        threads = [threading.Thread(target=worker) for i in range(self.max_workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            for item in item_iterator:
+                if self.canceled:
+                    stop.set()
+                if stop.is_set():
+                    break
+                while state['submitted'] - state['delivered'] >= window:
+                    collect(True)
+                items.put((state['submitted'], item))
+                state['submitted'] += 1
+                while collect(False):
+                    pass
+            while state['delivered'] < state['submitted']:
+                if self.canceled:
+                    stop.set()
+                collect(True)
+        finally:
+            stop.set()
+            for thread in threads:
+                items.put(None)
+            for thread in threads:
+                thread.join()
+        if state['error'] is not None:
+            exc_type, exc_value, tb = state['error']
+            raise exc_type, exc_value, tb
+
     def _get_total(self):
         """
         DEPRECATED in favor of get_total()
@@ -339,25 +557,52 @@ class Step(object):
         if self.parent:
             self.parent.report_progress(force)
         else:
-            if force:
-                self.get_status_conduit().set_progress(self.get_progress_report())
-            else:
-                current_time = time.time()
-                if current_time != self.last_report_time:
-                    # Update at most once a second
-                    self.get_status_conduit().set_progress(self.get_progress_report())
-                    self.last_report_time = current_time
+            if self.progress_reporter is None:
+                self.progress_reporter = ProgressReporter()
+            self.progress_reporter.report(self, force)
+
+    def _progress_snapshot(self):
+        """
+        Return the values of this step that its progress report is built from. The number of
+        processed items comes first, followed by the values whose every change is reported. The
+        progress details are copied, so that changes made to them in place are detected.
+
+        :return: the progress values of this step
+        :rtype:  tuple
+        """
+        return (self.progress_successes + self.progress_failures, self.state,
+                self.progress_failures, len(self.error_details), self.total_units,
+                self.description, self.step_id, copy.deepcopy(self.progress_details))
 
     def get_progress_report(self):
         """
         Return the machine readable progress report for this task
 
+        :returns: The machine readable progress report for this task
+        :rtype: dict
+        """
+        return copy.deepcopy(self._get_progress_report())
+
+    def _get_progress_report(self):
+        """
+        Return the progress report for this task, which is only rebuilt if this step or one of its
+        children has changed since it was last built. The report is shared with the cache, so it
+        must not be modified.
+
         :returns: The machine readable progress report for this task
         :rtype: dict
         """
         if self.progress_failures > 0:
             self.state = reporting_constants.STATE_FAILED
 
+        child_reports = [step._get_progress_report() for step in self.children]
+        snapshot = self._progress_snapshot()
+        if self._report_cache is not None:
+            cached_snapshot, cached_child_reports, cached_report = self._report_cache
+            if cached_snapshot == snapshot and len(cached_child_reports) == len(child_reports) \
+                    and all(a is b for a, b in zip(cached_child_reports, child_reports)):
+                return cached_report
+
         total_processed = self.progress_successes + self.progress_failures
         report = {
             reporting_constants.PROGRESS_STEP_UUID: self.uuid,
@@ -369,18 +614,18 @@ class Step(object):
             reporting_constants.PROGRESS_NUM_FAILURES_KEY: self.progress_failures,
             reporting_constants.PROGRESS_ITEMS_TOTAL_KEY: self.total_units,
             reporting_constants.PROGRESS_DESCRIPTION_KEY: self.description,
-            reporting_constants.PROGRESS_DETAILS_KEY: self.progress_details
+            reporting_constants.PROGRESS_DETAILS_KEY: snapshot[-1]
         }
+        result = [report]
         if self.children:
-            child_reports = []
-            for step in self.children:
-                child_reports.extend(step.get_progress_report())
-            report[reporting_constants.PROGRESS_SUB_STEPS_KEY] = child_reports
+            sub_steps = list(chain.from_iterable(child_reports))
+            report[reporting_constants.PROGRESS_SUB_STEPS_KEY] = sub_steps
             # Root object is just a list of reports, this should be the object at some point
             if self.parent is None:
-                return child_reports
+                result = sub_steps
 
-        return [report]
+        self._report_cache = (snapshot, child_reports, result)
+        return result
 
     def _record_failure(self, e=None, tb=None):
         """
@@ -662,6 +907,71 @@ class UnitModelPluginStep(PluginStep):
         return self._total
 
 
+class MetadataFanOutStep(UnitModelPluginStep):
+    """
+    Writes several metadata files from a single iteration over the units of the repository.
+
+    Each unit is passed to the add_unit_metadata() method of every metadata file context, with
+    each context written on its own thread by a MetadataFanOut, so the contexts must not modify
+    the units they are given. Either pass the contexts to the constructor, or override
+    get_contexts() to create them once the working directory is known. The contexts are
+    finalized when the step is finalized.
+    """
+
+    def __init__(self, step_type, model_classes, contexts=None, queue_size=FAN_OUT_QUEUE_SIZE,
+                 **kwargs):
+        """
+        :param step_type: The id of the step this processes
+        :type  step_type: str
+        :param model_classes: list of ContentUnit subclasses that should be queried
+        :type  model_classes: list
+        :param contexts: the metadata file contexts to write the units to
+        :type  contexts: list of pulp.plugins.util.metadata_writer.MetadataFileContext
+        :param queue_size: the number of units that may be waiting to be written by each context
+        :type  queue_size: int
+        """
+        super(MetadataFanOutStep, self).__init__(step_type, model_classes, **kwargs)
+        self.contexts = contexts or []
+        self.queue_size = queue_size
+        self.fan_out = None
+
+    def get_contexts(self):
+        """
+        :return: the metadata file contexts to write the units to
+        :rtype:  list of pulp.plugins.util.metadata_writer.MetadataFileContext
+        """
+        return self.contexts
+
+    def initialize(self):
+        """
+        Start writing the metadata files.
+        """
+        self.fan_out = MetadataFanOut(self.get_contexts(), self.queue_size)
+
+    def process_main(self, item=None):
+        """
+        Queue a unit to be written to every metadata file.
+
+        :param item: The unit to write
+        :type  item: pulp.server.db.model.ContentUnit
+        """
+        self.fan_out.add_unit(item)
+
+    def finalize(self):
+        """
+        Wait for all the units to be written and the metadata files to be finalized.
+        """
+        if self.fan_out is not None:
+            self.fan_out.close(raise_error=False)
+
+    def post_process(self):
+        """
+        Fail the step if writing any of the metadata files failed.
+        """
+        if self.fan_out is not None and self.fan_out.error is not None:
+            raise self.fan_out.error
+
+
 class PublishStep(PluginStep):
     """
     The PublishStep has been deprecated in favor of the PluginStep
@@ -669,7 +979,7 @@ class PublishStep(PluginStep):
     """
 
     def __init__(self, step_type, repo=None, publish_conduit=None, config=None, working_dir=None,
-                 distributor_type=None):
+                 distributor_type=None, **kwargs):
         """
         Set the default parent, step_type and unit_type for the the publish step
         the unit_type defaults to none since some steps are not used for processing units.
@@ -689,7 +999,7 @@ class PublishStep(PluginStep):
         """
         super(PublishStep, self).__init__(step_type, repo=repo, conduit=publish_conduit,
                                           config=config, working_dir=working_dir,
-                                          plugin_type=distributor_type)
+                                          plugin_type=distributor_type, **kwargs)
 
     def get_distributor_type(self):
         """
@@ -752,7 +1062,7 @@ class UnitPublishStep(PublishStep):
     """
 
     def __init__(self, step_type, unit_type=None, association_filters=None,
-                 unit_fields=None):
+                 unit_fields=None, **kwargs):
         """
         Set the default parent, step_type and unit_type for the the publish step
         the unit_type defaults to none since some steps are not used for processing units.
@@ -762,7 +1072,7 @@ class UnitPublishStep(PublishStep):
         :param unit_type: The type of unit this step processes
         :type unit_type: str or list of str
         """
-        super(UnitPublishStep, self).__init__(step_type)
+        super(UnitPublishStep, self).__init__(step_type, **kwargs)
         if isinstance(unit_type, list):
             self.unit_type = unit_type
         else:
@@ -1265,6 +1575,7 @@ class GetLocalUnitsStep(SaveUnitsStep):
         for units_group in misc.paginate(available_units, self.unit_pagination_size):
             # any units that are already in pulp
             units_we_already_had = set()
+            units_to_associate = []
 
             # Get this group of units
             query = units_controller.find_units(units_group)
@@ -1274,7 +1585,10 @@ class GetLocalUnitsStep(SaveUnitsStep):
                     self.parent.conduit.remove_unit(found_unit)
                 else:
                     units_we_already_had.add(hash(found_unit))
-                    repo_controller.associate_single_unit(self.get_repo().repo_obj, found_unit)
+                    units_to_associate.append(found_unit)
+
+            if units_to_associate:
+                repo_controller.associate_units(self.get_repo().repo_obj, units_to_associate)
 
             for unit in units_group:
                 if hash(unit) not in units_we_already_had:
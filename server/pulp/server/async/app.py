@@ -10,7 +10,8 @@ from datetime import datetime, timedelta
 from gettext import gettext as _
 
 from celery import bootsteps
-from celery.signals import celeryd_after_setup, worker_process_init
+from celery.signals import (celeryd_after_setup, task_postrun, worker_process_init,
+                            worker_process_shutdown)
 import mongoengine
 
 from pulp.common import constants, dateutils
@@ -19,6 +20,7 @@ from pulp.server.async import tasks, worker_watcher
 from pulp.server.constants import PULP_PROCESS_HEARTBEAT_INTERVAL, PULP_PROCESS_TIMEOUT_INTERVAL
 from pulp.server.db.model import Worker, ResourceManagerLock
 from pulp.server.db.connection import reconnect
+from pulp.server.event import dispatch
 from pulp.server.managers.repo import _common as common_utils
 
 # This import will load our configs
@@ -189,6 +191,24 @@ def reconnect_services(sender, **kwargs):
     reconnect()
 
 
+@task_postrun.connect
+def flush_events(sender=None, **kwargs):
+    """
+    Wait for the events fired by a task to be delivered before the worker process
+    takes another task. Worker processes are recycled after a number of tasks, and
+    exit without running atexit handlers, so queued deliveries would otherwise be lost.
+    """
+    dispatch.flush()
+
+
+@worker_process_shutdown.connect
+def flush_events_at_shutdown(sender=None, **kwargs):
+    """
+    Wait for any events still queued to be delivered before a worker process exits.
+    """
+    dispatch.flush()
+
+
 def get_resource_manager_lock(name):
     """
     Tries to acquire the resource manager lock.
@@ -0,0 +1,372 @@
+"""
+This module contains the resource manager's in-process view of resource reservations.
+
+The resource manager is the only process that creates ReservedResource documents, but the
+reservations are released by the workers (through _release_resource) and by the worker cleanup
+routine. Rather than polling the database until a reservation can be made, the resource manager
+keeps a ReservationTable that is written through to the database when a reservation is made, and is
+updated from release notifications that are broadcast on a fanout exchange whenever reservations
+are released. A notification is also broadcast when a new worker is discovered. Dispatch requests
+that cannot be satisfied are parked in per-resource FIFO queues and are woken as soon as a release
+or a new worker is applied to the table.
+
+If the notifications cannot be received, the table falls back to reloading itself from the
+database at the same interval the resource manager used to poll at.
+"""
+from collections import defaultdict, deque
+from gettext import gettext as _
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from kombu import Exchange, Queue
+
+from pulp.server.async.celery_instance import celery
+from pulp.server.db.model import ReservedResource, Worker
+from pulp.server.exceptions import NoWorkers
+
+
+_logger = logging.getLogger(__name__)
+
+RELEASE_EXCHANGE = Exchange('pulp.reservations', type='fanout', durable=False, auto_delete=True)
+
+# The number of seconds a parked dispatch request waits for a notification before the table is
+# reloaded from the database, when notifications are being received. This only guards against
+# lost notifications, since releases and new workers are both notified.
+RESYNC_INTERVAL = 30
+# The number of seconds a parked dispatch request waits before the table is reloaded from the
+# database, when release notifications are not being received.
+POLL_INTERVAL = 0.25
+
+_table = None
+_table_pid = None
+_table_lock = threading.Lock()
+
+
+class ReservationTable(object):
+    """
+    An in-process table of resource reservations.
+
+    The table maps each reserved resource_id to the name of the worker holding it, each worker name
+    to the set of resource_ids it holds, and each task_id to the resource_ids reserved for it.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.RLock())
+        # resource_id -> worker_name
+        self._resources = {}
+        # worker_name -> set of resource_id
+        self._held = defaultdict(set)
+        # task_id -> (worker_name, set of resource_id)
+        self._tasks = {}
+        # resource_id -> deque of task_id waiting to reserve it
+        self._waiters = defaultdict(deque)
+        # incremented every time a reservation is removed from the table or a worker is discovered
+        self._generation = 0
+        self._loaded = False
+        self.listening = False
+
+    def load(self):
+        """
+        Reconcile the table with the ReservedResource documents in the database.
+
+        Reservations in the table whose task no longer has a document are released. Reservations
+        found in the database that the table does not know of are added. Reservations known to both
+        are kept as they are in the table, since the table also tracks every resource of a
+        multi-resource reservation.
+        """
+        reservations = list(ReservedResource.objects.all())
+        with self._condition:
+            # task_id -> (worker_name, list of resource_id)
+            found = {}
+            for r in reservations:
+                found.setdefault(r['task_id'], (r['worker_name'], []))[1].append(r['resource_id'])
+            for task_id in set(self._tasks) - set(found):
+                self._remove(task_id)
+            for task_id, (worker_name, resource_ids) in found.iteritems():
+                if task_id in self._tasks:
+                    continue
+                self._add(task_id, worker_name, resource_ids)
+            self._loaded = True
+            self._condition.notify_all()
+
+    def release(self, task_id):
+        """
+        Remove the reservation held for the given task, waking any parked dispatch requests.
+
+        :param task_id: The UUID of the task whose reservation was released
+        :type  task_id: basestring
+        """
+        with self._condition:
+            if task_id in self._tasks:
+                self._remove(task_id)
+                self._condition.notify_all()
+
+    def release_worker(self, worker_name):
+        """
+        Remove every reservation held by the given worker, waking any parked dispatch requests.
+
+        :param worker_name: The name of the worker whose reservations were released
+        :type  worker_name: basestring
+        """
+        with self._condition:
+            task_ids = [t for t, (name, _r) in self._tasks.iteritems() if name == worker_name]
+            for task_id in task_ids:
+                self._remove(task_id)
+            self._held.pop(worker_name, None)
+            if task_ids:
+                self._condition.notify_all()
+
+    def worker_online(self, worker_name):
+        """
+        Wake any parked dispatch requests, so that they can be dispatched to a new worker.
+
+        :param worker_name: The name of the worker that was discovered
+        :type  worker_name: basestring
+        """
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def holders(self, resource_ids):
+        """
+        Return the names of the workers holding any of the given resources.
+
+        :param resource_ids: The names of the resources
+        :type  resource_ids: list
+        :return:             The names of the workers holding any of the resources
+        :rtype:              set
+        """
+        with self._condition:
+            return set(self._resources[rid] for rid in resource_ids if rid in self._resources)
+
+    def reserved_workers(self):
+        """
+        :return: The names of all workers that hold at least one reservation
+        :rtype:  set
+        """
+        with self._condition:
+            return set(name for name, held in self._held.iteritems() if held)
+
+    def acquire(self, task_id, resource_ids, select_worker):
+        """
+        Block until a worker can be assigned all of the given resources, and reserve them for the
+        task on that worker.
+
+        The worker is the one that already holds any of the resources or, if none of them is
+        held, an idle worker returned by select_worker. While neither is possible the request is
+        parked in a FIFO queue for each of its resources, and it is only granted once it is at
+        the head of all of them, so that requests for the same resource are served in order.
+
+        The reservation is saved to the database as a ReservedResource document before it is
+        recorded in the table.
+
+        :param task_id:       The UUID of the task the resources are reserved for
+        :type  task_id:       basestring
+        :param resource_ids:  The names of the resources to reserve
+        :type  resource_ids:  list
+        :param select_worker: A callable that is passed the names of all reserved workers and
+                              returns an unreserved Worker, or raises NoWorkers
+        :type  select_worker: callable
+        :return:              The Worker the resources were reserved on
+        :rtype:               pulp.server.db.model.Worker
+        """
+        resource_ids = list(resource_ids)
+        with self._condition:
+            if not self._loaded:
+                self.load()
+            for rid in resource_ids:
+                self._waiters[rid].append(task_id)
+            try:
+                while True:
+                    if self._is_next(task_id, resource_ids):
+                        worker = self._find_worker(resource_ids, select_worker)
+                        if worker is not None:
+                            self._reserve(task_id, worker['name'], resource_ids)
+                            return worker
+                    generation = self._generation
+                    self._condition.wait(RESYNC_INTERVAL if self.listening else POLL_INTERVAL)
+                    if generation == self._generation:
+                        # Nothing has been released while waiting, which may mean that a
+                        # notification was missed.
+                        self.load()
+            finally:
+                for rid in resource_ids:
+                    self._waiters[rid].remove(task_id)
+                    if not self._waiters[rid]:
+                        del self._waiters[rid]
+                self._condition.notify_all()
+
+    def _is_next(self, task_id, resource_ids):
+        """
+        :return: True if the task is at the head of the queue of every one of its resources
+        :rtype:  bool
+        """
+        return all(self._waiters[rid][0] == task_id for rid in resource_ids)
+
+    def _find_worker(self, resource_ids, select_worker):
+        """
+        Return the Worker that the resources can be reserved on, or None if there isn't one.
+
+        :param resource_ids:  The names of the resources to reserve
+        :type  resource_ids:  list
+        :param select_worker: See acquire()
+        :type  select_worker: callable
+        :rtype:               pulp.server.db.model.Worker or None
+        """
+        holders = self.holders(resource_ids)
+        if len(holders) == 1:
+            # Exactly one worker holds any of the desired resources
+            return Worker.objects(name=holders.pop()).first()
+        elif not holders:
+            try:
+                return select_worker(self.reserved_workers())
+            except NoWorkers:
+                return None
+        # Multiple workers hold the desired resources
+        return None
+
+    def _reserve(self, task_id, worker_name, resource_ids):
+        for rid in resource_ids:
+            ReservedResource(task_id=task_id, worker_name=worker_name, resource_id=rid).save()
+        self._add(task_id, worker_name, resource_ids)
+
+    def _add(self, task_id, worker_name, resource_ids):
+        self._tasks[task_id] = (worker_name, set(resource_ids))
+        self._held[worker_name].update(resource_ids)
+        for rid in resource_ids:
+            self._resources[rid] = worker_name
+
+    def _remove(self, task_id):
+        worker_name, resource_ids = self._tasks.pop(task_id)
+        held = self._held[worker_name]
+        for rid in resource_ids:
+            # Another task may have reserved the resource on the same worker in the meantime
+            if any(rid in r for name, r in self._tasks.itervalues() if name == worker_name):
+                continue
+            held.discard(rid)
+            if self._resources.get(rid) == worker_name:
+                del self._resources[rid]
+        if not held:
+            del self._held[worker_name]
+        self._generation += 1
+
+
+class ReleaseListener(threading.Thread):
+    """
+    A daemon thread that applies release and worker notifications to a ReservationTable.
+    """
+
+    def __init__(self, table):
+        """
+        :param table: The table to apply release notifications to
+        :type  table: ReservationTable
+        """
+        super(ReleaseListener, self).__init__(name='pulp-reservation-listener')
+        self.daemon = True
+        self.table = table
+
+    def run(self):
+        """
+        Consume notifications, reconnecting to the broker whenever the connection is lost.
+        """
+        queue = Queue('pulp.reservations.%s' % uuid.uuid4(), exchange=RELEASE_EXCHANGE,
+                      exclusive=True, auto_delete=True, durable=False)
+        while True:
+            try:
+                with celery.connection() as connection:
+                    with connection.Consumer(queue, callbacks=[self.on_message],
+                                             accept=['json']):
+                        self.table.listening = True
+                        # Releases that happened before the queue was bound are picked up here.
+                        self.table.load()
+                        while True:
+                            try:
+                                connection.drain_events(timeout=1)
+                            except socket.timeout:
+                                pass
+            except Exception:
+                _logger.exception(_('Lost the connection for reservation notifications.'))
+            self.table.listening = False
+            time.sleep(RESYNC_INTERVAL)
+
+    def on_message(self, body, message):
+        """
+        Apply a notification to the table.
+
+        :param body:    The notification, as sent by notify_released() or notify_worker_online()
+        :type  body:    dict
+        :param message: The received message
+        :type  message: kombu.message.Message
+        """
+        if body.get('task_id'):
+            self.table.release(body['task_id'])
+        if body.get('worker_name'):
+            self.table.release_worker(body['worker_name'])
+        if body.get('worker_online'):
+            self.table.worker_online(body['worker_online'])
+        message.ack()
+
+
+def get_table():
+    """
+    Return this process's ReservationTable, creating it and starting its ReleaseListener if needed.
+
+    :return: The ReservationTable for this process
+    :rtype:  ReservationTable
+    """
+    global _table, _table_pid
+    with _table_lock:
+        # Worker processes are forked, so a table inherited from the parent must not be reused.
+        if _table is None or _table_pid != os.getpid():
+            _table = ReservationTable()
+            _table_pid = os.getpid()
+            ReleaseListener(_table).start()
+        return _table
+
+
+def notify_released(task_id=None, worker_name=None):
+    """
+    Broadcast that the reservations of a task, or of a worker, have been released.
+
+    Failing to send the notification is not fatal, since the resource manager periodically
+    reloads its ReservationTable from the database.
+
+    :param task_id:     The UUID of the task whose reservation was released
+    :type  task_id:     basestring
+    :param worker_name: The name of the worker whose reservations were released
+    :type  worker_name: basestring
+    """
+    _publish({'task_id': task_id, 'worker_name': worker_name}, task_id or worker_name)
+
+
+def notify_worker_online(worker_name):
+    """
+    Broadcast that a new worker has been discovered, so that dispatch requests waiting for an idle
+    worker can use it right away.
+
+    :param worker_name: The name of the worker
+    :type  worker_name: basestring
+    """
+    _publish({'worker_online': worker_name}, worker_name)
+
+
+def _publish(body, name):
+    """
+    Publish a notification to the resource manager, logging any failure.
+
+    :param body: The notification
+    :type  body: dict
+    :param name: The task or worker the notification is about, for logging
+    :type  name: basestring
+    """
+    try:
+        with celery.producer_or_acquire() as producer:
+            producer.publish(body, exchange=RELEASE_EXCHANGE, routing_key='',
+                             serializer='json', declare=[RELEASE_EXCHANGE])
+    except Exception:
+        _logger.warning(_('Unable to send the reservation notification for %(id)s.') %
+                        {'id': name})
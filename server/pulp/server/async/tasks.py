@@ -1,3 +1,4 @@
+from collections import deque
 import cProfile
 from datetime import datetime
 import errno
@@ -5,7 +6,6 @@ from gettext import gettext as _
 import logging
 import os
 import signal
-import time
 import traceback
 import uuid
 
@@ -22,6 +22,7 @@ from pulp.common.constants import RESOURCE_MANAGER_WORKER_NAME, SCHEDULER_WORKER
 from pulp.common import constants, dateutils, tags
 from pulp.plugins.util import misc
 
+from pulp.server.async import reservations
 from pulp.server.async.celery_instance import celery, RESOURCE_MANAGER_QUEUE, \
     DEDICATED_QUEUE_EXCHANGE
 from pulp.server.exceptions import PulpException, MissingResource, \
@@ -37,6 +38,16 @@ from pulp.server.managers.schedule import utils
 controller = control.Control(app=celery)
 _logger = logging.getLogger(__name__)
 
+# The number of completed tasks this process remembers, so that _release_resource does not need to
+# look up the TaskStatus of a task that was run by this process.
+COMPLETED_TASK_IDS_SIZE = 100
+
+# The ids of the tasks most recently completed by this process.
+_completed_task_ids = deque(maxlen=COMPLETED_TASK_IDS_SIZE)
+# The fields of the TaskStatus of running tasks that are written when the task completes, keyed by
+# task id. Only used when the tasks.buffer_task_status setting is enabled.
+_buffered_status = {}
+
 
 class PulpTask(CeleryTask):
     """
@@ -131,12 +142,9 @@ def _queue_reserved_task_list(name, task_id, resource_id_list, inner_args, inner
     """
     _logger.debug('_queue_reserved_task_list for task %s and ids [%s]' %
                   (task_id, resource_id_list))
-    # Find a/the available Worker for processing our list of resources
-    worker = get_worker_for_reservation_list(resource_id_list)
-    # Reserve each resource, associating them with that Worker
-    for rid in resource_id_list:
-        _logger.debug('...saving RR for RID %s' % rid)
-        ReservedResource(task_id=task_id, worker_name=worker['name'], resource_id=rid).save()
+    # Find a/the available Worker for processing our list of resources, and reserve each
+    # resource, associating them with that Worker
+    worker = get_worker_for_reservation_list(resource_id_list, task_id=task_id)
 
     # Dispatch the Worker
     inner_kwargs['routing_key'] = worker.name
@@ -161,7 +169,7 @@ def _queue_reserved_task(name, task_id, resource_id, inner_args, inner_kwargs):
 
     The inner task is dispatched into a dedicated queue for a worker that is decided at dispatch
     time. The logic deciding which queue receives a task is controlled through the
-    find_worker function.
+    get_worker_for_reservation_list function.
 
     :param name:          The name of the task to be called
     :type name:           basestring
@@ -176,25 +184,7 @@ def _queue_reserved_task(name, task_id, resource_id, inner_args, inner_kwargs):
 
     :return: None
     """
-    while True:
-        try:
-            worker = get_worker_for_reservation(resource_id)
-        except NoWorkers:
-            pass
-        else:
-            break
-
-        try:
-            worker = _get_unreserved_worker()
-        except NoWorkers:
-            pass
-        else:
-            break
-
-        # No worker is ready for this work, so we need to wait
-        time.sleep(0.25)
-
-    ReservedResource(task_id=task_id, worker_name=worker['name'], resource_id=resource_id).save()
+    worker = get_worker_for_reservation_list([resource_id], task_id=task_id)
 
     inner_kwargs['routing_key'] = worker.name
     inner_kwargs['exchange'] = DEDICATED_QUEUE_EXCHANGE
@@ -219,84 +209,44 @@ def _is_worker(worker_name):
     return True
 
 
-def get_worker_for_reservation(resource_id):
-    """
-    Return the Worker instance that is associated with a reservation of type resource_id. If
-    there are no workers with that reservation_id type a pulp.server.exceptions.NoWorkers
-    exception is raised.
-
-    :param resource_id:    The name of the resource you wish to reserve for your task.
-
-    :raises NoWorkers:     If all workers have reserved_resource entries associated with them.
-
-    :type resource_id:     basestring
-    :returns:              The Worker instance that has a reserved_resource entry of type
-                           `resource_id` associated with it.
-    :rtype:                pulp.server.db.model.resources.Worker
-    """
-    reservation = ReservedResource.objects(resource_id=resource_id).first()
-    if reservation:
-        return Worker.objects(name=reservation['worker_name']).first()
-    else:
-        raise NoWorkers()
-
-
-def get_worker_for_reservation_list(resources):
+def get_worker_for_reservation_list(resources, task_id=None):
     """
     Return the Worker instance that is associated with the reservations described by the 'resources'
     list. This will be either an existing Worker that is dealing with at least one of the specified
-    resources, or an available idle Worker. We sleep and retry the request until it can be
-    fulfilled.
+    resources, or an available idle Worker. The request is parked in the resource manager's
+    ReservationTable until it can be fulfilled, and is woken up as soon as a reservation it is
+    waiting on is released.
 
     :param resources:   A list of the names of the resources you wish to reserve for your task.
-
     :type resources:    list
+    :param task_id:     The UUID of the task the resources are reserved for. A ReservedResource
+                        entry is saved for each resource in 'resources'.
+    :type task_id:      basestring
     :returns:           The Worker instance that has a reserved_resource entry associated with it
                         for each resource in 'resources'
     :rtype:             pulp.server.db.model.resources.Worker
     """
 
     _logger.debug('get_worker_for_reservation_list [%s]' % resources)
-    # We leave this loop once we find a Worker to return - otherwise, sleep and try again
-    while True:
-        reservation_workers = set(
-            [reservation['worker_name'] for reservation in
-                ReservedResource.objects(resource_id__in=resources)])
-        _logger.debug('...num-RR is %d' % len(reservation_workers))
-        if len(reservation_workers) == 1:  # Exactly one worker holds any of the desired resources
-            _logger.debug('...one-holds')
-            return Worker.objects(name=list(reservation_workers)[0]).first()
-        elif len(reservation_workers) == 0:  # No worker holds any of the desired resources
-            _logger.debug('...zero-holds')
-            try:
-                worker = _get_unreserved_worker()
-                return worker
-            except NoWorkers:
-                _logger.debug('...unresolved NoWorkers - WAIT')
-                pass
-        else:
-            _logger.debug('...multiple-holds - WAIT')
-
-        time.sleep(0.25)
+    return reservations.get_table().acquire(task_id, resources, _select_unreserved_worker)
 
 
-def _get_unreserved_worker():
+def _select_unreserved_worker(reserved_names):
     """
-    Return the Worker instance that has no reserved_resource entries
-    associated with it. If there are no unreserved workers a
-    pulp.server.exceptions.NoWorkers exception is raised.
+    Return an online Worker instance whose name is not in reserved_names. If there is no such
+    worker a pulp.server.exceptions.NoWorkers exception is raised.
 
-    :raises NoWorkers: If all workers have reserved_resource entries associated with them.
+    :param reserved_names: The names of the workers that hold reservations
+    :type  reserved_names: iterable
+    :raises NoWorkers:     If all workers have reserved_resource entries associated with them.
 
-    :returns:          The Worker instance that has no reserved_resource
-                       entries associated with it.
-    :rtype:            pulp.server.db.model.resources.Worker
+    :returns:              The Worker instance that has no reserved_resource
+                           entries associated with it.
+    :rtype:                pulp.server.db.model.resources.Worker
     """
-
     # Build a mapping of queue names to Worker objects
     workers_dict = dict((worker['name'], worker) for worker in Worker.objects.get_online())
     worker_names = workers_dict.keys()
-    reserved_names = [r['worker_name'] for r in ReservedResource.objects.all()]
 
     # Find an unreserved worker using set differences of the names, and filter
     # out workers that should not be assigned work.
@@ -340,6 +290,7 @@ def _delete_worker(name, normal_shutdown=False):
 
     # Delete all reserved_resource documents for the worker
     ReservedResource.objects(worker_name=name).delete()
+    reservations.notify_released(worker_name=name)
 
     # If the worker is a resource manager, we also need to delete the associated lock
     if name.startswith(RESOURCE_MANAGER_WORKER_NAME):
@@ -367,7 +318,16 @@ def _release_resource(task_id):
     :param task_id: The UUID of the task that requested the reservation
     :type  task_id: basestring
     """
-    running_task_qs = TaskStatus.objects.filter(task_id=task_id, state=constants.CALL_RUNNING_STATE)
+    if task_id in _completed_task_ids:
+        # The task was run by this process, which has already written its final state.
+        running_task_qs = []
+    elif config.getboolean('tasks', 'buffer_task_status'):
+        # The task is not marked as running while the task status is buffered.
+        running_task_qs = TaskStatus.objects.filter(task_id=task_id,
+                                                    state__in=constants.CALL_INCOMPLETE_STATES)
+    else:
+        running_task_qs = TaskStatus.objects.filter(task_id=task_id,
+                                                    state=constants.CALL_RUNNING_STATE)
     for running_task in running_task_qs:
         new_task = Task()
         exception = PulpCodedException(error_codes.PLP0049, task_id=task_id)
@@ -377,6 +337,7 @@ def _release_resource(task_id):
 
         new_task.on_failure(exception, task_id, (), {}, MyEinfo)
     ReservedResource.objects(task_id=task_id).delete()
+    reservations.notify_released(task_id=task_id)
 
 
 class TaskResult(object):
@@ -646,37 +607,24 @@ class Task(PulpTask, ReservedTaskMixin):
         This overrides PulpTask's __call__() method. We use this method
         for task state tracking of Pulp tasks.
         """
-        # Check task status and skip running the task if task state is 'canceled'.
-        try:
-            task_status = TaskStatus.objects.get(task_id=self.request.id)
-        except DoesNotExist:
-            task_status = None
-        if task_status and task_status['state'] == constants.CALL_CANCELED_STATE:
+        # Skip running the task if task state is 'canceled'. Skip updating status for eagerly
+        # executed tasks, since we don't want to track synchronous tasks in our database.
+        if self.request.called_directly:
+            canceled = _is_canceled(self.request.id)
+        elif config.getboolean('tasks', 'buffer_task_status'):
+            task_status = TaskStatus.objects(task_id=self.request.id).only('state').first()
+            if task_status is None:
+                # The task status created by apply_async has not been written yet.
+                canceled = self._set_running()
+            else:
+                canceled = task_status['state'] == constants.CALL_CANCELED_STATE
+                if not canceled:
+                    _buffered_status[self.request.id] = self._running_status()
+        else:
+            canceled = self._set_running()
+        if canceled:
             _logger.debug("Task cancel received for task-id : [%s]" % self.request.id)
             return
-        # Update start_time and set the task state to 'running' for asynchronous tasks.
-        # Also update the worker_name to cover cases where apply_async was called without
-        # providing the worker name up-front. Skip updating status for eagerly executed tasks,
-        # since we don't want to track synchronous tasks in our database.
-        if not self.request.called_directly:
-            now = datetime.now(dateutils.utc_tz())
-            start_time = dateutils.format_iso8601_datetime(now)
-            worker_name = self.request.hostname
-            # Using 'upsert' to avoid a possible race condition described in the apply_async method
-            # above.
-            try:
-                TaskStatus.objects(task_id=self.request.id).update_one(
-                    set__state=constants.CALL_RUNNING_STATE,
-                    set__start_time=start_time,
-                    set__worker_name=worker_name,
-                    upsert=True)
-            except NotUniqueError:
-                # manually retry the upsert. see https://jira.mongodb.org/browse/SERVER-14322
-                TaskStatus.objects(task_id=self.request.id).update_one(
-                    set__state=constants.CALL_RUNNING_STATE,
-                    set__start_time=start_time,
-                    set__worker_name=worker_name,
-                    upsert=True)
 
         # Run the actual task
         _logger.debug("Running task : [%s]" % self.request.id)
@@ -687,6 +635,58 @@ class Task(PulpTask, ReservedTaskMixin):
 
         return super(Task, self).__call__(*args, **kwargs)
 
+    def _running_status(self):
+        """
+        Return the fields of the task status that are set when the task starts running. The
+        worker_name is included to cover cases where apply_async was called without providing the
+        worker name up-front.
+
+        :return: The fields of the task status, keyed by name
+        :rtype:  dict
+        """
+        now = datetime.now(dateutils.utc_tz())
+        return {'state': constants.CALL_RUNNING_STATE,
+                'start_time': dateutils.format_iso8601_datetime(now),
+                'worker_name': self.request.hostname}
+
+    def _set_running(self):
+        """
+        Set the task state to 'running' unless the task has been canceled. Checking for the
+        cancellation and updating the task status are done in a single find_and_modify.
+
+        :return: True if the task has been canceled, False otherwise
+        :rtype:  bool
+        """
+        update = dict(('set__%s' % name, value)
+                      for name, value in self._running_status().iteritems())
+        # Using 'upsert' to avoid a possible race condition described in the apply_async method
+        # above. A canceled task status does not match the query, so the upsert fails on the
+        # unique task_id index instead of overwriting it.
+        qs = TaskStatus.objects(task_id=self.request.id, state__ne=constants.CALL_CANCELED_STATE)
+        try:
+            qs.modify(upsert=True, **update)
+        except NotUniqueError:
+            if _is_canceled(self.request.id):
+                return True
+            # manually retry the upsert. see https://jira.mongodb.org/browse/SERVER-14322
+            qs.modify(upsert=True, **update)
+        return False
+
+    def _complete(self, task_status):
+        """
+        Save the final state of the task status, along with any fields that were buffered while
+        the task was running.
+
+        :param task_status: The task status of the completed task
+        :type  task_status: pulp.server.db.model.TaskStatus
+        """
+        buffered = _buffered_status.pop(task_status['task_id'], {})
+        for name in ('start_time', 'worker_name'):
+            if name in buffered:
+                task_status[name] = buffered[name]
+        task_status.save()
+        _completed_task_ids.append(task_status['task_id'])
+
     def on_success(self, retval, task_id, args, kwargs):
         """
         This overrides the success handler run by the worker when the task
@@ -733,7 +733,7 @@ class Task(PulpTask, ReservedTaskMixin):
                 task_status['spawned_tasks'] = [retval.task_id, ]
                 task_status['result'] = None
 
-            task_status.save()
+            self._complete(task_status)
             self._handle_cProfile(task_id)
             common_utils.delete_working_directory()
 
@@ -768,7 +768,7 @@ class Task(PulpTask, ReservedTaskMixin):
             if not isinstance(exc, PulpException):
                 exc = PulpException(str(exc))
             task_status['error'] = exc.to_dict()
-            task_status.save()
+            self._complete(task_status)
             self._handle_cProfile(task_id)
             common_utils.delete_working_directory()
 
@@ -786,6 +786,17 @@ class Task(PulpTask, ReservedTaskMixin):
             self.pr.dump_stats("%s/%s" % (profile_directory, task_id))
 
 
+def _is_canceled(task_id):
+    """
+    :param task_id: The ID of the task
+    :type  task_id: basestring
+    :return: True if the task has a task status in the 'canceled' state, False otherwise
+    :rtype:  bool
+    """
+    task_status = TaskStatus.objects(task_id=task_id).only('state').first()
+    return task_status is not None and task_status['state'] == constants.CALL_CANCELED_STATE
+
+
 def cancel(task_id, revoke_task=True):
     """
     Cancel the task that is represented by the given task_id. This method cancels only the task
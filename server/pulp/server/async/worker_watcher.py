@@ -17,7 +17,8 @@ from datetime import datetime, timedelta
 from gettext import gettext as _
 import logging
 
-from pulp.server.async.tasks import _delete_worker
+from pulp.server.async import reservations
+from pulp.server.async.tasks import _delete_worker, _is_worker
 from pulp.server.constants import PULP_PROCESS_HEARTBEAT_INTERVAL
 from pulp.server.db.model import Worker
 
@@ -30,7 +31,8 @@ def handle_worker_heartbeat(worker_name):
     This is a generic function for updating worker heartbeat records.
 
     Existing Worker objects are searched for one to update. If an existing one is found, it is
-    updated. Otherwise a new Worker entry is created. Logging at the info level is also done.
+    updated. Otherwise a new Worker entry is created, and the resource manager is notified so that
+    it can dispatch waiting tasks to the new worker. Logging at the info level is also done.
 
     :param worker_name: The hostname of the worker
     :type  worker_name: basestring
@@ -50,6 +52,9 @@ def handle_worker_heartbeat(worker_name):
     Worker.objects(name=worker_name).update_one(set__last_heartbeat=timestamp,
                                                 upsert=True)
 
+    if not existing_worker and _is_worker(worker_name):
+        reservations.notify_worker_online(worker_name)
+
     if(datetime.utcnow() - start > timedelta(seconds=PULP_PROCESS_HEARTBEAT_INTERVAL)):
         sec = (datetime.utcnow() - start).total_seconds()
         msg = _("Worker {name} heartbeat time {time}s exceeds heartbeat interval. Consider "
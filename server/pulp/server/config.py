@@ -78,6 +78,13 @@ _default_values = {
         'write_concern': 'majority',
         'x509_auth': 'false',
     },
+    'events': {
+        'notifier_workers': '0',
+        'notifier_queue_size': '1000',
+        'notifier_retries': '3',
+        'notifier_retry_delay': '1',
+        'listener_cache_ttl': '30',
+    },
     'email': {
         'host': 'localhost',
         'port': '25',
@@ -132,6 +139,9 @@ _default_values = {
         'certfile': '/etc/pki/pulp/qpid/client.crt',
         'login_method': '',
         'worker_timeout': '30',
+        'progress_report_interval': '1',
+        'progress_report_delta': '1',
+        'buffer_task_status': 'false',
     },
     'lazy': {
         'redirect_host': '',
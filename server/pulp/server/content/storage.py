@@ -1,14 +1,32 @@
 import os
 import errno
+import fcntl
+import logging
 import shutil
 import tempfile
 
+from gettext import gettext as _
 from hashlib import sha256
 
+import selinux
+
 from pulp.server.config import config
 from pulp.plugins.util import misc
 
 
+_logger = logging.getLogger(__name__)
+
+# The ioctl request that clones the blocks of a file into another file on filesystems
+# that support reflinks (btrfs, XFS).
+FICLONE = 0x40049409
+
+# The strategies used to transfer a file into FileStorage, reported by FileStorage.put().
+RENAME = 'rename'
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+COPY = 'copy'
+
+
 class ContentStorage(object):
     """
     Base class for content storage.
@@ -90,14 +108,19 @@ class FileStorage(ContentStorage):
             digest[0:2],
             digest[2:])
 
-    def put(self, unit, path, location=None):
+    def put(self, unit, path, location=None, disposable=False, hardlink=False):
         """
         Put the content defined by the content unit into storage.
         The file at the specified *path* is transferred into storage:
-         - Copy file to the temporary file at its final directory.
+         - Transfer file to the temporary file at its final directory.
          - If possible, verify size of the file to make sure that file is not corrupted.
          - Do atomic rename.
 
+        The file is transferred without copying its data whenever possible. It is moved when
+        it is *disposable*, hardlinked when the caller allows it, and otherwise cloned on
+        filesystems that support reflinks. It is only copied when none of these is possible,
+        such as when it is on another filesystem.
+
         :param unit: The content unit to be stored.
         :type unit: pulp.sever.db.model.ContentUnit
         :param path: The absolute path to the file (or directory) to be stored.
@@ -105,6 +128,14 @@ class FileStorage(ContentStorage):
         :param location: The (optional) location within the path
             where the content is to be stored.
         :type location: str
+        :param disposable: The file at *path* is no longer needed by the caller,
+            so that it may be moved into storage.
+        :type disposable: bool
+        :param hardlink: The file at *path* will not be modified in place, so that it
+            may be hardlinked into storage.
+        :type hardlink: bool
+        :return: The strategy used to transfer the file: RENAME, HARDLINK, REFLINK or COPY.
+        :rtype: str
         """
         destination = unit.storage_path
         if location:
@@ -116,7 +147,7 @@ class FileStorage(ContentStorage):
         # going to use.
         os.close(fd)
 
-        shutil.copy(path, temp_destination)
+        strategy = self.transfer(path, temp_destination, disposable, hardlink)
 
         try:
             unit.verify_size(temp_destination)
@@ -128,6 +159,71 @@ class FileStorage(ContentStorage):
             raise
 
         os.rename(temp_destination, destination)
+        _logger.debug(_('Stored {path} at {destination} by {strategy}.').format(
+            path=path, destination=destination, strategy=strategy))
+        return strategy
+
+    @staticmethod
+    def transfer(path, destination, disposable=False, hardlink=False):
+        """
+        Transfer the file at *path* to the existing file at *destination*, without copying
+        its data whenever possible.
+
+        A hardlinked file shares its data with *path*, so that modifying the file at *path*
+        in place would modify the stored content. A moved or hardlinked file keeps its
+        SELinux context, so the default context of *destination* is restored.
+
+        :param path: The absolute path to the file to be transferred.
+        :type path: str
+        :param destination: The absolute path to an (empty) file on the storage filesystem
+            that is replaced by the transferred file.
+        :type destination: str
+        :param disposable: The file at *path* may be moved.
+        :type disposable: bool
+        :param hardlink: The file at *path* may be hardlinked.
+        :type hardlink: bool
+        :return: The strategy used to transfer the file: RENAME, HARDLINK, REFLINK or COPY.
+        :rtype: str
+        """
+        # Symlinks are stored as the file they point to, which only copying does.
+        if not os.path.islink(path):
+            if disposable:
+                try:
+                    os.rename(path, destination)
+                    FileStorage._restorecon(destination)
+                    return RENAME
+                except OSError:
+                    pass
+            if hardlink:
+                try:
+                    os.unlink(destination)
+                    os.link(path, destination)
+                    FileStorage._restorecon(destination)
+                    return HARDLINK
+                except OSError:
+                    pass
+        try:
+            with open(path, 'rb') as src:
+                with open(destination, 'wb') as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copymode(path, destination)
+            return REFLINK
+        except (IOError, OSError):
+            pass
+        shutil.copy(path, destination)
+        return COPY
+
+    @staticmethod
+    def _restorecon(path):
+        """
+        Restore the default SELinux context of a file moved or linked into storage, so that
+        it can be served like a file created in storage.
+
+        :param path: The absolute path to the file.
+        :type path: str
+        """
+        if selinux.is_selinux_enabled():
+            selinux.restorecon(path.encode('utf-8'))
 
     def get(self, unit):
         """
@@ -2,12 +2,14 @@ from gettext import gettext as _
 import logging
 import mimetypes
 import os
+import time
 
 from django.http import \
     HttpResponse, HttpResponseRedirect, HttpResponseForbidden, Http404
 from django.shortcuts import render_to_response
 from django.views.generic import View
 
+from pulp.common.cache import ExpiringCache
 from pulp.repoauth.wsgi import allow_access
 from pulp.server.config import config as pulp_conf
 from pulp.server.lazy import URL, Key
@@ -22,6 +24,20 @@ SAFE_STORAGE_SUBDIRS = ('published', 'content', 'static')
 mimetypes_noencoding = mimetypes.MimeTypes()
 mimetypes_noencoding.encodings_map.clear()
 
+# The maximum number of entries in each of the caches below.
+CACHE_SIZE = 10000
+# The number of seconds the resolution of a requested path is cached for.
+PATH_CACHE_TTL = 5
+# The number of seconds a signed redirect URL is valid for.
+SIGNATURE_EXPIRATION = 90
+# A signed redirect URL is no longer reused when it expires in less than this number of seconds.
+SIGNATURE_MARGIN = 30
+
+# Requested path: (real path, kind)
+path_cache = ExpiringCache(CACHE_SIZE)
+# (redirect URL, remote IP, signing key): signed redirect URL
+redirect_cache = ExpiringCache(CACHE_SIZE)
+
 
 class ContentView(View):
     """
@@ -31,6 +47,42 @@ class ContentView(View):
     :type key: M2Crypto.RSA.RSA
     """
 
+    # The kinds of requested paths.
+    MISSING = 'missing'
+    DIRECTORY = 'directory'
+    FILE = 'file'
+    DEFERRED = 'deferred'
+
+    @staticmethod
+    def resolve(path_info):
+        """
+        Resolve a requested path to its real path and the kind of content found there.
+        Resolutions are cached for PATH_CACHE_TTL seconds, which saves the file system
+        lookups when the same content is requested by many clients.
+
+        :param path_info: The requested path.
+        :type path_info: str
+        :return: The fully qualified *real* path and one of MISSING (the symbolic link
+            does not exist), DIRECTORY, FILE or DEFERRED (the content has not been
+            downloaded).
+        :rtype: tuple
+        """
+        resolved = path_cache.get(path_info)
+        if resolved is not None:
+            return resolved
+        path = os.path.realpath(path_info)
+        if not os.path.lexists(path_info):
+            kind = ContentView.MISSING
+        elif os.path.isdir(path):
+            kind = ContentView.DIRECTORY
+        elif os.path.exists(path):
+            kind = ContentView.FILE
+        else:
+            kind = ContentView.DEFERRED
+        resolved = (path, kind)
+        path_cache.put(path_info, resolved, time.time() + PATH_CACHE_TTL)
+        return resolved
+
     @staticmethod
     def urljoin(scheme, host, port, base, path, query):
         """
@@ -98,6 +150,12 @@ class ContentView(View):
         """
         Redirected GET request.
 
+        The signed URL is reused for other requests of the same client for the same
+        content until it is about to expire, rather than signing it again. The client
+        IP is part of the signed policy, which the streamer validates against the
+        address of the client following the redirect, so signed URLs cannot be shared
+        between clients.
+
         :param request: The WSGI request object.
         :type request: django.core.handlers.wsgi.WSGIRequest
         :param key: A private RSA key.
@@ -105,7 +163,7 @@ class ContentView(View):
         :return: A redirect or not-found reply.
         :rtype: django.http.HttpResponse
         """
-        path = os.path.realpath(request.path_info)
+        path = ContentView.resolve(request.path_info)[0]
         scheme = request.environ['wsgi.url_scheme']
         host = request.environ['SERVER_NAME']
         port = request.environ['SERVER_PORT']
@@ -124,9 +182,15 @@ class ContentView(View):
             path,
             query)
 
-        url = URL(redirect)
-        signed = url.sign(key, remote_ip=remote_ip)
-        return HttpResponseRedirect(str(signed))
+        cache_key = (redirect, remote_ip, key.pub())
+        signed = redirect_cache.get(cache_key)
+        if signed is None:
+            now = time.time()
+            url = URL(redirect)
+            signed = str(url.sign(key, expiration=SIGNATURE_EXPIRATION, remote_ip=remote_ip))
+            expiration = now + SIGNATURE_EXPIRATION - SIGNATURE_MARGIN
+            redirect_cache.put(cache_key, signed, expiration)
+        return HttpResponseRedirect(signed)
 
     def __init__(self, **kwargs):
         super(ContentView, self).__init__(**kwargs)
@@ -150,7 +214,7 @@ class ContentView(View):
         :rtype: django.http.HttpResponse
         """
         host = request.get_host()
-        path = os.path.realpath(request.path_info)
+        path, kind = self.resolve(request.path_info)
 
         # Check authorization if http isn't being used. This environ variable must
         # be available in all implementations so it is not dependant on Apache httpd:
@@ -169,16 +233,16 @@ class ContentView(View):
             return HttpResponseForbidden()
 
         # Immediately 404 if the symbolic link doesn't even exist
-        if not os.path.lexists(request.path_info):
+        if kind == self.MISSING:
             logger.debug(_('Symbolic link to {path} does not exist.').format(path=path))
             raise Http404
 
-        if os.path.isdir(path):
+        if kind == self.DIRECTORY:
             logger.debug(_('Rendering directory index for {path}.').format(path=path))
             return self.directory_index(path)
 
         # Already downloaded
-        if os.path.exists(path):
+        if kind == self.FILE:
             logger.debug(_('Serving {path} with mod_xsendfile.').format(path=path))
             return self.x_send(path)
 
@@ -1,6 +1,11 @@
+from collections import Counter
 from gettext import gettext as _
-from itertools import chain, izip_longest
+from itertools import groupby
+from operator import attrgetter
+import base64
 import copy
+import hashlib
+import json
 import logging
 import os
 import socket
@@ -11,11 +16,13 @@ import uuid
 
 from bson.objectid import ObjectId, InvalidId
 import celery
-from mongoengine import NotUniqueError, OperationError, ValidationError, DoesNotExist
+from mongoengine import NotUniqueError, OperationError, ValidationError, DoesNotExist, Q
 from nectar.config import DownloaderConfig
 from nectar.request import DownloadRequest
 from nectar.downloaders.threaded import HTTPThreadedDownloader
 from nectar.listener import DownloadEventListener
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 from pulp.common import dateutils, error_codes, tags
 from pulp.common.config import parse_bool, Unparsable
@@ -44,6 +51,7 @@ from pulp.server.db.model.repository import (
 from pulp.server.exceptions import PulpCodedTaskException
 from pulp.server.lazy import URL, Key
 from pulp.server.managers import factory as manager_factory
+from pulp.server.managers.consumer.applicability import ConsumerApplicabilityGroupManager
 from pulp.server.managers.repo import _common as common_utils
 from pulp.server.util import InvalidChecksumType
 
@@ -57,6 +65,12 @@ TYPE_ID = 'type_id'
 UNIT_FILES = 'unit_files'
 REQUEST = 'request'
 
+# The number of repository content unit associations find_repo_content_units queries, and
+# associate_units_by_id writes, at a time
+UNIT_CHUNK_SIZE = 1000
+
+DUPLICATE_KEY_ERROR = 11000
+
 
 def get_associated_unit_ids(repo_id, unit_type, repo_content_unit_q=None):
     """
@@ -173,7 +187,7 @@ def get_mongoengine_unit_querysets(repo_id, repo_content_unit_q=None, file_units
 def find_repo_content_units(
         repository, repo_content_unit_q=None,
         units_q=None, unit_fields=None, limit=None, skip=None,
-        yield_content_unit=False):
+        yield_content_unit=False, after=None):
     """
     Search content units associated with a given repository.
 
@@ -182,6 +196,11 @@ def find_repo_content_units(
     ContentUnit. If yield_content_unit is set to true then the ContentUnit will be yielded instead
     of the RepoContentUnit.
 
+    Results are ordered by unit type and unit id. The associations are fetched UNIT_CHUNK_SIZE at
+    a time, each chunk starting after the last association of the previous one, so only a single
+    chunk of associations and units is held in memory. The same ordering is used to page through
+    the results with the after parameter, see get_unit_continuation_token().
+
     :param repository: The repository to search.
     :type repository: pulp.server.db.model.Repository
     :param repo_content_unit_q: Any query filters to apply to the RepoContentUnits.
@@ -197,61 +216,110 @@ def find_repo_content_units(
     :param yield_content_unit: Whether we should yield a ContentUnit or RepositoryContentUnit.
         If True then a ContentUnit will be yielded. Defaults to False
     :type yield_content_unit: bool
+    :param after: A continuation token; only units ordered after the unit it was created for are
+        returned.
+    :type after: basestring
 
     :return: Content unit assoociations matching the query.
     :rtype: generator of pulp.server.db.model.ContentUnit or
         pulp.server.db.model.RepositoryContentUnit
 
+    :raises pulp_exceptions.InvalidValue: if the continuation token is not valid
     """
 
     qs = model.RepositoryContentUnit.objects(q_obj=repo_content_unit_q,
                                              repo_id=repository.repo_id)
+    position = _parse_unit_continuation_token(after) if after else None
 
-    type_map = {}
-    content_units = {}
+    skip = skip or 0
+    association_skip = 0
+    if skip and (units_q is None or units_q.empty):
+        # Every association yields its unit, so the database can do the skipping
+        association_skip, skip = skip, 0
 
-    yield_count = 1
+    yield_count = 0
     skip_count = 0
 
-    for repo_content_unit in qs:
-        id_set = type_map.setdefault(repo_content_unit.unit_type_id, set())
-        id_set.add(repo_content_unit.unit_id)
-        content_unit_set = content_units.setdefault(repo_content_unit.unit_type_id, dict())
-        content_unit_set[repo_content_unit.unit_id] = repo_content_unit
-
-    for unit_type, unit_ids in type_map.iteritems():
-        _model = plugin_api.get_unit_model_by_id(unit_type)
-        # do chunks with izip_longest which zips together passed arguments
-        # so from x1,x2,x3 ... xn arguments it returns [x1[0],x2[0],x3[0],..xn[0]] every iteration
-        # until there's item at least in one of the x. Passing arugments as iter() * X will produces
-        # zipping from same iterator object thus iterating over the same source.
-        # So putting everything together behaves as source [x1,x2,x3,x4,...] is splitted
-        # into chunks of size 1000
-        for ids_chunk in izip_longest(*[iter(unit_ids)] * 1000):
-            ids_chunk = filter(lambda x: x, ids_chunk)
-
-            qs = _model.objects(q_obj=units_q,
-                                __raw__={'_id': {'$in': list(ids_chunk)}})
+    while True:
+        chunk_qs = qs
+        if position:
+            unit_type_id, unit_id = position
+            chunk_qs = chunk_qs.filter(Q(unit_type_id__gt=unit_type_id) |
+                                       Q(unit_type_id=unit_type_id, unit_id__gt=unit_id))
+        chunk_qs = chunk_qs.order_by('unit_type_id', 'unit_id')
+        if association_skip:
+            chunk_qs = chunk_qs.skip(association_skip)
+            association_skip = 0
+        chunk = list(chunk_qs.limit(UNIT_CHUNK_SIZE))
+        if not chunk:
+            return
+
+        for unit_type, repo_content_units in groupby(chunk, attrgetter('unit_type_id')):
+            repo_content_units = list(repo_content_units)
+            _model = plugin_api.get_unit_model_by_id(unit_type)
+            unit_ids = [rcu.unit_id for rcu in repo_content_units]
+            units_qs = _model.objects(q_obj=units_q, __raw__={'_id': {'$in': unit_ids}})
             if unit_fields:
-                qs = qs.only(*unit_fields)
+                units_qs = units_qs.only(*unit_fields)
+            units = dict((unit.id, unit) for unit in units_qs)
 
-            for unit in qs:
-                if skip and skip_count < skip:
+            for repo_content_unit in repo_content_units:
+                unit = units.get(repo_content_unit.unit_id)
+                if unit is None:
+                    # filtered out by units_q
+                    continue
+
+                if skip_count < skip:
                     skip_count += 1
                     continue
 
                 if yield_content_unit:
                     yield unit
                 else:
-                    cu = content_units[unit_type][unit.id]
-                    cu.unit = unit
-                    yield cu
-
-                if limit:
-                    if yield_count >= limit:
-                        return
+                    repo_content_unit.unit = unit
+                    yield repo_content_unit
 
                 yield_count += 1
+                if limit and yield_count >= limit:
+                    return
+
+        if len(chunk) < UNIT_CHUNK_SIZE:
+            return
+        position = (chunk[-1].unit_type_id, chunk[-1].unit_id)
+
+
+def get_unit_continuation_token(unit_type_id, unit_id):
+    """
+    Return an opaque token that can be passed to find_repo_content_units() as the after parameter
+    to continue a search after the given unit.
+
+    :param unit_type_id: The type of the last unit that was returned
+    :type  unit_type_id: basestring
+    :param unit_id:      The id of the last unit that was returned
+    :type  unit_id:      basestring
+    :return:             The continuation token
+    :rtype:              str
+    """
+    return base64.urlsafe_b64encode(json.dumps([unit_type_id, unit_id]))
+
+
+def _parse_unit_continuation_token(token):
+    """
+    Return the unit type and unit id a continuation token was created for.
+
+    :param token: A token as returned by get_unit_continuation_token()
+    :type  token: basestring
+    :return:      The unit type id and unit id
+    :rtype:       tuple
+    :raises pulp_exceptions.InvalidValue: if the token is not valid
+    """
+    try:
+        unit_type_id, unit_id = json.loads(base64.urlsafe_b64decode(str(token)))
+    except (TypeError, ValueError):
+        raise pulp_exceptions.InvalidValue(['after'])
+    if not isinstance(unit_type_id, basestring) or not isinstance(unit_id, basestring):
+        raise pulp_exceptions.InvalidValue(['after'])
+    return unit_type_id, unit_id
 
 
 def find_units_not_downloaded(repo_id):
@@ -264,9 +332,39 @@ def find_units_not_downloaded(repo_id):
     :return: The requested units.
     :rtype:  generator
     """
-    query_sets = get_mongoengine_unit_querysets(repo_id, file_units=True)
-    query_sets = [q(downloaded=False) for q in query_sets]
-    return chain(*query_sets)
+    return _find_mongoengine_units(repo_id, units_q=Q(downloaded=False), file_units=True)
+
+
+def _find_mongoengine_units(repo_id, units_q=None, file_units=False):
+    """
+    Find the units in a repository that have MongoEngine models.
+
+    The units are read with find_repo_content_units(), one bounded chunk at a time, so no database
+    cursor is left open while the caller processes them. This matters to callers that download
+    the units, since a download can outlast the server's idle cursor timeout.
+
+    :param repo_id:    The ID of the repo whose units should be retrieved.
+    :type  repo_id:    str
+    :param units_q:    Any query filters to apply to the ContentUnits.
+    :type  units_q:    mongoengine.Q
+    :param file_units: Retrieve exclusively units inheriting from
+                       pulp.server.db.model.FileContentUnit.
+    :type  file_units: bool
+
+    :return: The requested units.
+    :rtype:  generator of pulp.server.db.model.ContentUnit
+    """
+    unit_models = get_repo_unit_models(repo_id)
+    if file_units:
+        unit_models = filter(lambda m: issubclass(m, model.FileContentUnit), unit_models)
+    unit_type_ids = [unit_model._content_type_id.default for unit_model in unit_models]
+    if not unit_type_ids:
+        return iter([])
+
+    repository = model.Repository.objects.get_repo_or_missing_resource(repo_id)
+    return find_repo_content_units(repository,
+                                   repo_content_unit_q=Q(unit_type_id__in=unit_type_ids),
+                                   units_q=units_q, yield_content_unit=True)
 
 
 def missing_unit_count(repo_id):
@@ -302,7 +400,7 @@ def has_all_units_downloaded(repo_id):
 
 def rebuild_content_unit_counts(repository):
     """
-    Update the content_unit_counts field on a Repository.
+    Update the content_unit_counts and content_fingerprint fields on a Repository.
 
     :param repository: The repository to update
     :type repository: pulp.server.db.model.Repository
@@ -320,13 +418,41 @@ def rebuild_content_unit_counts(repository):
         counts[result['_id']] = result['sum']
 
     repository.content_unit_counts = counts
+    repository.content_fingerprint = calculate_content_fingerprint(repository.repo_id)
     repository.save()
 
 
+def calculate_content_fingerprint(repo_id):
+    """
+    Calculate a hash of the units associated with a repository, which is the same for all
+    repositories with identical content.
+
+    :param repo_id: The repository ID
+    :type repo_id: str
+    :return: The hex digest of the hash
+    :rtype: str
+    """
+    db = connection.get_database()
+    # Covered by the repo_id, unit_type_id, unit_id index
+    associations = db.repo_content_units.find(
+        {'repo_id': repo_id}, projection={'unit_type_id': 1, 'unit_id': 1, '_id': 0})
+    associations = associations.sort([('unit_type_id', 1), ('unit_id', 1)])
+
+    fingerprint = hashlib.sha256()
+    for association in associations:
+        line = u'%s:%s\n' % (association['unit_type_id'], association['unit_id'])
+        fingerprint.update(line.encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
 def associate_single_unit(repository, unit):
     """
     Associate a single unit to a repository.
 
+    When the unit was not already associated, the `content_fingerprint` of the repository is
+    unset, since it no longer matches the content of the repository. It is calculated again by
+    rebuild_content_unit_counts().
+
     :param repository: The repository to update.
     :type repository: pulp.server.db.model.Repository
     :param unit: The unit to associate to the repository.
@@ -338,10 +464,97 @@ def associate_single_unit(repository, unit):
         repo_id=repository.repo_id,
         unit_id=unit.id,
         unit_type_id=unit._content_type_id)
-    qs.update_one(
+    result = qs.update(
         set_on_insert__created=formatted_datetime,
         set__updated=formatted_datetime,
-        upsert=True)
+        upsert=True, multi=False, full_result=True)
+    if not result.get('updatedExisting'):
+        model.Repository.objects(repo_id=repository.repo_id).update_one(
+            unset__content_fingerprint=True)
+
+
+def associate_units(repository, unit_iterable):
+    """
+    Associate units to a repository in bulk. See associate_units_by_id.
+
+    :param repository: The repository to update.
+    :type repository: pulp.server.db.model.Repository
+    :param unit_iterable: The units to associate to the repository.
+    :type unit_iterable: iterable of pulp.server.db.model.ContentUnit
+    :return: The number of units that were not already associated to the repository.
+    :rtype: int
+    """
+    unit_refs = ((unit._content_type_id, unit.id) for unit in unit_iterable)
+    return associate_units_by_id(repository.repo_id, unit_refs)
+
+
+def associate_units_by_id(repo_id, unit_refs):
+    """
+    Associate units to a repository in bulk.
+
+    The associations are upserted with unordered bulk writes of UNIT_CHUNK_SIZE
+    associations at a time. After each chunk, the `content_unit_counts` and the
+    `last_unit_added` timestamp of the repository are updated in a single write
+    for the units that were not already associated, which also unsets the
+    `content_fingerprint` of the repository.
+
+    :param repo_id: The ID of the repository to update.
+    :type repo_id: str
+    :param unit_refs: The (unit_type_id, unit_id) of the units to associate.
+    :type unit_refs: iterable of tuple
+    :return: The number of units that were not already associated to the repository.
+    :rtype: int
+
+    :raises pulp_exceptions.PulpExecutionException: if there is an error in updating the
+                                                    repository
+    """
+    added = 0
+    for chunk in paginate(unit_refs, UNIT_CHUNK_SIZE):
+        added += _associate_unit_chunk(repo_id, chunk)
+    return added
+
+
+def _associate_unit_chunk(repo_id, unit_refs):
+    """
+    Associate a chunk of units to a repository. See associate_units_by_id.
+
+    :param repo_id: The ID of the repository to update.
+    :type repo_id: str
+    :param unit_refs: The (unit_type_id, unit_id) of the units to associate.
+    :type unit_refs: tuple
+    :return: The number of units that were not already associated to the repository.
+    :rtype: int
+    """
+    formatted_datetime = dateutils.format_iso8601_utc_timestamp(dateutils.now_utc_timestamp())
+    update = {'$set': {'updated': formatted_datetime},
+              '$setOnInsert': {'created': formatted_datetime}}
+    writes = [UpdateOne({'repo_id': repo_id, 'unit_type_id': unit_type_id, 'unit_id': unit_id},
+                        update, upsert=True)
+              for unit_type_id, unit_id in unit_refs]
+    collection = model.RepositoryContentUnit._get_collection()
+    try:
+        upserted = collection.bulk_write(writes, ordered=False).upserted_ids
+    except BulkWriteError as e:
+        # Concurrent upserts of the same association can both try to insert it, in which case
+        # retrying the one that failed updates the inserted association.
+        errors = e.details['writeErrors']
+        if any(error['code'] != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        upserted = dict((u['index'], u['_id']) for u in e.details['upserted'])
+        collection.bulk_write([writes[error['index']] for error in errors], ordered=False)
+
+    counts = Counter(unit_refs[index][0] for index in upserted)
+    if counts:
+        repo_update = dict(('inc__content_unit_counts__{t}'.format(t=unit_type_id), count)
+                           for unit_type_id, count in counts.iteritems())
+        repo_update['set__last_unit_added'] = dateutils.now_utc_datetime_with_tzinfo()
+        repo_update['unset__content_fingerprint'] = True
+        try:
+            model.Repository.objects(repo_id=repo_id).update_one(**repo_update)
+        except OperationError:
+            message = 'There was a problem updating repository %s' % repo_id
+            raise pulp_exceptions.PulpExecutionException(message), None, sys.exc_info()[2]
+    return sum(counts.values())
 
 
 def disassociate_units(repository, unit_iterable):
@@ -349,6 +562,10 @@ def disassociate_units(repository, unit_iterable):
     Disassociate all units in the iterable from the repository.
     Update `last_unit_removed` timestamp for the repository if needed.
 
+    The `content_fingerprint` of the repository is unset before any unit is removed, so that it
+    does not describe the previous content if the removal fails part way. It is calculated again
+    by rebuild_content_unit_counts().
+
     :param repository: The repository to update.
     :type repository: pulp.server.db.model.Repository
     :param unit_iterable: The units to disassociate from the repository.
@@ -356,7 +573,12 @@ def disassociate_units(repository, unit_iterable):
     """
     # track if units are removed so last_unit_removed is only updated when units are removed
     units_removed = 0
+    fingerprint_unset = False
     for unit_group in paginate(unit_iterable):
+        if not fingerprint_unset:
+            model.Repository.objects(repo_id=repository.repo_id).update_one(
+                unset__content_fingerprint=True)
+            fingerprint_unset = True
         unit_id_list = [unit.id for unit in unit_group]
         qs = model.RepositoryContentUnit.objects(
             repo_id=repository.repo_id, unit_id__in=unit_id_list)
@@ -562,6 +784,9 @@ def delete(repo_id):
     group_manager = manager_factory.repo_group_manager()
     group_manager.remove_repo_from_groups(repo_id)
 
+    # remove the repo from the materialized consumer applicability
+    ConsumerApplicabilityGroupManager.remove_repo(repo_id)
+
     if len(error_tuples) > 0:
         pe = pulp_exceptions.PulpExecutionException()
         pe.child_exceptions = error_tuples
@@ -656,6 +881,9 @@ def update_unit_count(repo_id, unit_type_id, delta):
 
     example: {'rpm': 12, 'srpm': 3}
 
+    The 'content_fingerprint' of the repo no longer matches its content once the count changes,
+    so it is unset in the same update. It is calculated again by rebuild_content_unit_counts().
+
     :param repo_id: identifies the repo
     :type  repo_id: str
     :param unit_type_id: identifies the unit type to update
@@ -668,7 +896,8 @@ def update_unit_count(repo_id, unit_type_id, delta):
     atomic_inc_key = 'inc__content_unit_counts__{unit_type_id}'.format(unit_type_id=unit_type_id)
     if delta:
         try:
-            model.Repository.objects(repo_id=repo_id).update_one(**{atomic_inc_key: delta})
+            model.Repository.objects(repo_id=repo_id).update_one(
+                unset__content_fingerprint=True, **{atomic_inc_key: delta})
         except OperationError:
             message = 'There was a problem updating repository %s' % repo_id
             raise pulp_exceptions.PulpExecutionException(message), None, sys.exc_info()[2]
@@ -1456,8 +1685,7 @@ def download_repo(repo_id, verify_all_units=False):
     """
     task_description = _('Download Repository Content')
     if verify_all_units:
-        repo_unit_querysets = get_mongoengine_unit_querysets(repo_id)
-        missing_content_units = chain(*repo_unit_querysets)
+        missing_content_units = _find_mongoengine_units(repo_id)
     else:
         missing_content_units = find_units_not_downloaded(repo_id)
 
@@ -1474,80 +1702,128 @@ def _get_deferred_content_units():
     """
     Retrieve a list of units that have been added to the DeferredDownload collection.
 
+    The DeferredDownload entries are read in pages ordered by their id, each page starting after
+    the last entry of the previous one, and the units of each page are retrieved with one query
+    per unit type. Every page is read completely before its units are yielded, so no database
+    cursor is left open while they are downloaded.
+
     :return: A generator of content units that correspond to DeferredDownload entries.
     :rtype:  generator of pulp.server.db.model.FileContentUnit
     """
-    for deferred_download in model.DeferredDownload.objects.filter():
-        try:
-            unit_model = plugin_api.get_unit_model_by_id(deferred_download.unit_type_id)
+    last_id = None
+    while True:
+        deferred_downloads = model.DeferredDownload.objects.order_by('id')
+        if last_id is not None:
+            deferred_downloads = deferred_downloads.filter(id__gt=last_id)
+        page = list(deferred_downloads.limit(UNIT_CHUNK_SIZE))
+        if not page:
+            return
+
+        unit_ids = {}
+        for deferred_download in page:
+            unit_ids.setdefault(deferred_download.unit_type_id, []).append(
+                deferred_download.unit_id)
+        units = {}
+        unknown_types = set()
+        for unit_type_id, ids in unit_ids.iteritems():
+            unit_model = plugin_api.get_unit_model_by_id(unit_type_id)
             if unit_model is None:
                 _logger.error(_('Unable to find the model object for the {type} type.').format(
-                    type=deferred_download.unit_type_id))
-            else:
-                unit = unit_model.objects.filter(id=deferred_download.unit_id).get()
+                    type=unit_type_id))
+                unknown_types.add(unit_type_id)
+                continue
+            for unit in unit_model.objects.filter(id__in=ids):
+                units[(unit_type_id, unit.id)] = unit
+        for deferred_download in page:
+            unit = units.get((deferred_download.unit_type_id, deferred_download.unit_id))
+            if unit is not None:
                 yield unit
-        except DoesNotExist:
-            # This is normal if the content unit in question has been purged during an
-            # orphan cleanup.
-            _logger.debug(_('Unable to find the {type}:{id} content unit.').format(
-                type=deferred_download.unit_type_id, id=deferred_download.unit_id))
+            elif deferred_download.unit_type_id not in unknown_types:
+                # This is normal if the content unit in question has been purged during an
+                # orphan cleanup.
+                _logger.debug(_('Unable to find the {type}:{id} content unit.').format(
+                    type=deferred_download.unit_type_id, id=deferred_download.unit_id))
+
+        if len(page) < UNIT_CHUNK_SIZE:
+            return
+        last_id = page[-1].id
+
+
+def _get_catalog_entries(content_units):
+    """
+    Retrieve the lazy catalog entries of the given content units with a single query.
+
+    When there are several entries for the same file, the one with the latest revision is used.
+
+    :param content_units: The content units to retrieve the catalog entries of.
+    :type  content_units: iterable of pulp.server.db.model.FileContentUnit
+
+    :return: The catalog entries, keyed by the unit type ID, unit ID and path of their file.
+    :rtype:  dict
+    """
+    entries = {}
+    unit_ids = [content_unit.id for content_unit in content_units]
+    qs = model.LazyCatalogEntry.objects.filter(unit_id__in=unit_ids).order_by('-revision')
+    for catalog_entry in qs:
+        key = (catalog_entry.unit_type_id, catalog_entry.unit_id, catalog_entry.path)
+        entries.setdefault(key, catalog_entry)
+    return entries
 
 
 def _create_download_requests(content_units):
     """
-    Make a list of Nectar DownloadRequests for the given content units using
-    the lazy catalog.
+    Make Nectar DownloadRequests for the given content units using the lazy catalog.
+
+    The content units are processed in pages, and the catalog entries of each page are retrieved
+    with a single query. Requests are generated as they are made, so that they can be downloaded
+    while the remaining content units are being processed. The content units must therefore not
+    be read from an open database cursor, which could time out during the downloads.
 
-    :param content_units: The content units to build a list of DownloadRequests for.
-    :type  content_units: list of pulp.server.db.model.FileContentUnit
+    :param content_units: The content units to build DownloadRequests for.
+    :type  content_units: iterable of pulp.server.db.model.FileContentUnit
 
-    :return: A list of DownloadRequests; each request includes a ``data``
+    :return: A generator of DownloadRequests; each request includes a ``data``
              instance variable which is a dict containing the FileContentUnit,
              the list of files in the unit, and the downloaded file's storage
              path.
-    :rtype:  list of nectar.request.DownloadRequest
+    :rtype:  generator of nectar.request.DownloadRequest
     """
-    requests = []
     working_dir = common_utils.get_working_directory()
     signing_key = Key.load(pulp_conf.get('authentication', 'rsa_key'))
 
-    for content_unit in content_units:
-        # All files in the unit; every request for a unit has a reference to this dict.
-        unit_files = {}
-        unit_working_dir = os.path.join(working_dir, content_unit.id)
-        for file_path in content_unit.list_files():
-            qs = model.LazyCatalogEntry.objects.filter(
-                unit_id=content_unit.id,
-                unit_type_id=content_unit.type_id,
-                path=file_path
-            )
-            catalog_entry = qs.order_by('revision').first()
-            if catalog_entry is None:
-                continue
-            signed_url = _get_streamer_url(catalog_entry, signing_key)
+    for page in paginate(content_units, UNIT_CHUNK_SIZE):
+        catalog_entries = _get_catalog_entries(page)
+        for content_unit in page:
+            # All files in the unit; every request for a unit has a reference to this dict.
+            unit_files = {}
+            unit_working_dir = os.path.join(working_dir, content_unit.id)
+            for file_path in content_unit.list_files():
+                catalog_entry = catalog_entries.get(
+                    (content_unit.type_id, content_unit.id, file_path))
+                if catalog_entry is None:
+                    continue
+                signed_url = _get_streamer_url(catalog_entry, signing_key)
 
-            temporary_destination = os.path.join(
-                unit_working_dir,
-                os.path.basename(catalog_entry.path)
-            )
-            mkdir(unit_working_dir)
-            unit_files[temporary_destination] = {
-                CATALOG_ENTRY: catalog_entry,
-                PATH_DOWNLOADED: None,
-            }
-
-            request = DownloadRequest(signed_url, temporary_destination)
-            # For memory reasons, only hold onto the id and type_id so we can reload the unit
-            # once it's successfully downloaded.
-            request.data = {
-                TYPE_ID: content_unit.type_id,
-                UNIT_ID: content_unit.id,
-                UNIT_FILES: unit_files,
-                REQUEST: request
-            }
-            requests.append(request)
-
-    return requests
+                temporary_destination = os.path.join(
+                    unit_working_dir,
+                    os.path.basename(catalog_entry.path)
+                )
+                mkdir(unit_working_dir)
+                unit_files[temporary_destination] = {
+                    CATALOG_ENTRY: catalog_entry,
+                    PATH_DOWNLOADED: None,
+                }
+
+                request = DownloadRequest(signed_url, temporary_destination)
+                # For memory reasons, only hold onto the id and type_id so we can reload the unit
+                # once it's successfully downloaded.
+                request.data = {
+                    TYPE_ID: content_unit.type_id,
+                    UNIT_ID: content_unit.id,
+                    UNIT_FILES: unit_files,
+                    REQUEST: request
+                }
+                yield request
 
 
 def _get_streamer_url(catalog_entry, signing_key):
@@ -1585,7 +1861,7 @@ class LazyUnitDownloadStep(DownloadEventListener):
     to download from the Pulp Streamer components.
 
     :ivar download_requests: The download requests the step will process.
-    :type download_requests: list of nectar.request.DownloadRequest
+    :type download_requests: iterable of nectar.request.DownloadRequest
     :ivar download_config:   The keyword args used to initialize the Nectar
                              downloader configuration.
     :type download_config:   dict
@@ -1597,8 +1873,11 @@ class LazyUnitDownloadStep(DownloadEventListener):
         """
         Initializes a Step that downloads all the download requests provided.
 
-        :param download_requests:   List of download requests to process.
-        :type  download_requests:   list of nectar.request.DownloadRequest
+        When the download requests are given as a generator, the total number of requests is only
+        known once the downloader has consumed all of them.
+
+        :param download_requests:   Download requests to process.
+        :type  download_requests:   iterable of nectar.request.DownloadRequest
         """
         self.description = step_description
         self.download_requests = download_requests
@@ -1620,7 +1899,12 @@ class LazyUnitDownloadStep(DownloadEventListener):
         self.progress_successes = 0
         self.progress_failures = 0
         self.error_details = []
-        self.total_units = len(download_requests)
+        try:
+            self.total_units = len(download_requests)
+            self.all_requests_counted = True
+        except TypeError:
+            self.total_units = 0
+            self.all_requests_counted = False
         self.last_report_time = 0
         self.last_reported_state = self.state
         self.timestamp = str(time.time())
@@ -1632,7 +1916,26 @@ class LazyUnitDownloadStep(DownloadEventListener):
         """
         self.state = reporting_constants.STATE_RUNNING
         self.report()
-        self.downloader.download(self.download_requests)
+        if self.all_requests_counted:
+            self.downloader.download(self.download_requests)
+        else:
+            self.downloader.download(self._count_requests(self.download_requests))
+            self.report()
+
+    def _count_requests(self, download_requests):
+        """
+        Count the download requests as the downloader consumes them.
+
+        :param download_requests: Download requests to process.
+        :type  download_requests: iterable of nectar.request.DownloadRequest
+
+        :return: The download requests.
+        :rtype:  generator of nectar.request.DownloadRequest
+        """
+        for request in download_requests:
+            self.total_units += 1
+            yield request
+        self.all_requests_counted = True
 
     def report(self):
         """
@@ -1641,7 +1944,7 @@ class LazyUnitDownloadStep(DownloadEventListener):
         progress reporting system when that has been implemented.
         """
         total_processed = self.progress_successes + self.progress_failures
-        if self.total_units == total_processed:
+        if self.all_requests_counted and self.total_units == total_processed:
             self.state = reporting_constants.STATE_COMPLETE
 
         if self.progress_failures > 0:
@@ -1754,14 +2057,16 @@ class LazyUnitDownloadStep(DownloadEventListener):
                 catalog_entry.checksum
             )
 
+            # The downloaded file is in the working directory of the task, so it is moved.
             if len(report.data[UNIT_FILES]) == 1:
-                content_unit.import_content(report.destination)
+                content_unit.import_content(report.destination, disposable=True)
             else:
                 relative_path = os.path.relpath(
                     catalog_entry.path,
                     content_unit.storage_path,
                 )
-                content_unit.import_content(report.destination, location=relative_path)
+                content_unit.import_content(report.destination, location=relative_path,
+                                            disposable=True)
             self.progress_successes += 1
             path_entry[PATH_DOWNLOADED] = True
         except (InvalidChecksumType, VerificationException, IOError), e:
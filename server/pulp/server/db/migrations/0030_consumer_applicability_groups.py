@@ -0,0 +1,125 @@
+"""
+This migration populates the consumer_applicability_groups collection, which holds the
+applicability materialized for groups of consumers with the same profiles and bindings, from the
+existing profiles, bindings and applicability.
+
+The hashes identifying the profiles and groups are calculated here as they are by
+pulp.server.managers.consumer.applicability at the time of this migration, so that later
+changes to the managers do not change what the migration does.
+"""
+import hashlib
+import json
+
+from pulp.server.db.connection import get_collection
+from pulp.server.db.migrations.lib import utils
+
+BATCH_SIZE = 1000
+
+
+def calculate_all_profiles_hash(profile_hashes):
+    """
+    Calculate the hash identifying the set of profiles of a consumer.
+
+    :param profile_hashes: the hashes of the profiles of a consumer
+    :type  profile_hashes: list
+    :return: all_profiles_hash
+    :rtype:  str
+    """
+    if len(profile_hashes) == 1:
+        return profile_hashes[0]
+    return hashlib.sha256(json.dumps(sorted(profile_hashes))).hexdigest()
+
+
+def calculate_group_id(all_profiles_hash, repo_ids):
+    """
+    Calculate the id of the group for a set of profiles and bound repositories.
+
+    :param all_profiles_hash: hash of the consumer profiles
+    :type  all_profiles_hash: basestring
+    :param repo_ids: ids of the repositories the consumers are bound to
+    :type  repo_ids: iterable
+    :return: the id of the group
+    :rtype:  str
+    """
+    serialized = json.dumps([all_profiles_hash, sorted(set(repo_ids))])
+    return hashlib.sha256(serialized).hexdigest()
+
+
+def add_consumers_to_groups(consumer_ids):
+    """
+    Add consumers to the groups for their profiles and bindings, creating the groups with a copy
+    of the existing applicability. Consumers without profiles or bindings are not added.
+
+    :param consumer_ids: ids of the consumers to add
+    :type  consumer_ids: list
+    """
+    profile_hashes = {}
+    profiles = get_collection('consumer_unit_profiles').find(
+        {'consumer_id': {'$in': consumer_ids}, 'profile': {'$ne': []}},
+        projection=['consumer_id', 'profile_hash'])
+    for profile in profiles:
+        profile_hashes.setdefault(profile['consumer_id'], []).append(profile['profile_hash'])
+
+    bound_repo_ids = {}
+    bindings = get_collection('consumer_bindings').find(
+        {'consumer_id': {'$in': consumer_ids}, 'deleted': False},
+        projection=['consumer_id', 'repo_id'])
+    for binding in bindings:
+        bound_repo_ids.setdefault(binding['consumer_id'], set()).add(binding['repo_id'])
+
+    # {group_id: (all_profiles_hash, repo_ids, consumer_ids)}
+    groups = {}
+    for consumer_id in consumer_ids:
+        if consumer_id not in profile_hashes or consumer_id not in bound_repo_ids:
+            continue
+        all_profiles_hash = calculate_all_profiles_hash(profile_hashes[consumer_id])
+        repo_ids = sorted(bound_repo_ids[consumer_id])
+        group_id = calculate_group_id(all_profiles_hash, repo_ids)
+        groups.setdefault(group_id, (all_profiles_hash, repo_ids, []))[2].append(consumer_id)
+
+    group_collection = get_collection('consumer_applicability_groups')
+    applicability_collection = get_collection('repo_profile_applicability')
+    for group_id, (all_profiles_hash, repo_ids, members) in groups.items():
+        result = group_collection.update_one(
+            {'group_id': group_id},
+            {'$addToSet': {'consumers': {'$each': members}}},
+            upsert=True)
+        if result.upserted_id is None:
+            continue
+        repos = []
+        for repo_id in repo_ids:
+            applicability = applicability_collection.find_one(
+                {'all_profiles_hash': all_profiles_hash, 'repo_id': repo_id},
+                projection=['applicability'])
+            if applicability is not None:
+                applicability = applicability['applicability']
+            repos.append({'repo_id': repo_id, 'applicability': applicability})
+        group_collection.update_one(
+            {'_id': result.upserted_id},
+            {'$set': {'all_profiles_hash': all_profiles_hash, 'repos': repos}})
+
+
+def migrate(*args, **kwargs):
+    """
+    Perform the migration as described in this module's docblock.
+
+    :param args:   unused
+    :type  args:   list
+    :param kwargs: unused
+    :type  kwargs: dict
+    """
+    consumer_collection = get_collection('consumers')
+    total_consumers = consumer_collection.count()
+    consumers = consumer_collection.find({}, ['id']).batch_size(BATCH_SIZE)
+
+    with utils.MigrationProgressLog('Consumers', total_consumers) as migration_log:
+        consumer_ids = []
+        for consumer in consumers:
+            consumer_ids.append(consumer['id'])
+            if len(consumer_ids) >= BATCH_SIZE:
+                add_consumers_to_groups(consumer_ids)
+                migration_log.progress(migrated_units=len(consumer_ids))
+                consumer_ids = []
+        if consumer_ids:
+            add_consumers_to_groups(consumer_ids)
+            migration_log.progress(migrated_units=len(consumer_ids))
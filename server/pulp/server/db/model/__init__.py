@@ -104,6 +104,9 @@ class Repository(AutoRetryDocument):
                                This is different than the number of associations, since a
                                unit may be associated multiple times.
     :type content_unit_counts: mongoengine.DictField
+    :ivar content_fingerprint: hash of the units associated with this repo, which is the same for
+                               all repos with identical content
+    :type content_fingerprint: mongoengine.StringField
     :ivar scratchpad: Field used to persistently store arbitrary information from the plugins
                       across multiple operations.
     :type scratchpad: mongoengine.DictField
@@ -124,6 +127,7 @@ class Repository(AutoRetryDocument):
     notes = DictField()
     scratchpad = DictField(default={})
     content_unit_counts = DictField(default={})
+    content_fingerprint = StringField()
     last_unit_added = UTCDateTimeField()
     last_unit_removed = UTCDateTimeField()
 
@@ -170,7 +174,8 @@ class Repository(AutoRetryDocument):
                     self.notes[key] = value
 
         # These keys may not be changed.
-        prohibited = ['content_unit_counts', 'repo_id', 'last_unit_added', 'last_unit_removed']
+        prohibited = ['content_unit_counts', 'content_fingerprint', 'repo_id', 'last_unit_added',
+                      'last_unit_removed']
         [setattr(self, key, value) for key, value in repo_delta.items() if key not in prohibited]
 
 
@@ -896,7 +901,7 @@ class FileContentUnit(ContentUnit):
                 raise ValueError(_('must be relative path'))
         self._storage_path = path
 
-    def import_content(self, path, location=None):
+    def import_content(self, path, location=None, disposable=False, hardlink=False):
         """
         Import a content file into platform storage.
         The (optional) *location* may be used to specify a path within the unit
@@ -905,11 +910,22 @@ class FileContentUnit(ContentUnit):
           import_content('/tmp/file') will store 'file' at: _storage_path
           import_content('/tmp/file', 'a/b/c) will store 'file' at: _storage_path/a/b/c
 
+        The file is moved into storage when it is *disposable*, and hardlinked when
+        *hardlink* is set, so that it is not copied. See FileStorage.put().
+
         :param path: The absolute path to the file to be imported.
         :type path: str
         :param location: The (optional) location within the unit storage path
             where the content is to be stored.
         :type location: str
+        :param disposable: The file is no longer needed by the caller, such as a
+            downloaded file in a working directory, so that it may be moved into storage.
+        :type disposable: bool
+        :param hardlink: The file will not be modified in place after it is imported, so
+            that it may be hardlinked into storage.
+        :type hardlink: bool
+        :return: The strategy used to transfer the file into storage.
+        :rtype: str
 
         :raises ImportError: if the unit has not been saved.
         :raises PulpCodedException: PLP0037 if *path* is not an existing file.
@@ -920,7 +936,7 @@ class FileContentUnit(ContentUnit):
         if not os.path.isfile(path):
             raise exceptions.PulpCodedException(error_code=error_codes.PLP0037, path=path)
         with FileStorage() as storage:
-            storage.put(self, path, location)
+            return storage.put(self, path, location, disposable=disposable, hardlink=hardlink)
 
     def save_and_import_content(self, path, location=None):
         """
@@ -243,6 +243,57 @@ class RepoProfileApplicability(Model):
             self._id = self.get_collection().insert(new_document)
 
 
+class ConsumerApplicabilityGroup(Model):
+    """
+    This class models a Mongo collection that is used to store applicability materialized for
+    groups of consumers. The consumers of a group have the same set of profiles, identified by
+    all_profiles_hash, and are bound to the same repositories. For each of these repositories,
+    the group holds a copy of the applicability data from the repo_profile_applicability
+    collection, or None if there is none.
+
+    The groups are maintained by the ConsumerApplicabilityGroupManager when applicability is
+    regenerated.
+    """
+    collection_name = 'consumer_applicability_groups'
+
+    unique_indices = ('group_id',)
+    search_indices = (
+        ('consumers',),
+        ('all_profiles_hash', 'repos.repo_id'),
+    )
+
+    def __init__(self, group_id, all_profiles_hash, consumers, repos, _id=None, **kwargs):
+        """
+        Construct a ConsumerApplicabilityGroup object.
+
+        :param group_id:          Identifies the set of profiles and repositories of the group
+        :type  group_id:          basestring
+        :param all_profiles_hash: The hash of the set of profiles of the consumers
+        :type  all_profiles_hash: basestring
+        :param consumers:         The IDs of the consumers in the group
+        :type  consumers:         list
+        :param repos:             The applicability for each repository the consumers are bound
+                                  to, as dictionaries with keys 'repo_id' and 'applicability'
+        :type  repos:             list
+        :param _id:               The MongoDB ID for this object, if it exists in the database.
+                                  A new ID is generated otherwise.
+        :type  _id:               bson.objectid.ObjectId
+        :param kwargs:            unused, but collected to allow instantiation from Mongo query
+                                  results
+        :type  kwargs:            dict
+        """
+        super(ConsumerApplicabilityGroup, self).__init__()
+
+        self.group_id = group_id
+        self.all_profiles_hash = all_profiles_hash
+        self.consumers = consumers
+        self.repos = repos
+        if _id is not None:
+            self._id = _id
+
+        del self.id
+
+
 class UnitProfile(Model):
     """
     Represents a consumer profile, which is a data structure that records which content is installed
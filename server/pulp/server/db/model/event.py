@@ -27,3 +27,21 @@ class EventListener(Model):
         self.notifier_type_id = notifier_type_id
         self.notifier_config = notifier_config
         self.event_types = event_types
+
+
+class EventListenerGeneration(Model):
+    """
+    Counts the changes made to the event listeners. Processes that cache the
+    listeners compare the count with the one they read the listeners at, so that
+    a change made by any process is seen by all of them.
+
+    The collection holds a single document whose _id is GENERATION_ID.
+
+    @ivar generation: the number of changes made to the event listeners
+    @type generation: int
+    """
+
+    collection_name = 'event_listener_generation'
+    unique_indices = ()
+
+    GENERATION_ID = 'event_listeners'
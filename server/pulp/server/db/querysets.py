@@ -168,7 +168,7 @@ class RepositoryContentUnitQuerySet(CriteriaQuerySet):
     Custom queryset for repository content units.
     """
 
-    def _num_between(self, field, start=None, end=None, repo_id=None):
+    def _between(self, field, start=None, end=None, repo_id=None):
         """
         Helper function to query units of based on timestamps.
 
@@ -180,8 +180,8 @@ class RepositoryContentUnitQuerySet(CriteriaQuerySet):
         :type  end: str in ISO8601 format with timezone
         :param repo_id: restrict search to this repo
         :type  repo_id: str
-        :return: number of units in the repo in which the specified field is between start and end
-        :rtype:  int
+        :return: units in the repo in which the specified field is between start and end
+        :rtype:  RepositoryContentUnitQuerySet
         """
         q_dicts = []
 
@@ -197,7 +197,39 @@ class RepositoryContentUnitQuerySet(CriteriaQuerySet):
         Q_filters = [Q(**q_dict) for q_dict in q_dicts]
         query = reduce(operator.and_, Q_filters)
 
-        return self(query).count()
+        return self(query)
+
+    def _num_between(self, field, start=None, end=None, repo_id=None):
+        """
+        Helper function to count units of based on timestamps.
+
+        :param field: date field that will be searched
+        :type  field: str
+        :param start: find units in which the specified field is after this time
+        :type  start: str in ISO8601 format with timezone
+        :param end: find units in which the specified field is before this time
+        :type  end: str in ISO8601 format with timezone
+        :param repo_id: restrict search to this repo
+        :type  repo_id: str
+        :return: number of units in the repo in which the specified field is between start and end
+        :rtype:  int
+        """
+        return self._between(field, start, end, repo_id).count()
+
+    def created_between(self, start=None, end=None, repo_id=None):
+        """
+        Find the content units that were created in between the start and end times.
+
+        :param start: find units created after this time
+        :type  start: str in ISO8601 format with timezone
+        :param end: find units created before this time
+        :type  end: str in ISO8601 format with timezone
+        :param repo_id: restrict search to this repo
+        :type  repo_id: str
+        :return: units created between start and end of the specified repo
+        :rtype:  RepositoryContentUnitQuerySet
+        """
+        return self._between("created", start, end, repo_id)
 
     def num_created(self, start=None, end=None, repo_id=None):
         """
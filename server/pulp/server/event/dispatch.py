@@ -0,0 +1,401 @@
+"""
+Delivers fired events to the notifiers of their listeners.
+
+When the notifier_workers setting is greater than 0, deliveries are made by a
+bounded pool of worker threads so that the task firing an event does not wait
+for notifiers such as a slow HTTP endpoint, and a failed delivery is retried
+with an exponential backoff. Celery worker processes exit without running atexit
+handlers, so the queued deliveries are flushed after each task (see flush()).
+By default, deliveries are made by the thread firing the event.
+
+The event listeners are cached so that firing an event does not read all of
+them from the database each time.
+
+The settings are in the events section of the server configuration.
+"""
+from gettext import gettext as _
+import atexit
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from pulp.server.config import config
+from pulp.server.db.model.event import EventListener, EventListenerGeneration
+from pulp.server.event import notifiers
+
+
+_logger = logging.getLogger(__name__)
+
+# The number of seconds to wait for queued deliveries when the process exits.
+DRAIN_TIMEOUT = 10
+
+
+class ListenerTable(object):
+    """
+    A cache of the event listeners.
+
+    The listeners are read from the database on first use and again once they
+    are older than the listener_cache_ttl setting or have been invalidated.
+    Invalidation increments the generation stored in the database, which each
+    process compares with the generation its cached listeners were read at.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._listeners = None
+        self._generation = None
+        self._loaded = 0
+
+    def find(self, event_type):
+        """
+        Get the listeners for an event type.
+
+        :param event_type: An event type.
+        :type  event_type: str
+        :return: The listeners for the event type, including those listening for all events.
+        :rtype:  list
+        """
+        return [l for l in self._load()
+                if event_type in l['event_types'] or '*' in l['event_types']]
+
+    def invalidate(self):
+        """
+        Drop the cached listeners of every process so that they are read again on
+        next use. This must be called after the listeners are changed.
+        """
+        EventListenerGeneration.get_collection().update(
+            {'_id': EventListenerGeneration.GENERATION_ID},
+            {'$inc': {'generation': 1}},
+            upsert=True)
+        with self._lock:
+            self._listeners = None
+
+    @staticmethod
+    def _read_generation():
+        """
+        :return: The number of changes made to the listeners.
+        :rtype:  int
+        """
+        document = EventListenerGeneration.get_collection().find_one(
+            {'_id': EventListenerGeneration.GENERATION_ID})
+        if document is None:
+            return 0
+        return document['generation']
+
+    def _load(self):
+        """
+        :return: The cached listeners, which are read again when expired or changed.
+        :rtype:  list
+        """
+        ttl = config.getfloat('events', 'listener_cache_ttl')
+        # The generation is read before the listeners, so a change made while they
+        # are read is seen on next use.
+        generation = self._read_generation()
+        with self._lock:
+            now = time.time()
+            if self._listeners is None or generation != self._generation or \
+                    now - self._loaded >= ttl:
+                self._listeners = list(EventListener.get_collection().find())
+                self._generation = generation
+                self._loaded = now
+            return self._listeners
+
+
+class Delivery(object):
+    """
+    An event to be passed to a notifier.
+
+    :ivar notifier_type_id: The type of notifier.
+    :type notifier_type_id: str
+    :ivar notifier_config: The configuration of the listener's notifier.
+    :type notifier_config: dict
+    :ivar event: The fired event.
+    :type event: pulp.server.event.data.Event
+    :ivar attempts: The number of delivery attempts made.
+    :type attempts: int
+    :ivar created: When the event was submitted for delivery (seconds since epoch).
+    :type created: float
+    """
+
+    def __init__(self, notifier_type_id, notifier_config, event):
+        """
+        :param notifier_type_id: The type of notifier.
+        :type  notifier_type_id: str
+        :param notifier_config: The configuration of the listener's notifier.
+        :type  notifier_config: dict
+        :param event: The fired event.
+        :type  event: pulp.server.event.data.Event
+        """
+        self.notifier_type_id = notifier_type_id
+        self.notifier_config = notifier_config
+        self.event = event
+        self.attempts = 0
+        self.created = time.time()
+
+
+class Dispatcher(object):
+    """
+    Delivers events to notifiers using a pool of worker threads.
+
+    The worker threads are started on the first submission in each process, so
+    a dispatcher created before a fork is usable in the child. When there are
+    no workers, deliveries are made in the submitting thread and are not retried.
+
+    :ivar workers: The number of worker threads.
+    :type workers: int
+    :ivar queue_size: The maximum number of queued deliveries. Deliveries submitted
+        when the queue is full are dropped.
+    :type queue_size: int
+    :ivar retries: The number of times a failed delivery is retried.
+    :type retries: int
+    :ivar retry_delay: The number of seconds before the first retry. The delay is
+        doubled for each subsequent retry.
+    :type retry_delay: float
+    """
+
+    def __init__(self, workers, queue_size, retries, retry_delay):
+        """
+        :param workers: The number of worker threads.
+        :type  workers: int
+        :param queue_size: The maximum number of queued deliveries.
+        :type  queue_size: int
+        :param retries: The number of times a failed delivery is retried.
+        :type  retries: int
+        :param retry_delay: The number of seconds before the first retry.
+        :type  retry_delay: float
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._condition = threading.Condition(threading.Lock())
+        self._pid = None
+        self._reset()
+
+    def submit(self, delivery):
+        """
+        Queue a delivery.
+
+        :param delivery: The delivery to make.
+        :type  delivery: Delivery
+        """
+        if self.workers < 1:
+            self._deliver(delivery)
+            return
+        with self._condition:
+            if self._pid != os.getpid():
+                self._start()
+            if len(self._pending) >= self.queue_size:
+                self._stats['dropped'] += 1
+                _logger.error(_('Event queue full; dropped [%(e)s] event for notifier of type '
+                                '[%(n)s]') % {'e': delivery.event.event_type,
+                                              'n': delivery.notifier_type_id})
+                return
+            self._schedule(delivery, time.time())
+
+    def join(self, timeout=None):
+        """
+        Wait for the queued deliveries, including their retries, to be made.
+
+        :param timeout: The maximum number of seconds to wait, or None to wait
+            until there are no more deliveries.
+        :type  timeout: float
+        :return: True if all deliveries were made.
+        :rtype:  bool
+        """
+        if self._pid != os.getpid():
+            # No deliveries have been queued by this process.
+            return True
+        if timeout is not None:
+            deadline = time.time() + timeout
+        with self._condition:
+            while self._pending or self._active:
+                if timeout is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def stats(self):
+        """
+        Get the delivery metrics of this process.
+
+        :return: A dictionary of: delivered, failed, retried and dropped counts,
+            the number of queued deliveries, and the average and maximum latency
+            (seconds) from submission to successful delivery.
+        :rtype:  dict
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats['queued'] = len(self._pending)
+        total = stats.pop('total_latency')
+        stats['average_latency'] = total / stats['delivered'] if stats['delivered'] else 0.0
+        return stats
+
+    def _reset(self):
+        """
+        Reset the queue and metrics.
+        """
+        # heap of: (due, sequence, delivery)
+        self._pending = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._stats = {
+            'delivered': 0,
+            'failed': 0,
+            'retried': 0,
+            'dropped': 0,
+            'total_latency': 0.0,
+            'max_latency': 0.0,
+        }
+
+    def _start(self):
+        """
+        Start the worker threads in the current process.
+        Deliveries queued in a parent process are not inherited.
+        The condition must be held.
+        """
+        if self._pid is not None:
+            self._reset()
+        self._pid = os.getpid()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name='event-dispatch-%d' % n)
+            thread.daemon = True
+            thread.start()
+        atexit.register(self.join, DRAIN_TIMEOUT)
+
+    def _schedule(self, delivery, due):
+        """
+        Queue a delivery to be made at the specified time.
+        The condition must be held.
+
+        :param delivery: The delivery to make.
+        :type  delivery: Delivery
+        :param due: When the delivery is to be made (seconds since epoch).
+        :type  due: float
+        """
+        heapq.heappush(self._pending, (due, next(self._sequence), delivery))
+        self._condition.notify()
+
+    def _next(self):
+        """
+        Wait for the next delivery that is due.
+
+        :return: The delivery to make.
+        :rtype:  Delivery
+        """
+        with self._condition:
+            while True:
+                now = time.time()
+                if self._pending and self._pending[0][0] <= now:
+                    self._active += 1
+                    return heapq.heappop(self._pending)[2]
+                if self._pending:
+                    self._condition.wait(self._pending[0][0] - now)
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        """
+        The main loop of a worker thread.
+        """
+        while True:
+            delivery = self._next()
+            try:
+                self._deliver(delivery)
+            finally:
+                with self._condition:
+                    self._active -= 1
+                    self._condition.notify_all()
+
+    def _deliver(self, delivery):
+        """
+        Pass an event to a notifier, scheduling a retry when the notifier fails.
+        Exceptions are logged but otherwise suppressed.
+
+        :param delivery: The delivery to make.
+        :type  delivery: Delivery
+        """
+        delivery.attempts += 1
+        try:
+            f = notifiers.get_notifier_function(delivery.notifier_type_id)
+        except KeyError:
+            _logger.error(_('Unknown notifier type [%(n)s]') % {'n': delivery.notifier_type_id})
+            with self._condition:
+                self._stats['failed'] += 1
+            return
+
+        try:
+            f(delivery.notifier_config, delivery.event)
+        except Exception:
+            with self._condition:
+                if self.workers > 0 and delivery.attempts <= self.retries:
+                    delay = self.retry_delay * 2 ** (delivery.attempts - 1)
+                    _logger.warning(
+                        _('Notifier of type [%(n)s] failed; retrying in %(d)s seconds') %
+                        {'n': delivery.notifier_type_id, 'd': delay}, exc_info=True)
+                    self._stats['retried'] += 1
+                    self._schedule(delivery, time.time() + delay)
+                    return
+                self._stats['failed'] += 1
+            _logger.exception('Exception from notifier of type [%s]' % delivery.notifier_type_id)
+            return
+
+        latency = time.time() - delivery.created
+        with self._condition:
+            self._stats['delivered'] += 1
+            self._stats['total_latency'] += latency
+            self._stats['max_latency'] = max(self._stats['max_latency'], latency)
+        _logger.debug('Delivered [%s] event to notifier of type [%s] in %.3f seconds' %
+                      (delivery.event.event_type, delivery.notifier_type_id, latency))
+
+
+# The cached event listeners of this process.
+LISTENERS = ListenerTable()
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def flush(timeout=DRAIN_TIMEOUT):
+    """
+    Wait for the deliveries queued by this process, including their retries, to be
+    made. Deliveries not made within the timeout are left queued, and are lost if
+    the process exits.
+
+    :param timeout: The maximum number of seconds to wait.
+    :type  timeout: float
+    :return: True if all deliveries were made.
+    :rtype:  bool
+    """
+    with _dispatcher_lock:
+        dispatcher = _dispatcher
+    if dispatcher is None or dispatcher.join(timeout):
+        return True
+    _logger.error(_('Timed out waiting for %(n)s queued event deliveries') %
+                  {'n': dispatcher.stats()['queued']})
+    return False
+
+
+def get_dispatcher():
+    """
+    Get the dispatcher of this process, which is created on first use.
+
+    :return: The dispatcher.
+    :rtype:  Dispatcher
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher(
+                config.getint('events', 'notifier_workers'),
+                config.getint('events', 'notifier_queue_size'),
+                config.getint('events', 'notifier_retries'),
+                config.getfloat('events', 'notifier_retry_delay'))
+        return _dispatcher
@@ -6,6 +6,9 @@ url
   Full URL to contact with the event data. A POST request will be made to this
   URL with the contents of the events in the body.
 
+timeout
+  Optional number of seconds to wait for the URL to respond. Defaults to 15.
+
 Eventually this should be enhanced to support authentication credentials as well.
 """
 from gettext import gettext as _
@@ -19,6 +22,9 @@ from requests.auth import HTTPBasicAuth
 
 TYPE_ID = 'http'
 
+# The default number of seconds to wait for the notifier URL to respond.
+DEFAULT_TIMEOUT = 15
+
 _logger = logging.getLogger(__name__)
 
 
@@ -40,6 +46,9 @@ def _send_post(notifier_config, json_body):
     :type notifier_config:  dict
     :param json_body:       The POST data that has been serialized to JSON.
     :param json_body:       dict
+    :raises requests.RequestException: if the request fails or the server responds
+                                       with an error, so that the event dispatcher
+                                       retries the notification
     """
     if 'url' not in notifier_config or not notifier_config['url']:
         _logger.error(_('HTTP notifier configured without a URL; cannot fire event'))
@@ -55,18 +64,16 @@ def _send_post(notifier_config, json_body):
     # CA path
     verify = notifier_config.get('ca_path') or True
 
-    try:
-        response = post(
-            url,
-            data=json_body,
-            auth=auth,
-            headers={'Content-Type': 'application/json'},
-            verify=verify,
-            timeout=15)
-    except Exception:
-        _logger.exception("HTTP Notification Failed")
-        return
+    response = post(
+        url,
+        data=json_body,
+        auth=auth,
+        headers={'Content-Type': 'application/json'},
+        verify=verify,
+        timeout=notifier_config.get('timeout') or DEFAULT_TIMEOUT)
 
     if response.status_code != 200:
         _logger.error(_('Received HTTP {code} from HTTP notifier to {url}.').format(
             code=response.status_code, url=url))
+        if response.status_code >= 500:
+            response.raise_for_status()
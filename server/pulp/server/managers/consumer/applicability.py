@@ -1,6 +1,7 @@
 """
 Contains content applicability management classes
 """
+from collections import Counter
 import hashlib
 import itertools
 import json
@@ -9,30 +10,108 @@ from gettext import gettext as _
 from logging import getLogger
 from uuid import uuid4
 
+from bson.errors import InvalidId
 from celery import task
 from mongoengine import errors as mongo_errors
-from pymongo.errors import DuplicateKeyError
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 from pulp.plugins.conduits.profiler import ProfilerConduit
 from pulp.plugins.config import PluginCallConfiguration
 from pulp.plugins.loader import api as plugin_api, exceptions as plugin_exceptions
+from pulp.common import dateutils
 from pulp.plugins.profiler import Profiler
 from pulp.server.async.tasks import Task
+from pulp.server.compat import ObjectId
 from pulp.server.db import model, connection
-from pulp.server.db.model.consumer import Bind, RepoProfileApplicability, UnitProfile
+from pulp.server.db.model.consumer import (Bind, ConsumerApplicabilityGroup,
+                                           RepoProfileApplicability, UnitProfile)
 from pulp.server.db.model.criteria import Criteria
+from pulp.server.exceptions import InvalidValue
 from pulp.server.managers import factory as managers
 from pulp.server.managers.consumer.query import ConsumerQueryManager
 
 
 _logger = getLogger(__name__)
 
+# The number of RepoProfileApplicability writes sent to the database at a time.
+APPLICABILITY_WRITE_BATCH_SIZE = 1000
+# The error code of a write that violated a unique index.
+DUPLICATE_KEY_ERROR = 11000
+
+
+class ApplicabilityCache(object):
+    """
+    Applicability calculated during a regeneration, keyed by the content fingerprint of the
+    repository it was calculated against and the hash of the profiles it was calculated for, so
+    that it is only calculated once for repositories with identical content.
+
+    Only the results for the fingerprint of the last repository are kept, so repositories should
+    be processed in the order of sort_key().
+    """
+
+    def __init__(self, repo_ids):
+        """
+        :param repo_ids: ids of the repositories applicability is regenerated for
+        :type  repo_ids: iterable
+        """
+        q_set = model.Repository.objects(repo_id__in=list(repo_ids))
+        fingerprints = dict(q_set.scalar('repo_id', 'content_fingerprint'))
+        # Results are only cached for the fingerprints of more than one repository
+        shared = set(f for f, count in Counter(fingerprints.values()).items() if f and count > 1)
+        self._fingerprints = dict((r, f) for r, f in fingerprints.items() if f in shared)
+        self._fingerprint = None
+        self._results = {}
+
+    def sort_key(self, repo_id):
+        """
+        :param repo_id: repo id
+        :type  repo_id: basestring
+        :return: a key that sorts repositories with identical content next to each other
+        :rtype:  basestring
+        """
+        return self._fingerprints.get(repo_id) or ''
+
+    def get(self, repo_id, all_profiles_hash):
+        """
+        :param repo_id: repo id
+        :type  repo_id: basestring
+        :param all_profiles_hash: hash of the consumer profiles
+        :type  all_profiles_hash: basestring
+        :return: the applicability calculated for the profiles against a repository with the same
+                 content, or None
+        :rtype:  dict
+        """
+        fingerprint = self._fingerprints.get(repo_id)
+        if fingerprint is None or fingerprint != self._fingerprint:
+            return None
+        return self._results.get(all_profiles_hash)
+
+    def add(self, repo_id, all_profiles_hash, applicability):
+        """
+        :param repo_id: repo id
+        :type  repo_id: basestring
+        :param all_profiles_hash: hash of the consumer profiles
+        :type  all_profiles_hash: basestring
+        :param applicability: the applicability calculated for the profiles against the repository
+        :type  applicability: dict
+        """
+        fingerprint = self._fingerprints.get(repo_id)
+        if fingerprint is None:
+            return
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._results = {}
+        self._results[all_profiles_hash] = applicability
+
 
 class ApplicabilityRegenerationManager(object):
     @staticmethod
     def regenerate_applicability_for_consumers(consumer_criteria):
         """
-        Regenerate and save applicability data for given updated consumers.
+        Regenerate and save applicability data for given updated consumers, and move the
+        consumers to the materialized applicability groups for their current profiles and
+        bindings.
 
         :param consumer_criteria: The consumer selection criteria
         :type consumer_criteria: dict
@@ -63,7 +142,10 @@ class ApplicabilityRegenerationManager(object):
 
         # Iterate through each unique all_profiles_hash and regenerate applicability,
         # if it doesn't exist.
-        for repo_id in repo_consumer_map:
+        writes = []
+        regenerated = set()
+        cache = ApplicabilityCache(repo_consumer_map)
+        for repo_id in sorted(repo_consumer_map, key=cache.sort_key):
             seen_hashes = set()
             for consumer_id in repo_consumer_map[repo_id]:
                 if consumer_id in consumer_profile_map:
@@ -77,16 +159,33 @@ class ApplicabilityRegenerationManager(object):
                         continue
                     # If applicability does not exist, generate applicability data for given
                     # profiles and repo id.
-                    ApplicabilityRegenerationManager.regenerate_applicability(all_profiles_hash,
-                                                                              profiles, repo_id)
+                    ApplicabilityRegenerationManager.regenerate_applicability(
+                        all_profiles_hash, profiles, repo_id, applicability_writes=writes,
+                        applicability_cache=cache)
+                    regenerated.add((all_profiles_hash, repo_id))
+                    ApplicabilityRegenerationManager._write_applicability(
+                        writes, APPLICABILITY_WRITE_BATCH_SIZE)
+        ApplicabilityRegenerationManager._write_applicability(writes)
+
+        # Update the materialized applicability of the consumers
+        ConsumerApplicabilityGroupManager.refresh(regenerated)
+        ConsumerApplicabilityGroupManager.update_consumers(consumer_ids)
 
     @staticmethod
-    def regenerate_applicability_for_repos(repo_criteria):
+    def regenerate_applicability_for_repos(repo_criteria, since=None):
         """
         Regenerate and save applicability data affected by given updated repositories.
 
+        When since is specified, applicability is regenerated incrementally: only the units
+        added to each repository since then are passed to the profiler, and the result is merged
+        into the existing applicability data, from which the units removed from the repository
+        are dropped.
+
         :param repo_criteria: The repo selection criteria
         :type repo_criteria: dict
+        :param since: The time the repositories were last updated before the update(s) that
+                      applicability is regenerated for
+        :type since: str in ISO8601 format
         """
         repo_criteria = Criteria.from_dict(repo_criteria)
         # Process repo criteria
@@ -100,7 +199,18 @@ class ApplicabilityRegenerationManager(object):
         consumer_profile_map = ApplicabilityRegenerationManager._get_consumer_profile_map(
             consumer_ids)
 
-        for repo_id in repo_consumer_map:
+        if since is not None:
+            # Stored in the same format as the RepositoryContentUnit timestamps it's compared to
+            since = dateutils.format_iso8601_datetime(
+                dateutils.to_utc_datetime(dateutils.parse_iso8601_datetime(since)))
+
+        writes = []
+        regenerated = set()
+        cache = ApplicabilityCache(repo_consumer_map)
+        for repo_id in sorted(repo_consumer_map, key=cache.sort_key):
+            delta = None
+            if since is not None:
+                delta = ApplicabilityRegenerationManager._get_repo_delta(repo_id, since)
             seen_hashes = set()
             for consumer_id in repo_consumer_map[repo_id]:
                 if consumer_id in consumer_profile_map:
@@ -112,7 +222,13 @@ class ApplicabilityRegenerationManager(object):
 
                     # Regenerate applicability data for a given all_profiles_hash and repo id
                     ApplicabilityRegenerationManager.regenerate_applicability(
-                        all_profiles_hash, profiles, repo_id)
+                        all_profiles_hash, profiles, repo_id, delta=delta,
+                        applicability_writes=writes, applicability_cache=cache)
+                    regenerated.add((all_profiles_hash, repo_id))
+                    ApplicabilityRegenerationManager._write_applicability(
+                        writes, APPLICABILITY_WRITE_BATCH_SIZE)
+        ApplicabilityRegenerationManager._write_applicability(writes)
+        ConsumerApplicabilityGroupManager.refresh(regenerated)
 
     @staticmethod
     def queue_regenerate_applicability_for_repos(repo_criteria):
@@ -166,18 +282,33 @@ class ApplicabilityRegenerationManager(object):
         """
         Regenerate and save applicability data for a batch of applicabilities
 
+        The unit profiles of the whole batch are fetched at once, and the results are written
+        with a single bulk write. Applicability is calculated once for repositories with identical
+        content.
+
         :param profiles_to_process: profile data necessary for applicability calculation,
                                     [(repo_id, all_profiles_hash, profiles), ...]
         :type  profiles_to_process: list of tuples
         """
+        profile_ids = [p_id for _, _, profiles in profiles_to_process for _, _, p_id in profiles]
+        unit_profiles = ApplicabilityRegenerationManager._get_unit_profiles(profile_ids)
+        writes = []
+        cache = ApplicabilityCache(set(repo_id for repo_id, _, _ in profiles_to_process))
+        profiles_to_process = sorted(profiles_to_process, key=lambda p: cache.sort_key(p[0]))
         for repo_id, all_profiles_hash, profiles in profiles_to_process:
 
             # Regenerate applicability data for given profiles and repo id
-            ApplicabilityRegenerationManager.regenerate_applicability(all_profiles_hash,
-                                                                      profiles, repo_id)
+            ApplicabilityRegenerationManager.regenerate_applicability(
+                all_profiles_hash, profiles, repo_id, unit_profiles=unit_profiles,
+                applicability_writes=writes, applicability_cache=cache)
+        ApplicabilityRegenerationManager._write_applicability(writes)
+        ConsumerApplicabilityGroupManager.refresh(
+            (all_profiles_hash, repo_id) for repo_id, all_profiles_hash, _ in profiles_to_process)
 
     @staticmethod
-    def regenerate_applicability(all_profiles_hash, profiles, bound_repo_id):
+    def regenerate_applicability(all_profiles_hash, profiles, bound_repo_id, delta=None,
+                                 unit_profiles=None, applicability_writes=None,
+                                 applicability_cache=None):
         """
         Regenerate and save applicability data for given set of profiles and bound repo id.
 
@@ -190,6 +321,27 @@ class ApplicabilityRegenerationManager(object):
         :param bound_repo_id: repo id to be used to calculate applicability
                               against the given unit profile
         :type  bound_repo_id: str
+
+        :param delta: the units added to and removed from the bound repo, as returned by
+                      _get_repo_delta(), to merge into the existing applicability data.
+                      Applicability is recalculated when not specified, when there is no existing
+                      applicability data or when the profiler cannot calculate it incrementally.
+        :type  delta: dict
+
+        :param unit_profiles: the unit profiles, as returned by _get_unit_profiles(), which are
+                              fetched from the database when not specified
+        :type  unit_profiles: dict
+
+        :param applicability_writes: the list the writes of the applicability data are appended
+                                     to, to be written by _write_applicability() later. The
+                                     applicability data is written before returning when not
+                                     specified.
+        :type  applicability_writes: list
+
+        :param applicability_cache: the applicability already calculated against repositories
+                                    with identical content, which calculated applicability is
+                                    added to
+        :type  applicability_cache: ApplicabilityCache
         """
         profiler_conduit = ProfilerConduit()
 
@@ -213,57 +365,183 @@ class ApplicabilityRegenerationManager(object):
         # Get the intersection of existing types in the repo and the types that the profiler
         # handles. If the intersection is not empty, regenerate applicability
         if (set(repo_content_types) & set(profiler.metadata()['types'])):
-            profile_ids = [p_id for _, _, p_id in profiles]
-            unit_profiles = UnitProfile.get_collection().find({'id': {'$in': profile_ids}},
-                                                              projection=['profile',
-                                                                          'content_type',
-                                                                          'profile_hash'])
-            try:
-                profiles = [(p['profile_hash'], p['content_type'], p['profile']) for p in
-                            unit_profiles]
-            except TypeError:
-                # It means that p = None.
-                # Consumer can be removed during applicability regeneration,
-                # so it is possible that its profile no longer exists. It is harmless.
-                return
-
-            call_config = PluginCallConfiguration(plugin_config=profiler_cfg,
-                                                  repo_plugin_config=None)
-            try:
-                applicability = profiler.calculate_applicable_units(profiles,
-                                                                    bound_repo_id,
-                                                                    call_config,
-                                                                    profiler_conduit)
-            except NotImplementedError:
-                msg = "Profiler for content type [%s] does not support applicability" % content_type
-                _logger.debug(msg)
-                return
+            applicability = None
+            if applicability_cache is not None:
+                applicability = applicability_cache.get(bound_repo_id, all_profiles_hash)
+            if applicability is None:
+                profile_ids = [p_id for _, _, p_id in profiles]
+                if unit_profiles is None:
+                    unit_profiles = ApplicabilityRegenerationManager._get_unit_profiles(
+                        profile_ids)
+                try:
+                    profiles = [unit_profiles[p_id] for p_id in profile_ids]
+                except KeyError:
+                    # Consumer can be removed during applicability regeneration,
+                    # so it is possible that its profile no longer exists. It is harmless.
+                    return
+
+                call_config = PluginCallConfiguration(plugin_config=profiler_cfg,
+                                                      repo_plugin_config=None)
+                if delta is not None and ApplicabilityRegenerationManager._merge_applicability(
+                        all_profiles_hash, profiles, bound_repo_id, delta, profiler, call_config,
+                        profiler_conduit):
+                    return
+                try:
+                    applicability = profiler.calculate_applicable_units(profiles,
+                                                                        bound_repo_id,
+                                                                        call_config,
+                                                                        profiler_conduit)
+                except NotImplementedError:
+                    msg = "Profiler for content type [%s] does not support applicability" % \
+                        content_type
+                    _logger.debug(msg)
+                    return
+                if applicability_cache is not None:
+                    applicability_cache.add(bound_repo_id, all_profiles_hash, applicability)
 
             # Save applicability results on each of the profiles. The results are duplicated.
             # It's a compromise to have applicability data available in any applicability profile
             # record in the DB.
+            writes = [] if applicability_writes is None else applicability_writes
             for profile in profiles:
                 profile_hash = profile[0]
-                try:
-                    # Create a new RepoProfileApplicability object and save it in the db
-                    RepoProfileApplicability.objects.create(profile_hash=profile_hash,
-                                                            repo_id=bound_repo_id,
-                                                            # profiles can be large, the one in
-                                                            # repo_profile_applicability collection
-                                                            # is no longer used,
-                                                            # it's a duplicated data
-                                                            # from the consumer_unit_profiles
-                                                            # collection.
-                                                            profile=[],
-                                                            applicability=applicability,
-                                                            all_profiles_hash=all_profiles_hash)
-                except DuplicateKeyError:
-                    applicability_dict = RepoProfileApplicability.get_collection().find_one(
-                        {'repo_id': bound_repo_id, 'all_profiles_hash': all_profiles_hash,
-                         'profile_hash': profile_hash})
-                    existing_applicability = RepoProfileApplicability(**applicability_dict)
-                    existing_applicability.applicability = applicability
-                    existing_applicability.save()
+                query = {'repo_id': bound_repo_id, 'all_profiles_hash': all_profiles_hash,
+                         'profile_hash': profile_hash}
+                # profiles can be large, the one in repo_profile_applicability collection
+                # is no longer used, it's a duplicated data from the consumer_unit_profiles
+                # collection.
+                update = {'$set': {'applicability': applicability},
+                          '$setOnInsert': {'profile': []}}
+                writes.append(UpdateOne(query, update, upsert=True))
+            if applicability_writes is None:
+                ApplicabilityRegenerationManager._write_applicability(writes)
+
+    @staticmethod
+    def _get_unit_profiles(profile_ids):
+        """
+        Fetch unit profiles.
+
+        :param profile_ids: ids of the unit profiles
+        :type  profile_ids: list
+        :return: {profile_id: (profile_hash, content_type, profile)} of the unit profiles that
+                 exist
+        :rtype:  dict
+        """
+        unit_profiles = UnitProfile.get_collection().find(
+            {'id': {'$in': list(profile_ids)}},
+            projection=['id', 'profile', 'content_type', 'profile_hash'])
+        return dict((p['id'], (p['profile_hash'], p['content_type'], p['profile']))
+                    for p in unit_profiles)
+
+    @staticmethod
+    def _write_applicability(writes, threshold=0):
+        """
+        Send the pending writes of applicability data to the database with an unordered bulk
+        write, and remove them from the list.
+
+        :param writes: the pending writes
+        :type  writes: list of pymongo.UpdateOne
+        :param threshold: the writes are only sent once there are at least this many of them
+        :type  threshold: int
+        """
+        if not writes or len(writes) < threshold:
+            return
+        pending = writes[:]
+        del writes[:]
+        collection = RepoProfileApplicability.get_collection()
+        try:
+            collection.bulk_write(pending, ordered=False)
+        except BulkWriteError as e:
+            # Concurrent upserts of the same document can both try to insert it, in which case
+            # retrying the one that failed updates the inserted document.
+            errors = e.details['writeErrors']
+            if any(error['code'] != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            collection.bulk_write([pending[error['index']] for error in errors], ordered=False)
+
+    @staticmethod
+    def _merge_applicability(all_profiles_hash, profiles, bound_repo_id, delta, profiler,
+                             call_config, profiler_conduit):
+        """
+        Merge the applicability of the units added to the bound repo into the existing
+        applicability data for given set of profiles, and drop the units removed from it.
+
+        :param all_profiles_hash: hash of the consumer profiles
+        :type  all_profiles_hash: basestring
+        :param profiles: profiles data: (profile_hash, content_type, profile)
+        :type  profiles: list of tuples
+        :param bound_repo_id: repo id to be used to calculate applicability
+                              against the given unit profile
+        :type  bound_repo_id: str
+        :param delta: the units added to and removed from the bound repo, as returned by
+                      _get_repo_delta()
+        :type  delta: dict
+        :param profiler: the profiler for the content type of the profiles
+        :type  profiler: pulp.plugins.profiler.Profiler
+        :param call_config: the profiler configuration
+        :type  call_config: pulp.plugins.config.PluginCallConfiguration
+        :param profiler_conduit: the profiler conduit
+        :type  profiler_conduit: pulp.plugins.conduits.profiler.ProfilerConduit
+        :return: False if applicability needs to be recalculated instead
+        :rtype:  bool
+        """
+        if not ApplicabilityRegenerationManager._is_existing_applicability(bound_repo_id,
+                                                                           all_profiles_hash):
+            return False
+        try:
+            applicability = profiler.calculate_applicable_units_delta(
+                profiles, bound_repo_id, delta['added'], delta['removed'], call_config,
+                profiler_conduit)
+        except NotImplementedError:
+            return False
+
+        collection = RepoProfileApplicability.get_collection()
+        query = {'repo_id': bound_repo_id, 'all_profiles_hash': all_profiles_hash}
+        # A field cannot be both pulled from and added to by the same update
+        for type_id, unit_ids in delta['removed'].items():
+            collection.update(
+                query, {'$pull': {'applicability.%s' % type_id: {'$in': unit_ids}}}, multi=True)
+        for type_id, unit_ids in applicability.items():
+            if unit_ids:
+                field = 'applicability.%s' % type_id
+                collection.update(
+                    query, {'$addToSet': {field: {'$each': list(unit_ids)}}}, multi=True)
+        return True
+
+    @staticmethod
+    def _get_repo_delta(repo_id, since):
+        """
+        Find the units added to a repo since the given time, and the units of its existing
+        applicability data that are no longer in the repo.
+
+        :param repo_id: repo id
+        :type  repo_id: basestring
+        :param since: find units added after this time
+        :type  since: str in ISO8601 format with timezone
+        :return: {'added': {type_id: [unit_id, ...]}, 'removed': {type_id: [unit_id, ...]}}
+        :rtype:  dict
+        """
+        added = {}
+        q_set = model.RepositoryContentUnit.objects.created_between(start=since, repo_id=repo_id)
+        for unit_type_id, unit_id in q_set.scalar('unit_type_id', 'unit_id'):
+            added.setdefault(unit_type_id, []).append(unit_id)
+
+        applicable = {}
+        applicabilities = RepoProfileApplicability.get_collection().find(
+            {'repo_id': repo_id}, projection=['applicability'])
+        for applicability in applicabilities:
+            for type_id, unit_ids in (applicability.get('applicability') or {}).items():
+                applicable.setdefault(type_id, set()).update(unit_ids)
+
+        removed = {}
+        for type_id, unit_ids in applicable.items():
+            q_set = model.RepositoryContentUnit.objects(
+                repo_id=repo_id, unit_type_id=type_id, unit_id__in=list(unit_ids))
+            missing = unit_ids - set(q_set.distinct('unit_id'))
+            if missing:
+                removed[type_id] = sorted(missing)
+
+        return {'added': added, 'removed': removed}
 
     @staticmethod
     def _get_existing_repo_content_types(repo_id):
@@ -601,6 +879,247 @@ class RepoProfileApplicabilityManager(object):
 RepoProfileApplicability.objects = RepoProfileApplicabilityManager()
 
 
+class ConsumerApplicabilityGroupManager(object):
+    """
+    Maintains the applicability materialized for groups of consumers that have the same set of
+    profiles and are bound to the same repositories, so that applicability reports read one
+    document per group instead of collating the profiles, bindings and applicability of each
+    consumer.
+
+    Group membership is updated when applicability is regenerated for consumers and when
+    consumers are bound or unbound, and the applicability of the groups is refreshed whenever
+    the applicability for one of their repositories is regenerated. Deleted repositories are
+    removed from the groups.
+    """
+
+    @staticmethod
+    def group_id(all_profiles_hash, repo_ids):
+        """
+        :param all_profiles_hash: hash of the consumer profiles
+        :type  all_profiles_hash: basestring
+        :param repo_ids: ids of the repositories the consumers are bound to
+        :type  repo_ids: iterable
+        :return: the id of the group for the profiles and repositories
+        :rtype:  basestring
+        """
+        serialized = json.dumps([all_profiles_hash, sorted(set(repo_ids))])
+        return hashlib.sha256(serialized).hexdigest()
+
+    @staticmethod
+    def update_consumers(consumer_ids):
+        """
+        Move consumers to the groups for their current profiles and bindings. Bindings marked
+        as deleted are ignored. Consumers without profiles or bindings are removed from their
+        groups, and groups left without consumers are deleted.
+
+        :param consumer_ids: ids of the consumers to update
+        :type  consumer_ids: iterable
+        """
+        consumer_ids = list(set(consumer_ids))
+        if not consumer_ids:
+            return
+        consumer_map = dict((c, {'profiles': [], 'repo_ids': []}) for c in consumer_ids)
+        _add_profiles_to_consumer_map_and_get_hashes(consumer_ids, consumer_map)
+        _add_repo_ids_to_consumer_map(consumer_ids, consumer_map, include_deleted=False)
+
+        # {group_id: (all_profiles_hash, repo_ids, consumer_ids)}
+        groups = {}
+        for consumer_id, consumer_data in consumer_map.items():
+            if not consumer_data['profiles'] or not consumer_data['repo_ids']:
+                continue
+            all_profiles_hash = _calculate_all_profiles_hash(
+                [p['profile_hash'] for p in consumer_data['profiles']])
+            repo_ids = sorted(set(consumer_data['repo_ids']))
+            group_id = ConsumerApplicabilityGroupManager.group_id(all_profiles_hash, repo_ids)
+            groups.setdefault(group_id, (all_profiles_hash, repo_ids, []))[2].append(consumer_id)
+
+        collection = ConsumerApplicabilityGroup.get_collection()
+        grouped = set()
+        for group_id, (all_profiles_hash, repo_ids, members) in groups.items():
+            # Consumers are added to their new group before being removed from the old one, so
+            # that reports never miss them.
+            ConsumerApplicabilityGroupManager._add_to_group(
+                group_id, all_profiles_hash, repo_ids, members)
+            collection.update_many(
+                {'consumers': {'$in': members}, 'group_id': {'$ne': group_id}},
+                {'$pull': {'consumers': {'$in': members}}})
+            grouped.update(members)
+
+        ungrouped = [c for c in consumer_ids if c not in grouped]
+        ConsumerApplicabilityGroupManager.remove_consumers(ungrouped)
+        collection.delete_many({'consumers': {'$size': 0}})
+
+    @staticmethod
+    def remove_consumers(consumer_ids):
+        """
+        Remove consumers from their groups, and delete the groups left without consumers.
+
+        :param consumer_ids: ids of the consumers to remove
+        :type  consumer_ids: list
+        """
+        if not consumer_ids:
+            return
+        collection = ConsumerApplicabilityGroup.get_collection()
+        collection.update_many({'consumers': {'$in': consumer_ids}},
+                               {'$pull': {'consumers': {'$in': consumer_ids}}})
+        collection.delete_many({'consumers': {'$size': 0}})
+
+    @staticmethod
+    def remove_repo(repo_id):
+        """
+        Remove a repository, and its applicability, from the groups bound to it, and delete the
+        groups left without repositories. The consumers are moved to the groups for their
+        remaining bindings when they are unbound from the repository.
+
+        :param repo_id: id of the repository to remove
+        :type  repo_id: basestring
+        """
+        collection = ConsumerApplicabilityGroup.get_collection()
+        collection.update_many({'repos.repo_id': repo_id},
+                               {'$pull': {'repos': {'repo_id': repo_id}}})
+        collection.delete_many({'repos': {'$size': 0}})
+
+    @staticmethod
+    def refresh(repo_profiles):
+        """
+        Copy the applicability regenerated for sets of profiles and repositories to the groups
+        with those profiles that are bound to those repositories. Groups are set to have no
+        applicability for a repository when there is none for their profiles.
+
+        :param repo_profiles: the (all_profiles_hash, repo_id) applicability was regenerated for
+        :type  repo_profiles: iterable of tuples
+        """
+        collection = ConsumerApplicabilityGroup.get_collection()
+        for all_profiles_hash, repo_id in set(repo_profiles):
+            applicability = _get_repo_profile_applicability(all_profiles_hash, repo_id)
+            collection.update_many(
+                {'all_profiles_hash': all_profiles_hash, 'repos.repo_id': repo_id},
+                {'$set': {'repos.$.applicability': applicability}})
+
+    @staticmethod
+    def _add_to_group(group_id, all_profiles_hash, repo_ids, consumer_ids):
+        """
+        Add consumers to a group, creating it with the existing applicability for its profiles
+        and repositories if it does not exist.
+
+        :param group_id: id of the group
+        :type  group_id: basestring
+        :param all_profiles_hash: hash of the consumer profiles
+        :type  all_profiles_hash: basestring
+        :param repo_ids: ids of the repositories the consumers are bound to
+        :type  repo_ids: list
+        :param consumer_ids: ids of the consumers to add
+        :type  consumer_ids: list
+        """
+        collection = ConsumerApplicabilityGroup.get_collection()
+        update = {'$addToSet': {'consumers': {'$each': consumer_ids}},
+                  '$setOnInsert': {'all_profiles_hash': all_profiles_hash,
+                                   'repos': [{'repo_id': r, 'applicability': None}
+                                             for r in repo_ids]}}
+        try:
+            result = collection.update_one({'group_id': group_id}, update, upsert=True)
+        except DuplicateKeyError:
+            # The group was created concurrently, so add the consumers to it.
+            del update['$setOnInsert']
+            collection.update_one({'group_id': group_id}, update)
+            return
+        if result.upserted_id is not None:
+            repos = [{'repo_id': r,
+                      'applicability': _get_repo_profile_applicability(all_profiles_hash, r)}
+                     for r in repo_ids]
+            collection.update_one({'_id': result.upserted_id}, {'$set': {'repos': repos}})
+
+
+class ConsumerApplicabilityReport(object):
+    """
+    The applicability of the consumers matched by a consumer criteria, read from the
+    materialized consumer applicability groups. Iterating yields a dictionary for each group
+    that has applicability data, with keys 'consumers' and 'applicability', in the format
+    returned by retrieve_consumer_applicability(). The applicability of a group is the union of
+    its applicability for each of the repositories its consumers are bound to.
+
+    Groups are read in order, so a report can be read in pages: pass the group_token of the
+    last page as after.
+
+    :ivar groups_read: the number of groups read
+    :type groups_read: int
+    :ivar group_token: identifies the last group read, or None
+    :type group_token: basestring
+    """
+
+    def __init__(self, consumer_criteria, content_types=None, after=None, limit=None):
+        """
+        :param consumer_criteria: criteria matching the consumers to report
+        :type  consumer_criteria: pulp.server.db.model.criteria.Criteria
+        :param content_types: An optional list of content types to limit the report to. Defaults
+                              to None, which reports all types
+        :type  content_types: list
+        :param after: the group_token of a previous report, to report the groups after it
+        :type  after: basestring
+        :param limit: the maximum number of groups to read
+        :type  limit: int
+
+        :raises InvalidValue: if after is not a valid group token
+        """
+        self.consumer_criteria = consumer_criteria
+        self.content_types = content_types
+        self.limit = limit
+        self.groups_read = 0
+        self.group_token = None
+        self.after = None
+        if after:
+            try:
+                self.after = ObjectId(after)
+            except (InvalidId, TypeError):
+                raise InvalidValue(['after'])
+
+    def __iter__(self):
+        consumer_ids = None
+        query = {}
+        criteria = self.consumer_criteria
+        if criteria.filters or criteria.skip or criteria.limit:
+            criteria.fields = ['id']
+            consumer_ids = set(c['id'] for c in ConsumerQueryManager.find_by_criteria(criteria))
+            query['consumers'] = {'$in': list(consumer_ids)}
+        if self.after is not None:
+            query['_id'] = {'$gt': self.after}
+        groups = ConsumerApplicabilityGroup.get_collection().find(query).sort('_id', ASCENDING)
+        if self.limit:
+            groups = groups.limit(self.limit)
+
+        for group in groups:
+            self.groups_read += 1
+            self.group_token = str(group['_id'])
+            consumers = group['consumers']
+            if consumer_ids is not None:
+                consumers = [c for c in consumers if c in consumer_ids]
+            applicability = self._applicability(group)
+            if consumers and applicability is not None:
+                yield {'consumers': consumers, 'applicability': applicability}
+
+    def _applicability(self, group):
+        """
+        :param group: a consumer applicability group
+        :type  group: dict
+        :return: the applicability of the group, limited to the requested content types, or
+                 None if there is no applicability data to report
+        :rtype:  dict
+        """
+        found = False
+        applicability = {}
+        for repo in group['repos']:
+            if repo['applicability'] is None:
+                continue
+            found = True
+            for content_type, unit_ids in repo['applicability'].iteritems():
+                if self.content_types is not None and content_type not in self.content_types:
+                    continue
+                applicability.setdefault(content_type, set()).update(unit_ids)
+        if not found or (self.content_types is not None and not applicability):
+            return None
+        return dict((t, sorted(unit_ids)) for t, unit_ids in applicability.iteritems())
+
+
 def retrieve_consumer_applicability(consumer_criteria, content_types=None):
     """
     Query content applicability for consumers matched by a given consumer_criteria, optionally
@@ -718,7 +1237,7 @@ def _add_profiles_to_consumer_map_and_get_hashes(consumer_ids, consumer_map):
     return list(all_profiles_hashes)
 
 
-def _add_repo_ids_to_consumer_map(consumer_ids, consumer_map):
+def _add_repo_ids_to_consumer_map(consumer_ids, consumer_map, include_deleted=True):
     """
     Query for all bindings for the given list of consumer_ids, and for each one add the bound
     repo_ids to the consumer_map's entry for the consumer.
@@ -731,10 +1250,14 @@ def _add_repo_ids_to_consumer_map(consumer_ids, consumer_map):
                          which indexes a list that this method will append the found profiles
                          to.
     :type  consumer_map: dict
+    :param include_deleted: whether to include bindings marked as deleted, which are waiting
+                            for the consumer to confirm the unbind
+    :type  include_deleted: bool
     """
-    bindings = Bind.get_collection().find(
-        {'consumer_id': {'$in': consumer_ids}},
-        projection=['consumer_id', 'repo_id'])
+    query = {'consumer_id': {'$in': consumer_ids}}
+    if not include_deleted:
+        query['deleted'] = False
+    bindings = Bind.get_collection().find(query, projection=['consumer_id', 'repo_id'])
     for b in bindings:
         consumer_map[b['consumer_id']]['repo_ids'].append(b['repo_id'])
 
@@ -844,6 +1367,23 @@ def _get_consumer_applicability_map(applicability_map):
     return consumer_applicability_map
 
 
+def _get_repo_profile_applicability(all_profiles_hash, repo_id):
+    """
+    :param all_profiles_hash: hash of the consumer profiles
+    :type  all_profiles_hash: basestring
+    :param repo_id: repo id
+    :type  repo_id: basestring
+    :return: the applicability data for the profiles and repository, or None if there is none
+    :rtype:  dict
+    """
+    applicability = RepoProfileApplicability.get_collection().find_one(
+        {'all_profiles_hash': all_profiles_hash, 'repo_id': repo_id},
+        projection=['applicability'])
+    if applicability is None:
+        return None
+    return applicability['applicability']
+
+
 def _calculate_all_profiles_hash(profile_hashes):
     """
     Calculate a hash of consumer profiles' hashes.
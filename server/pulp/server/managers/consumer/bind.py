@@ -13,6 +13,7 @@ from pulp.server.db import model
 from pulp.server.db.model.consumer import Bind
 from pulp.server.exceptions import MissingResource, InvalidValue
 from pulp.server.managers import factory
+from pulp.server.managers.consumer.applicability import ConsumerApplicabilityGroupManager
 
 
 _logger = getLogger(__name__)
@@ -79,6 +80,8 @@ class BindManager(object):
             BindManager._reset_bind(consumer_id, repo_id, distributor_id)
         # fetch the inserted/updated bind
         bind = BindManager.get_bind(consumer_id, repo_id, distributor_id)
+        # update the materialized applicability
+        ConsumerApplicabilityGroupManager.update_consumers([consumer_id])
         # update history
         details = {'repo_id': repo_id, 'distributor_id': distributor_id}
         manager = factory.consumer_history_manager()
@@ -151,6 +154,7 @@ class BindManager(object):
             # idempotent
             return
         BindManager.mark_deleted(consumer_id, repo_id, distributor_id)
+        ConsumerApplicabilityGroupManager.update_consumers([consumer_id])
         details = {
             'repo_id': repo_id,
             'distributor_id': distributor_id
@@ -320,6 +324,7 @@ class BindManager(object):
         if not force:
             bind_id['deleted'] = True
         collection.remove(bind_id)
+        ConsumerApplicabilityGroupManager.update_consumers([consumer_id])
 
     def action_pending(self, consumer_id, repo_id, distributor_id, action, action_id):
         """
@@ -16,6 +16,7 @@ from pulp.server.db.model.consumer import Consumer
 from pulp.server.exceptions import DuplicateResource, InvalidValue, \
     MissingResource, PulpExecutionException, MissingValue
 from pulp.server.managers import factory
+from pulp.server.managers.consumer.applicability import ConsumerApplicabilityGroupManager
 from pulp.server.managers.schedule import utils as schedule_utils
 
 
@@ -110,6 +111,9 @@ class ConsumerManager(object):
         manager = factory.consumer_profile_manager()
         manager.consumer_deleted(consumer_id)
 
+        # Remove from the materialized applicability
+        ConsumerApplicabilityGroupManager.remove_consumers([consumer_id])
+
         # Notify agent
         agent_consumer = factory.consumer_agent_manager()
         agent_consumer.unregister(consumer_id)
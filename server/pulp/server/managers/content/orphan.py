@@ -1,4 +1,6 @@
 from gettext import gettext as _
+from Queue import Queue
+from threading import Thread
 import itertools
 import logging
 import os
@@ -20,6 +22,11 @@ from pulp.server.exceptions import MissingResource
 
 _logger = logging.getLogger(__name__)
 
+# The number of orphans that are checked and deleted with each batch of database operations.
+ORPHAN_BATCH_SIZE = 1000
+# The number of threads removing the files of deleted orphans.
+ORPHAN_FILE_WORKERS = 8
+
 
 class OrphanManager(object):
 
@@ -85,7 +92,7 @@ class OrphanManager(object):
                 yield content_unit
 
     @staticmethod
-    def generate_orphans_by_type(content_type_id, fields=None):
+    def generate_orphans_by_type(content_type_id, fields=None, content_unit_ids=None):
         """
         Return an generator of all orphaned content units of the given content type.
 
@@ -95,6 +102,8 @@ class OrphanManager(object):
         :type content_type_id: basestring
         :param fields: list of fields to include in each content unit
         :type fields: list or None
+        :param content_unit_ids: list of content unit ids to limit the orphans to; None means all
+        :type content_unit_ids: iterable or None
         :return: generator of orphaned content units for the given content type
         :rtype: generator
         """
@@ -103,15 +112,22 @@ class OrphanManager(object):
         content_units_collection = content_types_db.type_units_collection(content_type_id)
         repo_content_units_collection = RepoContentUnit.get_collection()
 
-        for content_unit in content_units_collection.find({}, projection=fields).batch_size(100):
-
-            repo_content_units_cursor = repo_content_units_collection.find(
-                {'unit_id': content_unit['_id']})
+        if content_unit_ids is None:
+            content_units = content_units_collection.find(
+                {}, projection=fields).batch_size(ORPHAN_BATCH_SIZE)
+        else:
+            content_units = itertools.chain.from_iterable(
+                content_units_collection.find({'_id': {'$in': page}}, projection=fields)
+                for page in plugin_misc.paginate(content_unit_ids, ORPHAN_BATCH_SIZE))
 
-            if repo_content_units_cursor.count() > 0:
-                continue
+        for page in plugin_misc.paginate(content_units, ORPHAN_BATCH_SIZE):
+            associated = set(repo_content_units_collection.find(
+                {'unit_id': {'$in': [content_unit['_id'] for content_unit in page]}}
+            ).distinct('unit_id'))
 
-            yield content_unit
+            for content_unit in page:
+                if content_unit['_id'] not in associated:
+                    yield content_unit
 
     @staticmethod
     def generate_orphans_by_type_with_unit_keys(content_type_id):
@@ -150,34 +166,36 @@ class OrphanManager(object):
                                  given content type and unit id
         """
 
-        for content_unit in OrphanManager.generate_orphans_by_type(content_type_id):
-
-            if content_unit['_id'] != content_unit_id:
-                continue
-
+        for content_unit in OrphanManager.generate_orphans_by_type(
+                content_type_id, content_unit_ids=[content_unit_id]):
             return content_unit
 
         raise pulp_exceptions.MissingResource(content_type=content_type_id,
                                               content_unit=content_unit_id)
 
     @staticmethod
-    def delete_all_orphans():
+    def delete_all_orphans(dry_run=False):
         """
         Delete all orphaned content units.
 
-        :return: count of units deleted indexed by content_type_id
+        :param dry_run: if True, nothing is deleted and the count and size in bytes of the
+                        units that would be deleted are returned instead
+        :type dry_run: bool
+        :return: count of units deleted indexed by content_type_id, or when dry_run is True,
+                 a dict with the 'count' and 'size' of the orphans indexed by content_type_id
         :rtype: dict
         """
         ret = {}
         for content_type_id in content_types_db.all_type_ids():
-            count = OrphanManager.delete_orphans_by_type(content_type_id)
-            if count > 0:
-                ret[content_type_id] = count
+            result = OrphanManager.delete_orphans_by_type(content_type_id, dry_run=dry_run)
+            if (result['count'] if dry_run else result) > 0:
+                ret[content_type_id] = result
 
         for content_type_id in plugin_api.list_unit_models():
-            count = OrphanManager.delete_orphan_content_units_by_type(content_type_id)
-            if count > 0:
-                ret[content_type_id] = count
+            result = OrphanManager.delete_orphan_content_units_by_type(content_type_id,
+                                                                       dry_run=dry_run)
+            if (result['count'] if dry_run else result) > 0:
+                ret[content_type_id] = result
         return ret
 
     @staticmethod
@@ -206,7 +224,7 @@ class OrphanManager(object):
             OrphanManager.delete_orphans_by_type(content_type_id, content_unit_id_list)
 
     @staticmethod
-    def delete_orphans_by_type(content_type_id, content_unit_ids=None):
+    def delete_orphans_by_type(content_type_id, content_unit_ids=None, dry_run=False):
         """
         Delete the orphaned content units for the given content type.
 
@@ -219,8 +237,12 @@ class OrphanManager(object):
         :type content_type_id: basestring
         :param content_unit_ids: list of content unit ids to delete; None means delete them all
         :type content_unit_ids: iterable or None
-        :return: count of units deleted
-        :rtype: int
+        :param dry_run: if True, nothing is deleted and the count and size in bytes of the
+                        units that would be deleted are returned instead
+        :type dry_run: bool
+        :return: count of units deleted, or when dry_run is True, a dict with the 'count' and
+                 'size' of the orphans
+        :rtype: int or dict
         """
 
         content_units_collection = content_types_db.type_units_collection(content_type_id)
@@ -232,29 +254,35 @@ class OrphanManager(object):
             raise MissingResource(content_type_id=content_type_id)
 
         fields = ('_id', '_storage_path') + unit_key_fields
-        count = 0
-        for content_unit in OrphanManager.generate_orphans_by_type(content_type_id, fields=fields):
+        orphans = OrphanManager.generate_orphans_by_type(
+            content_type_id, fields=fields, content_unit_ids=content_unit_ids)
 
-            if content_unit_ids is not None and content_unit['_id'] not in content_unit_ids:
-                continue
+        if dry_run:
+            return OrphanManager.orphans_size(
+                content_unit.get('_storage_path') for content_unit in orphans)
 
-            model.LazyCatalogEntry.objects(
-                unit_id=content_unit['_id'],
-                unit_type_id=content_type_id
-            ).delete()
-            content_units_collection.remove(content_unit['_id'])
+        count = 0
+        with OrphanedFileRemover() as file_remover:
+            for page in plugin_misc.paginate(orphans, ORPHAN_BATCH_SIZE):
+                unit_ids = [content_unit['_id'] for content_unit in page]
+                model.LazyCatalogEntry.objects(
+                    unit_id__in=unit_ids,
+                    unit_type_id=content_type_id
+                ).delete()
+                content_units_collection.remove({'_id': {'$in': unit_ids}})
 
-            if hasattr(content_model, 'do_post_delete_actions'):
-                content_model.do_post_delete_actions(content_unit)
+                for content_unit in page:
+                    if hasattr(content_model, 'do_post_delete_actions'):
+                        content_model.do_post_delete_actions(content_unit)
 
-            storage_path = content_unit.get('_storage_path', None)
-            if storage_path is not None:
-                OrphanManager.delete_orphaned_file(storage_path)
-            count += 1
+                    storage_path = content_unit.get('_storage_path', None)
+                    if storage_path is not None:
+                        file_remover.add(storage_path)
+                count += len(page)
         return count
 
     @staticmethod
-    def delete_orphan_content_units_by_type(type_id, content_unit_ids=None):
+    def delete_orphan_content_units_by_type(type_id, content_unit_ids=None, dry_run=False):
         """
         Delete the orphaned content units for the given content type.
         This method only applies to new style content units that are loaded via entry points
@@ -265,8 +293,12 @@ class OrphanManager(object):
         :type type_id: basestring
         :param content_unit_ids: list of content unit ids to delete; None means delete them all
         :type content_unit_ids: iterable or None
-        :return: count of units deleted
-        :rtype: int
+        :param dry_run: if True, nothing is deleted and the count and size in bytes of the
+                        units that would be deleted are returned instead
+        :type dry_run: bool
+        :return: count of units deleted, or when dry_run is True, a dict with the 'count' and
+                 'size' of the orphans
+        :rtype: int or dict
         """
         # get the model matching the type
         content_model = plugin_api.get_unit_model_by_id(type_id)
@@ -285,40 +317,82 @@ class OrphanManager(object):
         else:
             content_units = content_model.objects.only(*fields)
 
-        count = 0
-
-        # Paginate the content units
-        for units_group in plugin_misc.paginate(content_units):
-            # Build the list of ids to search for an easier way to access units in the group by id
-            unit_dict = dict()
-            for unit in units_group:
-                unit_dict[unit.id] = unit
-
-            id_list = list(unit_dict.iterkeys())
+        orphans = OrphanManager._generate_orphan_content_units(content_units)
 
-            # Clear the units that are currently associated from unit_dict
-            non_orphan = model.RepositoryContentUnit.objects(unit_id__in=id_list)\
-                .distinct('unit_id')
-            for non_orphan_id in non_orphan:
-                unit_dict.pop(non_orphan_id)
+        if dry_run:
+            return OrphanManager.orphans_size(unit._storage_path for unit in orphans)
 
-            # Remove the unit, lazy catalog entries, and any content in storage.
-            for unit_to_delete in unit_dict.itervalues():
+        count = 0
+        with OrphanedFileRemover() as file_remover:
+            for units_group in plugin_misc.paginate(orphans, ORPHAN_BATCH_SIZE):
+                # Remove the units, lazy catalog entries, and any content in storage.
+                id_list = [unit.id for unit in units_group]
                 model.LazyCatalogEntry.objects(
-                    unit_id=str(unit_to_delete.id),
+                    unit_id__in=[str(unit_id) for unit_id in id_list],
                     unit_type_id=str(type_id)
                 ).delete()
-                unit_to_delete.delete()
+                content_model.objects(id__in=id_list).delete()
 
-                if hasattr(content_model, 'do_post_delete_actions'):
-                    content_model.do_post_delete_actions(unit_to_delete)
+                for unit_to_delete in units_group:
+                    if hasattr(content_model, 'do_post_delete_actions'):
+                        content_model.do_post_delete_actions(unit_to_delete)
 
-                if unit_to_delete._storage_path:
-                    OrphanManager.delete_orphaned_file(unit_to_delete._storage_path)
-                count += 1
+                    if unit_to_delete._storage_path:
+                        file_remover.add(unit_to_delete._storage_path)
+                count += len(units_group)
 
         return count
 
+    @staticmethod
+    def _generate_orphan_content_units(content_units):
+        """
+        Filter the content units that are associated with a repository out of the given units.
+
+        :param content_units: new style content units
+        :type content_units: iterable of pulp.server.db.model.ContentUnit
+        :return: generator of the orphaned content units
+        :rtype: generator
+        """
+        for units_group in plugin_misc.paginate(content_units, ORPHAN_BATCH_SIZE):
+            non_orphan = set(model.RepositoryContentUnit.objects(
+                unit_id__in=[unit.id for unit in units_group]).distinct('unit_id'))
+
+            for unit in units_group:
+                if unit.id not in non_orphan:
+                    yield unit
+
+    @staticmethod
+    def orphans_size(storage_paths):
+        """
+        Count the orphans with the given storage paths, and the number of bytes that deleting
+        them would reclaim on disk.
+
+        Directories are walked and links are not followed, so the content of shared storage is
+        not counted.
+
+        :param storage_paths: the storage path of each orphan, which may be None
+        :type storage_paths: iterable
+        :return: the 'count' of orphans and their 'size' in bytes
+        :rtype: dict
+        """
+        count = 0
+        size = 0
+        for path in storage_paths:
+            count += 1
+            if not path:
+                continue
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    for root, dirs, files in os.walk(path):
+                        for name in files:
+                            size += os.lstat(os.path.join(root, name)).st_size
+                else:
+                    size += os.lstat(path).st_size
+            except OSError:
+                # The file is already missing, so there is nothing to reclaim.
+                pass
+        return {'count': count, 'size': size}
+
     @staticmethod
     def delete_orphaned_file(path):
         """
@@ -350,12 +424,17 @@ class OrphanManager(object):
             path = os.path.dirname(path)
             if root_content_regex.match(path):
                 break
-            contents = os.listdir(path)
-            if contents:
+            try:
+                contents = os.listdir(path)
+                if contents:
+                    break
+                if not os.access(path, os.W_OK):
+                    break
+                os.rmdir(path)
+            except OSError:
+                # The files of other orphans are removed concurrently, so the directory may
+                # already have been removed, or have had files added by another thread.
                 break
-            if not os.access(path, os.W_OK):
-                break
-            os.rmdir(path)
 
     @staticmethod
     def is_shared(storage_dir, path):
@@ -420,6 +499,82 @@ class OrphanManager(object):
             _logger.error(_('Delete path: %(p)s failed: %(m)s'), {'p': path, 'm': str(e)})
 
 
+class OrphanedFileRemover(object):
+    """
+    Removes the files of deleted orphans with a bounded pool of threads.
+
+    Files are assigned to threads by parent directory, so that a directory and the parent
+    directories that fall empty are cleaned up by a single thread. Use as a context manager,
+    which waits for all the files to be removed on exit.
+
+    :ivar queues: the queue of paths of each thread
+    :type queues: list
+    :ivar threads: the threads removing files
+    :type threads: list
+    :ivar error: the first error raised while removing a file
+    :type error: Exception
+    """
+
+    def __init__(self, workers=ORPHAN_FILE_WORKERS):
+        """
+        :param workers: the number of threads removing files
+        :type workers: int
+        """
+        self.queues = [Queue(maxsize=ORPHAN_BATCH_SIZE) for _i in range(workers)]
+        self.threads = [Thread(target=self._run, args=(queue,)) for queue in self.queues]
+        self.error = None
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(raise_error=exc_type is None)
+
+    def add(self, path):
+        """
+        Queue an orphaned file to be removed, blocking while its thread is busy.
+
+        :param path: absolute path to the file to delete
+        :type path: str
+        """
+        self.queues[hash(os.path.dirname(path)) % len(self.queues)].put(path)
+
+    def close(self, raise_error=True):
+        """
+        Wait for all the queued files to be removed, and stop the threads.
+
+        :param raise_error: raise the first error raised while removing a file
+        :type raise_error: bool
+        """
+        for queue in self.queues:
+            queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if raise_error and self.error is not None:
+            raise self.error
+
+    def _run(self, queue):
+        """
+        Remove the files in the queue until None is found.
+
+        :param queue: the queue of paths
+        :type queue: Queue.Queue
+        """
+        while True:
+            path = queue.get()
+            if path is None:
+                return
+            try:
+                OrphanManager.delete_orphaned_file(path)
+            except Exception, e:
+                _logger.exception(_('Deleting orphaned file %(p)s failed') % {'p': path})
+                if self.error is None:
+                    self.error = e
+
+
 delete_all_orphans = task(OrphanManager.delete_all_orphans, base=Task)
 delete_orphans_by_id = task(OrphanManager.delete_orphans_by_id, base=Task, ignore_result=True)
 delete_orphans_by_type = task(OrphanManager.delete_orphans_by_type, base=Task, ignore_result=True)
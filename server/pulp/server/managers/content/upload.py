@@ -13,7 +13,7 @@ from pulp.plugins.config import PluginCallConfiguration
 from pulp.plugins.loader import api as plugin_api, exceptions as plugin_exceptions
 from pulp.plugins.util import misc
 
-from pulp.server import config as pulp_config
+from pulp.server import config as pulp_config, util
 from pulp.server.async.tasks import Task
 from pulp.server.db import model
 from pulp.server.exceptions import (PulpDataException, MissingResource, PulpExecutionException,
@@ -72,14 +72,22 @@ class ContentUploadManager(object):
 
         file_path = ContentUploadManager._upload_file_path(upload_id)
 
-        # Make sure the upload was initialized first and hasn't been deleted
-        if not os.path.exists(file_path):
-            raise MissingResource(upload_request=upload_id)
+        # Make sure the upload was initialized first and hasn't been deleted. Segments may be
+        # written concurrently by different processes, so the file is written without buffering.
+        try:
+            fd = os.open(file_path, os.O_WRONLY)
+        except OSError as e:
+            if e.errno == ENOENT:
+                raise MissingResource(upload_request=upload_id)
+            raise
 
-        f = open(file_path, 'r+')
-        f.seek(offset)
-        f.write(data)
-        f.close()
+        try:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = 0
+            while written < len(data):
+                written += os.write(fd, buffer(data, written))
+        finally:
+            os.close(fd)
 
     def delete_upload(self, upload_id):
         """
@@ -159,9 +167,39 @@ class ContentUploadManager(object):
 
         return True
 
+    @staticmethod
+    def verify_upload(upload_id, checksum_type, checksum):
+        """
+        Checks that the uploaded file matches the checksum calculated by the client, which is how
+        the server knows that every segment of the file was received.
+
+        :param upload_id:       upload request ID
+        :type  upload_id:       str
+        :param checksum_type:   the type of the checksum, such as sha256
+        :type  checksum_type:   str
+        :param checksum:        the checksum of the file calculated by the client
+        :type  checksum:        str
+        :raise MissingResource: if the upload request ID does not exist
+        :raise PulpCodedException: if the checksum type is unknown or the checksum does not match
+        """
+        checksum_type = util.sanitize_checksum_type(checksum_type)
+        file_path = ContentUploadManager._upload_file_path(upload_id)
+        try:
+            upload_file = open(file_path, 'rb')
+        except IOError as e:
+            if e.errno == ENOENT:
+                raise MissingResource(upload_request=upload_id)
+            raise
+
+        with upload_file:
+            calculated = util.calculate_checksums(upload_file, [checksum_type])[checksum_type]
+
+        if calculated != checksum.lower():
+            raise PulpCodedException(error_code=error_codes.PLP1013)
+
     @staticmethod
     def import_uploaded_unit(repo_id, unit_type_id, unit_key, unit_metadata, upload_id,
-                             override_config=None):
+                             override_config=None, checksum_type=None, checksum=None):
         """
         Called to trigger the importer's handling of an uploaded unit. This
         should not be called until the bits have finished uploading. The
@@ -183,6 +221,14 @@ class ContentUploadManager(object):
         :type  unit_metadata: dict
         :param upload_id:     upload being imported
         :type  upload_id:     str
+        :param override_config: importer configuration values that override the importer's
+                                default configuration
+        :type  override_config: dict
+        :param checksum_type: the type of the checksum the client calculated for the uploaded
+                              file, or None if the file should not be verified
+        :type  checksum_type: str
+        :param checksum:      the checksum the client calculated for the uploaded file
+        :type  checksum:      str
         :return:              A dictionary describing the success or failure of the upload. It must
                               contain the following keys:
                                 'success_flag': bool. Indicates whether the upload was successful
@@ -190,13 +236,16 @@ class ContentUploadManager(object):
                                 'details':      json-serializable object, providing details
         :rtype:               dict
         :raises MissingResource: if upload request was for the non-existent repository
-        :raises PulpCodedException: if import was unsuccessful and it was handled by the importer
+        :raises PulpCodedException: if import was unsuccessful and it was handled by the importer,
+                                    or the uploaded file does not match the checksum
         :raises PulpException: if import was unsuccessful and it was not handled by the importer
         :raises PulpExecutionException: if an unexpected error occured during the upload
         """
         # If it doesn't raise an exception, it's good to go
         ContentUploadManager.is_valid_upload(repo_id, unit_type_id)
         repo_obj = model.Repository.objects.get_repo_or_missing_resource(repo_id)
+        if checksum is not None:
+            ContentUploadManager.verify_upload(upload_id, checksum_type, checksum)
         repo_importer = model.Importer.objects.get_or_404(repo_id=repo_id)
 
         try:
@@ -7,7 +7,7 @@ from bson.errors import InvalidId
 
 from pulp.server.compat import ObjectId
 from pulp.server.db.model.event import EventListener
-from pulp.server.event import notifiers
+from pulp.server.event import dispatch, notifiers
 from pulp.server.event.data import ALL_EVENT_TYPES
 from pulp.server.exceptions import InvalidValue, MissingResource
 
@@ -58,6 +58,7 @@ class EventListenerManager(object):
         collection = EventListener.get_collection()
         created_id = collection.save(el)
         created = collection.find_one(created_id)
+        dispatch.LISTENERS.invalidate()
 
         return created
 
@@ -103,6 +104,7 @@ class EventListenerManager(object):
         self.get(event_listener_id)  # check for MissingResource
 
         collection.remove({'_id': ObjectId(event_listener_id)})
+        dispatch.LISTENERS.invalidate()
 
     def update(self, event_listener_id, notifier_config=None, event_types=None):
         """
@@ -153,6 +155,7 @@ class EventListenerManager(object):
 
         # Update the database
         collection.save(existing)
+        dispatch.LISTENERS.invalidate()
 
         # Reload to return
         existing = collection.find_one({'_id': ObjectId(event_listener_id)})
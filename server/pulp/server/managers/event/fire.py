@@ -5,13 +5,7 @@ each event type require data relevant to that event type and package it up
 in a consistent event format for that type.
 """
 
-import logging
-
-from pulp.server.db.model.event import EventListener
-from pulp.server.event import data as e, notifiers
-
-
-_logger = logging.getLogger(__name__)
+from pulp.server.event import data as e, dispatch
 
 
 class EventFireManager(object):
@@ -55,24 +49,21 @@ class EventFireManager(object):
     def _do_fire(self, event):
         """
         Performs the actual act of firing an event to all appropriate
-        listeners. This call will log but otherwise suppress any exception
-        that comes out of a notifier.
+        listeners. The notifiers are called inline, by the thread firing the
+        event, unless the notifier_workers setting is greater than 0, in which
+        case they are called asynchronously by the worker threads of the event
+        dispatcher. Either way, any exception that comes out of a notifier is
+        logged but otherwise suppressed.
 
         @param event: event object to fire
         @type  event: pulp.server.event.data.Event
         """
         # Determine which listeners should be notified
-        listeners = list(EventListener.get_collection().find(
-            {'$or': ({'event_types': event.event_type}, {'event_types': '*'})}))
+        listeners = dispatch.LISTENERS.find(event.event_type)
 
-        # For each listener, retrieve the notifier and invoke it. Be sure that
-        # an exception from a notifier is logged but does not interrupt the
-        # remainder of the firing, nor bubble up.
+        # Queue the event for delivery to the notifier of each listener.
+        dispatcher = dispatch.get_dispatcher()
         for listener in listeners:
-            notifier_type_id = listener['notifier_type_id']
-            f = notifiers.get_notifier_function(notifier_type_id)
-
-            try:
-                f(listener['notifier_config'], event)
-            except Exception:
-                _logger.exception('Exception from notifier of type [%s]' % notifier_type_id)
+            delivery = dispatch.Delivery(
+                listener['notifier_type_id'], listener['notifier_config'], event)
+            dispatcher.submit(delivery)
@@ -139,7 +139,7 @@ class RepoUnitAssociationManager(object):
         return unique_count
 
     @staticmethod
-    def _units_from_criteria(source_repo, criteria):
+    def _units_from_criteria(source_repo, criteria, **kwargs):
         """
         Given a criteria, return an iterator of units
 
@@ -147,6 +147,8 @@ class RepoUnitAssociationManager(object):
         :type  source_repo: pulp.server.db.model.Repository
         :param criteria:    criteria object to use for the search parameters
         :type  criteria:    pulp.server.db.model.criteria.UnitAssociationCriteria
+        :param kwargs:      additional arguments for repo_controller.find_repo_content_units; by
+                            default ContentUnits are yielded
 
         :return:    generator of pulp.server.db.model.ContentUnit instances
         :rtype:     generator
@@ -174,12 +176,43 @@ class RepoUnitAssociationManager(object):
                 unit_spec_t['_content_type_id'] = unit_type_id
                 unit_q |= mongoengine.Q(__raw__=unit_spec_t)
 
+        kwargs.setdefault('yield_content_unit', True)
         return repo_controller.find_repo_content_units(
             repository=source_repo,
             repo_content_unit_q=association_q,
             units_q=unit_q,
             unit_fields=criteria['unit_fields'],
-            yield_content_unit=True)
+            **kwargs)
+
+    @staticmethod
+    def find_units_after(repo, criteria, after=None):
+        """
+        Return a page of the units associated with a repository, ordered by unit type and unit id.
+
+        The criteria's limit and skip are applied to the page, and its sorts are not supported.
+        The token for the next page can be created from the last returned association with
+        repo_controller.get_unit_continuation_token().
+
+        :param repo:     repository to look for units in
+        :type  repo:     pulp.server.db.model.Repository
+        :param criteria: criteria object to use for the search parameters
+        :type  criteria: pulp.server.db.model.criteria.UnitAssociationCriteria
+        :param after:    continuation token of the previous page, if any
+        :type  after:    basestring
+
+        :return:    generator of pulp.server.db.model.RepositoryContentUnit instances, each with
+                    its ContentUnit as the "unit" attribute
+        :rtype:     generator
+        :raise InvalidValue: if the criteria specifies a sort or the continuation token is invalid
+        """
+        if criteria.association_sort or criteria.unit_sort:
+            raise exceptions.InvalidValue(['sort'])
+        # only units stored with mongoengine models can be paged through
+        if not set(repo.content_unit_counts.keys()).issubset(set(plugin_api.list_unit_models())):
+            raise exceptions.InvalidValue(['after'])
+        return RepoUnitAssociationManager._units_from_criteria(
+            repo, criteria, after=after, limit=criteria.limit, skip=criteria.skip,
+            yield_content_unit=False)
 
     @staticmethod
     def associate_from_repo(source_repo_id, dest_repo_id, criteria,
@@ -372,6 +405,10 @@ class RepoUnitAssociationManager(object):
             if unassociate_units is not None:
                 transfer_units = list(create_transfer_units(unassociate_units))
 
+        # The fingerprint no longer matches the content once units are removed; it is calculated
+        # again by rebuild_content_unit_counts() below, unless the removal fails.
+        model.Repository.objects(repo_id=repo_id).update_one(unset__content_fingerprint=True)
+
         if notify_plugins:
             remove_from_importer(repo_id, transfer_units)
 
@@ -15,6 +15,7 @@ from pulp.server.webservices.views import search
 from pulp.server.webservices.views.util import (generate_json_response,
                                                 generate_json_response_with_pulp_encoder,
                                                 generate_redirect_response,
+                                                generate_streaming_json_response_with_pulp_encoder,
                                                 parse_json_body)
 
 
@@ -149,7 +150,7 @@ class ConsumerGroupSearchView(search.SearchView):
     """
     This view provides GET and POST searching on Consumer Groups.
     """
-    response_builder = staticmethod(generate_json_response_with_pulp_encoder)
+    response_builder = staticmethod(generate_streaming_json_response_with_pulp_encoder)
     manager = query.ConsumerGroupQueryManager()
     serializer = staticmethod(serialize)
 
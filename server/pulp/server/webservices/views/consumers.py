@@ -1,8 +1,11 @@
+import itertools
+
 from django.core.urlresolvers import reverse
 from django.http import HttpResponseBadRequest
 from django.views.generic import View
 
 from pulp.common import tags
+from pulp.plugins.util.misc import paginate
 from pulp.server.async.tasks import TaskResult
 from pulp.server.auth import authorization
 from pulp.server.controllers import consumer as consumer_controller
@@ -14,8 +17,8 @@ from pulp.server.managers import factory
 from pulp.server.managers.consumer import bind
 from pulp.server.managers.consumer import profile
 from pulp.server.managers.consumer import query as query_manager
-from pulp.server.managers.consumer.applicability import (regenerate_applicability_for_consumers,
-                                                         retrieve_consumer_applicability)
+from pulp.server.managers.consumer.applicability import (ConsumerApplicabilityReport,
+                                                         regenerate_applicability_for_consumers)
 from pulp.server.managers.schedule.consumer import (UNIT_INSTALL_ACTION, UNIT_UNINSTALL_ACTION,
                                                     UNIT_UPDATE_ACTION)
 from pulp.server.webservices.views import search
@@ -25,6 +28,7 @@ from pulp.server.webservices.views.util import (_ensure_input_encoding,
                                                 generate_json_response,
                                                 generate_json_response_with_pulp_encoder,
                                                 generate_redirect_response,
+                                                generate_streaming_json_response_with_pulp_encoder,
                                                 parse_json_body)
 
 
@@ -286,7 +290,7 @@ class ConsumerSearchView(search.SearchView):
     This view provides GET and POST searching for Consumers.
     """
     optional_bool_fields = ('details', 'bindings')
-    response_builder = staticmethod(generate_json_response_with_pulp_encoder)
+    response_builder = staticmethod(generate_streaming_json_response_with_pulp_encoder)
     manager = query_manager.ConsumerQueryManager()
 
     @classmethod
@@ -294,6 +298,9 @@ class ConsumerSearchView(search.SearchView):
         """
         This overrides the base class implementation so we can include optional information.
 
+        The consumers are read from the database and expanded a page at a time as they are
+        iterated.
+
         :param query: The criteria that should be used to search for objects
         :type  query: dict
         :param search_method: function that should be used to search
@@ -303,12 +310,28 @@ class ConsumerSearchView(search.SearchView):
         :type  options: dict
 
         :return: results, expanded and serialized
-        :rtype:  list
+        :rtype:  iterable
+        """
+        pages = paginate(search_method(query), cls.page_size)
+        return itertools.chain.from_iterable(
+            cls._process_results(page, options) for page in pages)
+
+    @staticmethod
+    def _process_results(consumers, options):
+        """
+        Expand and serialize a page of consumers for the response.
+
+        :param consumers: consumers
+        :type  consumers: iterable of dicts
+        :param options: additional options for including extra data
+        :type  options: dict
+
+        :return: the expanded consumers
+        :rtype:  list of dicts
         """
-        results = list(search_method(query))
         results = expand_consumers(options.get('details', False),
                                    options.get('bindings', False),
-                                   results)
+                                   list(consumers))
         for consumer in results:
             add_link(consumer)
         return results
@@ -318,7 +341,7 @@ class ConsumerBindingSearchView(search.SearchView):
     """
     This view provides GET and POST searching for Consumer Bindings.
     """
-    response_builder = staticmethod(generate_json_response_with_pulp_encoder)
+    response_builder = staticmethod(generate_streaming_json_response_with_pulp_encoder)
     manager = bind.BindManager()
 
 
@@ -326,7 +349,7 @@ class ConsumerProfileSearchView(search.SearchView):
     """
     This view provides GET and POST searching for Consumer Profiles.
     """
-    response_builder = staticmethod(generate_json_response_with_pulp_encoder)
+    response_builder = staticmethod(generate_streaming_json_response_with_pulp_encoder)
     manager = profile.ProfileManager()
 
 
@@ -804,7 +827,16 @@ class ConsumerProfileResourceView(View):
 class ConsumerContentApplicabilityView(View):
     """
     View for query content applicability.
+
+    Applicability is read from the applicability materialized for groups of consumers when
+    applicability is regenerated. If the "after" option is given, even if empty, the report is
+    returned one page of groups at a time. When a page is full, the continuation token to pass as
+    "after" to get the next page is returned in the CONTINUATION_HEADER response header.
     """
+
+    CONTINUATION_HEADER = 'Pulp-Continuation-Token'
+    DEFAULT_PAGE_SIZE = 1000
+
     @auth_required(authorization.READ)
     @parse_json_body(json_type=dict)
     def post(self, request):
@@ -812,7 +844,9 @@ class ConsumerContentApplicabilityView(View):
         Query content applicability for a given consumer criteria query.
 
         body {criteria: <object>,
-              content_types: <array>[optional]}
+              content_types: <array>[optional],
+              after: <string>[optional],
+              limit: <integer>[optional]}
 
         This method returns a JSON document containing an array of objects that each have two
         keys: 'consumers', and 'applicability'. 'consumers' will index an array of consumer_ids,
@@ -831,18 +865,26 @@ class ConsumerContentApplicabilityView(View):
         :return: Response containing applicability data matching the consumer criteria query
         :rtype:  jango.http.HttpResponse
         """
-
-        # Get the consumer_ids that match the consumer criteria query that the requestor queried
-        # with, and build a map from consumer_id to a dict with profiles and repo_ids for each
-        # consumer
+        body = request.body_as_json
         try:
             consumer_criteria = self._get_consumer_criteria(request)
             content_types = self._get_content_types(request)
+            if 'after' in body:
+                limit = self._get_limit(request)
+                report = ConsumerApplicabilityReport(consumer_criteria, content_types,
+                                                     after=body['after'], limit=limit)
+            else:
+                report = ConsumerApplicabilityReport(consumer_criteria, content_types)
         except InvalidValue, e:
             return HttpResponseBadRequest(str(e))
 
-        response = retrieve_consumer_applicability(consumer_criteria, content_types)
-        return generate_json_response_with_pulp_encoder(response)
+        if 'after' not in body:
+            return generate_streaming_json_response_with_pulp_encoder(report)
+
+        response = generate_json_response_with_pulp_encoder(list(report))
+        if report.groups_read == limit:
+            response[self.CONTINUATION_HEADER] = report.group_token
+        return response
 
     def _get_consumer_criteria(self, request):
         """
@@ -890,6 +932,27 @@ class ConsumerContentApplicabilityView(View):
 
         return content_types
 
+    def _get_limit(self, request):
+        """
+        Get the maximum number of consumer groups the caller wishes a page to contain.
+
+        :param request: WSGI request object
+        :type request: django.core.handlers.wsgi.WSGIRequest
+
+        :raises InvalidValue: if the limit is not a positive integer
+
+        :return: The page size
+        :rtype:  int
+        """
+
+        body = request.body_as_json
+
+        limit = body.get('limit', self.DEFAULT_PAGE_SIZE)
+        if isinstance(limit, bool) or not isinstance(limit, (int, long)) or limit < 1:
+            raise InvalidValue('limit must be a positive integer.')
+
+        return limit
+
 
 class ConsumerContentApplicRegenerationView(View):
     """
@@ -1,4 +1,5 @@
 from gettext import gettext as _
+import itertools
 
 from django.core.urlresolvers import reverse
 from django.http import HttpResponseNotFound, HttpResponseBadRequest
@@ -8,6 +9,7 @@ from pulp.common import tags
 from pulp.common.tags import (ACTION_REFRESH_ALL_CONTENT_SOURCES,
                               ACTION_REFRESH_CONTENT_SOURCE,
                               RESOURCE_CONTENT_SOURCE)
+from pulp.plugins.util.misc import paginate
 from pulp.server import constants
 from pulp.server.auth import authorization
 from pulp.server.content.sources.container import ContentContainer
@@ -81,13 +83,20 @@ class OrphanCollectionView(View):
         """
         Dispatch a delete_all_orphans task.
 
+        When the dry_run query parameter is true, the task only reports the count and size of the
+        orphans that would be deleted.
+
         :param request: WSGI request object
         :type  request: django.core.handlers.wsgi.WSGIRequest
 
         :raises: OperationPostponed when an async operation is performed
         """
         task_tags = [tags.resource_tag(tags.RESOURCE_CONTENT_UNIT_TYPE, 'orphans')]
-        async_task = content_orphan.delete_all_orphans.apply_async(tags=task_tags)
+        if request.GET.get('dry_run', 'false').lower() == 'true':
+            async_task = content_orphan.delete_all_orphans.apply_async(
+                kwargs={'dry_run': True}, tags=task_tags)
+        else:
+            async_task = content_orphan.delete_all_orphans.apply_async(tags=task_tags)
         raise OperationPostponed(async_task)
 
 
@@ -284,6 +293,8 @@ class ContentUnitSearch(search.SearchView):
     def get_results(cls, query, search_method, options, *args, **kwargs):
         """
         Overrides the base class so additional information can optionally be added.
+
+        The units are read from the database and processed a page at a time as they are iterated.
         """
 
         type_id = kwargs['type_id']
@@ -291,9 +302,27 @@ class ContentUnitSearch(search.SearchView):
         if serializer and query.get('filters') is not None:
             # if we have a model serializer, translate the filter for this content unit type
             query['filters'] = serializer.translate_filters(serializer.model, query['filters'])
-        units = list(search_method(type_id, query))
+        include_repos = options.get('include_repos') is True
+        pages = paginate(search_method(type_id, query), cls.page_size)
+        return itertools.chain.from_iterable(
+            cls._process_units(page, type_id, include_repos) for page in pages)
+
+    @classmethod
+    def _process_units(cls, units, type_id, include_repos):
+        """
+        Process a page of units for the response.
+
+        :param units:         unit documents
+        :type  units:         iterable of dicts
+        :param type_id:       content type id
+        :type  type_id:       str
+        :param include_repos: whether to add the ids of the repos each unit is a member of
+        :type  include_repos: bool
+        :return:              the processed units
+        :rtype:               list of dicts
+        """
         units = [_process_content_unit(unit, type_id) for unit in units]
-        if options.get('include_repos') is True:
+        if include_repos:
             cls._add_repo_memberships(units, type_id)
         return units
 
@@ -14,7 +14,7 @@ from pulp.server.webservices.views import search
 from pulp.server.webservices.views.decorators import auth_required
 from pulp.server.webservices.views.util import (
     generate_json_response, generate_json_response_with_pulp_encoder, generate_redirect_response,
-    parse_json_body
+    generate_streaming_json_response_with_pulp_encoder, parse_json_body
 )
 
 
@@ -154,7 +154,7 @@ class RepoGroupSearch(search.SearchView):
     """
     serializer = staticmethod(_add_group_link)
     manager = repo_group_query.RepoGroupQueryManager()
-    response_builder = staticmethod(generate_json_response_with_pulp_encoder)
+    response_builder = staticmethod(generate_streaming_json_response_with_pulp_encoder)
 
 
 class RepoGroupAssociateView(View):
@@ -1,9 +1,12 @@
+import itertools
+
 import isodate
 
 from django.core.urlresolvers import reverse
 from django.views.generic import View
 
 from pulp.common import constants, dateutils, tags
+from pulp.plugins.util.misc import paginate
 from pulp.server import exceptions
 from pulp.server.auth import authorization
 from pulp.server.controllers import importer as importer_controller
@@ -23,6 +26,7 @@ from pulp.server.webservices.views.serializers import content
 from pulp.server.webservices.views.util import (generate_json_response,
                                                 generate_json_response_with_pulp_encoder,
                                                 generate_redirect_response,
+                                                generate_streaming_json_response_with_pulp_encoder,
                                                 parse_json_body)
 
 
@@ -229,13 +233,15 @@ class RepoSearch(search.SearchView):
     """
     model = model.Repository
     optional_bool_fields = ('details', 'importers', 'distributors')
-    response_builder = staticmethod(generate_json_response_with_pulp_encoder)
+    response_builder = staticmethod(generate_streaming_json_response_with_pulp_encoder)
 
     @classmethod
     def get_results(cls, query, search_method, options, *args, **kwargs):
         """
         This overrides the base class's implementation so we can optionally include extra data.
 
+        The repositories are read from the database and processed a page at a time as they are
+        iterated.
 
         :param query: The criteria that should be used to search for objects
         :type  query: dict
@@ -245,15 +251,34 @@ class RepoSearch(search.SearchView):
         :type  options: dict
 
         :return: processed results of the query
-        :rtype:  list
+        :rtype:  iterable
         """
         only = query.get('fields', [])
-        results = list(search_method(query))
-        results = _process_repos(results, options.get('details', False),
+        if only:
+            only.extend(['importers', 'distributors'])
+        pages = paginate(search_method(query), cls.page_size)
+        return itertools.chain.from_iterable(
+            cls._process_results(page, only, options) for page in pages)
+
+    @classmethod
+    def _process_results(cls, repos, only, options):
+        """
+        Process a page of repositories for the response.
+
+        :param repos:   repository objects
+        :type  repos:   iterable of pulp.server.db.model.Repository
+        :param only:    the fields to return, or an empty list for all fields
+        :type  only:    list
+        :param options: additional options for including extra data
+        :type  options: dict
+
+        :return: the serialized repositories
+        :rtype:  list of dicts
+        """
+        results = _process_repos(list(repos), options.get('details', False),
                                  options.get('importers', False),
                                  options.get('distributors', False))
         if only:
-            only.extend(['importers', 'distributors'])
             search._trim_results(cls.model, results, only)
         return results
 
@@ -261,8 +286,17 @@ class RepoSearch(search.SearchView):
 class RepoUnitSearch(search.SearchView):
     """
     Adds GET and POST searching for units within a repository.
+
+    If the "after" option is given, even if empty, the units are returned one page at a time
+    ordered by unit type and unit id. When a page is full, the continuation token to pass as
+    "after" to get the next page is returned in the CONTINUATION_HEADER response header.
     """
 
+    optional_string_fields = ('after',)
+
+    CONTINUATION_HEADER = 'Pulp-Continuation-Token'
+    DEFAULT_PAGE_SIZE = 1000
+
     @classmethod
     def _generate_response(cls, query, options, *args, **kwargs):
         """
@@ -270,7 +304,8 @@ class RepoUnitSearch(search.SearchView):
         serialized HttpReponse object.
 
         This overrides the base class so we can validate repo existance and to choose the search
-        method depending on how many unit types we are dealing with.
+        method depending on how many unit types we are dealing with. The units are serialized as
+        they are read from the database and streamed.
 
         :param query: The criteria that should be used to search for objects
         :type  query: dict
@@ -281,17 +316,67 @@ class RepoUnitSearch(search.SearchView):
         :rtype:       django.http.HttpResponse
         """
         repo_id = kwargs.get('repo_id')
-        model.Repository.objects.get_repo_or_missing_resource(repo_id)
+        repo = model.Repository.objects.get_repo_or_missing_resource(repo_id)
         criteria = UnitAssociationCriteria.from_client_input(query)
+        if 'after' in options:
+            return cls._generate_page_response(repo, criteria, options['after'] or None)
         manager = manager_factory.repo_unit_association_query_manager()
         if criteria.type_ids is not None and len(criteria.type_ids) == 1:
             type_id = criteria.type_ids[0]
-            units = manager.get_units_by_type(repo_id, type_id, criteria=criteria)
+            units = manager.get_units_by_type(repo_id, type_id, criteria=criteria,
+                                              as_generator=True)
         else:
-            units = manager.get_units(repo_id, criteria=criteria)
-        for unit in units:
-            content.serialize_unit_with_serializer(unit['metadata'])
-        return generate_json_response_with_pulp_encoder(units)
+            units = manager.get_units(repo_id, criteria=criteria, as_generator=True)
+        return generate_streaming_json_response_with_pulp_encoder(
+            cls._serialize_unit(unit) for unit in units)
+
+    @staticmethod
+    def _serialize_unit(unit):
+        """
+        Serialize the metadata of a unit association in place.
+
+        :param unit: unit association with the unit metadata
+        :type  unit: dict
+
+        :return: the unit association
+        :rtype:  dict
+        """
+        content.serialize_unit_with_serializer(unit['metadata'])
+        return unit
+
+    @classmethod
+    def _generate_page_response(cls, repo, criteria, after):
+        """
+        Return one page of the units associated with the repository, ordered by unit type and unit
+        id, as a JSON serialized HttpResponse object.
+
+        :param repo:     The repository to search
+        :type  repo:     pulp.server.db.model.Repository
+        :param criteria: The criteria that should be used to search for units
+        :type  criteria: pulp.server.db.model.criteria.UnitAssociationCriteria
+        :param after:    The continuation token returned with the previous page, if any
+        :type  after:    basestring
+
+        :return:      The serialized page of results in an HttpReponse
+        :rtype:       django.http.HttpResponse
+        """
+        if not criteria.limit:
+            criteria.limit = cls.DEFAULT_PAGE_SIZE
+        manager = manager_factory.repo_unit_association_manager()
+        units = []
+        association = None
+        for association in manager.find_units_after(repo, criteria, after=after):
+            unit = association.unit.to_mongo().to_dict()
+            content.serialize_unit_with_serializer(unit)
+            serialized = association.to_mongo().to_dict()
+            serialized['metadata'] = unit
+            units.append(serialized)
+
+        response = generate_json_response_with_pulp_encoder(units)
+        if len(units) == criteria.limit:
+            response[cls.CONTINUATION_HEADER] = repo_controller.get_unit_continuation_token(
+                association.unit_type_id, association.unit_id)
+        return response
 
 
 class RepoImportersView(View):
@@ -635,7 +720,7 @@ class RepoDistributorsSearchView(search.SearchView):
     """
 
     model = model.Distributor
-    response_builder = staticmethod(generate_json_response_with_pulp_encoder)
+    response_builder = staticmethod(generate_streaming_json_response_with_pulp_encoder)
 
 
 class RepoDistributorResourceView(View):
@@ -882,6 +967,7 @@ class ContentApplicabilityRegenerationView(View):
         :type  request: django.core.handlers.wsgi.WSGIRequest
 
         :raises exceptions.MissingValue: if repo_critera is not a body parameter
+        :raises exceptions.InvalidValue: if since is not an ISO8601 datetime
         :raises exceptions.InvalidValue: if repo_critera (dict) has unsupported keys,
                                               the manager will raise an InvalidValue for the
                                               specific keys. Here, we create a parent exception
@@ -895,6 +981,7 @@ class ContentApplicabilityRegenerationView(View):
 
         repo_criteria_body = request.body_as_json.get('repo_criteria', None)
         parallel = request.body_as_json.get('parallel', False)
+        since = request.body_as_json.get('since', None)
 
         if repo_criteria_body is None:
             raise exceptions.MissingValue('repo_criteria')
@@ -905,6 +992,12 @@ class ContentApplicabilityRegenerationView(View):
             invalid_criteria.add_child_exception(e)
             raise invalid_criteria
 
+        if since is not None:
+            try:
+                dateutils.parse_iso8601_datetime(since)
+            except (ValueError, TypeError, isodate.ISO8601Error):
+                raise exceptions.InvalidValue('since')
+
         if parallel:
             if type(parallel) is not bool:
                 raise exceptions.InvalidValue('parallel')
@@ -917,9 +1010,10 @@ class ContentApplicabilityRegenerationView(View):
             raise exceptions.OperationPostponed(ret)
 
         regeneration_tag = tags.action_tag('content_applicability_regeneration')
+        args = (repo_criteria.as_dict(),) if since is None else (repo_criteria.as_dict(), since)
         async_result = regenerate_applicability_for_repos.apply_async_with_reservation(
             tags.RESOURCE_REPOSITORY_PROFILE_APPLICABILITY_TYPE, tags.RESOURCE_ANY_ID,
-            (repo_criteria.as_dict(),), tags=[regeneration_tag])
+            args, tags=[regeneration_tag])
         raise exceptions.OperationPostponed(async_result)
 
 
@@ -1262,10 +1356,14 @@ class RepoImportUpload(View):
 
         unit_metadata = request.body_as_json.pop('unit_metadata', None)
         override_config = request.body_as_json.pop('override_config', None)
+        checksum_type = request.body_as_json.pop('checksum_type', None)
+        checksum = request.body_as_json.pop('checksum', None)
+        if checksum is not None and not checksum_type:
+            raise exceptions.MissingValue('checksum_type')
         task_tags = [tags.resource_tag(tags.RESOURCE_REPOSITORY_TYPE, repo_id),
                      tags.action_tag('import_upload')]
         async_result = import_uploaded_unit.apply_async_with_reservation(
             tags.RESOURCE_REPOSITORY_TYPE, repo_id,
             [repo_id, unit_type_id, unit_key, unit_metadata, upload_id, override_config],
-            tags=task_tags)
+            kwargs={'checksum_type': checksum_type, 'checksum': checksum}, tags=task_tags)
         raise exceptions.OperationPostponed(async_result)
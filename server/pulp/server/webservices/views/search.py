@@ -2,11 +2,13 @@
 This module contains the SearchView superclass. Your view code should subclass this to create a
 search view for a specific model.
 """
+import itertools
 import json
 
 from django.views import generic
 from pymongo.errors import OperationFailure
 
+from pulp.plugins.util.misc import paginate
 from pulp.server import exceptions
 from pulp.server.auth import authorization
 from pulp.server.db.model import criteria
@@ -25,8 +27,9 @@ class SearchView(generic.View):
 
     :cvar    response_builder: The function that should be used to turn the search results
                                into a JSON serialized Django Response object. If not defined,
-                               this defaults to
-                               pulp.server.webservices.views.util.generate_json_response.
+                               this defaults to pulp.server.webservices.views.util.
+                               generate_streaming_json_response_with_pulp_encoder, which
+                               streams the results as they are read from the database.
     :vartype response_builder: staticmethod
     :cvar    manager:          Define this class attribute if you are making a SearchView for
                                a model that has not yet been converted to MongoEngine. It
@@ -46,11 +49,15 @@ class SearchView(generic.View):
                                model instance, sane serializers are used by default, and this
                                method should not be defined.
     :vartype serializer:       staticmethod
+    :cvar    page_size:        The number of search results that are read from the database and
+                               serialized at a time while they are streamed.
+    :vartype page_size:        int
     """
 
-    response_builder = staticmethod(util.generate_json_response_with_pulp_encoder)
+    response_builder = staticmethod(util.generate_streaming_json_response_with_pulp_encoder)
     optional_string_fields = tuple()
     optional_bool_fields = tuple()
+    page_size = 1000
 
     @classmethod
     def _parse_args(cls, args):
@@ -211,12 +218,16 @@ class SearchView(generic.View):
         :param options: additional options for including extra data
         :type  options: dict
 
+        The results are read from the database and serialized a page at a time as they are
+        iterated.
+
         :return: search results
-        :rtype:  list
+        :rtype:  iterable
         """
         only = query.get('fields')
-        results = list(search_method(query))
-        return cls._serialize_results(results, only=only)
+        pages = paginate(search_method(query), cls.page_size)
+        return itertools.chain.from_iterable(
+            cls._serialize_results(list(page), only=only) for page in pages)
 
 
 def _trim_results(model, results, only):
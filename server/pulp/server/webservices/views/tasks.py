@@ -17,8 +17,9 @@ from pulp.server.exceptions import MissingResource
 from pulp.server.webservices.views import search
 from pulp.server.webservices.views.decorators import auth_required
 from pulp.server.webservices.views.serializers import dispatch as serial_dispatch
-from pulp.server.webservices.views.util import (generate_json_response,
-                                                generate_json_response_with_pulp_encoder)
+from pulp.server.webservices.views.util import (
+    generate_json_response, generate_json_response_with_pulp_encoder,
+    generate_streaming_json_response_with_pulp_encoder)
 
 
 # This constant set is used for deleting the completed tasks from the collection.
@@ -45,7 +46,7 @@ class TaskSearchView(search.SearchView):
     """
     This view provides GET and POST searching on TaskStatus objects.
     """
-    response_builder = staticmethod(generate_json_response_with_pulp_encoder)
+    response_builder = staticmethod(generate_streaming_json_response_with_pulp_encoder)
     model = TaskStatus
     serializer = staticmethod(task_serializer)
 
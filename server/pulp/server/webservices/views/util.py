@@ -3,10 +3,11 @@ from functools import wraps
 
 import functools
 import httplib
+import itertools
 import json
 import sys
 
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils.encoding import iri_to_uri
 
 from pulp.common import dateutils, error_codes
@@ -15,6 +16,11 @@ from pulp.server.compat import json_util
 from pulp.server.exceptions import PulpCodedValidationException, InputEncodingError
 
 
+# The number of bytes of serialized JSON that are collected before being written to a streamed
+# response.
+STREAM_CHUNK_SIZE = 65536
+
+
 def pulp_json_encoder(obj):
     """
     Specialized json encoding.
@@ -65,6 +71,74 @@ generate_json_response_with_pulp_encoder = functools.partial(
 )
 
 
+def _json_array_chunks(items, default=None):
+    """
+    Serialize an iterable as a JSON array, one item at a time, yielding the serialized array in
+    chunks of about STREAM_CHUNK_SIZE bytes. The result is the same as json.dumps() of a list of
+    the items.
+
+    :param items   : items to serialize
+    :type  items   : iterable of anything that is serializable by json.dumps
+    :param default : function used by json.dumps to serialize each item
+    :type  default : function or None
+
+    :return        : chunks of the serialized array
+    :rtype         : generator of str
+    """
+    chunk = ['[']
+    size = 1
+    separator = ''
+    for item in items:
+        serialized = json.dumps(item, default=default)
+        chunk.append(separator)
+        chunk.append(serialized)
+        separator = ', '
+        size += len(serialized) + 2
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    chunk.append(']')
+    yield ''.join(chunk)
+
+
+def generate_streaming_json_response(items, default=None,
+                                     content_type='application/json; charset=utf-8'):
+    """
+    Serialize an iterable as a JSON array and return a django response that streams it, so that
+    neither the list of items nor the serialized array are held in memory at once.
+
+    The first chunk is serialized before the response is returned, so that errors raised when
+    starting to iterate, such as a database query failing on invalid criteria, are raised here
+    rather than after the response has started.
+
+    :param items        : items to serialize, such as the results of a database query
+    :type  items        : iterable of anything that is serializable by json.dumps
+    :param default      : function used by json.dumps to serialize each item
+    :type  default      : function or None
+    :param content_type : type of returned content
+    :type  content_type : str
+
+    :return             : response streaming the serialized items
+    :rtype              : django.http.StreamingHttpResponse
+    """
+    chunks = _json_array_chunks(items, default=default)
+    first = next(chunks)
+    return StreamingHttpResponse(itertools.chain([first], chunks), content_type=content_type)
+
+
+"""
+Shortcut function to generate a streaming json response using the in house json_encoder.
+
+This function is equivalent to:
+generate_streaming_json_response(items, default=pulp_json_encoder)
+"""
+generate_streaming_json_response_with_pulp_encoder = functools.partial(
+    generate_streaming_json_response,
+    default=pulp_json_encoder,
+)
+
+
 def generate_redirect_response(response, href):
     response['Location'] = iri_to_uri(href)
     response.status_code = httplib.CREATED
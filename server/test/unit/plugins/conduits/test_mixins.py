@@ -620,6 +620,42 @@ class AddUnitMixinTests(unittest.TestCase):
         # Test
         self.assertRaises(mixins.ImporterConduitException, self.mixin.save_unit, None)
 
+    @mock.patch('pulp.server.managers.content.query.ContentQueryManager.'
+                'get_content_unit_by_keys_dict')
+    @mock.patch('pulp.server.managers.content.cud.ContentManager.update_content_unit')
+    @mock.patch('pulp.server.controllers.repository.associate_units_by_id')
+    @mock.patch('pulp.server.controllers.repository.UNIT_CHUNK_SIZE', 2)
+    def test_save_units(self, mock_associate, mock_update, mock_get):
+        # Setup
+        units = [Unit('t', {'k': 'v%d' % i}, {'m': 'm'}, None) for i in range(3)]
+        mock_get.side_effect = [{'_id': 'existing-%d' % i} for i in range(3)]
+
+        # Test
+        saved = self.mixin.save_units(iter(units))
+
+        # Verify
+        self.assertEqual(saved, units)
+        self.assertEqual([u.id for u in saved], ['existing-0', 'existing-1', 'existing-2'])
+        self.assertEqual(3, mock_update.call_count)
+        self.assertEqual(3, self.mixin._updated_count)
+        mock_associate.assert_has_calls([
+            mock.call(self.repo_id, [('t', 'existing-0'), ('t', 'existing-1')]),
+            mock.call(self.repo_id, [('t', 'existing-2')])])
+        self.assertEqual(2, mock_associate.call_count)
+
+    @mock.patch('pulp.server.managers.content.query.ContentQueryManager.'
+                'get_content_unit_by_keys_dict')
+    @mock.patch('pulp.server.controllers.repository.associate_units_by_id')
+    def test_save_units_with_error(self, mock_associate, mock_get):
+        # Setup
+        mock_get.return_value = {'_id': 'existing'}
+        mock_associate.side_effect = Exception()
+        units = [Unit('t', {'k': 'v'}, {'m': 'm'}, None)]
+
+        # Test
+        with mock.patch('pulp.server.managers.content.cud.ContentManager.update_content_unit'):
+            self.assertRaises(mixins.ImporterConduitException, self.mixin.save_units, units)
+
     @mock.patch('pulp.server.managers.content.cud.ContentManager.link_referenced_content_units')
     def test_link_unit(self, mock_link):
         # Setup
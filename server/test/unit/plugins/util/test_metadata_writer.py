@@ -5,16 +5,19 @@ import os
 import tempfile
 import shutil
 import sys
+import threading
 from time import sleep
 
 from mock import Mock, patch
 
 from pulp.common.error_codes import PLP1005
 from pulp.devel.unit.server.util import assert_validation_exception
+from pulp.plugins.util.metadata_writer import ChecksumWriter
 from pulp.plugins.util.metadata_writer import MetadataFileContext, JSONArrayFileContext
 from pulp.plugins.util.metadata_writer import XmlFileContext
 from pulp.plugins.util.metadata_writer import FastForwardXmlFileContext
-from pulp.server.util import TYPE_SHA1
+from pulp.plugins.util.metadata_writer import MetadataFanOut
+from pulp.server.util import TYPE_SHA1, TYPE_SHA256
 
 
 DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'data'))
@@ -247,6 +250,52 @@ class MetadataWriterTests(unittest.TestCase):
                                                    expected_metadata_file_name)
         self.assertEquals(expected_metadata_file_path, context.metadata_file_path)
 
+    def test_finalize_checksum_streamed(self):
+        path = os.path.join(self.metadata_file_dir, 'test.xml')
+        context = MetadataFileContext(path, TYPE_SHA256)
+        context._open_metadata_file_handle()
+        context.metadata_file_handle.write('<metadata/>')
+
+        with patch('pulp.plugins.util.metadata_writer.open', create=True) as mock_open:
+            context.finalize()
+            # the file is not read again
+            self.assertFalse(mock_open.called)
+
+        expected = hashlib.sha256('<metadata/>').hexdigest()
+        self.assertEqual(context.checksum, expected)
+        self.assertEqual(context.size, len('<metadata/>'))
+        self.assertEqual(context.open_checksum, expected)
+        self.assertEqual(context.open_size, len('<metadata/>'))
+        self.assertEqual(context.metadata_file_path,
+                         os.path.join(self.metadata_file_dir, expected + '-test.xml'))
+
+    def test_finalize_checksum_streamed_gzip(self):
+        path = os.path.join(self.metadata_file_dir, 'test.xml.gz')
+        context = MetadataFileContext(path, TYPE_SHA256)
+        context._open_metadata_file_handle()
+        context.metadata_file_handle.write('<metadata/>')
+        context.finalize()
+
+        with open(context.metadata_file_path, 'rb') as file_handle:
+            content = file_handle.read()
+        self.assertEqual(context.checksum, hashlib.sha256(content).hexdigest())
+        self.assertEqual(context.size, len(content))
+        self.assertEqual(context.open_checksum, hashlib.sha256('<metadata/>').hexdigest())
+        self.assertEqual(context.open_size, len('<metadata/>'))
+        handle = gzip.open(context.metadata_file_path)
+        self.assertEqual(handle.read(), '<metadata/>')
+        handle.close()
+
+    def test_finalize_checksum_handle_not_opened_by_context(self):
+        path = os.path.join(self.metadata_file_dir, 'test.xml')
+        context = MetadataFileContext(path, TYPE_SHA256)
+        context.metadata_file_handle = open(path, 'w')
+        context.metadata_file_handle.write('<metadata/>')
+        context.finalize()
+
+        self.assertEqual(context.checksum, hashlib.sha256('<metadata/>').hexdigest())
+        self.assertEqual(context.open_checksum, None)
+
     @patch('pulp.plugins.util.metadata_writer._LOG.exception')
     def test_finalize_error_on_footer(self, mock_logger):
 
@@ -294,6 +343,34 @@ class MetadataWriterTests(unittest.TestCase):
         context.initialize.assert_called_once_with()
 
 
+class TestChecksumWriter(unittest.TestCase):
+
+    def test_write(self):
+        file_object = Mock()
+        writer = ChecksumWriter(file_object, hashlib.sha256)
+        writer.write('abc')
+        writer.write('def')
+
+        self.assertEqual(file_object.write.call_args_list, [(('abc',), {}), (('def',), {})])
+        self.assertEqual(writer.size, 6)
+        self.assertEqual(writer.hexdigest(), hashlib.sha256('abcdef').hexdigest())
+
+    def test_write_no_checksum(self):
+        writer = ChecksumWriter(Mock())
+        writer.write('abc')
+
+        self.assertEqual(writer.size, 3)
+        self.assertEqual(writer.hexdigest(), None)
+
+    def test_attributes(self):
+        file_object = Mock()
+        writer = ChecksumWriter(file_object)
+        writer.flush()
+
+        file_object.flush.assert_called_once_with()
+        self.assertTrue(writer.closed is file_object.closed)
+
+
 class TestJSONArrayFileContext(unittest.TestCase):
 
     def setUp(self):
@@ -320,6 +397,78 @@ class TestJSONArrayFileContext(unittest.TestCase):
         self.context.metadata_file_handle.write.assert_called_once_with(',')
 
 
+class NumberFileContext(JSONArrayFileContext):
+
+    def add_unit_metadata(self, unit):
+        super(NumberFileContext, self).add_unit_metadata(unit)
+        self.metadata_file_handle.write(str(unit))
+
+
+class TestMetadataFanOut(unittest.TestCase):
+
+    def setUp(self):
+        self.working_directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.working_directory)
+
+    def test_write(self):
+        paths = [os.path.join(self.working_directory, 'a.json'),
+                 os.path.join(self.working_directory, 'b.json.gz')]
+        contexts = [NumberFileContext(path, checksum_type=TYPE_SHA256) for path in paths]
+
+        with MetadataFanOut(contexts, queue_size=2) as fan_out:
+            for unit in range(10):
+                fan_out.add_unit(unit)
+
+        expected = '[0,1,2,3,4,5,6,7,8,9]'
+        with open(contexts[0].metadata_file_path) as json_file:
+            self.assertEqual(json_file.read(), expected)
+        gzip_file = gzip.open(contexts[1].metadata_file_path)
+        try:
+            self.assertEqual(gzip_file.read(), expected)
+        finally:
+            gzip_file.close()
+        self.assertEqual(contexts[1].open_checksum, hashlib.sha256(expected).hexdigest())
+        self.assertFalse(any(thread.is_alive() for thread in fan_out.threads))
+
+    def test_add_unit_error(self):
+        context = NumberFileContext(os.path.join(self.working_directory, 'a.json'))
+        failing = Mock(metadata_file_path='b.json')
+        failing.add_unit_metadata.side_effect = ValueError()
+        fan_out = MetadataFanOut([context, failing])
+
+        fan_out.add_unit(1)
+        fan_out.add_unit(2)
+        self.assertRaises(ValueError, fan_out.close)
+
+        self.assertEqual(failing.add_unit_metadata.call_count, 1)
+        failing.finalize.assert_called_once_with()
+        self.assertTrue(isinstance(fan_out.error, ValueError))
+        self.assertRaises(ValueError, fan_out.add_unit, 3)
+        with open(context.metadata_file_path) as json_file:
+            self.assertEqual(json_file.read(), '[1,2]')
+
+    def test_initialize_error(self):
+        initializing = threading.Event()
+
+        def initialize():
+            # fail only once the unit is queued
+            initializing.wait(5)
+            raise IOError()
+
+        failing = Mock(metadata_file_path='a.json')
+        failing.initialize.side_effect = initialize
+        fan_out = MetadataFanOut([failing])
+        fan_out.add_unit(1)
+        initializing.set()
+        fan_out.close(raise_error=False)
+
+        self.assertFalse(failing.add_unit_metadata.called)
+        failing.finalize.assert_called_once_with()
+        self.assertTrue(isinstance(fan_out.error, IOError))
+
+
 class XmlFileContextTests(unittest.TestCase):
 
     def setUp(self):
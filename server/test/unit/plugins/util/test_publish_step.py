@@ -4,12 +4,13 @@ import shutil
 import sys
 import tarfile
 import tempfile
+import threading
 import time
 import traceback
 import unittest
 
 import mongoengine
-from mock import Mock, patch, MagicMock
+from mock import Mock, patch, MagicMock, call
 from nectar.downloaders.local import LocalFileDownloader
 from nectar.request import DownloadRequest
 
@@ -21,6 +22,7 @@ from pulp.plugins.config import PluginCallConfiguration
 from pulp.plugins.model import Repository, SyncReport, Unit
 from pulp.plugins.util import publish_step
 from pulp.server.db import model
+from pulp.server.exceptions import PulpCodedTaskFailedException
 from pulp.server.managers import factory
 
 factory.initialize()
@@ -129,6 +131,43 @@ class TestUnitModelPluginStep(PluginBase):
         self.assertEqual(list(ret), [u1, u2, u3])
 
 
+class TestMetadataFanOutStep(PluginBase):
+
+    def setUp(self):
+        super(TestMetadataFanOutStep, self).setUp()
+        self.contexts = [Mock(), Mock()]
+        self.step = publish_step.MetadataFanOutStep('mytype', [MagicMock()],
+                                                    contexts=self.contexts, repo=self.repo)
+
+    @patch('pulp.plugins.util.publish_step.MetadataFanOut')
+    def test_process(self, mock_fan_out):
+        u1 = MagicMock()
+        u2 = MagicMock()
+        self.step._unit_querysets = [[u1], [u2]]
+        self.step._total = 2
+        self.step.parent = self.pluginstep
+        mock_fan_out.return_value.error = None
+
+        self.step.process()
+
+        mock_fan_out.assert_called_once_with(self.contexts, publish_step.FAN_OUT_QUEUE_SIZE)
+        fan_out = mock_fan_out.return_value
+        self.assertEqual(fan_out.add_unit.call_args_list, [call(u1), call(u2)])
+        fan_out.close.assert_called_once_with(raise_error=False)
+        self.assertEqual(self.step.state, reporting_constants.STATE_COMPLETE)
+
+    @patch('pulp.plugins.util.publish_step.MetadataFanOut')
+    def test_post_process_error(self, mock_fan_out):
+        self.step.initialize()
+        mock_fan_out.return_value.error = ValueError()
+
+        self.assertRaises(ValueError, self.step.post_process)
+
+    def test_finalize_not_initialized(self):
+        self.step.finalize()
+        self.step.post_process()
+
+
 class PostOrderTests(unittest.TestCase):
 
     def test_ordered_output(self):
@@ -199,6 +238,168 @@ class StepTests(PublisherBase):
         step.report_progress()
         self.assertFalse(step.status_conduit.report_progress.called)
 
+    @patch('pulp.plugins.util.publish_step.ProgressReporter')
+    def test_report_progress_root(self, mock_reporter):
+        step = publish_step.Step('foo_step')
+        step.report_progress()
+        step.report_progress(force=True)
+        mock_reporter.assert_called_once_with()
+        mock_reporter.return_value.report.assert_has_calls([call(step, False),
+                                                           call(step, True)])
+
+    def test_report_progress_state_change_forced(self):
+        step = publish_step.Step('foo_step')
+        step.progress_reporter = Mock()
+        step.state = reporting_constants.STATE_RUNNING
+        step.report_progress()
+        step.report_progress()
+        step.progress_reporter.report.assert_has_calls([call(step, True), call(step, False)])
+
+    def test_get_progress_report_unchanged(self):
+        step = publish_step.Step('foo_step')
+        child = publish_step.Step('child_step')
+        step.add_child(child)
+        report = step._get_progress_report()
+        self.assertTrue(step._get_progress_report() is report)
+
+    def test_get_progress_report_child_changed(self):
+        step = publish_step.Step('foo_step')
+        step.parent = Mock()
+        child = publish_step.Step('child_step')
+        other_child = publish_step.Step('other_step')
+        step.add_child(child)
+        step.add_child(other_child)
+        report = step._get_progress_report()
+        other_report = other_child._get_progress_report()
+
+        child.progress_successes = 1
+        new_report = step._get_progress_report()
+
+        self.assertFalse(new_report is report)
+        sub_steps = new_report[0][reporting_constants.PROGRESS_SUB_STEPS_KEY]
+        self.assertEqual(sub_steps[0][reporting_constants.PROGRESS_NUM_SUCCESSES_KEY], 1)
+        # the unchanged child step is not built again
+        self.assertTrue(other_child._get_progress_report() is other_report)
+        self.assertTrue(sub_steps[1] is other_report[0])
+
+    def test_get_progress_report_details_changed(self):
+        step = publish_step.Step('foo_step')
+        step.get_progress_report()
+        step.progress_details = 'foo'
+        new_report = step.get_progress_report()
+        self.assertEqual(new_report[0][reporting_constants.PROGRESS_DETAILS_KEY], 'foo')
+
+    def test_get_progress_report_details_changed_in_place(self):
+        step = publish_step.Step('foo_step')
+        step.progress_details = {'size_left': 10}
+        report = step.get_progress_report()
+        step.progress_details['size_left'] = 5
+        new_report = step.get_progress_report()
+        self.assertEqual(report[0][reporting_constants.PROGRESS_DETAILS_KEY], {'size_left': 10})
+        self.assertEqual(new_report[0][reporting_constants.PROGRESS_DETAILS_KEY],
+                         {'size_left': 5})
+
+    def test_get_progress_report_copied(self):
+        step = publish_step.Step('foo_step')
+        report = step.get_progress_report()
+        report[0][reporting_constants.PROGRESS_STATE_KEY] = 'modified'
+        new_report = step.get_progress_report()
+        self.assertFalse(new_report is report)
+        self.assertEqual(new_report[0][reporting_constants.PROGRESS_STATE_KEY], step.state)
+
+
+@patch('pulp.plugins.util.publish_step.time.time')
+class ProgressReporterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.step = publish_step.Step('foo_step')
+        self.step.status_conduit = Mock()
+        self.step.total_units = 1000
+        self.child = publish_step.Step('child_step')
+        self.step.add_child(self.child)
+        self.reporter = publish_step.ProgressReporter(interval=1, delta=1)
+
+    def assertWritten(self, count):
+        self.assertEqual(self.step.status_conduit.set_progress.call_count, count)
+
+    @patch('pulp.plugins.util.publish_step.pulp_config')
+    def test_defaults_from_config(self, mock_config, mock_time):
+        mock_config.getfloat.side_effect = lambda section, key: {
+            ('tasks', 'progress_report_interval'): 2.0,
+            ('tasks', 'progress_report_delta'): 5.0}[(section, key)]
+        reporter = publish_step.ProgressReporter()
+        self.assertEqual(reporter.interval, 2.0)
+        self.assertEqual(reporter.delta, 0.05)
+
+    def test_first_report(self, mock_time):
+        mock_time.return_value = 100
+        self.assertTrue(self.reporter.report(self.step))
+        self.step.status_conduit.set_progress.assert_called_once_with(
+            self.step.get_progress_report())
+
+    def test_throttled_by_interval(self, mock_time):
+        mock_time.return_value = 100
+        self.reporter.report(self.step)
+        self.step.state = reporting_constants.STATE_RUNNING
+        mock_time.return_value = 100.5
+        self.assertFalse(self.reporter.report(self.step))
+        self.assertWritten(1)
+
+    def test_unchanged_not_written(self, mock_time):
+        mock_time.return_value = 100
+        self.reporter.report(self.step)
+        mock_time.return_value = 200
+        self.assertFalse(self.reporter.report(self.step))
+        self.assertWritten(1)
+
+    def test_small_delta_not_written(self, mock_time):
+        mock_time.return_value = 100
+        self.reporter.report(self.step)
+        self.step.progress_successes = 9
+        mock_time.return_value = 200
+        self.assertFalse(self.reporter.report(self.step))
+        self.assertWritten(1)
+
+    def test_details_changed_in_place_written(self, mock_time):
+        self.child.progress_details = {'size_left': 10}
+        mock_time.return_value = 100
+        self.reporter.report(self.step)
+        self.child.progress_details['size_left'] = 5
+        mock_time.return_value = 200
+        self.assertTrue(self.reporter.report(self.step))
+        self.assertWritten(2)
+        report = self.step.status_conduit.set_progress.call_args[0][0]
+        self.assertEqual(report[0][reporting_constants.PROGRESS_DETAILS_KEY], {'size_left': 5})
+
+    def test_delta_written(self, mock_time):
+        mock_time.return_value = 100
+        self.reporter.report(self.step)
+        self.step.progress_successes = 10
+        mock_time.return_value = 200
+        self.assertTrue(self.reporter.report(self.step))
+        self.assertWritten(2)
+
+    def test_child_change_written(self, mock_time):
+        mock_time.return_value = 100
+        self.reporter.report(self.step)
+        # the child only has one item, so one processed item is more than the delta
+        self.child.progress_successes = 1
+        mock_time.return_value = 200
+        self.assertTrue(self.reporter.report(self.step))
+
+    def test_failure_written(self, mock_time):
+        mock_time.return_value = 100
+        self.reporter.report(self.step)
+        self.step.progress_failures = 1
+        mock_time.return_value = 200
+        self.assertTrue(self.reporter.report(self.step))
+
+    def test_forced(self, mock_time):
+        mock_time.return_value = 100
+        self.reporter.report(self.step)
+        self.assertTrue(self.reporter.report(self.step, force=True))
+        self.assertWritten(2)
+
 
 class TestStepProcessBlock(unittest.TestCase):
     def test_increments_progress(self):
@@ -220,6 +421,136 @@ class TestStepProcessBlock(unittest.TestCase):
         self.assertEqual(step.progress_successes, 1)
 
 
+class TestStepProcessConcurrently(unittest.TestCase):
+
+    def setUp(self):
+        self.step = publish_step.Step('foo_step', status_conduit=Mock(), max_workers=3)
+        self.step.report_progress = Mock()
+        self.step.get_iterator = Mock(return_value=range(1, 11))
+        self.step.get_total = Mock(return_value=10)
+        self.step.process_main = Mock(side_effect=lambda item: item * 2)
+        self.step.on_item_processed = Mock()
+
+    def test_processes_all_items(self):
+        self.step.process()
+
+        self.assertEqual(self.step.state, reporting_constants.STATE_COMPLETE)
+        self.assertEqual(self.step.progress_successes, 10)
+        self.assertEqual(self.step.process_main.call_count, 10)
+        self.assertEqual(self.step.on_item_processed.call_args_list,
+                         [call(i, i * 2) for i in range(1, 11)])
+
+    def test_ordered(self):
+        first_started = threading.Event()
+        second_done = threading.Event()
+
+        def process_main(item):
+            if item == 1:
+                first_started.set()
+                second_done.wait(5)
+            elif item == 2:
+                first_started.wait(5)
+                second_done.set()
+            return item
+
+        self.step.process_main = Mock(side_effect=process_main)
+        self.step.get_iterator.return_value = [1, 2]
+
+        self.step.process()
+
+        # item 1 is delivered first, even though item 2 was processed first
+        self.assertEqual(self.step.on_item_processed.call_args_list, [call(1, 1), call(2, 2)])
+
+    def test_unordered(self):
+        first_started = threading.Event()
+        second_done = threading.Event()
+
+        def process_main(item):
+            if item == 1:
+                first_started.set()
+                second_done.wait(5)
+            elif item == 2:
+                first_started.wait(5)
+            return item
+
+        self.step.ordered = False
+        self.step.process_main = Mock(side_effect=process_main)
+        self.step.on_item_processed = Mock(side_effect=lambda item, result: second_done.set())
+        self.step.get_iterator.return_value = [1, 2]
+
+        self.step.process()
+
+        self.assertEqual(self.step.on_item_processed.call_args_list, [call(2, 2), call(1, 1)])
+
+    def test_back_pressure(self):
+        lock = threading.Lock()
+        counts = {'submitted': 0, 'processed': 0, 'max_ahead': 0}
+
+        def get_iterator():
+            for i in range(1, 51):
+                with lock:
+                    counts['max_ahead'] = max(counts['max_ahead'],
+                                              counts['submitted'] - counts['processed'])
+                    counts['submitted'] += 1
+                yield i
+
+        def on_item_processed(item, result):
+            with lock:
+                counts['processed'] += 1
+
+        self.step.get_iterator = get_iterator
+        self.step.on_item_processed = Mock(side_effect=on_item_processed)
+
+        self.step.process()
+
+        self.assertEqual(counts['processed'], 50)
+        self.assertTrue(counts['max_ahead'] <= 6)
+
+    def test_non_halting_exception(self):
+        self.step.non_halting_exceptions = [ValueError]
+        self.step.process_main = Mock(
+            side_effect=lambda item: item if item % 2 else int('not a number'))
+
+        self.assertRaises(PulpCodedTaskFailedException, self.step.process)
+
+        self.assertEqual(self.step.progress_successes, 5)
+        self.assertEqual(self.step.progress_failures, 5)
+        self.assertEqual(len(self.step.exceptions), 5)
+        self.assertEqual(self.step.on_item_processed.call_count, 5)
+        self.assertEqual(self.step.state, reporting_constants.STATE_FAILED)
+
+    def test_halting_exception(self):
+        def process_main(item):
+            if item == 1:
+                raise ValueError('boom')
+            return item
+
+        self.step.max_workers = 2
+        self.step.process_main = Mock(side_effect=process_main)
+        self.step.get_iterator.return_value = xrange(1, 1001)
+
+        self.assertRaises(ValueError, self.step.process)
+
+        # the items that were not started when the error was delivered are not processed
+        self.assertTrue(self.step.process_main.call_count < 1000)
+        self.assertEqual(self.step.progress_failures, 1)
+        self.assertEqual(self.step.state, reporting_constants.STATE_FAILED)
+
+    def test_cancel(self):
+        def process_main(item):
+            if item == 1:
+                self.step.cancel()
+            return item
+
+        self.step.process_main = Mock(side_effect=process_main)
+        self.step.get_iterator.return_value = xrange(1, 1001)
+
+        self.step.process()
+
+        self.assertTrue(self.step.process_main.call_count < 1000)
+        self.assertEqual(self.step.state, reporting_constants.STATE_CANCELLED)
+
+
 class PluginStepTests(PluginBase):
     """
     This class has a lot of duplicated tests from PublishStepTests, in order to
@@ -1063,7 +1394,7 @@ class DownloadStepTests(unittest.TestCase):
         dlstep.cancel()
 
 
-@patch('pulp.plugins.util.publish_step.repo_controller.associate_single_unit')
+@patch('pulp.plugins.util.publish_step.repo_controller.associate_units')
 @patch('pulp.plugins.util.publish_step.units_controller.find_units')
 class TestGetLocalUnitsStep(unittest.TestCase):
 
@@ -1133,7 +1464,7 @@ class TestGetLocalUnitsStep(unittest.TestCase):
         mock_find_units.return_value = [existing_demo]
 
         self.step.process_main()
-        mock_associate.assert_called_once_with('fake_repo', existing_demo)
+        mock_associate.assert_called_once_with('fake_repo', [existing_demo])
         mock_find_units.assert_called_once_with((demo, ))
 
         # Ensure that the unit was not marked for download
@@ -1155,7 +1486,7 @@ class TestGetLocalUnitsStep(unittest.TestCase):
         mock_find_units.assert_called_once_with((demo_1, demo_2))
 
         # the one that exists is associated
-        mock_associate.assert_called_once_with('fake_repo', existing_demo)
+        mock_associate.assert_called_once_with('fake_repo', [existing_demo])
         # the one that does not exist yet is added to the download list
         self.assertEqual(self.step.units_to_download, [demo_1])
 
@@ -1183,7 +1514,7 @@ class TestGetLocalUnitsStep(unittest.TestCase):
         # being ignored and the correct available_units is being used instead.
         mock_find_units.assert_called_once_with((demo_1, demo_2, demo_3))
         # the one that exists is associated
-        mock_associate.assert_called_once_with('fake_repo', existing_demo)
+        mock_associate.assert_called_once_with('fake_repo', [existing_demo])
         # the two that do not exist yet are added to the download list
         self.assertEqual(step.units_to_download, [demo_1, demo_3])
 
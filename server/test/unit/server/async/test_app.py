@@ -88,3 +88,26 @@ class InitializeWorkerTestCase(unittest.TestCase):
 
         self.assertEquals(2, len(mock_rm_lock().save.mock_calls))
         mock_time.sleep.assert_called_once_with(PULP_PROCESS_HEARTBEAT_INTERVAL)
+
+
+class FlushEventsTestCase(unittest.TestCase):
+    """
+    This class contains tests for the flush_events() and flush_events_at_shutdown() functions.
+    """
+    @mock.patch('pulp.server.async.app.dispatch.flush')
+    def test_flush_events(self, flush):
+        """
+        Assert that queued event deliveries are flushed after a task.
+        """
+        app.flush_events(sender=mock.MagicMock(), task_id='1')
+
+        flush.assert_called_once_with()
+
+    @mock.patch('pulp.server.async.app.dispatch.flush')
+    def test_flush_events_at_shutdown(self, flush):
+        """
+        Assert that queued event deliveries are flushed when a worker process exits.
+        """
+        app.flush_events_at_shutdown(pid=1, exitcode=0)
+
+        flush.assert_called_once_with()
@@ -0,0 +1,264 @@
+"""
+This module contains tests for the pulp.server.async.reservations module.
+"""
+import threading
+import unittest
+
+import mock
+
+from pulp.server.async import reservations
+from pulp.server.exceptions import NoWorkers
+
+
+class ReservationTableTests(unittest.TestCase):
+
+    def setUp(self):
+        self.patch_a = mock.patch('pulp.server.async.reservations.ReservedResource')
+        self.mock_reserved_resource = self.patch_a.start()
+        self.mock_reserved_resource.objects.all.return_value = []
+
+        self.patch_b = mock.patch('pulp.server.async.reservations.Worker')
+        self.mock_worker = self.patch_b.start()
+        self.mock_worker.objects.return_value.first.side_effect = lambda: self.holder
+
+        self.holder = None
+        self.table = reservations.ReservationTable()
+
+    def tearDown(self):
+        self.patch_a.stop()
+        self.patch_b.stop()
+
+
+class TestReservationTableLoad(ReservationTableTests):
+
+    def test_adds_reservations_from_database(self):
+        self.mock_reserved_resource.objects.all.return_value = [
+            {'task_id': 't1', 'worker_name': 'w1', 'resource_id': 'r1'}]
+        self.table.load()
+        self.assertEqual(self.table.holders(['r1', 'r2']), set(['w1']))
+        self.assertEqual(self.table.reserved_workers(), set(['w1']))
+
+    def test_adds_every_resource_of_a_reservation(self):
+        self.mock_reserved_resource.objects.all.return_value = [
+            {'task_id': 't1', 'worker_name': 'w1', 'resource_id': 'r1'},
+            {'task_id': 't1', 'worker_name': 'w1', 'resource_id': 'r2'},
+            {'task_id': 't2', 'worker_name': 'w2', 'resource_id': 'r3'}]
+        self.table.load()
+        self.assertEqual(self.table._tasks['t1'], ('w1', set(['r1', 'r2'])))
+        select_worker = mock.Mock(return_value={'name': 'w3'})
+        for rid in ('r1', 'r2'):
+            # A task asking for a resource held by w1 and one held by w2 stays parked
+            self.assertTrue(self.table._find_worker([rid, 'r3'], select_worker) is None)
+            # and one asking for the resource alone is not given an idle worker
+            self.assertEqual(self.table.holders([rid]), set(['w1']))
+        self.assertFalse(select_worker.called)
+
+    def test_releases_reservations_missing_from_database(self):
+        self.table._add('t1', 'w1', ['r1'])
+        self.table.load()
+        self.assertEqual(self.table.holders(['r1']), set())
+        self.assertEqual(self.table.reserved_workers(), set())
+
+    def test_keeps_all_resources_of_known_reservations(self):
+        self.table._add('t1', 'w1', ['r1', 'r2'])
+        self.mock_reserved_resource.objects.all.return_value = [
+            {'task_id': 't1', 'worker_name': 'w1', 'resource_id': 'r2'}]
+        self.table.load()
+        self.assertEqual(self.table.holders(['r1']), set(['w1']))
+
+
+class TestReservationTableRelease(ReservationTableTests):
+
+    def test_release(self):
+        self.table._add('t1', 'w1', ['r1'])
+        self.table._add('t2', 'w2', ['r2'])
+        self.table.release('t1')
+        self.assertEqual(self.table.holders(['r1', 'r2']), set(['w2']))
+        self.assertEqual(self.table.reserved_workers(), set(['w2']))
+
+    def test_release_unknown_task(self):
+        self.table.release('t1')
+        self.assertEqual(self.table._generation, 0)
+
+    def test_release_keeps_resource_held_by_other_task_on_same_worker(self):
+        self.table._add('t1', 'w1', ['r1'])
+        self.table._add('t2', 'w1', ['r1'])
+        self.table.release('t1')
+        self.assertEqual(self.table.holders(['r1']), set(['w1']))
+
+    def test_release_worker(self):
+        self.table._add('t1', 'w1', ['r1'])
+        self.table._add('t2', 'w1', ['r2'])
+        self.table._add('t3', 'w2', ['r3'])
+        self.table.release_worker('w1')
+        self.assertEqual(self.table.holders(['r1', 'r2', 'r3']), set(['w2']))
+        self.assertEqual(self.table.reserved_workers(), set(['w2']))
+
+
+class TestReservationTableAcquire(ReservationTableTests):
+
+    def test_reserves_on_idle_worker(self):
+        select_worker = mock.Mock(return_value={'name': 'w1'})
+        worker = self.table.acquire('t1', ['r1', 'r2'], select_worker)
+        self.assertEqual(worker, {'name': 'w1'})
+        select_worker.assert_called_once_with(set())
+        self.assertEqual(self.table.holders(['r1', 'r2']), set(['w1']))
+        self.mock_reserved_resource.assert_has_calls([
+            mock.call(task_id='t1', worker_name='w1', resource_id='r1'),
+            mock.call().save(),
+            mock.call(task_id='t1', worker_name='w1', resource_id='r2'),
+            mock.call().save()])
+        self.assertEqual(dict(self.table._waiters), {})
+
+    def test_reserves_on_holding_worker(self):
+        self.table._loaded = True
+        self.table._add('t1', 'w1', ['r1'])
+        self.holder = {'name': 'w1'}
+        select_worker = mock.Mock()
+        worker = self.table.acquire('t2', ['r1'], select_worker)
+        self.assertTrue(worker is self.holder)
+        self.mock_worker.objects.assert_called_once_with(name='w1')
+        self.assertFalse(select_worker.called)
+        self.assertEqual(self.table._tasks['t2'], ('w1', set(['r1'])))
+
+    def test_does_not_query_reservations_once_loaded(self):
+        select_worker = mock.Mock(return_value={'name': 'w1'})
+        self.table.acquire('t1', ['r1'], select_worker)
+        self.table.acquire('t2', ['r2'], select_worker)
+        self.mock_reserved_resource.objects.all.assert_called_once_with()
+
+    @mock.patch('pulp.server.async.reservations.RESYNC_INTERVAL', 5)
+    def test_woken_on_release(self):
+        self.table._loaded = True
+        self.table.listening = True
+        self.table._add('t1', 'w1', ['r1'])
+        self.table._add('t2', 'w2', ['r2'])
+        select_worker = mock.Mock(side_effect=NoWorkers())
+        self.holder = {'name': 'w2'}
+        result = []
+
+        waiter = threading.Thread(
+            target=lambda: result.append(self.table.acquire('t3', ['r1', 'r2'], select_worker)))
+        waiter.start()
+        self.table.release('t1')
+        waiter.join(2)
+
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(result, [{'name': 'w2'}])
+        self.assertEqual(self.table.holders(['r1', 'r2']), set(['w2']))
+        # No resync from the database was needed
+        self.assertFalse(self.mock_reserved_resource.objects.all.called)
+
+    @mock.patch('pulp.server.async.reservations.RESYNC_INTERVAL', 5)
+    def test_woken_on_worker_online(self):
+        self.table._loaded = True
+        self.table.listening = True
+        self.table._add('t1', 'w1', ['r1'])
+        select_worker = mock.Mock(side_effect=[NoWorkers(), {'name': 'w2'}])
+        result = []
+
+        waiter = threading.Thread(
+            target=lambda: result.append(self.table.acquire('t2', ['r2'], select_worker)))
+        waiter.start()
+        # wait for the request to be parked
+        while not select_worker.called:
+            waiter.join(0.01)
+        self.table.worker_online('w2')
+        waiter.join(2)
+
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(result, [{'name': 'w2'}])
+        self.assertEqual(self.table.holders(['r2']), set(['w2']))
+        # No resync from the database was needed
+        self.assertFalse(self.mock_reserved_resource.objects.all.called)
+
+    @mock.patch('pulp.server.async.reservations.POLL_INTERVAL', 0.01)
+    def test_reloads_while_waiting_without_releases(self):
+        select_worker = mock.Mock(side_effect=[NoWorkers(), {'name': 'w1'}])
+        worker = self.table.acquire('t1', ['r1'], select_worker)
+        self.assertEqual(worker, {'name': 'w1'})
+        self.assertEqual(self.mock_reserved_resource.objects.all.call_count, 2)
+
+    def test_waits_for_earlier_request_for_same_resource(self):
+        self.table._loaded = True
+        self.table._waiters['r1'].append('t1')
+        self.assertFalse(self.table._is_next('t2', ['r1']))
+        self.table._waiters['r1'].append('t2')
+        self.assertFalse(self.table._is_next('t2', ['r1']))
+        self.table._waiters['r1'].popleft()
+        self.assertTrue(self.table._is_next('t2', ['r1']))
+
+
+class TestReleaseListener(unittest.TestCase):
+
+    def test_on_message_task(self):
+        table = mock.Mock()
+        message = mock.Mock()
+        reservations.ReleaseListener(table).on_message(
+            {'task_id': 't1', 'worker_name': None}, message)
+        table.release.assert_called_once_with('t1')
+        self.assertFalse(table.release_worker.called)
+        message.ack.assert_called_once_with()
+
+    def test_on_message_worker(self):
+        table = mock.Mock()
+        message = mock.Mock()
+        reservations.ReleaseListener(table).on_message(
+            {'task_id': None, 'worker_name': 'w1'}, message)
+        table.release_worker.assert_called_once_with('w1')
+        self.assertFalse(table.release.called)
+
+    def test_on_message_worker_online(self):
+        table = mock.Mock()
+        message = mock.Mock()
+        reservations.ReleaseListener(table).on_message({'worker_online': 'w1'}, message)
+        table.worker_online.assert_called_once_with('w1')
+        self.assertFalse(table.release.called)
+        self.assertFalse(table.release_worker.called)
+        message.ack.assert_called_once_with()
+
+
+class TestGetTable(unittest.TestCase):
+
+    @mock.patch('pulp.server.async.reservations._table', None)
+    @mock.patch('pulp.server.async.reservations.ReleaseListener')
+    def test_created_once_per_process(self, mock_listener):
+        table = reservations.get_table()
+        self.assertTrue(reservations.get_table() is table)
+        mock_listener.assert_called_once_with(table)
+        mock_listener.return_value.start.assert_called_once_with()
+
+    @mock.patch('pulp.server.async.reservations._table', None)
+    @mock.patch('pulp.server.async.reservations.os')
+    @mock.patch('pulp.server.async.reservations.ReleaseListener')
+    def test_recreated_after_fork(self, mock_listener, mock_os):
+        mock_os.getpid.return_value = 1
+        table = reservations.get_table()
+        mock_os.getpid.return_value = 2
+        self.assertFalse(reservations.get_table() is table)
+
+
+class TestNotifyReleased(unittest.TestCase):
+
+    @mock.patch('pulp.server.async.reservations.celery')
+    def test_publishes_release(self, mock_celery):
+        reservations.notify_released(task_id='t1')
+        producer = mock_celery.producer_or_acquire.return_value.__enter__.return_value
+        producer.publish.assert_called_once_with(
+            {'task_id': 't1', 'worker_name': None}, exchange=reservations.RELEASE_EXCHANGE,
+            routing_key='', serializer='json', declare=[reservations.RELEASE_EXCHANGE])
+
+    @mock.patch('pulp.server.async.reservations.celery')
+    def test_publishes_worker_online(self, mock_celery):
+        reservations.notify_worker_online('w1')
+        producer = mock_celery.producer_or_acquire.return_value.__enter__.return_value
+        producer.publish.assert_called_once_with(
+            {'worker_online': 'w1'}, exchange=reservations.RELEASE_EXCHANGE,
+            routing_key='', serializer='json', declare=[reservations.RELEASE_EXCHANGE])
+
+    @mock.patch('pulp.server.async.reservations._logger')
+    @mock.patch('pulp.server.async.reservations.celery')
+    def test_failure_is_logged(self, mock_celery, mock_logger):
+        mock_celery.producer_or_acquire.side_effect = IOError()
+        reservations.notify_released(worker_name='w1')
+        self.assertTrue(mock_logger.warning.called)
@@ -11,7 +11,7 @@ from celery.result import AsyncResult
 import celery
 import mock
 
-from mongoengine import ValidationError
+from mongoengine import NotUniqueError, ValidationError
 
 from ...base import PulpServerTests, ResourceReservationTests
 from pulp.common import dateutils
@@ -38,17 +38,10 @@ WORKER_3 = 'worker-3'
 class TestQueueReservedTask(ResourceReservationTests):
 
     def setUp(self):
-        self.patch_a = mock.patch('pulp.server.async.tasks.get_worker_for_reservation')
-        self.mock_get_worker_for_reservation = self.patch_a.start()
-
-        self.patch_b = mock.patch('pulp.server.async.tasks._get_unreserved_worker')
-        self.mock_get_unreserved_worker = self.patch_b.start()
-
-        self.patch_c = mock.patch('pulp.server.async.tasks.time', autospec=True)
-        self.mock_time = self.patch_c.start()
-
-        self.patch_d = mock.patch('pulp.server.async.tasks.ReservedResource', autospec=True)
-        self.mock_reserved_resource = self.patch_d.start()
+        self.patch_a = mock.patch('pulp.server.async.tasks.get_worker_for_reservation_list')
+        self.mock_get_worker_for_reservation_list = self.patch_a.start()
+        self.mock_get_worker_for_reservation_list.return_value = Worker(
+            name='worker1', last_heartbeat=datetime.utcnow())
 
         self.patch_e = mock.patch('pulp.server.async.tasks.celery', autospec=True)
         self.mock_celery = self.patch_e.start()
@@ -61,25 +54,21 @@ class TestQueueReservedTask(ResourceReservationTests):
 
     def tearDown(self):
         self.patch_a.stop()
-        self.patch_b.stop()
-        self.patch_c.stop()
-        self.patch_d.stop()
         self.patch_e.stop()
         self.patch_f.stop()
         super(TestQueueReservedTask, self).tearDown()
 
-    def test_creates_and_saves_reserved_resource(self):
-        self.mock_get_worker_for_reservation.return_value = Worker(
-            name='worker1', last_heartbeat=datetime.utcnow())
+    def test_reserves_resource_for_task(self):
         tasks._queue_reserved_task('task_name', 'my_task_id', 'my_resource_id', [1, 2], {'a': 2})
-        self.mock_reserved_resource.assert_called_once_with(task_id='my_task_id',
-                                                            worker_name='worker1',
-                                                            resource_id='my_resource_id')
-        self.mock_reserved_resource.return_value.save.assert_called_once_with()
+        self.mock_get_worker_for_reservation_list.assert_called_once_with(
+            ['my_resource_id'], task_id='my_task_id')
+
+    def test_reserves_resource_list_for_task(self):
+        tasks._queue_reserved_task_list('task_name', 'my_task_id', ['r1', 'r2'], [1, 2], {'a': 2})
+        self.mock_get_worker_for_reservation_list.assert_called_once_with(
+            ['r1', 'r2'], task_id='my_task_id')
 
     def test_dispatches_inner_task(self):
-        self.mock_get_worker_for_reservation.return_value = Worker(
-            name='worker1', last_heartbeat=datetime.utcnow())
         tasks._queue_reserved_task('task_name', 'my_task_id', 'my_resource_id', [1, 2], {'a': 2})
         apply_async = self.mock_celery.tasks['task_name'].apply_async
         if is_celery_4:
@@ -92,8 +81,6 @@ class TestQueueReservedTask(ResourceReservationTests):
                                                 exchange='C.dq')
 
     def test_dispatches__release_resource(self):
-        self.mock_get_worker_for_reservation.return_value = Worker(
-            name='worker1', last_heartbeat=datetime.utcnow())
         tasks._queue_reserved_task('task_name', 'my_task_id', 'my_resource_id', [1, 2], {'a': 2})
         if is_celery_4:
             self.mock__release_resource.apply_async.assert_called_once_with(('my_task_id',),
@@ -104,44 +91,16 @@ class TestQueueReservedTask(ResourceReservationTests):
                                                                             routing_key='worker1',
                                                                             exchange='C.dq')
 
-    def test_get_worker_for_reservation_breaks_out_of_loop(self):
-        self.mock_get_worker_for_reservation.return_value = Worker(
-            name='worker1', last_heartbeat=datetime.utcnow())
-        tasks._queue_reserved_task('task_name', 'my_task_id', 'my_resource_id', [1, 2], {'a': 2})
-        self.assertTrue(not self.mock_get_unreserved_worker.called)
-        self.assertTrue(not self.mock_time.sleep.called)
-
-    def test_get_unreserved_worker_breaks_out_of_loop(self):
-        self.mock_get_worker_for_reservation.side_effect = NoWorkers()
-        self.mock_get_unreserved_worker.return_value = Worker(name='worker1',
-                                                              last_heartbeat=datetime.utcnow())
-        tasks._queue_reserved_task('task_name', 'my_task_id', 'my_resource_id', [1, 2], {'a': 2})
-        self.assertTrue(not self.mock_time.sleep.called)
 
-    def test_loops_and_sleeps_waiting_for_available_worker(self):
-        self.mock_get_worker_for_reservation.side_effect = NoWorkers()
-        self.mock_get_unreserved_worker.side_effect = NoWorkers()
+class TestGetWorkerForReservationList(ResourceReservationTests):
 
-        class BreakOutException(Exception):
-            pass
-
-        def side_effect(*args):
-            def second_call(*args):
-                raise BreakOutException()
-            self.mock_time.sleep.side_effect = second_call
-            return None
-
-        self.mock_time.sleep.side_effect = side_effect
-
-        try:
-            tasks._queue_reserved_task('task_name', 'my_task_id', 'my_resource_id', [1, 2],
-                                       {'a': 2})
-        except BreakOutException:
-            pass
-        else:
-            self.fail('_queue_reserved_task should have raised a BreakOutException')
-
-        self.mock_time.sleep.assert_has_calls([mock.call(0.25), mock.call(0.25)])
+    @mock.patch('pulp.server.async.tasks.reservations.get_table')
+    def test_acquires_from_reservation_table(self, mock_get_table):
+        acquire = mock_get_table.return_value.acquire
+        result = tasks.get_worker_for_reservation_list(['r1', 'r2'], task_id='my_task_id')
+        acquire.assert_called_once_with('my_task_id', ['r1', 'r2'],
+                                        tasks._select_unreserved_worker)
+        self.assertTrue(result is acquire.return_value)
 
 
 class TestDeleteWorker(ResourceReservationTests):
@@ -168,6 +127,9 @@ class TestDeleteWorker(ResourceReservationTests):
         self.patch_i = mock.patch('pulp.server.async.tasks.constants', autospec=True)
         self.mock_constants = self.patch_i.start()
 
+        self.patch_j = mock.patch('pulp.server.async.tasks.reservations', autospec=True)
+        self.mock_reservations = self.patch_j.start()
+
         super(TestDeleteWorker, self).setUp()
 
     def tearDown(self):
@@ -178,6 +140,7 @@ class TestDeleteWorker(ResourceReservationTests):
         self.patch_f.stop()
         self.patch_g.stop()
         self.patch_i.stop()
+        self.patch_j.stop()
         super(TestDeleteWorker, self).tearDown()
 
     def test_normal_shutdown_true_logs_correctly(self):
@@ -198,6 +161,10 @@ class TestDeleteWorker(ResourceReservationTests):
         remove = self.mock_reserved_resource.objects.return_value.delete
         remove.assert_called_once_with()
 
+    def test_notifies_release_of_worker_reservations(self):
+        tasks._delete_worker('worker1')
+        self.mock_reservations.notify_released.assert_called_once_with(worker_name='worker1')
+
     @mock.patch('pulp.server.async.tasks.Worker.objects')
     def test_removes_the_worker(self, mock_worker_objects):
         mock_document = mock.Mock()
@@ -244,6 +211,9 @@ class TestReleaseResource(unittest.TestCase):
         self.patch_d = mock.patch('pulp.server.async.tasks.constants', autospec=True)
         self.mock_constants = self.patch_d.start()
 
+        self.patch_e = mock.patch('pulp.server.async.tasks.reservations', autospec=True)
+        self.mock_reservations = self.patch_e.start()
+
         super(TestReleaseResource, self).setUp()
 
     def tearDown(self):
@@ -251,6 +221,7 @@ class TestReleaseResource(unittest.TestCase):
         self.patch_b.stop()
         self.patch_c.stop()
         self.patch_d.stop()
+        self.patch_e.stop()
         super(TestReleaseResource, self).tearDown()
 
     def test_deletes_reserved_resource(self):
@@ -259,6 +230,11 @@ class TestReleaseResource(unittest.TestCase):
         self.mock_reserved_resource.objects.assert_called_once_with(task_id=mock_task_id)
         self.mock_reserved_resource.objects.return_value.delete.assert_called_once_with()
 
+    def test_notifies_release(self):
+        mock_task_id = mock.Mock()
+        tasks._release_resource(mock_task_id)
+        self.mock_reservations.notify_released.assert_called_once_with(task_id=mock_task_id)
+
     def test_finds_running_task_by_uuid(self):
         mock_task_id = mock.Mock()
         tasks._release_resource(mock_task_id)
@@ -274,6 +250,20 @@ class TestReleaseResource(unittest.TestCase):
         tasks._release_resource(mock_task_id)
         self.assertTrue(mock_task.on_failure.called)
 
+    @mock.patch('pulp.server.async.tasks._completed_task_ids', ['task-1'])
+    def test_skips_task_completed_by_this_process(self):
+        tasks._release_resource('task-1')
+        self.assertFalse(self.mock_task_status.objects.filter.called)
+        self.assertFalse(self.mock_task.called)
+        self.mock_reserved_resource.objects.assert_called_once_with(task_id='task-1')
+
+    @mock.patch('pulp.server.async.tasks.config')
+    def test_finds_incomplete_task_when_buffered(self, mock_config):
+        mock_config.getboolean.return_value = True
+        tasks._release_resource('task-1')
+        self.mock_task_status.objects.filter.assert_called_once_with(
+            task_id='task-1', state__in=self.mock_constants.CALL_INCOMPLETE_STATES)
+
 
 class TestTaskResult(unittest.TestCase):
 
@@ -771,6 +761,160 @@ class TestTaskApplyAsync(ResourceReservationTests):
         self.assertEqual(result.tags, ['test_tags'])
 
 
+@mock.patch('pulp.server.async.tasks.Task.request')
+@mock.patch('pulp.server.async.tasks.TaskStatus')
+@mock.patch('pulp.server.async.tasks.config')
+class TestTaskCall(unittest.TestCase):
+
+    def setUp(self):
+        self.config = {'buffer_task_status': False, 'enabled': False}
+        tasks._buffered_status.clear()
+
+    def tearDown(self):
+        tasks._buffered_status.clear()
+
+    def _getboolean(self, section, name):
+        return self.config[name]
+
+    @mock.patch('celery.Task.__call__')
+    def test_sets_running(self, mock_call, mock_config, mock_task_status, mock_request):
+        mock_config.getboolean.side_effect = self._getboolean
+        mock_request.called_directly = False
+        mock_request.id = 'task-1'
+        mock_request.hostname = 'worker-1'
+        task = tasks.Task()
+
+        result = task(1, a=2)
+
+        # The cancellation check and the running transition are a single find_and_modify
+        mock_task_status.objects.assert_called_once_with(task_id='task-1',
+                                                         state__ne=CALL_CANCELED_STATE)
+        qs = mock_task_status.objects.return_value
+        self.assertEqual(qs.modify.call_count, 1)
+        update = qs.modify.call_args[1]
+        self.assertTrue(update['upsert'])
+        self.assertEqual(update['set__state'], 'running')
+        self.assertEqual(update['set__worker_name'], 'worker-1')
+        dateutils.parse_iso8601_datetime(update['set__start_time'])
+        self.assertFalse(qs.first.called)
+        mock_call.assert_called_once_with(1, a=2)
+        self.assertEqual(result, mock_call.return_value)
+
+    @mock.patch('celery.Task.__call__')
+    def test_canceled(self, mock_call, mock_config, mock_task_status, mock_request):
+        mock_config.getboolean.side_effect = self._getboolean
+        mock_request.called_directly = False
+        mock_request.id = 'task-1'
+        qs = mock_task_status.objects.return_value
+        qs.modify.side_effect = NotUniqueError()
+        qs.only.return_value.first.return_value = {'state': CALL_CANCELED_STATE}
+        task = tasks.Task()
+
+        result = task(1, a=2)
+
+        self.assertEqual(qs.modify.call_count, 1)
+        self.assertFalse(mock_call.called)
+        self.assertTrue(result is None)
+
+    @mock.patch('celery.Task.__call__')
+    def test_upsert_retried(self, mock_call, mock_config, mock_task_status, mock_request):
+        mock_config.getboolean.side_effect = self._getboolean
+        mock_request.called_directly = False
+        mock_request.id = 'task-1'
+        qs = mock_task_status.objects.return_value
+        qs.modify.side_effect = [NotUniqueError(), None]
+        qs.only.return_value.first.return_value = {'state': 'waiting'}
+        task = tasks.Task()
+
+        task(1, a=2)
+
+        self.assertEqual(qs.modify.call_count, 2)
+        mock_call.assert_called_once_with(1, a=2)
+
+    @mock.patch('celery.Task.__call__')
+    def test_called_directly(self, mock_call, mock_config, mock_task_status, mock_request):
+        mock_config.getboolean.side_effect = self._getboolean
+        mock_request.called_directly = True
+        mock_request.id = 'task-1'
+        qs = mock_task_status.objects.return_value
+        qs.only.return_value.first.return_value = None
+        task = tasks.Task()
+
+        task(1, a=2)
+
+        mock_task_status.objects.assert_called_once_with(task_id='task-1')
+        self.assertFalse(qs.modify.called)
+        mock_call.assert_called_once_with(1, a=2)
+
+    @mock.patch('celery.Task.__call__')
+    def test_buffered(self, mock_call, mock_config, mock_task_status, mock_request):
+        self.config['buffer_task_status'] = True
+        mock_config.getboolean.side_effect = self._getboolean
+        mock_request.called_directly = False
+        mock_request.id = 'task-1'
+        mock_request.hostname = 'worker-1'
+        qs = mock_task_status.objects.return_value
+        qs.only.return_value.first.return_value = {'state': 'waiting'}
+        task = tasks.Task()
+
+        task(1, a=2)
+
+        self.assertFalse(qs.modify.called)
+        self.assertEqual(tasks._buffered_status['task-1']['worker_name'], 'worker-1')
+        mock_call.assert_called_once_with(1, a=2)
+
+    @mock.patch('celery.Task.__call__')
+    def test_buffered_canceled(self, mock_call, mock_config, mock_task_status, mock_request):
+        self.config['buffer_task_status'] = True
+        mock_config.getboolean.side_effect = self._getboolean
+        mock_request.called_directly = False
+        mock_request.id = 'task-1'
+        qs = mock_task_status.objects.return_value
+        qs.only.return_value.first.return_value = {'state': CALL_CANCELED_STATE}
+        task = tasks.Task()
+
+        task(1, a=2)
+
+        self.assertFalse(qs.modify.called)
+        self.assertFalse('task-1' in tasks._buffered_status)
+        self.assertFalse(mock_call.called)
+
+    @mock.patch('celery.Task.__call__')
+    def test_buffered_not_created(self, mock_call, mock_config, mock_task_status, mock_request):
+        self.config['buffer_task_status'] = True
+        mock_config.getboolean.side_effect = self._getboolean
+        mock_request.called_directly = False
+        mock_request.id = 'task-1'
+        qs = mock_task_status.objects.return_value
+        qs.only.return_value.first.return_value = None
+        task = tasks.Task()
+
+        task(1, a=2)
+
+        # The task status is upserted as when the task status is not buffered
+        self.assertEqual(qs.modify.call_count, 1)
+        self.assertFalse('task-1' in tasks._buffered_status)
+        mock_call.assert_called_once_with(1, a=2)
+
+    @mock.patch('pulp.server.async.tasks._completed_task_ids', [])
+    def test_complete(self, mock_config, mock_task_status, mock_request):
+        tasks._buffered_status['task-1'] = {'state': 'running', 'start_time': 'start',
+                                            'worker_name': 'worker-1'}
+        task_status = mock.MagicMock()
+        task_status.__getitem__.return_value = 'task-1'
+        task = tasks.Task()
+
+        task._complete(task_status)
+
+        task_status.__setitem__.assert_has_calls([mock.call('start_time', 'start'),
+                                                  mock.call('worker_name', 'worker-1')],
+                                                 any_order=True)
+        self.assertEqual(task_status.__setitem__.call_count, 2)
+        task_status.save.assert_called_once_with()
+        self.assertEqual(tasks._buffered_status, {})
+        self.assertEqual(tasks._completed_task_ids, ['task-1'])
+
+
 class TestTaskThrows(unittest.TestCase):
     """
     Exceptions listed in the "throws" collection will not have their stack
@@ -987,96 +1131,30 @@ class TestScheduledTasks(unittest.TestCase):
         mock_monthly_apply_async.assert_called_once_with(tags=[action_tag('monthly')])
 
 
-class TestGetWorkerForReservation(ResourceReservationTests):
-
-    @mock.patch('pulp.server.async.tasks.Worker.objects')
-    @mock.patch('pulp.server.async.tasks.ReservedResource')
-    def test_existing_reservation_correctly_found(self, mock_reserved_resource,
-                                                  mock_worker_objects):
-        get_objects = mock_reserved_resource.objects
-        tasks.get_worker_for_reservation('resource1')
-        get_objects.assert_called_once_with(resource_id='resource1')
-        get_objects.return_value.first.assert_called_once_with()
+class TestSelectUnreservedWorker(unittest.TestCase):
 
     @mock.patch('pulp.server.async.tasks.Worker.objects')
-    @mock.patch('pulp.server.async.tasks.ReservedResource')
-    def test_correct_worker_returned(self, mock_reserved_resource, mock_worker_objects):
-        find_one = mock_reserved_resource.objects.return_value.first
-        find_one.return_value = {'worker_name': 'worker1'}
-        mock_worker_objects.return_value.first.return_value = find_one.return_value
-        result = tasks.get_worker_for_reservation('resource1')
-        self.assertTrue(result is find_one.return_value)
-
-    @mock.patch('pulp.server.async.tasks.ReservedResource')
-    def test_no_workers_raised_if_no_reservations(self, mock_reserved_resource):
-        find_one = mock_reserved_resource.objects.return_value.first
-        find_one.return_value = False
-        try:
-            tasks.get_worker_for_reservation('resource1')
-        except NoWorkers:
-            pass
-        else:
-            self.fail("NoWorkers() Exception should have been raised.")
-
-
-class TestGetUnreservedWorker(ResourceReservationTests):
-
-    @mock.patch('pulp.server.async.tasks.ReservedResource')
-    def test_reserved_resources_queried_correctly(self, mock_reserved_resource):
-        find = mock_reserved_resource.objects.all
-        find.return_value = [{'worker_name': 'a'}, {'worker_name': 'b'}]
-        try:
-            tasks._get_unreserved_worker()
-        except NoWorkers:
-            pass
-        else:
-            self.fail("NoWorkers() Exception should have been raised.")
-        find.assert_called_once_with()
-
-    @mock.patch('pulp.server.async.tasks.Worker.objects')
-    @mock.patch('pulp.server.async.tasks.ReservedResource')
-    def test_worker_returned_when_one_worker_is_not_reserved(self, mock_reserved_resource,
-                                                             mock_worker_objects):
-        get_online = mock_worker_objects.get_online
-        get_online.return_value = [{'name': 'a'}, {'name': 'b'}]
-        mock_reserved_resource.objects.all.return_value = [{'worker_name': 'a'}]
-        result = tasks._get_unreserved_worker()
+    def test_worker_returned_when_one_worker_is_not_reserved(self, mock_worker_objects):
+        mock_worker_objects.get_online.return_value = [{'name': 'a'}, {'name': 'b'}]
+        result = tasks._select_unreserved_worker(['a'])
         self.assertEqual(result, {'name': 'b'})
 
     @mock.patch('pulp.server.async.tasks.Worker.objects')
-    @mock.patch('pulp.server.async.tasks.ReservedResource')
-    def test_no_workers_raised_when_all_workers_reserved(self, mock_reserved_resource, mock_worker):
-        mock_worker.objects.return_value = [{'name': 'a'}, {'name': 'b'}]
-        find = mock_reserved_resource.objects
-        find.return_value = [{'worker_name': 'a'}, {'worker_name': 'b'}]
-        try:
-            tasks._get_unreserved_worker()
-        except NoWorkers:
-            pass
-        else:
-            self.fail("NoWorkers() Exception should have been raised.")
+    def test_no_workers_raised_when_all_workers_reserved(self, mock_worker_objects):
+        mock_worker_objects.get_online.return_value = [{'name': 'a'}, {'name': 'b'}]
+        self.assertRaises(NoWorkers, tasks._select_unreserved_worker, ['a', 'b'])
 
     @mock.patch('pulp.server.async.tasks.Worker.objects')
-    @mock.patch('pulp.server.async.tasks.ReservedResource')
-    def test_no_workers_raised_when_there_are_no_workers(self, mock_reserved_resource, mock_worker):
-        mock_worker.objects.return_value = []
-        find = mock_reserved_resource.objects
-        find.return_value = [{'worker_name': 'a'}, {'worker_name': 'b'}]
-        try:
-            tasks._get_unreserved_worker()
-        except NoWorkers:
-            pass
-        else:
-            self.fail("NoWorkers() Exception should have been raised.")
-
-    def test_is_worker(self):
-        self.assertTrue(tasks._is_worker("a_worker@some.hostname"))
+    def test_no_workers_raised_when_there_are_no_workers(self, mock_worker_objects):
+        mock_worker_objects.get_online.return_value = []
+        self.assertRaises(NoWorkers, tasks._select_unreserved_worker, ['a', 'b'])
 
-    def test_is_not_worker_is_scheduler(self):
-        self.assertEquals(tasks._is_worker(SCHEDULER_WORKER_NAME + "@some.hostname"), False)
-
-    def test_is_not_worker_is_resource_mgr(self):
-        self.assertEquals(tasks._is_worker(RESOURCE_MANAGER_WORKER_NAME + "@some.hostname"), False)
+    @mock.patch('pulp.server.async.tasks.Worker.objects')
+    def test_special_workers_are_not_selected(self, mock_worker_objects):
+        mock_worker_objects.get_online.return_value = [
+            {'name': SCHEDULER_WORKER_NAME + '@host'},
+            {'name': RESOURCE_MANAGER_WORKER_NAME + '@host'}]
+        self.assertRaises(NoWorkers, tasks._select_unreserved_worker, [])
 
 
 class TestPulpTask(unittest.TestCase):
@@ -1,6 +1,8 @@
 import os
+import shutil
 
-from errno import EEXIST, EPERM
+from errno import EEXIST, EOPNOTSUPP, EPERM, EXDEV
+from tempfile import mkdtemp, mkstemp
 from unittest import TestCase
 
 from mock import Mock, patch
@@ -8,7 +10,8 @@ from mock import Mock, patch
 from pulp.plugins.util import verification
 from pulp.plugins.util import misc
 
-from pulp.server.content.storage import ContentStorage, FileStorage, SharedStorage
+from pulp.server.content.storage import (
+    COPY, FICLONE, HARDLINK, REFLINK, RENAME, ContentStorage, FileStorage, SharedStorage)
 
 
 class TestMkdir(TestCase):
@@ -89,9 +92,9 @@ class TestFileStorage(TestCase):
     @patch('os.rename')
     @patch('os.close')
     @patch('pulp.server.content.storage.tempfile')
-    @patch('pulp.server.content.storage.shutil')
+    @patch('pulp.server.content.storage.FileStorage.transfer')
     @patch('pulp.plugins.util.misc.mkdir')
-    def test_put_file_correct_size(self, _mkdir, shutil, tempfile, close, rename):
+    def test_put_file_correct_size(self, _mkdir, transfer, tempfile, close, rename):
         path_in = '/tmp/test'
         temp_destination = '/some/file/path'
         unit = Mock(id='123', storage_path='/tmp/storage')
@@ -99,23 +102,24 @@ class TestFileStorage(TestCase):
         tempfile.mkstemp.return_value = ('fd', temp_destination)
 
         # test
-        storage.put(unit, path_in)
+        strategy = storage.put(unit, path_in, disposable=True)
 
         # validation
         _mkdir.assert_called_once_with(os.path.dirname(unit.storage_path))
         tempfile.mkstemp.assert_called_once_with(dir=os.path.dirname(unit.storage_path))
         close.assert_called_once_with('fd')
-        shutil.copy.assert_called_once_with(path_in, temp_destination)
+        transfer.assert_called_once_with(path_in, temp_destination, True, False)
         unit.verify_size.assert_called_once_with(temp_destination)
         rename.assert_called_once_with(temp_destination, unit.storage_path)
+        self.assertEqual(strategy, transfer.return_value)
 
     @patch('os.rename')
     @patch('os.remove')
     @patch('os.close')
     @patch('pulp.server.content.storage.tempfile')
-    @patch('pulp.server.content.storage.shutil')
+    @patch('pulp.server.content.storage.FileStorage.transfer')
     @patch('pulp.plugins.util.misc.mkdir')
-    def test_put_file_incorrect_size(self, _mkdir, shutil, tempfile, close, remove, rename):
+    def test_put_file_incorrect_size(self, _mkdir, transfer, tempfile, close, remove, rename):
         path_in = '/tmp/test'
         temp_destination = '/some/file/path'
         unit = Mock(id='123', storage_path='/tmp/storage')
@@ -130,7 +134,7 @@ class TestFileStorage(TestCase):
         _mkdir.assert_called_once_with(os.path.dirname(unit.storage_path))
         tempfile.mkstemp.assert_called_once_with(dir=os.path.dirname(unit.storage_path))
         close.assert_called_once_with('fd')
-        shutil.copy.assert_called_once_with(path_in, temp_destination)
+        transfer.assert_called_once_with(path_in, temp_destination, False, False)
         unit.verify_size.assert_called_once_with(temp_destination)
         remove.assert_called_once_with(temp_destination)
         self.assertFalse(rename.called)
@@ -139,9 +143,9 @@ class TestFileStorage(TestCase):
     @patch('os.remove')
     @patch('os.close')
     @patch('pulp.server.content.storage.tempfile')
-    @patch('pulp.server.content.storage.shutil')
+    @patch('pulp.server.content.storage.FileStorage.transfer')
     @patch('pulp.plugins.util.misc.mkdir')
-    def test_put_file_no_verify_size(self, _mkdir, shutil, tempfile, close, remove, rename):
+    def test_put_file_no_verify_size(self, _mkdir, transfer, tempfile, close, remove, rename):
         path_in = '/tmp/test'
         temp_destination = '/some/file/path'
         unit = Mock(id='123', storage_path='/tmp/storage')
@@ -156,7 +160,7 @@ class TestFileStorage(TestCase):
         _mkdir.assert_called_once_with(os.path.dirname(unit.storage_path))
         tempfile.mkstemp.assert_called_once_with(dir=os.path.dirname(unit.storage_path))
         close.assert_called_once_with('fd')
-        shutil.copy.assert_called_once_with(path_in, temp_destination)
+        transfer.assert_called_once_with(path_in, temp_destination, False, False)
         unit.verify_size.assert_called_once_with(temp_destination)
         self.assertFalse(remove.called)
         rename.assert_called_once_with(temp_destination, unit.storage_path)
@@ -164,9 +168,9 @@ class TestFileStorage(TestCase):
     @patch('os.rename')
     @patch('os.close')
     @patch('pulp.server.content.storage.tempfile')
-    @patch('pulp.server.content.storage.shutil')
+    @patch('pulp.server.content.storage.FileStorage.transfer')
     @patch('pulp.plugins.util.misc.mkdir')
-    def test_put_file_with_location(self, _mkdir, shutil, tempfile, close, rename):
+    def test_put_file_with_location(self, _mkdir, transfer, tempfile, close, rename):
         path_in = '/tmp/test'
         location = '/a/b/'
         temp_destination = '/some/file/path'
@@ -180,7 +184,7 @@ class TestFileStorage(TestCase):
         # validation
         destination = os.path.join(unit.storage_path, location.lstrip('/'))
         _mkdir.assert_called_once_with(os.path.dirname(destination))
-        shutil.copy.assert_called_once_with(path_in, temp_destination)
+        transfer.assert_called_once_with(path_in, temp_destination, False, False)
         rename.assert_called_once_with(temp_destination, destination)
 
     def test_get(self):
@@ -188,6 +192,106 @@ class TestFileStorage(TestCase):
         storage.get(None)  # just for coverage
 
 
+class TestFileStorageTransfer(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'source')
+        with open(self.path, 'w') as fp:
+            fp.write('content')
+        os.chmod(self.path, 0640)
+        fd, self.destination = mkstemp(dir=self.tmp_dir)
+        os.close(fd)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assert_transferred(self):
+        with open(self.destination) as fp:
+            self.assertEqual(fp.read(), 'content')
+        self.assertEqual(os.stat(self.destination).st_mode & 0777, 0640)
+
+    @patch('pulp.server.content.storage.selinux')
+    def test_rename(self, selinux):
+        selinux.is_selinux_enabled.return_value = True
+
+        strategy = FileStorage.transfer(self.path, self.destination, disposable=True)
+
+        self.assertEqual(strategy, RENAME)
+        self.assertFalse(os.path.exists(self.path))
+        self.assert_transferred()
+        selinux.restorecon.assert_called_once_with(self.destination)
+
+    @patch('pulp.server.content.storage.selinux')
+    def test_hardlink(self, selinux):
+        selinux.is_selinux_enabled.return_value = True
+
+        strategy = FileStorage.transfer(self.path, self.destination, hardlink=True)
+
+        self.assertEqual(strategy, HARDLINK)
+        self.assertEqual(os.stat(self.path).st_ino, os.stat(self.destination).st_ino)
+        self.assert_transferred()
+        selinux.restorecon.assert_called_once_with(self.destination)
+
+    @patch('pulp.server.content.storage.selinux')
+    def test_selinux_disabled(self, selinux):
+        selinux.is_selinux_enabled.return_value = False
+
+        FileStorage.transfer(self.path, self.destination, disposable=True)
+
+        self.assertFalse(selinux.restorecon.called)
+
+    @patch('os.link')
+    @patch('pulp.server.content.storage.selinux')
+    @patch('pulp.server.content.storage.fcntl')
+    def test_not_hardlinked_by_default(self, fcntl, selinux, link):
+        fcntl.ioctl.side_effect = IOError(EOPNOTSUPP, 'not supported')
+
+        strategy = FileStorage.transfer(self.path, self.destination)
+
+        self.assertEqual(strategy, COPY)
+        self.assertFalse(link.called)
+        self.assertNotEqual(os.stat(self.path).st_ino, os.stat(self.destination).st_ino)
+        self.assertFalse(selinux.restorecon.called)
+        self.assert_transferred()
+
+    @patch('os.rename', side_effect=OSError(EXDEV, 'cross-device'))
+    @patch('os.link', side_effect=OSError(EXDEV, 'cross-device'))
+    @patch('pulp.server.content.storage.fcntl')
+    def test_reflink(self, fcntl, link, rename):
+        strategy = FileStorage.transfer(self.path, self.destination, disposable=True,
+                                        hardlink=True)
+
+        self.assertEqual(strategy, REFLINK)
+        self.assertEqual(fcntl.ioctl.call_args[0][1], FICLONE)
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(os.stat(self.destination).st_mode & 0777, 0640)
+
+    @patch('os.link', side_effect=OSError(EXDEV, 'cross-device'))
+    @patch('pulp.server.content.storage.fcntl')
+    def test_copy(self, fcntl, link):
+        fcntl.ioctl.side_effect = IOError(EOPNOTSUPP, 'not supported')
+
+        strategy = FileStorage.transfer(self.path, self.destination, hardlink=True)
+
+        self.assertEqual(strategy, COPY)
+        self.assertNotEqual(os.stat(self.path).st_ino, os.stat(self.destination).st_ino)
+        self.assert_transferred()
+
+    @patch('pulp.server.content.storage.fcntl')
+    def test_symlink_copied(self, fcntl):
+        fcntl.ioctl.side_effect = IOError(EOPNOTSUPP, 'not supported')
+        link = os.path.join(self.tmp_dir, 'link')
+        os.symlink(self.path, link)
+
+        strategy = FileStorage.transfer(link, self.destination, disposable=True, hardlink=True)
+
+        self.assertEqual(strategy, COPY)
+        self.assertFalse(os.path.islink(self.destination))
+        self.assertTrue(os.path.islink(link))
+        self.assert_transferred()
+
+
 class TestSharedStorage(TestCase):
 
     @patch('pulp.server.content.storage.sha256')
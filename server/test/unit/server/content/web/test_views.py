@@ -14,6 +14,8 @@ MODULE = 'pulp.server.content.web.views'
 class TestContentView(TestCase):
 
     def setUp(self):
+        content_views.path_cache.clear()
+        content_views.redirect_cache.clear()
         self.environ = {
             # These values must be present in all requests unless they are
             # allowed to be empty strings
@@ -147,7 +149,8 @@ class TestContentView(TestCase):
         # validation
         url.assert_called_once_with(ContentView.urljoin(
             scheme, host, port, redirect_path, path, query))
-        url.return_value.sign.assert_called_once_with(key, remote_ip=remote_ip)
+        url.return_value.sign.assert_called_once_with(
+            key, expiration=content_views.SIGNATURE_EXPIRATION, remote_ip=remote_ip)
         redirect.assert_called_once_with(str(url.return_value.sign.return_value))
         self.assertEqual(reply, redirect.return_value)
 
@@ -185,10 +188,136 @@ class TestContentView(TestCase):
         # validation
         url.assert_called_once_with(ContentView.urljoin(
             scheme, host, port, redirect_path, path, query))
-        url.return_value.sign.assert_called_once_with(key, remote_ip=remote_ip)
+        url.return_value.sign.assert_called_once_with(
+            key, expiration=content_views.SIGNATURE_EXPIRATION, remote_ip=remote_ip)
         redirect.assert_called_once_with(str(url.return_value.sign.return_value))
         self.assertEqual(reply, redirect.return_value)
 
+    @patch('pulp.common.cache.time', Mock(return_value=1000))
+    @patch(MODULE + '.time')
+    @patch(MODULE + '.URL')
+    @patch(MODULE + '.pulp_conf')
+    @patch(MODULE + '.HttpResponseRedirect')
+    def test_redirect_cached(self, redirect, pulp_conf, url, mock_time):
+        pulp_conf.get.return_value = ''
+        self.environ['REMOTE_ADDR'] = '172.10.08.20'
+        request = Mock(environ=self.environ, path_info='/var/pulp/content/zoo/lion')
+        other = Mock(environ=dict(self.environ, REMOTE_ADDR='172.10.08.21'),
+                     path_info='/var/pulp/content/zoo/lion')
+        key = Mock()
+        mock_time.time.return_value = 1000
+
+        # test
+        ContentView.redirect(request, key)
+        ContentView.redirect(request, key)
+        ContentView.redirect(other, key)
+
+        # validation
+        self.assertEqual(url.return_value.sign.call_count, 2)
+        self.assertEqual(redirect.call_count, 3)
+        self.assertEqual(redirect.call_args_list[0], redirect.call_args_list[1])
+
+    @patch('pulp.common.cache.time', Mock(return_value=1000))
+    @patch(MODULE + '.time')
+    @patch(MODULE + '.URL')
+    @patch(MODULE + '.pulp_conf')
+    @patch(MODULE + '.HttpResponseRedirect', Mock())
+    def test_redirect_cached_by_key(self, pulp_conf, url, mock_time):
+        pulp_conf.get.return_value = ''
+        self.environ['REMOTE_ADDR'] = '172.10.08.20'
+        request = Mock(environ=self.environ, path_info='/var/pulp/content/zoo/lion')
+        key = Mock()
+        key.pub.return_value = ('e', 'n')
+        new_key = Mock()
+        new_key.pub.return_value = ('e', 'm')
+        mock_time.time.return_value = 1000
+
+        # test
+        ContentView.redirect(request, key)
+        ContentView.redirect(request, new_key)
+
+        # validation
+        self.assertEqual(url.return_value.sign.call_count, 2)
+        url.return_value.sign.assert_called_with(
+            new_key, expiration=content_views.SIGNATURE_EXPIRATION, remote_ip='172.10.08.20')
+
+    @patch(MODULE + '.time')
+    @patch(MODULE + '.URL')
+    @patch(MODULE + '.pulp_conf')
+    @patch(MODULE + '.HttpResponseRedirect', Mock())
+    def test_redirect_cache_expired(self, pulp_conf, url, mock_time):
+        pulp_conf.get.return_value = ''
+        self.environ['REMOTE_ADDR'] = '172.10.08.20'
+        request = Mock(environ=self.environ, path_info='/var/pulp/content/zoo/lion')
+        key = Mock()
+        mock_time.time.return_value = 1000
+        ContentView.redirect(request, key)
+
+        # test
+        # The cached signed URL expires SIGNATURE_MARGIN seconds before the policy.
+        with patch('pulp.common.cache.time') as cache_time:
+            cache_time.return_value = (
+                1000 + content_views.SIGNATURE_EXPIRATION - content_views.SIGNATURE_MARGIN)
+            ContentView.redirect(request, key)
+
+        # validation
+        self.assertEqual(url.return_value.sign.call_count, 2)
+
+    @patch('os.path.lexists')
+    @patch('os.path.realpath')
+    @patch('os.path.isdir')
+    @patch('os.path.exists')
+    def test_resolve(self, exists, isdir, realpath, lexists):
+        realpath.side_effect = lambda p: '/var/lib/pulp/content/rpm'
+        lexists.return_value = True
+        isdir.return_value = False
+        exists.return_value = False
+
+        # test
+        resolved = ContentView.resolve('/var/www/pub/content')
+        cached = ContentView.resolve('/var/www/pub/content')
+
+        # validation
+        self.assertEqual(resolved, ('/var/lib/pulp/content/rpm', ContentView.DEFERRED))
+        self.assertEqual(cached, resolved)
+        realpath.assert_called_once_with('/var/www/pub/content')
+        lexists.assert_called_once_with('/var/www/pub/content')
+        self.assertEqual(exists.call_count, 1)
+
+    @patch('os.path.lexists')
+    @patch('os.path.realpath')
+    @patch('os.path.isdir')
+    @patch('os.path.exists')
+    def test_resolve_kinds(self, exists, isdir, realpath, lexists):
+        realpath.side_effect = lambda p: p
+        lexists.side_effect = lambda p: p != '/missing'
+        isdir.side_effect = lambda p: p == '/dir'
+        exists.side_effect = lambda p: p == '/file'
+
+        # test and validation
+        self.assertEqual(ContentView.resolve('/missing')[1], ContentView.MISSING)
+        self.assertEqual(ContentView.resolve('/dir')[1], ContentView.DIRECTORY)
+        self.assertEqual(ContentView.resolve('/file')[1], ContentView.FILE)
+        self.assertEqual(ContentView.resolve('/deferred')[1], ContentView.DEFERRED)
+
+    @patch(MODULE + '.time')
+    @patch('os.path.lexists', Mock(return_value=True))
+    @patch('os.path.isdir', Mock(return_value=False))
+    @patch('os.path.exists', Mock(return_value=True))
+    @patch('os.path.realpath')
+    def test_resolve_expired(self, realpath, mock_time):
+        realpath.side_effect = lambda p: p
+        mock_time.time.return_value = 1000
+        ContentView.resolve('/file')
+
+        # test
+        with patch('pulp.common.cache.time') as cache_time:
+            cache_time.return_value = 1000 + content_views.PATH_CACHE_TTL
+            ContentView.resolve('/file')
+
+        # validation
+        self.assertEqual(realpath.call_count, 2)
+
     @patch('os.path.lexists', Mock(return_value=True))
     @patch('os.path.realpath')
     @patch('os.path.exists')
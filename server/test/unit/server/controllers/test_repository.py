@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 import inspect
 
 from bson.objectid import InvalidId
@@ -104,15 +105,48 @@ class TestGetUnitModelQuerySets(unittest.TestCase):
 @patch('pulp.server.controllers.repository.model.RepositoryContentUnit.objects')
 class FindRepoContentUnitsTest(unittest.TestCase):
 
+    AFTER_BAR_1 = {'$or': [{'unit_type_id': {'$gt': 'demo_model'}},
+                           {'unit_type_id': 'demo_model', 'unit_id': {'$gt': 'bar_1'}}]}
+
+    @staticmethod
+    def _mock_chunks(mock_rcu_objects, *chunks):
+        """
+        Make the RepositoryContentUnit queryset return the given chunks of associations.
+        """
+        qs = mock_rcu_objects.return_value
+        qs.filter.return_value = qs
+        qs.order_by.return_value = qs
+        qs.skip.return_value = qs
+        qs.limit.side_effect = list(chunks) + [[]]
+        return qs
+
+    @staticmethod
+    def _units(count):
+        rcu_list = []
+        unit_list = []
+        for i in range(count):
+            unit_id = 'bar_%i' % i
+            unit_key = 'key_%i' % i
+            rcu = model.RepositoryContentUnit(repo_id='foo',
+                                              unit_type_id='demo_model',
+                                              unit_id=unit_id)
+            rcu_list.append(rcu)
+            unit_list.append(DemoModel(id=unit_id, key_field=unit_key))
+        return rcu_list, unit_list
+
     def test_repo_content_units_query(self, mock_rcu_objects):
         """
         Test the query parameters for the RepositoryContentUnit
         """
+        qs = self._mock_chunks(mock_rcu_objects)
         repo = MagicMock(repo_id='foo')
         rcu_filter = mongoengine.Q(unit_type_id='demo_model')
         list(repo_controller.find_repo_content_units(repo, repo_content_unit_q=rcu_filter))
         self.assertEquals(mock_rcu_objects.call_args[1]['repo_id'], 'foo')
         self.assertEquals(mock_rcu_objects.call_args[1]['q_obj'], rcu_filter)
+        qs.order_by.assert_called_once_with('unit_type_id', 'unit_id')
+        qs.limit.assert_called_once_with(repo_controller.UNIT_CHUNK_SIZE)
+        self.assertFalse(qs.filter.called)
 
     @patch.object(DemoModel, 'objects')
     @patch('pulp.server.controllers.repository.plugin_api.get_unit_model_by_id')
@@ -125,7 +159,7 @@ class FindRepoContentUnitsTest(unittest.TestCase):
         test_rcu = model.RepositoryContentUnit(repo_id='foo',
                                                unit_type_id='demo_model',
                                                unit_id='bar')
-        mock_rcu_objects.return_value = [test_rcu]
+        self._mock_chunks(mock_rcu_objects, [test_rcu])
 
         u_filter = mongoengine.Q(key_field='baz')
         u_fields = ['key_field']
@@ -134,6 +168,8 @@ class FindRepoContentUnitsTest(unittest.TestCase):
         result = list(repo_controller.find_repo_content_units(repo, units_q=u_filter,
                                                               unit_fields=u_fields))
 
+        mock_demo_objects.assert_called_once_with(q_obj=u_filter,
+                                                  __raw__={'_id': {'$in': ['bar']}})
         mock_demo_objects.return_value.only.assert_called_once_with('key_field')
 
         # validate that the repo content unit was returned and that the unit is attached
@@ -152,7 +188,7 @@ class FindRepoContentUnitsTest(unittest.TestCase):
         test_rcu = model.RepositoryContentUnit(repo_id='foo',
                                                unit_type_id='demo_model',
                                                unit_id='bar')
-        mock_rcu_objects.return_value = [test_rcu]
+        self._mock_chunks(mock_rcu_objects, [test_rcu])
 
         u_filter = mongoengine.Q(key_field='baz')
         u_fields = ['key_field']
@@ -167,6 +203,40 @@ class FindRepoContentUnitsTest(unittest.TestCase):
         # validate that the content unit was returned
         self.assertEquals(result, [test_unit])
 
+    @patch.object(DemoModel, 'objects')
+    @patch('pulp.server.controllers.repository.plugin_api.get_unit_model_by_id')
+    def test_units_in_association_order(self, mock_get_model, mock_demo_objects,
+                                        mock_rcu_objects):
+        """
+        Test that units are returned in the order of their associations
+        """
+        repo = MagicMock(repo_id='foo')
+        rcu_list, unit_list = self._units(3)
+        self._mock_chunks(mock_rcu_objects, rcu_list)
+        mock_get_model.return_value = DemoModel
+        mock_demo_objects.return_value = list(reversed(unit_list))
+
+        result = list(repo_controller.find_repo_content_units(repo, yield_content_unit=True))
+
+        self.assertEquals(result, unit_list)
+
+    @patch.object(DemoModel, 'objects')
+    @patch('pulp.server.controllers.repository.plugin_api.get_unit_model_by_id')
+    def test_filtered_units_skipped(self, mock_get_model, mock_demo_objects, mock_rcu_objects):
+        """
+        Test that associations whose unit does not match the unit filters are skipped
+        """
+        repo = MagicMock(repo_id='foo')
+        rcu_list, unit_list = self._units(3)
+        self._mock_chunks(mock_rcu_objects, rcu_list)
+        mock_get_model.return_value = DemoModel
+        mock_demo_objects.return_value = [unit_list[1]]
+
+        result = list(repo_controller.find_repo_content_units(
+            repo, units_q=mongoengine.Q(key_field='key_1')))
+
+        self.assertEquals(result, [rcu_list[1]])
+
     @patch.object(DemoModel, 'objects')
     @patch('pulp.server.controllers.repository.plugin_api.get_unit_model_by_id')
     def test_limit(self, mock_get_model, mock_demo_objects, mock_rcu_objects):
@@ -174,18 +244,8 @@ class FindRepoContentUnitsTest(unittest.TestCase):
         Test that limits are applied properly to the results
         """
         repo = MagicMock(repo_id='foo')
-        rcu_list = []
-        unit_list = []
-        for i in range(10):
-            unit_id = 'bar_%i' % i
-            unit_key = 'key_%i' % i
-            rcu = model.RepositoryContentUnit(repo_id='foo',
-                                              unit_type_id='demo_model',
-                                              unit_id=unit_id)
-            rcu_list.append(rcu)
-            unit_list.append(DemoModel(id=unit_id, key_field=unit_key))
-
-        mock_rcu_objects.return_value = rcu_list
+        rcu_list, unit_list = self._units(10)
+        self._mock_chunks(mock_rcu_objects, rcu_list)
 
         mock_get_model.return_value = DemoModel
         mock_demo_objects.return_value = unit_list
@@ -199,41 +259,147 @@ class FindRepoContentUnitsTest(unittest.TestCase):
     @patch('pulp.server.controllers.repository.plugin_api.get_unit_model_by_id')
     def test_skip(self, mock_get_model, mock_demo_objects, mock_rcu_objects):
         """
-        Test that the skip parameter is applied properly
+        Test that the skip parameter is done by the database when units are not filtered
         """
         repo = MagicMock(repo_id='foo')
-        rcu_list = []
-        unit_list = []
-        for i in range(10):
-            unit_id = 'bar_%i' % i
-            unit_key = 'key_%i' % i
-            rcu = model.RepositoryContentUnit(repo_id='foo',
-                                              unit_type_id='demo_model',
-                                              unit_id=unit_id)
-            rcu_list.append(rcu)
-            unit_list.append(DemoModel(id=unit_id, key_field=unit_key))
+        rcu_list, unit_list = self._units(10)
+        qs = self._mock_chunks(mock_rcu_objects, rcu_list[5:])
+
+        mock_get_model.return_value = DemoModel
+        mock_demo_objects.return_value = unit_list[5:]
+        result = list(repo_controller.find_repo_content_units(repo, limit=5, skip=5))
 
-        mock_rcu_objects.return_value = rcu_list
+        qs.skip.assert_called_once_with(5)
+        self.assertEquals(5, len(result))
+        self.assertEquals(result[0].unit_id, 'bar_5')
+        self.assertEquals(result[4].unit_id, 'bar_9')
+
+    @patch.object(DemoModel, 'objects')
+    @patch('pulp.server.controllers.repository.plugin_api.get_unit_model_by_id')
+    def test_skip_with_units_q(self, mock_get_model, mock_demo_objects, mock_rcu_objects):
+        """
+        Test that the skip parameter is applied to the filtered units
+        """
+        repo = MagicMock(repo_id='foo')
+        rcu_list, unit_list = self._units(10)
+        qs = self._mock_chunks(mock_rcu_objects, rcu_list)
 
         mock_get_model.return_value = DemoModel
         mock_demo_objects.return_value = unit_list
-        result = list(repo_controller.find_repo_content_units(repo, limit=5, skip=5))
+        result = list(repo_controller.find_repo_content_units(
+            repo, units_q=mongoengine.Q(key_field__ne='x'), limit=5, skip=5))
 
+        self.assertFalse(qs.skip.called)
         self.assertEquals(5, len(result))
         self.assertEquals(result[0].unit_id, 'bar_5')
         self.assertEquals(result[4].unit_id, 'bar_9')
 
+    @patch(MODULE + 'UNIT_CHUNK_SIZE', 2)
+    @patch.object(DemoModel, 'objects')
+    @patch('pulp.server.controllers.repository.plugin_api.get_unit_model_by_id')
+    def test_chunks(self, mock_get_model, mock_demo_objects, mock_rcu_objects):
+        """
+        Test that each chunk of associations starts after the last one of the previous chunk
+        """
+        repo = MagicMock(repo_id='foo')
+        rcu_list, unit_list = self._units(3)
+        qs = self._mock_chunks(mock_rcu_objects, rcu_list[:2], rcu_list[2:])
+        mock_get_model.return_value = DemoModel
+        mock_demo_objects.side_effect = [unit_list[:2], unit_list[2:]]
+
+        result = list(repo_controller.find_repo_content_units(repo))
+
+        self.assertEquals(result, rcu_list)
+        self.assertEquals(qs.limit.call_count, 2)
+        self.assertEqual(qs.filter.call_count, 1)
+        self.assertEqual(qs.filter.call_args[0][0].to_query(model.RepositoryContentUnit),
+                         self.AFTER_BAR_1)
+
+    def test_after(self, mock_rcu_objects):
+        """
+        Test that a search continues after the unit of the continuation token
+        """
+        qs = self._mock_chunks(mock_rcu_objects)
+        repo = MagicMock(repo_id='foo')
+        token = repo_controller.get_unit_continuation_token('demo_model', 'bar_1')
+
+        list(repo_controller.find_repo_content_units(repo, after=token))
+
+        self.assertEqual(qs.filter.call_count, 1)
+        self.assertEqual(qs.filter.call_args[0][0].to_query(model.RepositoryContentUnit),
+                         self.AFTER_BAR_1)
+
+    def test_after_invalid(self, mock_rcu_objects):
+        """
+        Test that an invalid continuation token is rejected
+        """
+        repo = MagicMock(repo_id='foo')
+        for token in ('not a token', repo_controller.base64.urlsafe_b64encode('[1, 2]')):
+            units = repo_controller.find_repo_content_units(repo, after=token)
+            self.assertRaises(pulp_exceptions.InvalidValue, list, units)
+
 
 class FindUnitsNotDownloadedTests(unittest.TestCase):
 
-    @patch(MODULE + 'get_mongoengine_unit_querysets')
-    def test_call(self, mock_repo_querysets):
-        mock_qs = Mock()
-        mock_qs.return_value = [0, 1, 2]
-        mock_repo_querysets.return_value = [mock_qs]
+    @patch(MODULE + '_find_mongoengine_units')
+    def test_call(self, mock_find_units):
         units = repo_controller.find_units_not_downloaded('mock_repo')
-        for x, unit in zip(range(3), units):
-            self.assertEqual(x, unit)
+        self.assertTrue(units is mock_find_units.return_value)
+        args, kwargs = mock_find_units.call_args
+        self.assertEqual(args, ('mock_repo',))
+        self.assertEqual(kwargs['units_q'].query, {'downloaded': False})
+        self.assertTrue(kwargs['file_units'])
+
+
+class FindMongoengineUnitsTests(unittest.TestCase):
+
+    @patch(MODULE + 'find_repo_content_units')
+    @patch(MODULE + 'model.Repository.objects')
+    @patch(MODULE + 'get_repo_unit_models')
+    def test_find(self, mock_get_models, mock_repo_objects, mock_find):
+        """Assert the units are read with find_repo_content_units, limited to the model types."""
+        other_model = Mock()
+        other_model._content_type_id.default = 'other'
+        mock_get_models.return_value = [other_model]
+        units_q = repo_controller.Q(downloaded=False)
+
+        units = repo_controller._find_mongoengine_units('repo', units_q=units_q)
+
+        self.assertTrue(units is mock_find.return_value)
+        mock_repo_objects.get_repo_or_missing_resource.assert_called_once_with('repo')
+        args, kwargs = mock_find.call_args
+        self.assertEqual(args, (mock_repo_objects.get_repo_or_missing_resource.return_value,))
+        self.assertEqual(kwargs['repo_content_unit_q'].query, {'unit_type_id__in': ['other']})
+        self.assertTrue(kwargs['units_q'] is units_q)
+        self.assertTrue(kwargs['yield_content_unit'])
+
+    @patch(MODULE + 'find_repo_content_units')
+    @patch(MODULE + 'model.Repository.objects')
+    @patch(MODULE + 'get_repo_unit_models')
+    @patch(MODULE + 'model.FileContentUnit', type('FileContentUnit', (object,), {}))
+    def test_file_units(self, mock_get_models, mock_repo_objects, mock_find):
+        """Assert only the types of file unit models are searched for file units."""
+        file_model = type('FileModel', (repo_controller.model.FileContentUnit,), {})
+        file_model._content_type_id = Mock(default='file')
+        other_model = type('OtherModel', (object,), {})
+        other_model._content_type_id = Mock(default='other')
+        mock_get_models.return_value = [file_model, other_model]
+
+        repo_controller._find_mongoengine_units('repo', file_units=True)
+
+        type_q = mock_find.call_args[1]['repo_content_unit_q']
+        self.assertEqual(type_q.query, {'unit_type_id__in': ['file']})
+
+    @patch(MODULE + 'find_repo_content_units')
+    @patch(MODULE + 'model.Repository.objects')
+    @patch(MODULE + 'get_repo_unit_models')
+    def test_no_models(self, mock_get_models, mock_repo_objects, mock_find):
+        """Assert nothing is queried when the repository has no unit with a model."""
+        mock_get_models.return_value = []
+
+        self.assertEqual(list(repo_controller._find_mongoengine_units('repo')), [])
+        self.assertFalse(mock_repo_objects.get_repo_or_missing_resource.called)
+        self.assertFalse(mock_find.called)
 
 
 class MissingUnitCountTests(unittest.TestCase):
@@ -337,15 +503,31 @@ class UpdateRepoUnitCountsTests(unittest.TestCase):
             pipeline=expected_pipeline
         )
         self.assertDictEqual(repo.content_unit_counts, {'type_1': 5, 'type_2': 3})
+        self.assertEqual(repo.content_fingerprint, hashlib.sha256().hexdigest())
         repo.save.assert_called_once_with()
 
+    @patch('pulp.server.controllers.repository.connection.get_database')
+    def test_calculate_content_fingerprint(self, mock_get_db):
+        find = mock_get_db.return_value.repo_content_units.find
+        find.return_value.sort.return_value = [
+            {'unit_type_id': 'type_1', 'unit_id': 'a'}, {'unit_type_id': 'type_2', 'unit_id': 'b'}]
+
+        fingerprint = repo_controller.calculate_content_fingerprint('foo')
+
+        self.assertEqual(fingerprint, hashlib.sha256('type_1:a\ntype_2:b\n').hexdigest())
+        find.assert_called_once_with(
+            {'repo_id': 'foo'}, projection={'unit_type_id': 1, 'unit_id': 1, '_id': 0})
+        find.return_value.sort.assert_called_once_with([('unit_type_id', 1), ('unit_id', 1)])
+
 
 class AssociateSingleUnitTests(unittest.TestCase):
 
+    @patch('pulp.server.controllers.repository.model.Repository.objects')
     @patch('pulp.server.controllers.repository.model.RepositoryContentUnit.objects')
     @patch('pulp.server.controllers.repository.dateutils.format_iso8601_utc_timestamp')
-    def test_unit_association(self, mock_get_timestamp, mock_rcu_objects):
+    def test_unit_association(self, mock_get_timestamp, mock_rcu_objects, mock_repo_objects):
         mock_get_timestamp.return_value = 'foo_tstamp'
+        mock_rcu_objects.return_value.update.return_value = {'updatedExisting': False}
         test_unit = DemoModel(id='bar', key_field='baz')
         repo = MagicMock(repo_id='foo')
         repo_controller.associate_single_unit(repo, test_unit)
@@ -354,16 +536,153 @@ class AssociateSingleUnitTests(unittest.TestCase):
             unit_id='bar',
             unit_type_id=DemoModel._content_type_id.default
         )
-        mock_rcu_objects.return_value.update_one.assert_called_once_with(
+        mock_rcu_objects.return_value.update.assert_called_once_with(
             set_on_insert__created='foo_tstamp',
             set__updated='foo_tstamp',
-            upsert=True)
+            upsert=True, multi=False, full_result=True)
+        mock_repo_objects.assert_called_once_with(repo_id='foo')
+        mock_repo_objects.return_value.update_one.assert_called_once_with(
+            unset__content_fingerprint=True)
+
+    @patch('pulp.server.controllers.repository.model.Repository.objects')
+    @patch('pulp.server.controllers.repository.model.RepositoryContentUnit.objects')
+    def test_unit_already_associated(self, mock_rcu_objects, mock_repo_objects):
+        """
+        Test the content fingerprint is kept when the unit was already associated.
+        """
+        mock_rcu_objects.return_value.update.return_value = {'updatedExisting': True}
+        repo_controller.associate_single_unit(MagicMock(repo_id='foo'),
+                                              DemoModel(id='bar', key_field='baz'))
+        self.assertFalse(mock_repo_objects.called)
+
+
+@patch(MODULE + 'dateutils')
+@patch(MODULE + 'model.Repository.objects')
+@patch(MODULE + 'model.RepositoryContentUnit._get_collection')
+class TestAssociateUnits(unittest.TestCase):
+
+    def test_associate_units(self, m_get_collection, m_repo_objects, m_dateutils):
+        """
+        Test that the associations are upserted in bulk and the counts updated once.
+        """
+        m_dateutils.format_iso8601_utc_timestamp.return_value = 'foo_tstamp'
+        collection = m_get_collection.return_value
+        collection.bulk_write.return_value.upserted_ids = {0: 'a', 2: 'c'}
+        units = [DemoModel(id='bar', key_field='bar'), DemoModel(id='baz', key_field='baz'),
+                 DemoModel(id='qux', key_field='qux')]
+        repo = MagicMock(repo_id='foo')
+
+        added = repo_controller.associate_units(repo, iter(units))
+
+        self.assertEqual(added, 2)
+        writes = collection.bulk_write.call_args[0][0]
+        self.assertEqual(len(writes), 3)
+        self.assertEqual(writes[1]._filter,
+                         {'repo_id': 'foo', 'unit_type_id': 'demo_model', 'unit_id': 'baz'})
+        self.assertEqual(writes[1]._doc, {'$set': {'updated': 'foo_tstamp'},
+                                          '$setOnInsert': {'created': 'foo_tstamp'}})
+        self.assertTrue(writes[1]._upsert)
+        self.assertEqual(collection.bulk_write.call_args[1], {'ordered': False})
+        m_repo_objects.assert_called_once_with(repo_id='foo')
+        m_repo_objects.return_value.update_one.assert_called_once_with(
+            inc__content_unit_counts__demo_model=2,
+            set__last_unit_added=m_dateutils.now_utc_datetime_with_tzinfo.return_value,
+            unset__content_fingerprint=True)
+
+    def test_associate_units_by_id_counts_types(self, m_get_collection, m_repo_objects,
+                                                m_dateutils):
+        """
+        Test that the counts of each unit type are incremented.
+        """
+        collection = m_get_collection.return_value
+        collection.bulk_write.return_value.upserted_ids = {0: 'a', 1: 'b', 2: 'c'}
+
+        added = repo_controller.associate_units_by_id(
+            'foo', [('rpm', 'a'), ('srpm', 'b'), ('rpm', 'c')])
+
+        self.assertEqual(added, 3)
+        m_repo_objects.return_value.update_one.assert_called_once_with(
+            inc__content_unit_counts__rpm=2, inc__content_unit_counts__srpm=1,
+            set__last_unit_added=m_dateutils.now_utc_datetime_with_tzinfo.return_value,
+            unset__content_fingerprint=True)
+
+    def test_associate_units_by_id_existing(self, m_get_collection, m_repo_objects, m_dateutils):
+        """
+        Test that the repository is not updated when all associations already exist.
+        """
+        m_get_collection.return_value.bulk_write.return_value.upserted_ids = {}
+
+        added = repo_controller.associate_units_by_id('foo', [('rpm', 'a')])
+
+        self.assertEqual(added, 0)
+        self.assertEqual(m_repo_objects.call_count, 0)
+
+    @patch(MODULE + 'UNIT_CHUNK_SIZE', 2)
+    def test_associate_units_by_id_chunks(self, m_get_collection, m_repo_objects, m_dateutils):
+        """
+        Test that the associations are written, and the repository updated, a chunk at a time.
+        """
+        collection = m_get_collection.return_value
+        collection.bulk_write.return_value.upserted_ids = {0: 'a'}
+
+        added = repo_controller.associate_units_by_id(
+            'foo', iter([('rpm', 'a'), ('rpm', 'b'), ('rpm', 'c')]))
+
+        self.assertEqual(added, 2)
+        self.assertEqual([len(c[0][0]) for c in collection.bulk_write.call_args_list], [2, 1])
+        self.assertEqual(m_repo_objects.return_value.update_one.call_count, 2)
+
+    def test_associate_units_by_id_duplicate(self, m_get_collection, m_repo_objects,
+                                             m_dateutils):
+        """
+        Test that upserts that failed because of a concurrent insert are retried.
+        """
+        collection = m_get_collection.return_value
+        error = repo_controller.BulkWriteError({
+            'writeErrors': [{'index': 1, 'code': repo_controller.DUPLICATE_KEY_ERROR}],
+            'upserted': [{'index': 0, '_id': 'a'}]})
+        collection.bulk_write.side_effect = [error, None]
+
+        added = repo_controller.associate_units_by_id('foo', [('rpm', 'a'), ('rpm', 'b')])
+
+        self.assertEqual(added, 1)
+        writes = collection.bulk_write.call_args_list[0][0][0]
+        collection.bulk_write.assert_called_with([writes[1]], ordered=False)
+        m_repo_objects.return_value.update_one.assert_called_once_with(
+            inc__content_unit_counts__rpm=1,
+            set__last_unit_added=m_dateutils.now_utc_datetime_with_tzinfo.return_value,
+            unset__content_fingerprint=True)
+
+    def test_associate_units_by_id_error(self, m_get_collection, m_repo_objects, m_dateutils):
+        """
+        Test that errors other than duplicate keys are raised.
+        """
+        error = repo_controller.BulkWriteError({
+            'writeErrors': [{'index': 0, 'code': 2}], 'upserted': []})
+        m_get_collection.return_value.bulk_write.side_effect = error
+
+        self.assertRaises(repo_controller.BulkWriteError, repo_controller.associate_units_by_id,
+                          'foo', [('rpm', 'a')])
+        self.assertEqual(m_repo_objects.call_count, 0)
+
+    def test_associate_units_by_id_repo_error(self, m_get_collection, m_repo_objects,
+                                              m_dateutils):
+        """
+        Test that an error updating the repository is raised as a PulpExecutionException.
+        """
+        m_get_collection.return_value.bulk_write.return_value.upserted_ids = {0: 'a'}
+        m_repo_objects.return_value.update_one.side_effect = mongoengine.OperationError()
+
+        self.assertRaises(pulp_exceptions.PulpExecutionException,
+                          repo_controller.associate_units_by_id, 'foo', [('rpm', 'a')])
 
 
 class TestDisassociateUnits(unittest.TestCase):
+    @patch('pulp.server.controllers.repository.model.Repository.objects')
     @patch('pulp.server.controllers.repository.update_last_unit_removed')
     @patch('pulp.server.controllers.repository.model.RepositoryContentUnit.objects')
-    def test_disassociate_units(self, m_rcu_objects, m_update_last_unit_removed):
+    def test_disassociate_units(self, m_rcu_objects, m_update_last_unit_removed,
+                                m_repo_objects):
         """"
         Test that multiple objects are all deleted and timestamp for units removal updated
         """
@@ -374,15 +693,36 @@ class TestDisassociateUnits(unittest.TestCase):
         m_rcu_objects.assert_called_once_with(repo_id='foo', unit_id__in=['bar', 'baz'])
         m_rcu_objects.return_value.delete.assert_called_once()
         m_update_last_unit_removed.assert_called_once_with('foo')
+        m_repo_objects.assert_called_once_with(repo_id='foo')
+        m_repo_objects.return_value.update_one.assert_called_once_with(
+            unset__content_fingerprint=True)
 
+    @patch('pulp.server.controllers.repository.model.Repository.objects')
+    @patch('pulp.server.controllers.repository.update_last_unit_removed')
+    @patch('pulp.server.controllers.repository.model.RepositoryContentUnit.objects')
+    def test_disassociate_units_fingerprint_unset_first(self, m_rcu_objects,
+                                                        m_update_last_unit_removed,
+                                                        m_repo_objects):
+        """"
+        Test that the content fingerprint is unset when the removal of units fails
+        """
+        m_rcu_objects.return_value.delete.side_effect = mongoengine.OperationError
+        repo = MagicMock(repo_id='foo')
+        self.assertRaises(mongoengine.OperationError, repo_controller.disassociate_units,
+                          repo, [DemoModel(id='bar', key_field='baz')])
+        m_repo_objects.return_value.update_one.assert_called_once_with(
+            unset__content_fingerprint=True)
+
+    @patch('pulp.server.controllers.repository.model.Repository.objects')
     @patch('pulp.server.controllers.repository.update_last_unit_removed')
-    def test_disassociate_units_empty_iterable(self, m_update_last_unit_removed):
+    def test_disassociate_units_empty_iterable(self, m_update_last_unit_removed, m_repo_objects):
         """"
         Test that timestamp for units removal is not updated when no units are removed
         """
         repo = MagicMock(repo_id='foo')
         repo_controller.disassociate_units(repo, [])
         self.assertFalse(m_update_last_unit_removed.called)
+        self.assertFalse(m_repo_objects.called)
 
 
 @mock.patch('pulp.server.controllers.repository.dist_controller')
@@ -506,6 +846,7 @@ class TestQueueDelete(unittest.TestCase):
         self.assertTrue(async_result is mock_delete.apply_async_with_reservation())
 
 
+@mock.patch('pulp.server.controllers.repository.ConsumerApplicabilityGroupManager')
 @mock.patch('pulp.server.controllers.repository.dist_controller')
 @mock.patch('pulp.server.controllers.repository.importer_controller')
 @mock.patch('pulp.server.controllers.repository.TaskResult')
@@ -520,7 +861,8 @@ class TestDelete(unittest.TestCase):
     """
 
     def test_delete_no_importers_or_distributors(self, m_factory, m_model, m_content, m_publish,
-                                                 m_sync, m_task_result, m_imp_ctrl, m_dist_ctrl):
+                                                 m_sync, m_task_result, m_imp_ctrl, m_dist_ctrl,
+                                                 m_app_groups):
         """
         Test a simple repository delete when there are no importers or distributors.
         """
@@ -542,13 +884,14 @@ class TestDelete(unittest.TestCase):
         m_publish.get_collection().remove.assert_called_once_with(pymongo_args, **pymongo_kwargs)
         m_content.get_collection().remove.assert_called_once_with(pymongo_args, **pymongo_kwargs)
         mock_group_manager.remove_repo_from_groups.assert_called_once_with('foo-repo')
+        m_app_groups.remove_repo.assert_called_once_with('foo-repo')
         m_task_result.assert_called_once_with(error=None, spawned_tasks=[])
         self.assertTrue(result is m_task_result.return_value)
 
     @mock.patch('pulp.server.controllers.repository.consumer_controller')
     def test_delete_imforms_other_collections(self, mock_consumer_ctrl, m_factory, m_model,
                                               m_content, m_publish, m_sync, m_task_result,
-                                              m_imp_ctrl, m_dist_ctrl):
+                                              m_imp_ctrl, m_dist_ctrl, m_app_groups):
         """
         Test that other collections are correctly informed when a repository is deleted.
         """
@@ -580,7 +923,8 @@ class TestDelete(unittest.TestCase):
         self.assertTrue(result is m_task_result.return_value)
 
     def test_delete_with_dist_and_imp_errors(self, m_factory, m_model, m_content, m_publish,
-                                             m_sync, m_task_result, m_imp_ctrl, m_dist_ctrl):
+                                             m_sync, m_task_result, m_imp_ctrl, m_dist_ctrl,
+                                             m_app_groups):
         """
         Test repository delete when the other collections raise errors.
         """
@@ -628,7 +972,7 @@ class TestDelete(unittest.TestCase):
         self.assertTrue(isinstance(e.child_exceptions[2], MockException))
 
     def test_delete_content_errors(self, m_factory, m_model, m_content, m_publish,
-                                   m_sync, m_task_result, m_imp_ctrl, m_dist_ctrl):
+                                   m_sync, m_task_result, m_imp_ctrl, m_dist_ctrl, m_app_groups):
         """
         Test delete repository when the content collection raises errors.
         """
@@ -672,7 +1016,8 @@ class TestDelete(unittest.TestCase):
     @mock.patch('pulp.server.controllers.repository.pulp_exceptions.PulpCodedException')
     def test_delete_consumer_bind_error(self, mock_coded_exception, mock_pulp_error,
                                         mock_consumer_ctrl, m_factory, m_model, m_content,
-                                        m_publish, m_sync, m_task_result, m_imp_ctrl, m_dist_ctrl):
+                                        m_publish, m_sync, m_task_result, m_imp_ctrl, m_dist_ctrl,
+                                        m_app_groups):
         """
         Test repository delete when consumer bind collection raises an error.
         """
@@ -1614,7 +1959,8 @@ class TestUpdateUnitCount(unittest.TestCase):
         """
         repo_controller.update_unit_count('m_repo', 'mock_type', 2)
         expected_key = 'inc__content_unit_counts__mock_type'
-        m_repo_qs().update_one.assert_called_once_with(**{expected_key: 2})
+        m_repo_qs().update_one.assert_called_once_with(
+            unset__content_fingerprint=True, **{expected_key: 2})
 
     @mock.patch('pulp.server.controllers.repository.model.Repository.objects')
     def test_update_unit_count_errror(self, m_repo_qs):
@@ -1625,7 +1971,8 @@ class TestUpdateUnitCount(unittest.TestCase):
         self.assertRaises(pulp_exceptions.PulpExecutionException, repo_controller.update_unit_count,
                           'm_repo', 'mock_type', 2)
         expected_key = 'inc__content_unit_counts__mock_type'
-        m_repo_qs().update_one.assert_called_once_with(**{expected_key: 2})
+        m_repo_qs().update_one.assert_called_once_with(
+            unset__content_fingerprint=True, **{expected_key: 2})
 
 
 class TestGetImporterById(unittest.TestCase):
@@ -1749,13 +2096,12 @@ class TestDownloadRepo(unittest.TestCase):
 
     @patch(MODULE + 'LazyUnitDownloadStep')
     @patch(MODULE + '_create_download_requests')
-    @patch(MODULE + 'get_mongoengine_unit_querysets')
-    def test_download_repo_verify(self, mock_units_qs, mock_create_requests, mock_step):
+    @patch(MODULE + '_find_mongoengine_units')
+    def test_download_repo_verify(self, mock_find_units, mock_create_requests, mock_step):
         """Assert the download step is initialized and called with all units."""
-        mock_units_qs.return_value = [['some'], ['lists']]
         repo_controller.download_repo('fake-id', verify_all_units=True)
-        mock_units_qs.assert_called_once_with('fake-id')
-        self.assertEqual(list(mock_create_requests.call_args[0][0]), ['some', 'lists'])
+        mock_find_units.assert_called_once_with('fake-id')
+        mock_create_requests.assert_called_once_with(mock_find_units.return_value)
         mock_step.return_value.start.assert_called_once_with()
 
 
@@ -1766,15 +2112,64 @@ class TestGetDeferredContentUnits(unittest.TestCase):
     def test_get_deferred_content_units(self, mock_qs, mock_get_model):
         # Setup
         mock_unit = Mock(unit_type_id='abc', unit_id='123')
-        mock_qs.objects.filter.return_value = [mock_unit]
+        mock_qs.objects.order_by.return_value.limit.return_value = [mock_unit]
+        unit = Mock(id='123')
+        mock_get_model.return_value.objects.filter.return_value = [unit]
 
         # Test
         result = list(repo_controller._get_deferred_content_units())
-        self.assertEqual(1, len(result))
+        self.assertEqual([unit], result)
         mock_get_model.assert_called_once_with('abc')
         unit_filter = mock_get_model.return_value.objects.filter
-        unit_filter.assert_called_once_with(id='123')
-        unit_filter.return_value.get.assert_called_once_with()
+        unit_filter.assert_called_once_with(id__in=['123'])
+
+    @patch(MODULE + 'UNIT_CHUNK_SIZE', 2)
+    @patch(MODULE + 'plugin_api.get_unit_model_by_id')
+    @patch(MODULE + 'model.DeferredDownload')
+    def test_get_deferred_content_units_pages(self, mock_qs, mock_get_model):
+        """Assert units are retrieved with one query per page and type, in deferred order."""
+        deferred = [Mock(unit_type_id='abc', unit_id='1', id=1),
+                    Mock(unit_type_id='def', unit_id='2', id=2),
+                    Mock(unit_type_id='abc', unit_id='3', id=3)]
+        first_page = mock_qs.objects.order_by.return_value
+        first_page.limit.return_value = deferred[:2]
+        first_page.filter.return_value.limit.return_value = deferred[2:]
+        models = {'abc': Mock(), 'def': Mock()}
+        units = dict((i, Mock(id=i)) for i in ('1', '2', '3'))
+        models['abc'].objects.filter.side_effect = lambda id__in: [units[i] for i in id__in]
+        models['def'].objects.filter.side_effect = lambda id__in: [units[i] for i in id__in]
+        mock_get_model.side_effect = models.get
+
+        result = list(repo_controller._get_deferred_content_units())
+
+        self.assertEqual([units['1'], units['2'], units['3']], result)
+        mock_qs.objects.order_by.assert_called_with('id')
+        first_page.limit.assert_called_once_with(2)
+        # the second page starts after the last entry of the first one
+        first_page.filter.assert_called_once_with(id__gt=2)
+        first_page.filter.return_value.limit.assert_called_once_with(2)
+        self.assertEqual(models['abc'].objects.filter.call_args_list,
+                         [call(id__in=['1']), call(id__in=['3'])])
+        models['def'].objects.filter.assert_called_once_with(id__in=['2'])
+
+    @patch(MODULE + 'UNIT_CHUNK_SIZE', 1)
+    @patch(MODULE + 'plugin_api.get_unit_model_by_id')
+    @patch(MODULE + 'model.DeferredDownload')
+    def test_get_deferred_content_units_page_read_before_yield(self, mock_qs, mock_get_model):
+        """Assert each page is read completely before its units are yielded."""
+        page = Mock()
+        page.__iter__ = Mock(return_value=iter([Mock(unit_type_id='abc', unit_id='1', id=1)]))
+        first_page = mock_qs.objects.order_by.return_value
+        first_page.limit.return_value = page
+        first_page.filter.return_value.limit.return_value = []
+        mock_get_model.return_value.objects.filter.return_value = [Mock(id='1')]
+
+        result = repo_controller._get_deferred_content_units()
+        next(result)
+
+        # the page is not left open while the unit is processed
+        self.assertRaises(StopIteration, next, page.__iter__.return_value)
+        self.assertEqual(list(result), [])
 
     @patch(MODULE + '_logger.error')
     @patch(MODULE + 'plugin_api.get_unit_model_by_id')
@@ -1782,7 +2177,7 @@ class TestGetDeferredContentUnits(unittest.TestCase):
     def test_get_deferred_content_units_no_model(self, mock_qs, mock_get_model, mock_log):
         # Setup
         mock_unit = Mock(unit_type_id='abc', unit_id='123')
-        mock_qs.objects.filter.return_value = [mock_unit]
+        mock_qs.objects.order_by.return_value.limit.return_value = [mock_unit]
         mock_get_model.return_value = None
 
         # Test
@@ -1797,9 +2192,8 @@ class TestGetDeferredContentUnits(unittest.TestCase):
     def test_get_deferred_content_units_no_unit(self, mock_qs, mock_get_model, mock_log):
         # Setup
         mock_unit = Mock(unit_type_id='abc', unit_id='123')
-        mock_qs.objects.filter.return_value = [mock_unit]
-        unit_qs = mock_get_model.return_value.objects.filter.return_value
-        unit_qs.get.side_effect = mongoengine.DoesNotExist()
+        mock_qs.objects.order_by.return_value.limit.return_value = [mock_unit]
+        mock_get_model.return_value.objects.filter.return_value = []
 
         # Test
         result = list(repo_controller._get_deferred_content_units())
@@ -1819,8 +2213,8 @@ class TestCreateDownloadRequests(unittest.TestCase):
         # Setup
         content_units = [Mock(id='123', type_id='abc', list_files=lambda: ['/file/path'])]
         filtered_qs = mock_catalog.objects.filter.return_value
-        catalog_entry = filtered_qs.order_by.return_value.first.return_value
-        catalog_entry.path = '/storage/123/path'
+        catalog_entry = Mock(unit_id='123', unit_type_id='abc', path='/file/path')
+        filtered_qs.order_by.return_value = [catalog_entry]
         expected_data_dict = {
             repo_controller.TYPE_ID: 'abc',
             repo_controller.UNIT_ID: '123',
@@ -1833,21 +2227,63 @@ class TestCreateDownloadRequests(unittest.TestCase):
         }
 
         # Test
-        requests = repo_controller._create_download_requests(content_units)
+        requests = list(repo_controller._create_download_requests(content_units))
         expected_data_dict[repo_controller.REQUEST] = requests[0]
-        mock_catalog.objects.filter.assert_called_once_with(
-            unit_id='123',
-            unit_type_id='abc',
-            path='/file/path'
-        )
-        filtered_qs.order_by.assert_called_once_with('revision')
-        filtered_qs.order_by.return_value.first.assert_called_once_with()
+        mock_catalog.objects.filter.assert_called_once_with(unit_id__in=['123'])
+        filtered_qs.order_by.assert_called_once_with('-revision')
         mock_mkdir.assert_called_once_with('/working/123')
         self.assertEqual(1, len(requests))
         self.assertEqual(mock_get_url.return_value, requests[0].url)
         self.assertEqual('/working/123/path', requests[0].destination)
         self.assertEqual(expected_data_dict, requests[0].data)
 
+    @patch(MODULE + 'UNIT_CHUNK_SIZE', 2)
+    @patch(MODULE + 'Key.load', Mock())
+    @patch(MODULE + 'common_utils.get_working_directory', Mock(return_value='/working/'))
+    @patch(MODULE + 'mkdir', Mock())
+    @patch(MODULE + '_get_streamer_url', Mock(return_value='http://streamer/'))
+    @patch(MODULE + 'model.LazyCatalogEntry')
+    def test_create_download_requests_pages(self, mock_catalog):
+        """Assert catalog entries are retrieved once per page of units."""
+        content_units = [Mock(id=i, type_id='abc', list_files=lambda: ['/a', '/b'])
+                         for i in ('1', '2', '3')]
+        entries = [Mock(unit_id=i, unit_type_id='abc', path=path)
+                   for i in ('1', '2', '3') for path in ('/a', '/b')]
+        mock_catalog.objects.filter.side_effect = lambda unit_id__in: Mock(
+            order_by=Mock(return_value=[e for e in entries if e.unit_id in unit_id__in]))
+
+        requests = repo_controller._create_download_requests(content_units)
+
+        self.assertFalse(mock_catalog.objects.filter.called)
+        requests = list(requests)
+        self.assertEqual(6, len(requests))
+        self.assertEqual(mock_catalog.objects.filter.call_args_list,
+                         [call(unit_id__in=['1', '2']), call(unit_id__in=['3'])])
+
+    @patch(MODULE + 'model.LazyCatalogEntry')
+    def test_get_catalog_entries_latest_revision(self, mock_catalog):
+        """Assert the entry with the latest revision is used for each file."""
+        latest = Mock(unit_id='1', unit_type_id='abc', path='/a', revision=2)
+        previous = Mock(unit_id='1', unit_type_id='abc', path='/a', revision=1)
+        mock_catalog.objects.filter.return_value.order_by.return_value = [latest, previous]
+
+        entries = repo_controller._get_catalog_entries([Mock(id='1')])
+
+        mock_catalog.objects.filter.return_value.order_by.assert_called_once_with('-revision')
+        self.assertEqual({('abc', '1', '/a'): latest}, entries)
+
+    @patch(MODULE + 'Key.load', Mock())
+    @patch(MODULE + 'common_utils.get_working_directory', Mock(return_value='/working/'))
+    @patch(MODULE + 'mkdir')
+    @patch(MODULE + 'model.LazyCatalogEntry')
+    def test_create_download_requests_no_entry(self, mock_catalog, mock_mkdir):
+        """Assert files without catalog entries are skipped."""
+        content_units = [Mock(id='123', type_id='abc', list_files=lambda: ['/file/path'])]
+        mock_catalog.objects.filter.return_value.order_by.return_value = []
+
+        self.assertEqual([], list(repo_controller._create_download_requests(content_units)))
+        self.assertFalse(mock_mkdir.called)
+
 
 class TestGetStreamerUrl(unittest.TestCase):
 
@@ -1941,6 +2377,34 @@ class TestLazyUnitDownloadStep(unittest.TestCase):
         self.step.start()
         self.step.downloader.download.assert_called_once_with(self.step.download_requests)
 
+    def test_start_generator(self):
+        """Assert requests from a generator are counted as they are downloaded."""
+        step = repo_controller.LazyUnitDownloadStep('test_step', 'Test Step',
+                                                    (request for request in [Mock(), Mock()]))
+        step.downloader = Mock()
+        step.report = Mock()
+
+        def download(requests):
+            for request in requests:
+                self.assertEqual(repo_controller.reporting_constants.STATE_RUNNING, step.state)
+                step.progress_successes += 1
+        step.downloader.download.side_effect = download
+
+        self.assertFalse(step.all_requests_counted)
+        step.start()
+
+        self.assertTrue(step.all_requests_counted)
+        self.assertEqual(2, step.total_units)
+        self.assertEqual(2, step.report.call_count)
+
+    def test_report_not_complete_before_all_requests_counted(self):
+        step = repo_controller.LazyUnitDownloadStep('test_step', 'Test Step', iter([]))
+        step.report()
+        self.assertNotEqual(repo_controller.reporting_constants.STATE_COMPLETE, step.state)
+        step.all_requests_counted = True
+        step.report()
+        self.assertEqual(repo_controller.reporting_constants.STATE_COMPLETE, step.state)
+
     @patch(MODULE + 'plugin_api.get_unit_model_by_id')
     @patch(MODULE + 'model.DeferredDownload')
     def test_download_started(self, mock_deferred_download, mock_get_model):
@@ -1980,7 +2444,7 @@ class TestLazyUnitDownloadStep(unittest.TestCase):
 
         # Test
         self.step.download_succeeded(self.report)
-        unit.import_content.assert_called_once_with(self.report.destination)
+        unit.import_content.assert_called_once_with(self.report.destination, disposable=True)
         self.assertEqual(1, self.step.progress_successes)
         self.assertEqual(0, self.step.progress_failures)
         self.assertEqual(
@@ -2005,7 +2469,8 @@ class TestLazyUnitDownloadStep(unittest.TestCase):
         self.assertEqual(0, unit.set_storage_path.call_count)
         unit.import_content.assert_called_once_with(
             self.report.destination,
-            location='a/filename'
+            location='a/filename',
+            disposable=True
         )
         self.assertEqual(1, self.step.progress_successes)
         self.assertEqual(0, self.step.progress_failures)
@@ -2028,7 +2493,8 @@ class TestLazyUnitDownloadStep(unittest.TestCase):
         self.assertEqual(0, unit.set_storage_path.call_count)
         unit.import_content.assert_called_once_with(
             self.report.destination,
-            location='a/filename'
+            location='a/filename',
+            disposable=True
         )
         self.assertEqual(1, self.step.progress_successes)
         self.assertEqual(0, self.step.progress_failures)
@@ -0,0 +1,130 @@
+from unittest import TestCase
+
+from mock import call, MagicMock, patch
+
+from pulp.server.db.migrate.models import MigrationModule
+from pulp.server.managers.consumer import applicability
+
+MIGRATION = 'pulp.server.db.migrations.0030_consumer_applicability_groups'
+
+
+class TestMigration(TestCase):
+    """
+    Test the migration.
+    """
+
+    def setUp(self):
+        super(TestMigration, self).setUp()
+        self.module = MigrationModule(MIGRATION)._module
+        self.collections = {}
+        patcher = patch('.'.join((MIGRATION, 'get_collection')),
+                        side_effect=lambda name: self.collections.setdefault(name, MagicMock()))
+        self.m_get_collection = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('.'.join((MIGRATION, 'BATCH_SIZE')), 2)
+    @patch('.'.join((MIGRATION, 'add_consumers_to_groups')))
+    def test_migrate(self, m_add_consumers):
+        """
+        Test the consumers are added to their groups in batches.
+        """
+        collection = self.m_get_collection('consumers')
+        collection.count.return_value = 3
+        collection.find.return_value.batch_size.return_value = [
+            {'id': 'consumer-1'}, {'id': 'consumer-2'}, {'id': 'consumer-3'}]
+
+        # test
+        self.module.migrate()
+
+        # validation
+        collection.find.assert_called_once_with({}, ['id'])
+        self.assertEqual(m_add_consumers.call_args_list,
+                         [call(['consumer-1', 'consumer-2']), call(['consumer-3'])])
+
+    @patch('.'.join((MIGRATION, 'add_consumers_to_groups')))
+    def test_migrate_no_consumers(self, m_add_consumers):
+        """
+        Test nothing is done when there are no consumers.
+        """
+        collection = self.m_get_collection('consumers')
+        collection.count.return_value = 0
+        collection.find.return_value.batch_size.return_value = []
+
+        # test
+        self.module.migrate()
+
+        # validation
+        self.assertFalse(m_add_consumers.called)
+
+    def test_add_consumers_to_groups(self):
+        """
+        Test consumers with the same profiles and bindings are added to a group created with
+        the existing applicability.
+        """
+        self.m_get_collection('consumer_unit_profiles').find.return_value = [
+            {'consumer_id': 'c1', 'profile_hash': 'hash-1'},
+            {'consumer_id': 'c2', 'profile_hash': 'hash-1'},
+            {'consumer_id': 'c3', 'profile_hash': 'hash-1'}]
+        bindings = self.m_get_collection('consumer_bindings')
+        bindings.find.return_value = [
+            {'consumer_id': 'c1', 'repo_id': 'repo-2'},
+            {'consumer_id': 'c1', 'repo_id': 'repo-1'},
+            {'consumer_id': 'c2', 'repo_id': 'repo-1'},
+            {'consumer_id': 'c2', 'repo_id': 'repo-2'},
+            {'consumer_id': 'c4', 'repo_id': 'repo-1'}]
+        self.m_get_collection('repo_profile_applicability').find_one.side_effect = \
+            lambda query, projection: {'applicability': {'erratum': ['e1']}} \
+            if query['repo_id'] == 'repo-1' else None
+        groups = self.m_get_collection('consumer_applicability_groups')
+        groups.update_one.return_value.upserted_id = 'object-id'
+
+        # test
+        self.module.add_consumers_to_groups(['c1', 'c2', 'c3', 'c4'])
+
+        # validation
+        bindings.find.assert_called_once_with(
+            {'consumer_id': {'$in': ['c1', 'c2', 'c3', 'c4']}, 'deleted': False},
+            projection=['consumer_id', 'repo_id'])
+        group_id = self.module.calculate_group_id('hash-1', ['repo-1', 'repo-2'])
+        # c3 has no bindings and c4 has no profiles
+        self.assertEqual(groups.update_one.call_args_list, [
+            call({'group_id': group_id},
+                 {'$addToSet': {'consumers': {'$each': ['c1', 'c2']}}}, upsert=True),
+            call({'_id': 'object-id'},
+                 {'$set': {'all_profiles_hash': 'hash-1',
+                           'repos': [{'repo_id': 'repo-1',
+                                      'applicability': {'erratum': ['e1']}},
+                                     {'repo_id': 'repo-2', 'applicability': None}]}})])
+
+    def test_add_consumers_to_existing_group(self):
+        """
+        Test consumers are added to an existing group without changing its applicability.
+        """
+        self.m_get_collection('consumer_unit_profiles').find.return_value = [
+            {'consumer_id': 'c1', 'profile_hash': 'hash-1'}]
+        self.m_get_collection('consumer_bindings').find.return_value = [
+            {'consumer_id': 'c1', 'repo_id': 'repo-1'}]
+        groups = self.m_get_collection('consumer_applicability_groups')
+        groups.update_one.return_value.upserted_id = None
+
+        # test
+        self.module.add_consumers_to_groups(['c1'])
+
+        # validation
+        self.assertEqual(groups.update_one.call_count, 1)
+        self.assertFalse(self.m_get_collection('repo_profile_applicability').find_one.called)
+
+    def test_hashes(self):
+        """
+        Test the hashes match the ones used to maintain the groups.
+        """
+        profile_hashes = ['hash-2', 'hash-1']
+        all_profiles_hash = self.module.calculate_all_profiles_hash(profile_hashes)
+
+        self.assertEqual(all_profiles_hash,
+                         applicability._calculate_all_profiles_hash(profile_hashes))
+        self.assertEqual(self.module.calculate_all_profiles_hash(['hash-1']), 'hash-1')
+        self.assertEqual(
+            self.module.calculate_group_id(all_profiles_hash, ['repo-2', 'repo-1']),
+            applicability.ConsumerApplicabilityGroupManager.group_id(
+                all_profiles_hash, ['repo-1', 'repo-2']))
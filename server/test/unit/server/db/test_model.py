@@ -480,7 +480,8 @@ class TestFileContentUnit(unittest.TestCase):
         file_storage.assert_called_once_with()
         storage.__enter__.assert_called_once_with()
         storage.__exit__.assert_called_once_with(None, None, None)
-        storage.put.assert_called_once_with(unit, path, None)
+        storage.put.assert_called_once_with(unit, path, None, disposable=False,
+                                            hardlink=False)
 
     @patch('os.path.isfile')
     @patch('pulp.server.db.model.FileStorage')
@@ -502,7 +503,8 @@ class TestFileContentUnit(unittest.TestCase):
         file_storage.assert_called_once_with()
         storage.__enter__.assert_called_once_with()
         storage.__exit__.assert_called_once_with(None, None, None)
-        storage.put.assert_called_once_with(unit, path, location)
+        storage.put.assert_called_once_with(unit, path, location, disposable=False,
+                                            hardlink=False)
 
     def test_import_content_unit_not_saved(self):
         try:
@@ -784,6 +786,9 @@ class TestRepository(unittest.TestCase):
         self.assertTrue(isinstance(model.Repository.content_unit_counts, DictField))
         self.assertFalse(model.Repository.content_unit_counts.required)
 
+        self.assertTrue(isinstance(model.Repository.content_fingerprint, StringField))
+        self.assertFalse(model.Repository.content_fingerprint.required)
+
         self.assertTrue(isinstance(model.Repository.last_unit_added, DateTimeField))
         self.assertFalse(model.Repository.last_unit_added.required)
 
@@ -0,0 +1,285 @@
+import threading
+import unittest
+
+import mock
+
+from pulp.server.event import dispatch
+from pulp.server.event.data import Event
+
+
+MODULE = 'pulp.server.event.dispatch'
+
+
+class TestListenerTable(unittest.TestCase):
+
+    def setUp(self):
+        self.listeners = [
+            {'notifier_type_id': 'a', 'event_types': ['t1']},
+            {'notifier_type_id': 'b', 'event_types': ['t1', 't2']},
+            {'notifier_type_id': 'c', 'event_types': ['*']},
+        ]
+
+    @mock.patch(MODULE + '.EventListenerGeneration')
+    @mock.patch(MODULE + '.config')
+    @mock.patch(MODULE + '.EventListener')
+    def test_find(self, listener, config, generation):
+        config.getfloat.return_value = 30
+        listener.get_collection.return_value.find.return_value = self.listeners
+        table = dispatch.ListenerTable()
+
+        found = table.find('t2')
+
+        self.assertEqual([l['notifier_type_id'] for l in found], ['b', 'c'])
+        config.getfloat.assert_called_with('events', 'listener_cache_ttl')
+
+    @mock.patch(MODULE + '.EventListenerGeneration')
+    @mock.patch(MODULE + '.time')
+    @mock.patch(MODULE + '.config')
+    @mock.patch(MODULE + '.EventListener')
+    def test_find_cached(self, listener, config, _time, generation):
+        config.getfloat.return_value = 30
+        generation.get_collection.return_value.find_one.return_value = None
+        find = listener.get_collection.return_value.find
+        find.return_value = self.listeners
+        table = dispatch.ListenerTable()
+
+        _time.time.return_value = 100
+        table.find('t1')
+        _time.time.return_value = 129
+        table.find('t1')
+        self.assertEqual(find.call_count, 1)
+
+        # expired
+        _time.time.return_value = 130
+        table.find('t1')
+        self.assertEqual(find.call_count, 2)
+
+    @mock.patch(MODULE + '.EventListenerGeneration')
+    @mock.patch(MODULE + '.config')
+    @mock.patch(MODULE + '.EventListener')
+    def test_invalidate(self, listener, config, generation):
+        config.getfloat.return_value = 30
+        find = listener.get_collection.return_value.find
+        find.return_value = self.listeners
+        generation.get_collection.return_value.find_one.return_value = None
+        table = dispatch.ListenerTable()
+
+        table.find('t1')
+        table.invalidate()
+        table.find('t1')
+
+        self.assertEqual(find.call_count, 2)
+        generation.get_collection.return_value.update.assert_called_once_with(
+            {'_id': generation.GENERATION_ID}, {'$inc': {'generation': 1}}, upsert=True)
+
+    @mock.patch(MODULE + '.EventListenerGeneration')
+    @mock.patch(MODULE + '.config')
+    @mock.patch(MODULE + '.EventListener')
+    def test_invalidated_by_other_process(self, listener, config, generation):
+        config.getfloat.return_value = 30
+        find = listener.get_collection.return_value.find
+        find.return_value = self.listeners
+        find_one = generation.get_collection.return_value.find_one
+        find_one.return_value = {'_id': generation.GENERATION_ID, 'generation': 1}
+        table = dispatch.ListenerTable()
+
+        table.find('t1')
+        table.find('t1')
+        self.assertEqual(find.call_count, 1)
+
+        # the listeners were changed by another process
+        find_one.return_value = {'_id': generation.GENERATION_ID, 'generation': 2}
+        table.find('t1')
+        self.assertEqual(find.call_count, 2)
+        find_one.assert_called_with({'_id': generation.GENERATION_ID})
+
+
+class TestDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.notifier = mock.Mock()
+        patcher = mock.patch.dict(
+            dispatch.notifiers.NOTIFIER_FUNCTIONS, {'test': self.notifier})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.event = Event('test-event', {})
+
+    def delivery(self, notifier_type_id='test'):
+        return dispatch.Delivery(notifier_type_id, {'a': 1}, self.event)
+
+    def test_submit(self):
+        dispatcher = dispatch.Dispatcher(2, 10, 0, 0)
+
+        for n in range(5):
+            dispatcher.submit(self.delivery())
+
+        self.assertTrue(dispatcher.join(5))
+        self.assertEqual(self.notifier.call_count, 5)
+        self.notifier.assert_called_with({'a': 1}, self.event)
+        stats = dispatcher.stats()
+        self.assertEqual(stats['delivered'], 5)
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(stats['queued'], 0)
+
+    def test_submit_does_not_wait(self):
+        dispatcher = dispatch.Dispatcher(1, 10, 0, 0)
+        event = threading.Event()
+        self.notifier.side_effect = lambda *args: event.wait(5)
+
+        dispatcher.submit(self.delivery())
+
+        self.assertFalse(dispatcher.join(0.01))
+        event.set()
+        self.assertTrue(dispatcher.join(5))
+
+    def test_submit_inline(self):
+        dispatcher = dispatch.Dispatcher(0, 10, 3, 0)
+        self.notifier.side_effect = Exception()
+
+        dispatcher.submit(self.delivery())
+
+        # delivered by the caller and not retried
+        self.assertEqual(self.notifier.call_count, 1)
+        self.assertEqual(dispatcher.stats()['failed'], 1)
+
+    def test_submit_queue_full(self):
+        dispatcher = dispatch.Dispatcher(1, 1, 0, 0)
+        event = threading.Event()
+        started = threading.Event()
+
+        def notify(*args):
+            started.set()
+            event.wait(5)
+
+        self.notifier.side_effect = notify
+        dispatcher.submit(self.delivery())
+        started.wait(5)
+        dispatcher.submit(self.delivery())
+        dispatcher.submit(self.delivery())
+        event.set()
+
+        self.assertTrue(dispatcher.join(5))
+        self.assertEqual(self.notifier.call_count, 2)
+        self.assertEqual(dispatcher.stats()['dropped'], 1)
+
+    @mock.patch(MODULE + '._logger')
+    def test_retry(self, _logger):
+        dispatcher = dispatch.Dispatcher(1, 10, 2, 0.01)
+        self.notifier.side_effect = [Exception(), Exception(), None]
+
+        dispatcher.submit(self.delivery())
+
+        self.assertTrue(dispatcher.join(5))
+        self.assertEqual(self.notifier.call_count, 3)
+        stats = dispatcher.stats()
+        self.assertEqual(stats['retried'], 2)
+        self.assertEqual(stats['delivered'], 1)
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(_logger.warning.call_count, 2)
+
+    @mock.patch(MODULE + '._logger')
+    def test_retry_exhausted(self, _logger):
+        dispatcher = dispatch.Dispatcher(1, 10, 1, 0)
+        self.notifier.side_effect = Exception()
+
+        dispatcher.submit(self.delivery())
+
+        self.assertTrue(dispatcher.join(5))
+        self.assertEqual(self.notifier.call_count, 2)
+        self.assertEqual(dispatcher.stats()['failed'], 1)
+        _logger.exception.assert_called_once_with('Exception from notifier of type [test]')
+
+    @mock.patch(MODULE + '.time')
+    def test_retry_backoff(self, _time):
+        _time.time.return_value = 100
+        dispatcher = dispatch.Dispatcher(1, 10, 3, 2)
+        dispatcher._schedule = mock.Mock()
+        self.notifier.side_effect = Exception()
+        delivery = self.delivery()
+
+        for n in range(3):
+            dispatcher._deliver(delivery)
+
+        self.assertEqual([c[0][1] for c in dispatcher._schedule.call_args_list], [102, 104, 108])
+
+    @mock.patch(MODULE + '._logger')
+    def test_unknown_notifier(self, _logger):
+        dispatcher = dispatch.Dispatcher(1, 10, 3, 0)
+
+        dispatcher.submit(self.delivery('unknown'))
+
+        self.assertTrue(dispatcher.join(5))
+        self.assertEqual(dispatcher.stats()['failed'], 1)
+        self.assertEqual(_logger.error.call_count, 1)
+
+    @mock.patch(MODULE + '.atexit')
+    @mock.patch(MODULE + '.threading.Thread')
+    @mock.patch(MODULE + '.os')
+    def test_submit_after_fork(self, _os, thread, _atexit):
+        dispatcher = dispatch.Dispatcher(1, 10, 0, 0)
+        # started in the parent process
+        dispatcher._pid = 1
+        dispatcher._pending.append((0, 0, self.delivery()))
+        dispatcher._stats['delivered'] = 3
+        _os.getpid.return_value = 2
+
+        dispatcher.submit(self.delivery())
+
+        # workers started in the child process, without the parent's queue
+        self.assertEqual(thread.call_count, 1)
+        self.assertEqual(len(dispatcher._pending), 1)
+        self.assertEqual(dispatcher.stats()['delivered'], 0)
+        _atexit.register.assert_called_once_with(dispatcher.join, dispatch.DRAIN_TIMEOUT)
+
+    @mock.patch(MODULE + '.os')
+    def test_join_other_process(self, _os):
+        dispatcher = dispatch.Dispatcher(1, 10, 0, 0)
+        # started in the parent process
+        dispatcher._pid = 1
+        dispatcher._pending.append((0, 0, self.delivery()))
+        _os.getpid.return_value = 2
+
+        self.assertTrue(dispatcher.join(0))
+
+
+class TestFlush(unittest.TestCase):
+
+    @mock.patch(MODULE + '._dispatcher', None)
+    def test_flush_no_dispatcher(self):
+        self.assertTrue(dispatch.flush())
+
+    @mock.patch(MODULE + '._dispatcher')
+    def test_flush(self, dispatcher):
+        dispatcher.join.return_value = True
+
+        self.assertTrue(dispatch.flush())
+
+        dispatcher.join.assert_called_once_with(dispatch.DRAIN_TIMEOUT)
+
+    @mock.patch(MODULE + '._logger')
+    @mock.patch(MODULE + '._dispatcher')
+    def test_flush_timeout(self, dispatcher, _logger):
+        dispatcher.join.return_value = False
+        dispatcher.stats.return_value = {'queued': 2}
+
+        self.assertFalse(dispatch.flush(1))
+
+        dispatcher.join.assert_called_once_with(1)
+        self.assertEqual(_logger.error.call_count, 1)
+
+
+class TestGetDispatcher(unittest.TestCase):
+
+    @mock.patch(MODULE + '._dispatcher', None)
+    @mock.patch(MODULE + '.config')
+    def test_get_dispatcher(self, config):
+        config.getint.side_effect = [3, 50, 2]
+        config.getfloat.return_value = 0.5
+
+        dispatcher = dispatch.get_dispatcher()
+
+        self.assertEqual(dispatcher.workers, 3)
+        self.assertEqual(dispatcher.queue_size, 50)
+        self.assertEqual(dispatcher.retries, 2)
+        self.assertEqual(dispatcher.retry_delay, 0.5)
+        self.assertTrue(dispatch.get_dispatcher() is dispatcher)
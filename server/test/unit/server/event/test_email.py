@@ -13,7 +13,7 @@ import mock
 
 from pulp.server.compat import json
 from pulp.server.config import config
-from pulp.server.event import data, mail
+from pulp.server.event import data, dispatch, mail
 from pulp.server.managers import factory
 
 
@@ -123,17 +123,24 @@ class TestSystem(unittest.TestCase):
     @mock.patch('pulp.server.event.data.task_serializer')
     # don't actually spawn a thread
     @mock.patch('threading.Thread', new=dummy_threading.Thread)
+    # deliver events in the firing thread
+    @mock.patch('pulp.server.event.dispatch.get_dispatcher',
+                return_value=dispatch.Dispatcher(0, 10, 0, 0))
     # mock qpid, because it freaks out over dummy_threading
     @mock.patch('pulp.server.managers.event.remote.TopicPublishManager')
     # don't actually send any email
     @mock.patch('smtplib.SMTP')
     # act as if the config has email enabled
     @mock.patch('ConfigParser.SafeConfigParser.getboolean', return_value=True)
-    # inject fake results from the database query
+    # inject fake results from the database queries
+    @mock.patch('pulp.server.db.model.event.EventListenerGeneration.get_collection',
+                new=mock.MagicMock())
     @mock.patch('pulp.server.db.model.event.EventListener.get_collection')
-    def test_fire(self, mock_get_collection, mock_getbool, mock_smtp, mock_publish, mock_task_ser):
+    def test_fire(self, mock_get_collection, mock_getbool, mock_smtp, mock_publish,
+                  mock_get_dispatcher, mock_task_ser):
         # verify that the event system will trigger listeners of this type
         mock_get_collection.return_value.find.return_value = [self.event_doc]
+        dispatch.LISTENERS.invalidate()
         mock_task_ser.return_value = 'serialized task'
         event = data.Event(data.TYPE_REPO_SYNC_FINISHED, 'stuff')
         factory.initialize()
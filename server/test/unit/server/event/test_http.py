@@ -1,6 +1,7 @@
 import unittest
 
 import mock
+from requests import ConnectionError
 
 from pulp.server.event import http
 from pulp.server.event.data import Event
@@ -115,3 +116,33 @@ class TestHTTPNotifierTests(unittest.TestCase):
             timeout=15
         )
         mock_log.error.assert_called_once_with(expected_log)
+
+    @mock.patch(MODULE_PATH + 'post')
+    def test_send_post_timeout(self, mock_post):
+        """Assert the configured timeout is used."""
+        notifier_config = {'url': 'https://localhost/api/', 'timeout': 2}
+        mock_post.return_value.status_code = 200
+
+        http._send_post(notifier_config, {})
+
+        self.assertEqual(mock_post.call_args[1]['timeout'], 2)
+
+    @mock.patch(MODULE_PATH + '_logger')
+    @mock.patch(MODULE_PATH + 'post')
+    def test_send_post_server_error(self, mock_post, mock_log):
+        """Assert server errors are raised so the notification is retried."""
+        notifier_config = {'url': 'https://localhost/api/'}
+        mock_post.return_value.status_code = 503
+
+        http._send_post(notifier_config, {})
+
+        mock_post.return_value.raise_for_status.assert_called_once_with()
+        self.assertEqual(mock_log.error.call_count, 1)
+
+    @mock.patch(MODULE_PATH + 'post')
+    def test_send_post_connection_error(self, mock_post):
+        """Assert connection errors are raised so the notification is retried."""
+        notifier_config = {'url': 'https://localhost/api/'}
+        mock_post.side_effect = ConnectionError()
+
+        self.assertRaises(ConnectionError, http._send_post, notifier_config, {})
@@ -1,21 +1,27 @@
+import unittest
+
 import mock
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 from .... import base
 from pulp.devel import mock_plugins
 from pulp.devel.skip import skip_broken
 from pulp.plugins.loader import api as plugins
+from pulp.server.compat import ObjectId
 from pulp.server.controllers import distributor as dist_controller
 from pulp.server.db import model
-from pulp.server.db.model.consumer import (Bind, Consumer, RepoProfileApplicability,
-                                           UnitProfile)
+from pulp.server.db.model.consumer import (Bind, Consumer, ConsumerApplicabilityGroup,
+                                           RepoProfileApplicability, UnitProfile)
 from pulp.server.db.model.criteria import Criteria
 from pulp.server.db.model import Repository
+from pulp.server.exceptions import InvalidValue
 from pulp.server.managers import factory as factory
 from pulp.server.managers.consumer.applicability import (
     _add_consumers_to_applicability_map, _add_profiles_to_consumer_map_and_get_hashes,
     _add_repo_ids_to_consumer_map, _format_report, _get_applicability_map,
     _get_consumer_applicability_map, DoesNotExist, MultipleObjectsReturned,
-    retrieve_consumer_applicability, ApplicabilityRegenerationManager)
+    retrieve_consumer_applicability, ApplicabilityCache, ApplicabilityRegenerationManager,
+    ConsumerApplicabilityGroupManager, ConsumerApplicabilityReport)
 from pulp.server.managers.consumer.bind import BindManager
 from pulp.server.managers.consumer.cud import ConsumerManager
 from pulp.server.managers.consumer.profile import ProfileManager
@@ -40,6 +46,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         Consumer.get_collection().remove()
         UnitProfile.get_collection().remove()
         RepoProfileApplicability.get_collection().remove()
+        ConsumerApplicabilityGroup.get_collection().remove()
         plugins._create_manager()
         mock_plugins.install()
 
@@ -63,6 +70,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         Consumer.get_collection().remove()
         UnitProfile.get_collection().remove()
         RepoProfileApplicability.get_collection().remove()
+        ConsumerApplicabilityGroup.get_collection().remove()
         mock_plugins.reset()
         ApplicabilityRegenerationManager._get_existing_repo_content_types = staticmethod(
             self.old_get_existing)
@@ -467,6 +475,555 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         mock_get_collection.return_value.find.return_value.batch_size.assert_called_with(5)
 
 
+class TestIncrementalApplicabilityRegeneration(unittest.TestCase):
+    """
+    Tests for regenerating applicability from the units added to and removed from a repo.
+    """
+
+    MODULE = 'pulp.server.managers.consumer.applicability.'
+
+    def setUp(self):
+        self.delta = {'added': {'erratum': ['errata-3']}, 'removed': {'rpm': ['rpm-1']}}
+        self.profiles = [('hash-1', 'rpm', [{'name': 'zsh'}])]
+        self.profiler = mock.Mock()
+        self.profiler.calculate_applicable_units_delta.return_value = {'erratum': ['errata-3']}
+
+    @mock.patch(MODULE + 'RepoProfileApplicability')
+    @mock.patch(MODULE + 'model')
+    def test_get_repo_delta(self, mock_model, mock_rpa):
+        rcu_objects = mock_model.RepositoryContentUnit.objects
+        rcu_objects.created_between.return_value.scalar.return_value = [
+            ('erratum', 'errata-3'), ('rpm', 'rpm-3')]
+        mock_rpa.get_collection.return_value.find.return_value = [
+            {'applicability': {'rpm': ['rpm-1', 'rpm-2']}},
+            {'applicability': {'rpm': ['rpm-2']}},
+            {'applicability': {}}]
+        rcu_objects.return_value.distinct.return_value = ['rpm-2']
+
+        delta = ApplicabilityRegenerationManager._get_repo_delta('repo-1', '2016-01-01T00:00:00Z')
+
+        self.assertEqual(delta, {'added': {'erratum': ['errata-3'], 'rpm': ['rpm-3']},
+                                 'removed': {'rpm': ['rpm-1']}})
+        rcu_objects.created_between.assert_called_once_with(
+            start='2016-01-01T00:00:00Z', repo_id='repo-1')
+        mock_rpa.get_collection.return_value.find.assert_called_once_with(
+            {'repo_id': 'repo-1'}, projection=['applicability'])
+        self.assertEqual(rcu_objects.call_args[1]['unit_type_id'], 'rpm')
+        self.assertEqual(sorted(rcu_objects.call_args[1]['unit_id__in']), ['rpm-1', 'rpm-2'])
+
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._is_existing_applicability',
+                return_value=True)
+    @mock.patch(MODULE + 'RepoProfileApplicability')
+    def test_merge_applicability(self, mock_rpa, mock_existing):
+        merged = ApplicabilityRegenerationManager._merge_applicability(
+            'all-hash', self.profiles, 'repo-1', self.delta, self.profiler, 'config', 'conduit')
+
+        self.assertTrue(merged)
+        self.profiler.calculate_applicable_units_delta.assert_called_once_with(
+            self.profiles, 'repo-1', self.delta['added'], self.delta['removed'], 'config',
+            'conduit')
+        query = {'repo_id': 'repo-1', 'all_profiles_hash': 'all-hash'}
+        self.assertEqual(mock_rpa.get_collection.return_value.update.call_args_list, [
+            mock.call(query, {'$pull': {'applicability.rpm': {'$in': ['rpm-1']}}}, multi=True),
+            mock.call(query, {'$addToSet': {'applicability.erratum': {'$each': ['errata-3']}}},
+                      multi=True)])
+
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._is_existing_applicability',
+                return_value=False)
+    @mock.patch(MODULE + 'RepoProfileApplicability')
+    def test_merge_applicability_not_existing(self, mock_rpa, mock_existing):
+        merged = ApplicabilityRegenerationManager._merge_applicability(
+            'all-hash', self.profiles, 'repo-1', self.delta, self.profiler, 'config', 'conduit')
+
+        self.assertFalse(merged)
+        self.assertFalse(self.profiler.calculate_applicable_units_delta.called)
+        self.assertFalse(mock_rpa.get_collection.return_value.update.called)
+
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._is_existing_applicability',
+                return_value=True)
+    @mock.patch(MODULE + 'RepoProfileApplicability')
+    def test_merge_applicability_not_supported(self, mock_rpa, mock_existing):
+        self.profiler.calculate_applicable_units_delta.side_effect = NotImplementedError()
+
+        merged = ApplicabilityRegenerationManager._merge_applicability(
+            'all-hash', self.profiles, 'repo-1', self.delta, self.profiler, 'config', 'conduit')
+
+        self.assertFalse(merged)
+        self.assertFalse(mock_rpa.get_collection.return_value.update.called)
+
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._merge_applicability',
+                return_value=True)
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._get_existing_repo_content_types',
+                return_value=['rpm'])
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._profiler')
+    @mock.patch(MODULE + 'UnitProfile')
+    @mock.patch(MODULE + 'RepoProfileApplicability')
+    def test_regenerate_applicability_merged(self, mock_rpa, mock_unit_profile, mock_profiler,
+                                             mock_types, mock_merge):
+        mock_profiler.return_value = (self.profiler, {})
+        self.profiler.metadata.return_value = {'types': ['rpm', 'erratum']}
+        mock_unit_profile.get_collection.return_value.find.return_value = [
+            {'id': 'profile-id', 'profile_hash': 'hash-1', 'content_type': 'rpm',
+             'profile': [{'name': 'zsh'}]}]
+
+        ApplicabilityRegenerationManager.regenerate_applicability(
+            'all-hash', [('hash-1', 'rpm', 'profile-id')], 'repo-1', delta=self.delta)
+
+        self.assertEqual(mock_merge.call_args[0][:5],
+                         ('all-hash', self.profiles, 'repo-1', self.delta, self.profiler))
+        self.assertFalse(self.profiler.calculate_applicable_units.called)
+        self.assertFalse(mock_rpa.get_collection.return_value.bulk_write.called)
+
+    @mock.patch(MODULE + 'ConsumerApplicabilityGroupManager')
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager.regenerate_applicability')
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._get_repo_delta')
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._get_consumer_profile_map')
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._get_repo_consumer_map')
+    @mock.patch(MODULE + 'model')
+    def test_regenerate_applicability_for_repos_since(self, mock_model, mock_repo_consumer_map,
+                                                      mock_consumer_profile_map, mock_delta,
+                                                      mock_regenerate, mock_groups):
+        mock_model.Repository.objects.find_by_criteria.return_value = [mock.Mock(repo_id='repo-1')]
+        mock_repo_consumer_map.return_value = {'repo-1': ['consumer-1', 'consumer-2']}
+        mock_consumer_profile_map.return_value = {
+            'consumer-1': {'all_profiles_hash': 'all-hash', 'profiles': self.profiles},
+            'consumer-2': {'all_profiles_hash': 'all-hash', 'profiles': self.profiles}}
+
+        ApplicabilityRegenerationManager.regenerate_applicability_for_repos(
+            Criteria().as_dict(), since='2016-01-01T02:00:00+02:00')
+
+        mock_delta.assert_called_once_with('repo-1', '2016-01-01T00:00:00Z')
+        mock_regenerate.assert_called_once_with(
+            'all-hash', self.profiles, 'repo-1', delta=mock_delta.return_value,
+            applicability_writes=[], applicability_cache=mock.ANY)
+        mock_groups.refresh.assert_called_once_with(set([('all-hash', 'repo-1')]))
+
+
+class TestBulkApplicabilityWrites(unittest.TestCase):
+    """
+    Tests for writing the applicability data of a batch of profiles at once.
+    """
+
+    MODULE = 'pulp.server.managers.consumer.applicability.'
+
+    @mock.patch(MODULE + 'ConsumerApplicabilityGroupManager')
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._get_existing_repo_content_types',
+                return_value=['rpm'])
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._profiler')
+    @mock.patch(MODULE + 'UnitProfile')
+    @mock.patch(MODULE + 'RepoProfileApplicability')
+    @mock.patch(MODULE + 'model')
+    def test_batch_regenerate_applicability(self, mock_model, mock_rpa, mock_unit_profile,
+                                            mock_profiler, mock_types, mock_groups):
+        mock_model.Repository.objects.return_value.scalar.return_value = []
+        profiler = mock.Mock()
+        profiler.metadata.return_value = {'types': ['rpm', 'erratum']}
+        profiler.calculate_applicable_units.return_value = {'erratum': ['errata-1']}
+        mock_profiler.return_value = (profiler, {})
+        mock_unit_profile.get_collection.return_value.find.return_value = [
+            {'id': 'p1', 'profile_hash': 'hash-1', 'content_type': 'rpm', 'profile': ['a']},
+            {'id': 'p2', 'profile_hash': 'hash-2', 'content_type': 'rpm', 'profile': ['b']}]
+
+        ApplicabilityRegenerationManager.batch_regenerate_applicability([
+            ('repo-1', 'all-hash-1', [('hash-1', 'rpm', 'p1')]),
+            ('repo-1', 'all-hash-2', [('hash-2', 'rpm', 'p2')]),
+            ('repo-2', 'all-hash-3', [('hash-3', 'rpm', 'p3')])])  # removed consumer
+
+        # The unit profiles are fetched once
+        mock_unit_profile.get_collection.return_value.find.assert_called_once_with(
+            {'id': {'$in': ['p1', 'p2', 'p3']}},
+            projection=['id', 'profile', 'content_type', 'profile_hash'])
+        self.assertEqual(
+            profiler.calculate_applicable_units.call_args_list,
+            [mock.call([('hash-1', 'rpm', ['a'])], 'repo-1', mock.ANY, mock.ANY),
+             mock.call([('hash-2', 'rpm', ['b'])], 'repo-1', mock.ANY, mock.ANY)])
+        # The results are written at once
+        bulk_write = mock_rpa.get_collection.return_value.bulk_write
+        self.assertEqual(bulk_write.call_count, 1)
+        writes, = bulk_write.call_args[0]
+        self.assertEqual(bulk_write.call_args[1], {'ordered': False})
+        self.assertEqual([w._filter for w in writes], [
+            {'repo_id': 'repo-1', 'all_profiles_hash': 'all-hash-1', 'profile_hash': 'hash-1'},
+            {'repo_id': 'repo-1', 'all_profiles_hash': 'all-hash-2', 'profile_hash': 'hash-2'}])
+        self.assertEqual(writes[0]._doc, {'$set': {'applicability': {'erratum': ['errata-1']}},
+                                          '$setOnInsert': {'profile': []}})
+        self.assertTrue(writes[0]._upsert)
+        # The consumer applicability groups are refreshed
+        self.assertEqual(list(mock_groups.refresh.call_args[0][0]), [
+            ('all-hash-1', 'repo-1'), ('all-hash-2', 'repo-1'), ('all-hash-3', 'repo-2')])
+
+    @mock.patch(MODULE + 'RepoProfileApplicability')
+    def test_write_applicability_threshold(self, mock_rpa):
+        writes = ['w1', 'w2']
+
+        ApplicabilityRegenerationManager._write_applicability(writes, 3)
+        self.assertFalse(mock_rpa.get_collection.return_value.bulk_write.called)
+
+        ApplicabilityRegenerationManager._write_applicability(writes, 2)
+        mock_rpa.get_collection.return_value.bulk_write.assert_called_once_with(
+            ['w1', 'w2'], ordered=False)
+        self.assertEqual(writes, [])
+
+    @mock.patch(MODULE + 'RepoProfileApplicability')
+    def test_write_applicability_duplicate_retried(self, mock_rpa):
+        bulk_write = mock_rpa.get_collection.return_value.bulk_write
+        bulk_write.side_effect = [
+            BulkWriteError({'writeErrors': [{'index': 1, 'code': 11000}]}), None]
+        writes = ['w1', 'w2', 'w3']
+
+        ApplicabilityRegenerationManager._write_applicability(writes)
+
+        self.assertEqual(bulk_write.call_args_list, [
+            mock.call(['w1', 'w2', 'w3'], ordered=False), mock.call(['w2'], ordered=False)])
+        self.assertEqual(writes, [])
+
+    @mock.patch(MODULE + 'RepoProfileApplicability')
+    def test_write_applicability_error(self, mock_rpa):
+        bulk_write = mock_rpa.get_collection.return_value.bulk_write
+        bulk_write.side_effect = BulkWriteError(
+            {'writeErrors': [{'index': 0, 'code': 11000}, {'index': 1, 'code': 2}]})
+
+        self.assertRaises(BulkWriteError, ApplicabilityRegenerationManager._write_applicability,
+                          ['w1', 'w2'])
+        self.assertEqual(bulk_write.call_count, 1)
+
+
+class TestApplicabilityCache(unittest.TestCase):
+    """
+    Tests for reusing applicability across repositories with identical content.
+    """
+
+    MODULE = 'pulp.server.managers.consumer.applicability.'
+
+    def setUp(self):
+        super(TestApplicabilityCache, self).setUp()
+        patcher = mock.patch(self.MODULE + 'model')
+        self.mock_model = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_model.Repository.objects.return_value.scalar.return_value = [
+            ('repo-1', 'fingerprint-1'), ('repo-2', 'fingerprint-2'),
+            ('repo-3', 'fingerprint-1'), ('repo-4', None)]
+
+    def test_sort_key(self):
+        cache = ApplicabilityCache(['repo-1', 'repo-2', 'repo-3', 'repo-4'])
+
+        self.mock_model.Repository.objects.assert_called_once_with(
+            repo_id__in=['repo-1', 'repo-2', 'repo-3', 'repo-4'])
+        self.assertEqual(sorted(['repo-1', 'repo-2', 'repo-3', 'repo-4'], key=cache.sort_key),
+                         ['repo-2', 'repo-4', 'repo-1', 'repo-3'])
+
+    def test_get(self):
+        cache = ApplicabilityCache(['repo-1', 'repo-2', 'repo-3', 'repo-4'])
+        cache.add('repo-1', 'all-hash', {'erratum': ['errata-1']})
+
+        self.assertEqual(cache.get('repo-3', 'all-hash'), {'erratum': ['errata-1']})
+        self.assertEqual(cache.get('repo-3', 'other-hash'), None)
+        self.assertEqual(cache.get('repo-2', 'all-hash'), None)
+
+    def test_add_not_shared(self):
+        cache = ApplicabilityCache(['repo-1', 'repo-2', 'repo-3', 'repo-4'])
+        cache.add('repo-2', 'all-hash', {'erratum': ['errata-1']})
+        cache.add('repo-4', 'all-hash', {'erratum': ['errata-1']})
+
+        self.assertEqual(cache._results, {})
+
+    def test_add_other_fingerprint(self):
+        self.mock_model.Repository.objects.return_value.scalar.return_value = [
+            ('repo-1', 'fingerprint-1'), ('repo-2', 'fingerprint-2'),
+            ('repo-3', 'fingerprint-1'), ('repo-4', 'fingerprint-2')]
+        cache = ApplicabilityCache(['repo-1', 'repo-2', 'repo-3', 'repo-4'])
+        cache.add('repo-1', 'all-hash', {'erratum': ['errata-1']})
+        cache.add('repo-2', 'all-hash', {'erratum': ['errata-2']})
+
+        self.assertEqual(cache.get('repo-3', 'all-hash'), None)
+        self.assertEqual(cache.get('repo-4', 'all-hash'), {'erratum': ['errata-2']})
+
+    @mock.patch(MODULE + 'ConsumerApplicabilityGroupManager')
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._get_existing_repo_content_types',
+                return_value=['rpm'])
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._profiler')
+    @mock.patch(MODULE + 'UnitProfile')
+    @mock.patch(MODULE + 'RepoProfileApplicability')
+    def test_batch_regenerate_applicability(self, mock_rpa, mock_unit_profile, mock_profiler,
+                                            mock_types, mock_groups):
+        profiler = mock.Mock()
+        profiler.metadata.return_value = {'types': ['rpm', 'erratum']}
+        profiler.calculate_applicable_units.return_value = {'erratum': ['errata-1']}
+        mock_profiler.return_value = (profiler, {})
+        mock_unit_profile.get_collection.return_value.find.return_value = [
+            {'id': 'p1', 'profile_hash': 'hash-1', 'content_type': 'rpm', 'profile': ['a']}]
+
+        ApplicabilityRegenerationManager.batch_regenerate_applicability([
+            ('repo-1', 'all-hash', [('hash-1', 'rpm', 'p1')]),
+            ('repo-2', 'all-hash', [('hash-1', 'rpm', 'p1')]),
+            ('repo-3', 'all-hash', [('hash-1', 'rpm', 'p1')])])
+
+        # repo-1 and repo-3 have the same content, so applicability is calculated once for them
+        self.assertEqual(
+            profiler.calculate_applicable_units.call_args_list,
+            [mock.call([('hash-1', 'rpm', ['a'])], 'repo-2', mock.ANY, mock.ANY),
+             mock.call([('hash-1', 'rpm', ['a'])], 'repo-1', mock.ANY, mock.ANY)])
+        writes, = mock_rpa.get_collection.return_value.bulk_write.call_args[0]
+        self.assertEqual([w._filter['repo_id'] for w in writes], ['repo-2', 'repo-1', 'repo-3'])
+        self.assertEqual(writes[2]._doc['$set'], {'applicability': {'erratum': ['errata-1']}})
+
+
+class TestConsumerApplicabilityGroupManager(unittest.TestCase):
+    """
+    Tests for maintaining the applicability materialized for groups of consumers.
+    """
+
+    MODULE = 'pulp.server.managers.consumer.applicability.'
+
+    def setUp(self):
+        super(TestConsumerApplicabilityGroupManager, self).setUp()
+        patcher = mock.patch(self.MODULE + 'ConsumerApplicabilityGroup')
+        self.collection = patcher.start().get_collection.return_value
+        self.addCleanup(patcher.stop)
+
+    def test_group_id(self):
+        group_id = ConsumerApplicabilityGroupManager.group_id('hash-1', ['repo-2', 'repo-1'])
+
+        self.assertEqual(
+            group_id, ConsumerApplicabilityGroupManager.group_id('hash-1', ['repo-1', 'repo-2']))
+        self.assertNotEqual(
+            group_id, ConsumerApplicabilityGroupManager.group_id('hash-2', ['repo-1', 'repo-2']))
+        self.assertNotEqual(
+            group_id, ConsumerApplicabilityGroupManager.group_id('hash-1', ['repo-1']))
+
+    @mock.patch(MODULE + 'ConsumerApplicabilityGroupManager._add_to_group')
+    @mock.patch(MODULE + '_add_repo_ids_to_consumer_map')
+    @mock.patch(MODULE + '_add_profiles_to_consumer_map_and_get_hashes')
+    def test_update_consumers(self, mock_add_profiles, mock_add_repo_ids, mock_add_to_group):
+        def add_profiles(consumer_ids, consumer_map):
+            for consumer_id in ('c1', 'c2', 'c3'):
+                consumer_map[consumer_id]['profiles'].append({'profile_hash': 'hash-1'})
+
+        def add_repo_ids(consumer_ids, consumer_map, include_deleted):
+            consumer_map['c1']['repo_ids'].extend(['repo-2', 'repo-1'])
+            consumer_map['c2']['repo_ids'].extend(['repo-1', 'repo-2'])
+            consumer_map['c4']['repo_ids'].append('repo-1')
+
+        mock_add_profiles.side_effect = add_profiles
+        mock_add_repo_ids.side_effect = add_repo_ids
+
+        ConsumerApplicabilityGroupManager.update_consumers(['c1', 'c2', 'c3', 'c4'])
+
+        group_id = ConsumerApplicabilityGroupManager.group_id('hash-1', ['repo-1', 'repo-2'])
+        # bindings waiting for the consumer to confirm the unbind are ignored
+        self.assertFalse(mock_add_repo_ids.call_args[1]['include_deleted'])
+        self.assertEqual(mock_add_to_group.call_count, 1)
+        args = mock_add_to_group.call_args[0]
+        self.assertEqual(args[:3], (group_id, 'hash-1', ['repo-1', 'repo-2']))
+        self.assertEqual(sorted(args[3]), ['c1', 'c2'])
+        self.assertEqual(self.collection.update_many.call_args_list, [
+            mock.call({'consumers': {'$in': args[3]}, 'group_id': {'$ne': group_id}},
+                      {'$pull': {'consumers': {'$in': args[3]}}}),
+            # c3 has no bindings and c4 has no profiles
+            mock.call({'consumers': {'$in': ['c3', 'c4']}},
+                      {'$pull': {'consumers': {'$in': ['c3', 'c4']}}})])
+        self.collection.delete_many.assert_called_with({'consumers': {'$size': 0}})
+
+    @mock.patch(MODULE + '_add_profiles_to_consumer_map_and_get_hashes')
+    def test_update_consumers_none(self, mock_add_profiles):
+        ConsumerApplicabilityGroupManager.update_consumers([])
+
+        self.assertFalse(mock_add_profiles.called)
+        self.assertFalse(self.collection.update_many.called)
+
+    def test_remove_consumers(self):
+        ConsumerApplicabilityGroupManager.remove_consumers(['c1'])
+
+        self.collection.update_many.assert_called_once_with(
+            {'consumers': {'$in': ['c1']}}, {'$pull': {'consumers': {'$in': ['c1']}}})
+        self.collection.delete_many.assert_called_once_with({'consumers': {'$size': 0}})
+
+    @mock.patch(MODULE + '_get_repo_profile_applicability')
+    def test_refresh(self, mock_get_applicability):
+        mock_get_applicability.side_effect = \
+            lambda h, r: {'erratum': [r]} if h == 'hash-1' else None
+
+        ConsumerApplicabilityGroupManager.refresh([('hash-1', 'repo-1'), ('hash-2', 'repo-1'),
+                                                   ('hash-1', 'repo-1')])
+
+        self.assertEqual(mock_get_applicability.call_count, 2)
+        self.assertEqual(sorted(self.collection.update_many.call_args_list), sorted([
+            mock.call({'all_profiles_hash': 'hash-1', 'repos.repo_id': 'repo-1'},
+                      {'$set': {'repos.$.applicability': {'erratum': ['repo-1']}}}),
+            # the stale applicability of hash-2 is dropped
+            mock.call({'all_profiles_hash': 'hash-2', 'repos.repo_id': 'repo-1'},
+                      {'$set': {'repos.$.applicability': None}})]))
+
+    def test_remove_repo(self):
+        ConsumerApplicabilityGroupManager.remove_repo('repo-1')
+
+        self.collection.update_many.assert_called_once_with(
+            {'repos.repo_id': 'repo-1'}, {'$pull': {'repos': {'repo_id': 'repo-1'}}})
+        self.collection.delete_many.assert_called_once_with({'repos': {'$size': 0}})
+
+    @mock.patch(MODULE + 'Bind')
+    def test_add_repo_ids_to_consumer_map(self, mock_bind):
+        find = mock_bind.get_collection.return_value.find
+        find.return_value = [{'consumer_id': 'c1', 'repo_id': 'repo-1'}]
+        consumer_map = {'c1': {'repo_ids': []}}
+
+        _add_repo_ids_to_consumer_map(['c1'], consumer_map)
+
+        find.assert_called_once_with({'consumer_id': {'$in': ['c1']}},
+                                     projection=['consumer_id', 'repo_id'])
+        self.assertEqual(consumer_map['c1']['repo_ids'], ['repo-1'])
+
+    @mock.patch(MODULE + 'Bind')
+    def test_add_repo_ids_to_consumer_map_not_deleted(self, mock_bind):
+        find = mock_bind.get_collection.return_value.find
+        find.return_value = []
+
+        _add_repo_ids_to_consumer_map(['c1'], {}, include_deleted=False)
+
+        find.assert_called_once_with({'consumer_id': {'$in': ['c1']}, 'deleted': False},
+                                     projection=['consumer_id', 'repo_id'])
+
+    @mock.patch(MODULE + '_get_repo_profile_applicability')
+    def test_add_to_group_created(self, mock_get_applicability):
+        mock_get_applicability.side_effect = \
+            lambda h, r: {'erratum': [r]} if r == 'repo-1' else None
+        self.collection.update_one.return_value.upserted_id = 'object-id'
+
+        ConsumerApplicabilityGroupManager._add_to_group(
+            'group-1', 'hash-1', ['repo-1', 'repo-2'], ['c1'])
+
+        self.assertEqual(self.collection.update_one.call_args_list, [
+            mock.call({'group_id': 'group-1'},
+                      {'$addToSet': {'consumers': {'$each': ['c1']}},
+                       '$setOnInsert': {'all_profiles_hash': 'hash-1',
+                                        'repos': [{'repo_id': 'repo-1', 'applicability': None},
+                                                  {'repo_id': 'repo-2', 'applicability': None}]}},
+                      upsert=True),
+            mock.call({'_id': 'object-id'},
+                      {'$set': {'repos': [
+                          {'repo_id': 'repo-1', 'applicability': {'erratum': ['repo-1']}},
+                          {'repo_id': 'repo-2', 'applicability': None}]}})])
+
+    @mock.patch(MODULE + '_get_repo_profile_applicability')
+    def test_add_to_group_existing(self, mock_get_applicability):
+        self.collection.update_one.return_value.upserted_id = None
+
+        ConsumerApplicabilityGroupManager._add_to_group('group-1', 'hash-1', ['repo-1'], ['c1'])
+
+        self.assertEqual(self.collection.update_one.call_count, 1)
+        self.assertFalse(mock_get_applicability.called)
+
+    def test_add_to_group_created_concurrently(self):
+        self.collection.update_one.side_effect = [DuplicateKeyError('duplicate'), None]
+
+        ConsumerApplicabilityGroupManager._add_to_group('group-1', 'hash-1', ['repo-1'], ['c1'])
+
+        self.assertEqual(self.collection.update_one.call_args, mock.call(
+            {'group_id': 'group-1'}, {'$addToSet': {'consumers': {'$each': ['c1']}}}))
+
+    @mock.patch(MODULE + 'ConsumerApplicabilityGroupManager')
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._get_consumer_profile_map',
+                return_value={})
+    @mock.patch(MODULE + 'ApplicabilityRegenerationManager._get_repo_consumer_map',
+                return_value={})
+    @mock.patch(MODULE + 'model')
+    @mock.patch(MODULE + 'managers')
+    def test_regenerate_applicability_for_consumers(self, mock_managers, mock_model,
+                                                    mock_repo_consumer_map,
+                                                    mock_consumer_profile_map, mock_groups):
+        mock_managers.consumer_query_manager.return_value.find_by_criteria.return_value = [
+            {'id': 'c1'}, {'id': 'c2'}]
+        mock_model.Repository.objects.return_value.scalar.return_value = []
+
+        ApplicabilityRegenerationManager.regenerate_applicability_for_consumers(
+            Criteria().as_dict())
+
+        mock_groups.refresh.assert_called_once_with(set())
+        mock_groups.update_consumers.assert_called_once_with(['c1', 'c2'])
+
+
+class TestConsumerApplicabilityReport(unittest.TestCase):
+    """
+    Tests for reading the applicability of consumers from their groups.
+    """
+
+    MODULE = 'pulp.server.managers.consumer.applicability.'
+
+    def setUp(self):
+        super(TestConsumerApplicabilityReport, self).setUp()
+        patcher = mock.patch(self.MODULE + 'ConsumerApplicabilityGroup')
+        self.collection = patcher.start().get_collection.return_value
+        self.addCleanup(patcher.stop)
+        self.id_1 = ObjectId()
+        self.id_2 = ObjectId()
+        self.groups = [
+            {'_id': self.id_1, 'consumers': ['c1', 'c2'],
+             'repos': [{'repo_id': 'repo-1',
+                        'applicability': {'erratum': ['errata-2', 'errata-1'], 'rpm': []}},
+                       {'repo_id': 'repo-2',
+                        'applicability': {'erratum': ['errata-1', 'errata-3']}},
+                       {'repo_id': 'repo-3', 'applicability': None}]},
+            {'_id': self.id_2, 'consumers': ['c3'],
+             'repos': [{'repo_id': 'repo-1', 'applicability': {'rpm': ['rpm-1']}}]}]
+        self.find = self.collection.find
+        self.find.return_value.sort.return_value = self.groups
+
+    def test_report(self):
+        report = ConsumerApplicabilityReport(Criteria())
+
+        self.assertEqual(list(report), [
+            {'consumers': ['c1', 'c2'],
+             'applicability': {'erratum': ['errata-1', 'errata-2', 'errata-3'], 'rpm': []}},
+            {'consumers': ['c3'], 'applicability': {'rpm': ['rpm-1']}}])
+        self.find.assert_called_once_with({})
+        self.find.return_value.sort.assert_called_once_with('_id', 1)
+        self.assertEqual(report.groups_read, 2)
+        self.assertEqual(report.group_token, str(self.id_2))
+
+    def test_report_content_types(self):
+        report = ConsumerApplicabilityReport(Criteria(), ['erratum'])
+
+        self.assertEqual(list(report), [
+            {'consumers': ['c1', 'c2'],
+             'applicability': {'erratum': ['errata-1', 'errata-2', 'errata-3']}}])
+        self.assertEqual(report.groups_read, 2)
+
+    def test_report_no_applicability(self):
+        self.groups[1]['repos'][0]['applicability'] = None
+
+        report = ConsumerApplicabilityReport(Criteria())
+
+        self.assertEqual([g['consumers'] for g in report], [['c1', 'c2']])
+
+    @mock.patch(MODULE + 'ConsumerQueryManager')
+    def test_report_criteria(self, mock_query):
+        mock_query.find_by_criteria.return_value = [{'id': 'c2'}, {'id': 'c4'}]
+        criteria = Criteria(filters={'notes.region': 'east'})
+
+        report = ConsumerApplicabilityReport(criteria)
+
+        self.assertEqual([g['consumers'] for g in report], [['c2']])
+        mock_query.find_by_criteria.assert_called_once_with(criteria)
+        self.assertEqual(criteria.fields, ['id'])
+        self.assertEqual(sorted(self.find.call_args[0][0]['consumers']['$in']), ['c2', 'c4'])
+
+    def test_report_page(self):
+        self.find.return_value.sort.return_value = mock.Mock()
+        limited = self.find.return_value.sort.return_value.limit
+        limited.return_value = self.groups[1:]
+
+        report = ConsumerApplicabilityReport(Criteria(), after=str(self.id_1), limit=1)
+
+        self.assertEqual([g['consumers'] for g in report], [['c3']])
+        self.find.assert_called_once_with({'_id': {'$gt': self.id_1}})
+        limited.assert_called_once_with(1)
+        self.assertEqual(report.group_token, str(self.id_2))
+
+    def test_report_invalid_after(self):
+        self.assertRaises(InvalidValue, ConsumerApplicabilityReport, Criteria(), after='invalid')
+        self.assertRaises(InvalidValue, ConsumerApplicabilityReport, Criteria(), after=1)
+
+
 class TestRepoProfileApplicabilityManager(base.PulpServerTests):
     """
     Test the RepoProfileApplicabilityManager.
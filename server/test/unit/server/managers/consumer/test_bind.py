@@ -78,6 +78,15 @@ class BindManagerTests(base.PulpServerTests):
         self.assertEqual(bind['notify_agent'], self.NOTIFY_AGENT)
         self.assertEqual(bind['binding_config'], self.BINDING_CONFIG)
 
+    @patch('pulp.server.managers.consumer.bind.ConsumerApplicabilityGroupManager')
+    def test_bind_applicability_groups(self, mock_groups, mock_repo_qs):
+        self.populate()
+        manager = factory.consumer_bind_manager()
+        manager.bind(self.CONSUMER_ID, self.REPO_ID, self.DISTRIBUTOR_ID,
+                     self.NOTIFY_AGENT, self.BINDING_CONFIG)
+        # Verify
+        mock_groups.update_consumers.assert_called_once_with([self.CONSUMER_ID])
+
     def test_bind_consumer_history(self, mock_repo_qs):
         self.populate()
         manager = factory.consumer_bind_manager()
@@ -125,6 +134,19 @@ class BindManagerTests(base.PulpServerTests):
         self.assertTrue(bind is not None)
         self.assertTrue(bind['deleted'])
 
+    @patch('pulp.server.managers.consumer.bind.ConsumerApplicabilityGroupManager')
+    def test_unbind_applicability_groups(self, mock_groups, mock_repo_qs):
+        # Setup
+        self.populate()
+        manager = factory.consumer_bind_manager()
+        manager.bind(self.CONSUMER_ID, self.REPO_ID, self.DISTRIBUTOR_ID,
+                     self.NOTIFY_AGENT, self.BINDING_CONFIG)
+        mock_groups.reset_mock()
+        # Test
+        manager.unbind(self.CONSUMER_ID, self.REPO_ID, self.DISTRIBUTOR_ID)
+        # Verify
+        mock_groups.update_consumers.assert_called_once_with([self.CONSUMER_ID])
+
     def test_unbind_consumer_history(self, mock_repo_qs):
         self.populate()
         manager = factory.consumer_bind_manager()
@@ -422,6 +444,18 @@ class BindManagerTests(base.PulpServerTests):
         manager.get_bind(self.EXTRA_CONSUMER_1, self.REPO_ID, self.DISTRIBUTOR_ID)
         manager.get_bind(self.EXTRA_CONSUMER_2, self.REPO_ID, self.DISTRIBUTOR_ID)
 
+    @patch('pulp.server.managers.consumer.bind.ConsumerApplicabilityGroupManager')
+    def test_delete_applicability_groups(self, mock_groups, mock_repo_qs):
+        self.populate()
+        manager = factory.consumer_bind_manager()
+        manager.bind(self.CONSUMER_ID, self.REPO_ID, self.DISTRIBUTOR_ID, self.NOTIFY_AGENT,
+                     self.BINDING_CONFIG)
+        mock_groups.reset_mock()
+
+        manager.delete(self.CONSUMER_ID, self.REPO_ID, self.DISTRIBUTOR_ID, force=True)
+
+        mock_groups.update_consumers.assert_called_once_with([self.CONSUMER_ID])
+
     def test_delete_but_not_marked_for_delete(self, mock_repo_qs):
         self.populate()
         manager = factory.consumer_bind_manager()
@@ -1,7 +1,8 @@
 from mock import patch
 
 from .... import base
-from pulp.server.db.model.consumer import Consumer, ConsumerHistoryEvent
+from pulp.server.db.model.consumer import (Consumer, ConsumerApplicabilityGroup,
+                                           ConsumerHistoryEvent)
 import pulp.server.managers.consumer.cud as consumer_manager
 import pulp.server.managers.consumer.history as history_manager
 import pulp.server.exceptions as exceptions
@@ -22,6 +23,7 @@ class ConsumerManagerTests(base.PulpServerTests):
         base.PulpServerTests.clean(self)
 
         Consumer.get_collection().remove()
+        ConsumerApplicabilityGroup.get_collection().remove()
 
     def test_registration(self):
         """
@@ -140,6 +142,28 @@ class ConsumerManagerTests(base.PulpServerTests):
         self.assertEqual(0, len(consumers))
         mock_unreg.assert_called_with(consumer_id)
 
+    @patch('pulp.server.managers.consumer.agent.AgentManager.unregister')
+    def test_unregister_consumer_applicability_group(self, mock_unreg):
+        """
+        Tests that unregistering a consumer removes it from its applicability group.
+        """
+
+        # Setup
+        self.manager.register('doomed')
+        self.manager.register('other')
+        collection = ConsumerApplicabilityGroup.get_collection()
+        collection.insert(ConsumerApplicabilityGroup('group-1', 'hash-1', ['doomed', 'other'], []))
+        collection.insert(ConsumerApplicabilityGroup('group-2', 'hash-2', ['doomed'], []))
+
+        # Test
+        self.manager.unregister('doomed')
+
+        # Verify
+        groups = list(collection.find())
+        self.assertEqual(1, len(groups))
+        self.assertEqual(groups[0]['group_id'], 'group-1')
+        self.assertEqual(groups[0]['consumers'], ['other'])
+
     def test_delete_consumer_no_consumer(self):
         """
         Tests that unregistering a consumer that doesn't exist raises the appropriate error.
@@ -15,7 +15,7 @@ from pulp.plugins.types.model import TypeDefinition
 from pulp.server import exceptions as pulp_exceptions
 from pulp.server.db.model.repository import RepoContentUnit
 from pulp.server.managers import factory as manager_factory
-from pulp.server.managers.content.orphan import OrphanManager
+from pulp.server.managers.content.orphan import OrphanManager, OrphanedFileRemover
 
 
 MODULE_PATH = 'pulp.server.managers.content.orphan.'
@@ -273,7 +273,7 @@ class OrphanManagerGeneratorTests(OrphanManagerTests):
         self.assertEqual(len(orphans), 0)
         self.assertEqual(self.number_of_files_in_content_root(), 0)
         mock_lazy_catalog_objects.assert_called_once_with(
-            unit_id=unit['_id'],
+            unit_id__in=[unit['_id']],
             unit_type_id=unit['_content_type_id']
         )
         mock_lazy_catalog_objects.return_value.delete.assert_called_once_with()
@@ -292,12 +292,15 @@ class OrphanManagerGeneratorTests(OrphanManagerTests):
         ]
         m_rcu_objects.return_value.distinct.return_value = ['non_orphan']
 
-        self.orphan_manager.delete_orphan_content_units_by_type('foo_type')
+        count = self.orphan_manager.delete_orphan_content_units_by_type('foo_type')
+        self.assertEqual(count, 1)
         mock_lazy_catalog_objects.assert_called_once_with(
-            unit_id='orphan',
+            unit_id__in=['orphan'],
             unit_type_id='foo_type'
         )
         mock_lazy_catalog_objects.return_value.delete.assert_called_once_with()
+        m_get_model.return_value.objects.assert_called_once_with(id__in=['orphan'])
+        m_get_model.return_value.objects.return_value.delete.assert_called_once_with()
         m_del_orphan.assert_called_once_with('test_foo_path')
 
     @patch(MODULE_PATH + 'plugin_api.get_unit_model_by_id')
@@ -309,6 +312,146 @@ class OrphanManagerGeneratorTests(OrphanManagerTests):
         mock_get_model.return_value.objects.assert_called_once_with(id__in=('orphan2',))
 
 
+class TestBatchedOrphans(TestCase):
+
+    @patch(MODULE_PATH + 'ORPHAN_BATCH_SIZE', 2)
+    @patch(MODULE_PATH + 'RepoContentUnit')
+    @patch(MODULE_PATH + 'content_types_db')
+    def test_generate_orphans_by_type(self, mock_types_db, mock_rcu):
+        units = [{'_id': 'u1'}, {'_id': 'u2'}, {'_id': 'u3'}]
+        find = mock_types_db.type_units_collection.return_value.find
+        find.return_value.batch_size.return_value = units
+        rcu_find = mock_rcu.get_collection.return_value.find
+        rcu_find.return_value.distinct.side_effect = [['u2'], []]
+
+        orphans = list(OrphanManager.generate_orphans_by_type('foo_type'))
+
+        self.assertEqual(orphans, [{'_id': 'u1'}, {'_id': 'u3'}])
+        find.assert_called_once_with({}, projection=['_id'])
+        # The associations are looked up once per batch
+        self.assertEqual(rcu_find.call_args_list, [
+            call({'unit_id': {'$in': ['u1', 'u2']}}), call({'unit_id': {'$in': ['u3']}})])
+
+    @patch(MODULE_PATH + 'RepoContentUnit')
+    @patch(MODULE_PATH + 'content_types_db')
+    def test_generate_orphans_by_type_filtered(self, mock_types_db, mock_rcu):
+        find = mock_types_db.type_units_collection.return_value.find
+        find.return_value = [{'_id': 'u1'}]
+        mock_rcu.get_collection.return_value.find.return_value.distinct.return_value = []
+
+        orphans = list(OrphanManager.generate_orphans_by_type(
+            'foo_type', content_unit_ids=['u1', 'u2']))
+
+        self.assertEqual(orphans, [{'_id': 'u1'}])
+        find.assert_called_once_with({'_id': {'$in': ('u1', 'u2')}}, projection=['_id'])
+
+    @patch(MODULE_PATH + 'OrphanedFileRemover')
+    @patch(MODULE_PATH + 'model.LazyCatalogEntry.objects')
+    @patch(MODULE_PATH + 'units_controller.get_unit_key_fields_for_type', return_value=('name',))
+    @patch(MODULE_PATH + 'plugin_api.get_unit_model_by_id', return_value=None)
+    @patch(MODULE_PATH + 'OrphanManager.generate_orphans_by_type')
+    @patch(MODULE_PATH + 'content_types_db')
+    def test_delete_orphans_by_type(self, mock_types_db, mock_generate, mock_get_model,
+                                    mock_key_fields, mock_lazy_objects, mock_remover):
+        mock_generate.return_value = iter([{'_id': 'u1', '_storage_path': '/a/u1'},
+                                           {'_id': 'u2'}])
+
+        count = OrphanManager.delete_orphans_by_type('foo_type', ['u1', 'u2'])
+
+        self.assertEqual(count, 2)
+        mock_generate.assert_called_once_with(
+            'foo_type', fields=('_id', '_storage_path', 'name'), content_unit_ids=['u1', 'u2'])
+        mock_lazy_objects.assert_called_once_with(unit_id__in=['u1', 'u2'],
+                                                  unit_type_id='foo_type')
+        mock_types_db.type_units_collection.return_value.remove.assert_called_once_with(
+            {'_id': {'$in': ['u1', 'u2']}})
+        mock_remover.return_value.__enter__.return_value.add.assert_called_once_with('/a/u1')
+
+    @patch(MODULE_PATH + 'model.LazyCatalogEntry.objects')
+    @patch(MODULE_PATH + 'OrphanManager.delete_orphaned_file')
+    @patch(MODULE_PATH + 'model.RepositoryContentUnit.objects')
+    @patch(MODULE_PATH + 'plugin_api.get_unit_model_by_id')
+    def test_delete_content_unit_by_type_dry_run(
+            self, m_get_model, m_rcu_objects, m_del_orphan, mock_lazy_catalog_objects):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        path = os.path.join(root, 'orphan')
+        with open(path, 'w') as fp:
+            fp.write('12345')
+        orphan = Mock(_storage_path=path, id='orphan')
+        non_orphan = Mock(_storage_path=path, id='non_orphan')
+        m_get_model.return_value.objects.only.return_value = [orphan, non_orphan]
+        m_rcu_objects.return_value.distinct.return_value = ['non_orphan']
+
+        result = OrphanManager.delete_orphan_content_units_by_type('foo_type', dry_run=True)
+
+        self.assertEqual(result, {'count': 1, 'size': 5})
+        self.assertFalse(mock_lazy_catalog_objects.called)
+        self.assertFalse(m_get_model.return_value.objects.called)
+        self.assertFalse(m_del_orphan.called)
+
+    @patch(MODULE_PATH + 'plugin_api.list_unit_models', return_value=['new_type'])
+    @patch(MODULE_PATH + 'OrphanManager.delete_orphan_content_units_by_type')
+    @patch(MODULE_PATH + 'OrphanManager.delete_orphans_by_type')
+    @patch(MODULE_PATH + 'content_types_db.all_type_ids', return_value=['old_type', 'empty'])
+    def test_delete_all_orphans_dry_run(self, mock_type_ids, mock_delete_by_type,
+                                        mock_delete_units_by_type, mock_unit_models):
+        mock_delete_by_type.side_effect = [{'count': 2, 'size': 10}, {'count': 0, 'size': 0}]
+        mock_delete_units_by_type.return_value = {'count': 1, 'size': 0}
+
+        result = OrphanManager.delete_all_orphans(dry_run=True)
+
+        self.assertEqual(result, {'old_type': {'count': 2, 'size': 10},
+                                  'new_type': {'count': 1, 'size': 0}})
+        mock_delete_by_type.assert_has_calls([call('old_type', dry_run=True),
+                                              call('empty', dry_run=True)])
+        mock_delete_units_by_type.assert_called_once_with('new_type', dry_run=True)
+
+    def test_orphans_size(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        path = os.path.join(root, 'file')
+        with open(path, 'w') as fp:
+            fp.write('123')
+        directory = os.path.join(root, 'dir', 'nested')
+        os.makedirs(directory)
+        with open(os.path.join(directory, 'file'), 'w') as fp:
+            fp.write('12345')
+        link = os.path.join(root, 'link')
+        os.symlink(os.path.join(root, 'dir'), link)
+
+        result = OrphanManager.orphans_size(
+            [path, os.path.join(root, 'dir'), os.path.join(root, 'missing'), None, link])
+
+        self.assertEqual(result, {'count': 5, 'size': 3 + 5 + os.lstat(link).st_size})
+
+
+class TestOrphanedFileRemover(TestCase):
+
+    @patch(MODULE_PATH + 'OrphanManager.delete_orphaned_file')
+    def test_remove(self, mock_delete):
+        paths = ['/a/%d/file-%d' % (i % 3, i) for i in range(20)]
+
+        with OrphanedFileRemover(workers=4) as remover:
+            for path in paths:
+                remover.add(path)
+
+        self.assertEqual(sorted(c[0][0] for c in mock_delete.call_args_list), sorted(paths))
+        self.assertFalse(any(thread.is_alive() for thread in remover.threads))
+
+    @patch(MODULE_PATH + '_logger')
+    @patch(MODULE_PATH + 'OrphanManager.delete_orphaned_file')
+    def test_error(self, mock_delete, mock_logger):
+        mock_delete.side_effect = [ValueError(), None]
+        remover = OrphanedFileRemover(workers=1)
+        remover.add('path-1')
+        remover.add('/path-2')
+
+        self.assertRaises(ValueError, remover.close)
+        self.assertEqual(mock_delete.call_count, 2)
+        self.assertEqual(mock_logger.exception.call_count, 1)
+
+
 class TestDelete(TestCase):
 
     @patch('shutil.rmtree')
@@ -599,6 +742,32 @@ class TestDeleteOrphanedFile(TestCase):
         OrphanManager.delete_orphaned_file(path)
         self.assertFalse(rmdir.called)
 
+    @patch('pulp.server.managers.content.orphan.os.access')
+    @patch('pulp.server.managers.content.orphan.os.listdir')
+    def test_clean_removed_concurrently(
+            self,
+            listdir,
+            access,
+            is_shared,
+            unlink_shared,
+            delete,
+            config,
+            rmdir,
+            lexists):
+        """
+        Ensure that directories removed by another thread end the cleanup.
+        """
+        listdir.side_effect = [[], OSError()]
+        access.return_value = True
+        path = '/storage/pulp/content/test/lvl1/lvl2/thing.remove'
+        storage_dir = '/storage/pulp'
+        is_shared.return_value = False
+        config.get.return_value = storage_dir
+        lexists.return_value = True
+
+        OrphanManager.delete_orphaned_file(path)
+        rmdir.assert_called_once_with('/storage/pulp/content/test/lvl1/lvl2')
+
     @patch('pulp.server.managers.content.orphan.os.access')
     @patch('pulp.server.managers.content.orphan.os.listdir')
     def test_clean_no_access(
@@ -1,4 +1,5 @@
 import errno
+import hashlib
 import os
 import shutil
 
@@ -87,6 +88,42 @@ class ContentUploadManagerTests(base.PulpServerTests):
 
         self.assertEqual(expected_size, found_size)
 
+    def test_save_data_out_of_order(self):
+        upload_id = self.upload_manager.initialize_upload()
+
+        self.upload_manager.save_data(upload_id, 4, 'efgh')
+        self.upload_manager.save_data(upload_id, 8, 'ij')
+        self.upload_manager.save_data(upload_id, 0, 'abcd')
+
+        self.assertEqual(self.upload_manager.read_upload(upload_id), 'abcdefghij')
+
+    def test_verify_upload(self):
+        upload_id = self.upload_manager.initialize_upload()
+        self.upload_manager.save_data(upload_id, 0, 'fus ro dah')
+
+        self.upload_manager.verify_upload(upload_id, 'sha256',
+                                          hashlib.sha256('fus ro dah').hexdigest().upper())
+
+    def test_verify_upload_mismatch(self):
+        upload_id = self.upload_manager.initialize_upload()
+        self.upload_manager.save_data(upload_id, 0, 'fus ro')
+
+        with self.assertRaises(PulpCodedException) as cm:
+            self.upload_manager.verify_upload(upload_id, 'sha256',
+                                              hashlib.sha256('fus ro dah').hexdigest())
+        self.assertEqual('PLP1013', cm.exception.error_code.code)
+
+    def test_verify_upload_unknown_checksum_type(self):
+        upload_id = self.upload_manager.initialize_upload()
+
+        with self.assertRaises(PulpCodedException) as cm:
+            self.upload_manager.verify_upload(upload_id, 'crc', 'abc')
+        self.assertEqual('PLP1005', cm.exception.error_code.code)
+
+    def test_verify_upload_missing(self):
+        self.assertRaises(MissingResource, self.upload_manager.verify_upload, 'foo', 'sha256',
+                          'abc')
+
     def test_save_no_init(self):
 
         # Test
@@ -242,6 +279,19 @@ class ContentUploadManagerTests(base.PulpServerTests):
         self.assertEqual(importer_return_report['summary'], cm.exception.error_data['summary'])
         self.assertEqual(importer_return_report['details'], cm.exception.error_data['details'])
 
+    @mock.patch('pulp.server.controllers.importer.model.Repository.objects')
+    def test_import_uploaded_unit_checksum_mismatch(self, mock_repo_qs):
+        importer_controller.set_importer('repo-u', 'mock-importer', {})
+        upload_id = self.upload_manager.initialize_upload()
+        self.upload_manager.save_data(upload_id, 0, 'fus ro')
+        mock_plugins.MOCK_IMPORTER.upload_unit.reset_mock()
+
+        with self.assertRaises(PulpCodedException) as cm:
+            self.upload_manager.import_uploaded_unit('repo-u', 'mock-type', {}, {}, upload_id,
+                                                     checksum_type='sha256', checksum='abc')
+        self.assertEqual('PLP1013', cm.exception.error_code.code)
+        self.assertFalse(mock_plugins.MOCK_IMPORTER.upload_unit.called)
+
     def test_upload_dir_auto_created(self):
         # Setup
 
@@ -2,7 +2,7 @@ import mock
 
 from .... import base
 from pulp.server.db.model.event import EventListener
-from pulp.server.event import data as event_data, notifiers
+from pulp.server.event import data as event_data, dispatch, notifiers
 from pulp.server.managers import factory as manager_factory
 
 
@@ -14,10 +14,16 @@ class EventFireManagerTests(base.PulpServerTests):
         self.manager = manager_factory.event_fire_manager()
         self.event_manager = manager_factory.event_listener_manager()
 
+        self.dispatcher = dispatch.Dispatcher(2, 100, 0, 0)
+        patcher = mock.patch.object(dispatch, 'get_dispatcher', return_value=self.dispatcher)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def tearDown(self):
         super(EventFireManagerTests, self).tearDown()
 
         EventListener.get_collection().remove()
+        dispatch.LISTENERS.invalidate()
         notifiers.reset()
 
     def test_do_fire(self):
@@ -41,6 +47,7 @@ class EventFireManagerTests(base.PulpServerTests):
         # Test
         event = event_data.Event(event_data.TYPE_REPO_SYNC_STARTED, 'payload')
         self.manager._do_fire(event)
+        self.dispatcher.join()
 
         # Verify
         self.assertEqual(1, notifier_1.fire.call_count)
@@ -66,6 +73,7 @@ class EventFireManagerTests(base.PulpServerTests):
         # Test
         event = event_data.Event(event_data.TYPE_REPO_SYNC_STARTED, 'payload')
         self.manager._do_fire(event)
+        self.dispatcher.join()
 
         # Verify
         self.assertEqual(1, notifier_1.fire.call_count)
@@ -88,6 +96,7 @@ class EventFireManagerTests(base.PulpServerTests):
         # Test
         event = event_data.Event(event_data.TYPE_REPO_SYNC_STARTED, 'payload')
         self.manager._do_fire(event)
+        self.dispatcher.join()
 
         # Verify
 
@@ -113,6 +122,7 @@ class EventFireManagerTests(base.PulpServerTests):
         # Test
         repo_id = 'test-repo'
         self.manager.fire_repo_sync_started(repo_id)
+        self.dispatcher.join()
 
         # Verify
         self.assertEqual(1, notifier.fire.call_count)
@@ -134,6 +144,7 @@ class EventFireManagerTests(base.PulpServerTests):
         # so make up a fake dict here to simulate that.
         result = {'repo_id': 'test-repo', 'result': 'success'}
         self.manager.fire_repo_sync_finished(result)
+        self.dispatcher.join()
 
         # Verify
         self.assertEqual(1, notifier.fire.call_count)
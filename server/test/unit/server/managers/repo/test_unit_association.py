@@ -58,6 +58,55 @@ class TestUnitsFromCriteria(unittest.TestCase):
                 break
         self.assertTrue(found)
 
+    @mock.patch('pulp.server.managers.repo.unit_association.units_controller.'
+                'get_model_serializer_for_type', return_value=None)
+    def test_yields_content_units_by_default(self, mock_get_serializer, mock_find):
+        criteria = UnitAssociationCriteria(type_ids=['foo'])
+
+        self.manager._units_from_criteria(self.repo, criteria)
+
+        self.assertTrue(mock_find.call_args[1]['yield_content_unit'])
+
+
+@mock.patch('pulp.server.managers.repo.unit_association.units_controller.'
+            'get_model_serializer_for_type', return_value=None)
+@mock.patch('pulp.server.managers.repo.unit_association.plugin_api.list_unit_models',
+            return_value=['foo'])
+@mock.patch('pulp.server.controllers.repository.find_repo_content_units', spec_set=True)
+class TestFindUnitsAfter(unittest.TestCase):
+    def setUp(self):
+        super(TestFindUnitsAfter, self).setUp()
+        self.repo = me_model.Repository(repo_id='repo1', content_unit_counts={'foo': 3})
+
+    def test_page(self, mock_find, mock_list_models, mock_get_serializer):
+        criteria = UnitAssociationCriteria(type_ids=['foo'], limit=5, skip=2)
+
+        ret = association_manager.RepoUnitAssociationManager.find_units_after(
+            self.repo, criteria, after='token')
+
+        self.assertTrue(ret is mock_find.return_value)
+        kwargs = mock_find.call_args[1]
+        self.assertEqual(kwargs['after'], 'token')
+        self.assertEqual(kwargs['limit'], 5)
+        self.assertEqual(kwargs['skip'], 2)
+        self.assertFalse(kwargs['yield_content_unit'])
+
+    def test_sort_not_supported(self, mock_find, mock_list_models, mock_get_serializer):
+        criteria = UnitAssociationCriteria(unit_sort=[('name', 1)])
+
+        self.assertRaises(exceptions.InvalidValue,
+                          association_manager.RepoUnitAssociationManager.find_units_after,
+                          self.repo, criteria)
+        self.assertFalse(mock_find.called)
+
+    def test_legacy_types_not_supported(self, mock_find, mock_list_models, mock_get_serializer):
+        self.repo.content_unit_counts['legacy'] = 1
+
+        self.assertRaises(exceptions.InvalidValue,
+                          association_manager.RepoUnitAssociationManager.find_units_after,
+                          self.repo, UnitAssociationCriteria())
+        self.assertFalse(mock_find.called)
+
 
 @mock.patch('pulp.server.managers.repo.unit_association.model.Repository')
 class RepoUnitAssociationManagerTests(base.PulpServerTests):
@@ -5,6 +5,7 @@ import mock
 from django.http import HttpResponseBadRequest
 
 from base import assert_auth_CREATE, assert_auth_DELETE, assert_auth_READ, assert_auth_UPDATE
+from pulp.server.db.model.criteria import Criteria
 from pulp.server.exceptions import (InvalidValue, MissingResource, MissingValue,
                                     OperationPostponed, UnsupportedValue)
 from pulp.server.managers.consumer import bind
@@ -417,7 +418,7 @@ class TestConsumerSearchView(unittest.TestCase):
         Ensure that the ConsumerSearchView has the correct class attributes.
         """
         self.assertEqual(ConsumerSearchView.response_builder,
-                         util.generate_json_response_with_pulp_encoder)
+                         util.generate_streaming_json_response_with_pulp_encoder)
         self.assertEqual(ConsumerSearchView.optional_bool_fields, ('details', 'bindings'))
         self.assertTrue(isinstance(ConsumerSearchView.manager, query.ConsumerQueryManager))
 
@@ -428,15 +429,35 @@ class TestConsumerSearchView(unittest.TestCase):
         Test that results are expanded and serialized.
         """
         query = mock.MagicMock()
-        search_method = mock.MagicMock()
+        search_method = mock.MagicMock(return_value=['consumer_1', 'consumer_2'])
         mock_expand.return_value = ['result_1', 'result_2']
         options = {'mock': 'options'}
 
         consumer_search = ConsumerSearchView()
         serialized_results = consumer_search.get_results(query, search_method, options)
-        mock_expand.assert_called_once_with(False, False, list(search_method.return_value))
+        self.assertEqual(list(serialized_results), mock_expand.return_value)
+        mock_expand.assert_called_once_with(False, False, ['consumer_1', 'consumer_2'])
         mock_add_link.assert_has_calls([mock.call('result_1'), mock.call('result_2')])
-        self.assertEqual(serialized_results, mock_expand.return_value)
+
+    @mock.patch('pulp.server.webservices.views.consumers.add_link')
+    @mock.patch('pulp.server.webservices.views.consumers.expand_consumers')
+    def test_get_results_lazy(self, mock_expand, mock_add_link):
+        """
+        Test that the consumers are read and expanded a page at a time as they are iterated.
+        """
+        consumers = iter(['consumer_1', 'consumer_2', 'consumer_3'])
+        search_method = mock.MagicMock(return_value=consumers)
+        mock_expand.side_effect = lambda details, bindings, page: page
+
+        with mock.patch.object(ConsumerSearchView, 'page_size', 2):
+            results = ConsumerSearchView.get_results({}, search_method, {'bindings': True})
+
+            self.assertFalse(mock_expand.called)
+            self.assertEqual(next(results), 'consumer_1')
+            self.assertEqual(list(consumers), ['consumer_3'])
+            self.assertEqual(list(results), ['consumer_2'])
+
+        mock_expand.assert_called_once_with(False, True, ['consumer_1', 'consumer_2'])
 
 
 class TestConsumerBindingSearchView(unittest.TestCase):
@@ -448,7 +469,7 @@ class TestConsumerBindingSearchView(unittest.TestCase):
         Ensure that the ConsumerBindingSearchView has the correct class attributes.
         """
         self.assertEqual(ConsumerBindingSearchView.response_builder,
-                         util.generate_json_response_with_pulp_encoder)
+                         util.generate_streaming_json_response_with_pulp_encoder)
         self.assertTrue(isinstance(ConsumerBindingSearchView.manager, bind.BindManager))
 
 
@@ -1074,7 +1095,7 @@ class TestConsumerProfileSearchView(unittest.TestCase):
         Ensure that the ConsumerProfileSearchView has the correct class attributes.
         """
         self.assertEqual(ConsumerProfileSearchView.response_builder,
-                         util.generate_json_response_with_pulp_encoder)
+                         util.generate_streaming_json_response_with_pulp_encoder)
         self.assertTrue(isinstance(ConsumerProfileSearchView.manager, profile.ProfileManager))
 
 
@@ -1170,29 +1191,98 @@ class TestConsumerQueryContentApplicabilityView(unittest.TestCase):
         self.assertTrue(isinstance(response, HttpResponseBadRequest))
         self.assertEqual(response.status_code, 400)
 
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    @mock.patch('pulp.server.webservices.views.consumers.'
+                'generate_streaming_json_response_with_pulp_encoder')
+    @mock.patch('pulp.server.webservices.views.consumers.ConsumerApplicabilityReport')
+    def test_query_consumer_content_applic(self, mock_report, mock_resp):
+        """
+        Test query consumer content applicability
+        """
+        request = mock.MagicMock()
+        request.body = json.dumps({'criteria': {'filters': {}}, 'content_types': ['type1']})
+        consumer_applic = ConsumerContentApplicabilityView()
+        response = consumer_applic.post(request)
+
+        criteria = mock_report.call_args[0][0]
+        self.assertTrue(isinstance(criteria, Criteria))
+        self.assertEqual(criteria.filters, {})
+        mock_report.assert_called_once_with(criteria, ['type1'])
+        mock_resp.assert_called_once_with(mock_report.return_value)
+        self.assertTrue(response is mock_resp.return_value)
+
     @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
                 new=assert_auth_READ())
     @mock.patch(
         'pulp.server.webservices.views.consumers.generate_json_response_with_pulp_encoder')
-    @mock.patch('pulp.server.webservices.views.consumers.retrieve_consumer_applicability')
-    @mock.patch('pulp.server.webservices.views.consumers.ConsumerContentApplicabilityView')
-    def test_query_consumer_content_applic(self, mock_criteria_types, mock_applic, mock_resp):
+    @mock.patch('pulp.server.webservices.views.consumers.ConsumerApplicabilityReport')
+    def test_query_consumer_content_applic_page(self, mock_report, mock_resp):
         """
-        Test query consumer content applicability
+        Test query consumer content applicability one page at a time
         """
         resp = [{'consumers': ['c1', 'c2'],
                  'applicability': {'content_type_1': ['unit_1', 'unit_3']}}]
-        mock_criteria_types._get_consumer_criteria.return_value = {'mock': 'some-criteria'}
-        mock_criteria_types._get_content_types.return_value = {'mock': 'some-content-types'}
-        mock_applic.return_value = resp
+        mock_report.return_value.__iter__.return_value = iter(resp)
+        mock_report.return_value.groups_read = 2
+        mock_report.return_value.group_token = 'token'
 
         request = mock.MagicMock()
-        request.body = json.dumps({'criteria': {'filters': {}}, 'content_types': ['type1']})
+        request.body = json.dumps({'criteria': {'filters': {}}, 'after': 'last', 'limit': 2})
         consumer_applic = ConsumerContentApplicabilityView()
         response = consumer_applic.post(request)
 
+        mock_report.assert_called_once_with(mock.ANY, None, after='last', limit=2)
         mock_resp.assert_called_once_with(resp)
         self.assertTrue(response is mock_resp.return_value)
+        response.__setitem__.assert_called_once_with(
+            ConsumerContentApplicabilityView.CONTINUATION_HEADER, 'token')
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    @mock.patch(
+        'pulp.server.webservices.views.consumers.generate_json_response_with_pulp_encoder')
+    @mock.patch('pulp.server.webservices.views.consumers.ConsumerApplicabilityReport')
+    def test_query_consumer_content_applic_last_page(self, mock_report, mock_resp):
+        """
+        Test that the last page of content applicability has no continuation token
+        """
+        mock_report.return_value.__iter__.return_value = iter([])
+        mock_report.return_value.groups_read = 0
+
+        request = mock.MagicMock()
+        request.body = json.dumps({'criteria': {'filters': {}}, 'after': ''})
+        consumer_applic = ConsumerContentApplicabilityView()
+        response = consumer_applic.post(request)
+
+        mock_report.assert_called_once_with(
+            mock.ANY, None, after='', limit=ConsumerContentApplicabilityView.DEFAULT_PAGE_SIZE)
+        self.assertEqual(response.__setitem__.call_count, 0)
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    def test_query_consumer_content_applic_invalid_limit(self):
+        """
+        Test query consumer content applicability with an invalid page size
+        """
+        for limit in (0, 'ten', True):
+            request = mock.MagicMock()
+            request.body = json.dumps({'criteria': {}, 'after': '', 'limit': limit})
+            consumer_applic = ConsumerContentApplicabilityView()
+            response = consumer_applic.post(request)
+            self.assertEqual(response.status_code, 400)
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    def test_query_consumer_content_applic_invalid_after(self):
+        """
+        Test query consumer content applicability with an invalid continuation token
+        """
+        request = mock.MagicMock()
+        request.body = json.dumps({'criteria': {}, 'after': 'not-a-token'})
+        consumer_applic = ConsumerContentApplicabilityView()
+        response = consumer_applic.post(request)
+        self.assertTrue(isinstance(response, HttpResponseBadRequest))
 
     def test_get_consumer_criteria_no_criteria(self):
         """
@@ -83,6 +83,22 @@ class TestOrphanCollectionView(unittest.TestCase):
             tags=['pulp:content_unit:orphans']
         )
 
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_DELETE())
+    @mock.patch('pulp.server.webservices.views.content.content_orphan')
+    def test_delete_orphan_collection_view_dry_run(self, mock_orphan_manager):
+        """
+        Delete orphan collection view should pass dry_run to the delete all orphans function.
+        """
+        request = mock.MagicMock()
+        request.GET = {'dry_run': 'True'}
+        orphan_collection = OrphanCollectionView()
+        self.assertRaises(OperationPostponed, orphan_collection.delete, request)
+
+        mock_orphan_manager.delete_all_orphans.apply_async.assert_called_once_with(
+            kwargs={'dry_run': True}, tags=['pulp:content_unit:orphans']
+        )
+
 
 class TestOrphanTypeSubCollectionView(unittest.TestCase):
     """
@@ -327,8 +343,8 @@ class TestContentUnitSearch(unittest.TestCase):
         content_search = ContentUnitSearch()
         mock_query = mock.MagicMock()
         mock_search = mock.MagicMock(return_value=['result_1', 'result_2'])
-        serialized_results = content_search.get_results(mock_query, mock_search, {},
-                                                        type_id='mock_type')
+        serialized_results = list(content_search.get_results(mock_query, mock_search, {},
+                                                             type_id='mock_type'))
         mock_process.assert_has_calls([mock.call('result_1', 'mock_type'),
                                        mock.call('result_2', 'mock_type')])
         self.assertEqual(serialized_results, [mock_process.return_value, mock_process.return_value])
@@ -343,9 +359,9 @@ class TestContentUnitSearch(unittest.TestCase):
         content_search = ContentUnitSearch()
         mock_query = mock.MagicMock()
         mock_search = mock.MagicMock(return_value=['result_1', 'result_2'])
-        serialized_results = content_search.get_results(
+        serialized_results = list(content_search.get_results(
             mock_query, mock_search, {'include_repos': True}, type_id='mock_type'
-        )
+        ))
         mock_process.assert_has_calls([mock.call('result_1', 'mock_type'),
                                        mock.call('result_2', 'mock_type')])
         self.assertEqual(serialized_results, [mock_process.return_value, mock_process.return_value])
@@ -362,9 +378,9 @@ class TestContentUnitSearch(unittest.TestCase):
         content_search = ContentUnitSearch()
         mock_query = {}
         mock_search = mock.MagicMock(return_value=['result_1', 'result_2'])
-        serialized_results = content_search.get_results(
+        serialized_results = list(content_search.get_results(
             mock_query, mock_search, {'include_repos': True}, type_id='mock_type'
-        )
+        ))
         self.assertEqual(m_serializer.translate_filters.call_count, 0)
         mock_process.assert_has_calls([mock.call('result_1', 'mock_type'),
                                        mock.call('result_2', 'mock_type')])
@@ -382,9 +398,9 @@ class TestContentUnitSearch(unittest.TestCase):
         content_search = ContentUnitSearch()
         mock_query = {'filters': {'mock': 'filters'}}
         mock_search = mock.MagicMock(return_value=['result_1', 'result_2'])
-        serialized_results = content_search.get_results(
+        serialized_results = list(content_search.get_results(
             mock_query, mock_search, {'include_repos': True}, type_id='mock_type'
-        )
+        ))
         m_serial.translate_filters.assert_called_once_with(m_serial.model, {'mock': 'filters'})
         self.assertEqual(m_serial.translate_filters.call_count, 1)
         mock_process.assert_has_calls([mock.call('result_1', 'mock_type'),
@@ -647,20 +647,44 @@ class TestRepoSearch(unittest.TestCase):
         self.assertEqual(repo_search.model, model.Repository)
         self.assertEqual(repo_search.optional_bool_fields, ('details', 'importers', 'distributors'))
         self.assertEqual(repo_search.response_builder,
-                         util.generate_json_response_with_pulp_encoder)
+                         util.generate_streaming_json_response_with_pulp_encoder)
 
     @mock.patch('pulp.server.webservices.views.repositories._process_repos')
     def test_get_results(self, mock_process):
         """
         Test that optional arguments and the data are properly passed to _process_repos.
         """
-        mock_search = mock.MagicMock(return_value=[])
-        mock_query = mock.MagicMock()
+        mock_search = mock.MagicMock(return_value=['repo'])
+        mock_query = {}
+        mock_process.return_value = ['processed']
         options = {'details': 'mock_deets', 'importers': 'mock_imp', 'distributors': 'mock_dist'}
         repo_search = RepoSearch()
         content = repo_search.get_results(mock_query, mock_search, options)
-        self.assertEqual(content, mock_process.return_value)
-        mock_process.assert_called_once_with([], 'mock_deets', 'mock_imp', 'mock_dist')
+        self.assertEqual(list(content), ['processed'])
+        mock_process.assert_called_once_with(['repo'], 'mock_deets', 'mock_imp', 'mock_dist')
+
+    @mock.patch('pulp.server.webservices.views.repositories.search._trim_results')
+    @mock.patch('pulp.server.webservices.views.repositories._process_repos')
+    def test_get_results_lazy(self, mock_process, mock_trim):
+        """
+        Test that the repositories are read and processed a page at a time as they are iterated.
+        """
+        repos = iter(['repo_1', 'repo_2', 'repo_3'])
+        mock_search = mock.MagicMock(return_value=repos)
+        mock_process.side_effect = lambda page, *args: list(page)
+        query = {'fields': ['id']}
+
+        with mock.patch.object(RepoSearch, 'page_size', 2):
+            content = RepoSearch.get_results(query, mock_search, {})
+
+            self.assertFalse(mock_process.called)
+            self.assertEqual(next(content), 'repo_1')
+            self.assertEqual(list(repos), ['repo_3'])
+            self.assertEqual(list(content), ['repo_2'])
+
+        mock_process.assert_called_once_with(['repo_1', 'repo_2'], False, False, False)
+        mock_trim.assert_called_once_with(
+            model.Repository, ['repo_1', 'repo_2'], ['id', 'importers', 'distributors'])
 
 
 class TestRepoUnitSearch(unittest.TestCase):
@@ -669,7 +693,8 @@ class TestRepoUnitSearch(unittest.TestCase):
     """
 
     @mock.patch(
-        'pulp.server.webservices.views.repositories.generate_json_response_with_pulp_encoder')
+        'pulp.server.webservices.views.repositories.'
+        'generate_streaming_json_response_with_pulp_encoder')
     @mock.patch('pulp.server.webservices.views.repositories.manager_factory.'
                 'repo_unit_association_query_manager')
     @mock.patch('pulp.server.webservices.views.repositories.UnitAssociationCriteria')
@@ -685,11 +710,12 @@ class TestRepoUnitSearch(unittest.TestCase):
         repo_unit_search._generate_response('mock_q', {}, repo_id='mock_repo')
         mock_crit.from_client_input.assert_called_once_with('mock_q')
         mock_uqm().get_units_by_type.assert_called_once_with('mock_repo', 'one_type',
-                                                             criteria=criteria)
-        mock_resp.assert_called_once_with(mock_uqm().get_units_by_type.return_value)
+                                                             criteria=criteria, as_generator=True)
+        self.assertEqual(mock_resp.call_count, 1)
 
     @mock.patch(
-        'pulp.server.webservices.views.repositories.generate_json_response_with_pulp_encoder')
+        'pulp.server.webservices.views.repositories.'
+        'generate_streaming_json_response_with_pulp_encoder')
     @mock.patch('pulp.server.webservices.views.repositories.manager_factory.'
                 'repo_unit_association_query_manager')
     @mock.patch('pulp.server.webservices.views.repositories.UnitAssociationCriteria')
@@ -704,8 +730,91 @@ class TestRepoUnitSearch(unittest.TestCase):
         repo_unit_search = RepoUnitSearch()
         repo_unit_search._generate_response('mock_q', {}, repo_id='mock_repo')
         mock_crit.from_client_input.assert_called_once_with('mock_q')
-        mock_uqm().get_units.assert_called_once_with('mock_repo', criteria=criteria)
-        mock_resp.assert_called_once_with(mock_uqm().get_units.return_value)
+        mock_uqm().get_units.assert_called_once_with('mock_repo', criteria=criteria,
+                                                     as_generator=True)
+        self.assertEqual(mock_resp.call_count, 1)
+
+    @mock.patch('pulp.server.webservices.views.repositories.content')
+    @mock.patch(
+        'pulp.server.webservices.views.repositories.'
+        'generate_streaming_json_response_with_pulp_encoder')
+    @mock.patch('pulp.server.webservices.views.repositories.manager_factory.'
+                'repo_unit_association_query_manager')
+    @mock.patch('pulp.server.webservices.views.repositories.UnitAssociationCriteria')
+    @mock.patch('pulp.server.webservices.views.repositories.model.Repository.objects')
+    def test__generate_response_lazy(self, mock_repo_qs, mock_crit, mock_uqm, mock_resp,
+                                     mock_content):
+        """
+        Test that the units are serialized as the response iterates them.
+        """
+        criteria = mock_crit.from_client_input.return_value
+        criteria.type_ids = None
+        units = [{'metadata': 'unit_1'}, {'metadata': 'unit_2'}]
+        mock_uqm().get_units.return_value = iter(units)
+
+        RepoUnitSearch._generate_response('mock_q', {}, repo_id='mock_repo')
+
+        self.assertFalse(mock_content.serialize_unit_with_serializer.called)
+        streamed = mock_resp.call_args[0][0]
+        self.assertEqual(list(streamed), units)
+        mock_content.serialize_unit_with_serializer.assert_has_calls(
+            [mock.call('unit_1'), mock.call('unit_2')])
+
+    @mock.patch('pulp.server.webservices.views.repositories.content')
+    @mock.patch(
+        'pulp.server.webservices.views.repositories.generate_json_response_with_pulp_encoder')
+    @mock.patch('pulp.server.webservices.views.repositories.manager_factory.'
+                'repo_unit_association_manager')
+    @mock.patch('pulp.server.webservices.views.repositories.UnitAssociationCriteria')
+    @mock.patch('pulp.server.webservices.views.repositories.model.Repository.objects')
+    def test__generate_response_page(self, mock_repo_qs, mock_crit, mock_uam, mock_resp,
+                                     mock_content):
+        """
+        Test that a full page is returned with the continuation token of the next page.
+        """
+        repo = mock_repo_qs.get_repo_or_missing_resource.return_value
+        criteria = mock_crit.from_client_input.return_value
+        criteria.limit = 1
+        association = mock.MagicMock(unit_type_id='rpm', unit_id='a')
+        association.to_mongo.return_value.to_dict.return_value = {'unit_id': 'a'}
+        association.unit.to_mongo.return_value.to_dict.return_value = {'_id': 'a'}
+        mock_uam.return_value.find_units_after.return_value = [association]
+        mock_resp.return_value = {}
+
+        response = RepoUnitSearch._generate_response('mock_q', {'after': 'token'},
+                                                     repo_id='mock_repo')
+
+        mock_uam.return_value.find_units_after.assert_called_once_with(repo, criteria,
+                                                                       after='token')
+        mock_content.serialize_unit_with_serializer.assert_called_once_with({'_id': 'a'})
+        mock_resp.assert_called_once_with([{'unit_id': 'a', 'metadata': {'_id': 'a'}}])
+        self.assertEqual(response[RepoUnitSearch.CONTINUATION_HEADER],
+                         repo_controller.get_unit_continuation_token('rpm', 'a'))
+
+    @mock.patch(
+        'pulp.server.webservices.views.repositories.generate_json_response_with_pulp_encoder')
+    @mock.patch('pulp.server.webservices.views.repositories.manager_factory.'
+                'repo_unit_association_manager')
+    @mock.patch('pulp.server.webservices.views.repositories.UnitAssociationCriteria')
+    @mock.patch('pulp.server.webservices.views.repositories.model.Repository.objects')
+    def test__generate_response_last_page(self, mock_repo_qs, mock_crit, mock_uam, mock_resp):
+        """
+        Test that the first page is requested with an empty token and the default page size, and
+        that no continuation token is returned once the units are exhausted.
+        """
+        repo = mock_repo_qs.get_repo_or_missing_resource.return_value
+        criteria = mock_crit.from_client_input.return_value
+        criteria.limit = None
+        mock_uam.return_value.find_units_after.return_value = []
+        mock_resp.return_value = {}
+
+        response = RepoUnitSearch._generate_response('mock_q', {'after': ''},
+                                                     repo_id='mock_repo')
+
+        mock_uam.return_value.find_units_after.assert_called_once_with(repo, criteria,
+                                                                       after=None)
+        self.assertEqual(criteria.limit, RepoUnitSearch.DEFAULT_PAGE_SIZE)
+        self.assertEqual(response, {})
 
 
 class TestRepoImportersView(unittest.TestCase):
@@ -1137,7 +1246,7 @@ class TestRepoDistributorsSearchView(unittest.TestCase):
         self.assertTrue(isinstance(view, search.SearchView))
         self.assertTrue(RepoDistributorsSearchView.model is model.Distributor)
         self.assertEqual(RepoDistributorsSearchView.response_builder,
-                         util.generate_json_response_with_pulp_encoder)
+                         util.generate_streaming_json_response_with_pulp_encoder)
 
 
 @mock.patch('pulp.server.webservices.views.repositories.generate_json_response_with_pulp_encoder')
@@ -1469,6 +1578,51 @@ class TestContentApplicabilityRegenerationView(unittest.TestCase):
 
         self.assertEqual(response.http_status_code, 400)
 
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth', new=assert_auth_CREATE())
+    @mock.patch('pulp.server.webservices.views.repositories.regenerate_applicability_for_repos')
+    @mock.patch('pulp.server.webservices.views.repositories.tags')
+    @mock.patch('pulp.server.webservices.views.repositories.Criteria.from_client_input')
+    def test_post_with_since(self, mock_crit, mock_tags, mock_regen):
+        """
+        Test incremental regeneration of content applicability.
+        """
+        mock_request = mock.MagicMock()
+        mock_request.body = json.dumps({'repo_criteria': {}, 'since': '2016-01-01T00:00:00Z'})
+        mock_regen.apply_async_with_reservation.return_value = 'task'
+        content_app_regen = ContentApplicabilityRegenerationView()
+        try:
+            content_app_regen.post(mock_request)
+        except exceptions.OperationPostponed, response:
+            pass
+        else:
+            raise AssertionError('OperationPostponed should be raised for a regeneration task')
+
+        self.assertEqual(response.http_status_code, 202)
+        mock_regen.apply_async_with_reservation.assert_called_once_with(
+            mock_tags.RESOURCE_REPOSITORY_PROFILE_APPLICABILITY_TYPE, mock_tags.RESOURCE_ANY_ID,
+            (mock_crit.return_value.as_dict(), '2016-01-01T00:00:00Z'),
+            tags=[mock_tags.action_tag.return_value])
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth', new=assert_auth_CREATE())
+    @mock.patch('pulp.server.webservices.views.repositories.regenerate_applicability_for_repos')
+    @mock.patch('pulp.server.webservices.views.repositories.Criteria.from_client_input')
+    def test_post_with_invalid_since(self, mock_crit, mock_regen):
+        """
+        Test regenerate content applicability with a since that is not an ISO8601 datetime.
+        """
+        mock_request = mock.MagicMock()
+        mock_request.body = json.dumps({'repo_criteria': {}, 'since': 'yesterday'})
+        content_app_regen = ContentApplicabilityRegenerationView()
+        try:
+            content_app_regen.post(mock_request)
+        except exceptions.InvalidValue, response:
+            pass
+        else:
+            raise AssertionError('InvalidValue should be raised if since is not valid')
+
+        self.assertEqual(response.http_status_code, 400)
+        self.assertFalse(mock_regen.apply_async_with_reservation.called)
+
 
 class TestHistoryView(unittest.TestCase):
     """
@@ -1995,10 +2149,45 @@ class TestRepoImportUpload(unittest.TestCase):
         mock_import.apply_async_with_reservation.assert_called_once_with(
             mock_tags.RESOURCE_REPOSITORY_TYPE, 'mock_repo',
             ['mock_repo', 'mock_type', 'mock_key', None, 'mock_id', None],
-            tags=task_tags
+            kwargs={'checksum_type': None, 'checksum': None}, tags=task_tags
         )
         self.assertEqual(response.http_status_code, 202)
 
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_UPDATE())
+    @mock.patch('pulp.server.webservices.views.repositories.tags')
+    @mock.patch('pulp.server.webservices.views.repositories.import_uploaded_unit')
+    def test_post_checksum(self, mock_import, mock_tags):
+        """
+        Test that the checksum calculated by the client is passed to the task.
+        """
+        mock_request = mock.MagicMock()
+        mock_request.body = json.dumps({'upload_id': 'mock_id', 'unit_type_id': 'mock_type',
+                                        'unit_key': 'mock_key', 'checksum_type': 'sha256',
+                                        'checksum': 'abc'})
+        repo_import = RepoImportUpload()
+
+        self.assertRaises(exceptions.OperationPostponed, repo_import.post, mock_request,
+                          'mock_repo')
+
+        call_kwargs = mock_import.apply_async_with_reservation.call_args[1]
+        self.assertEqual(call_kwargs['kwargs'], {'checksum_type': 'sha256', 'checksum': 'abc'})
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_UPDATE())
+    @mock.patch('pulp.server.webservices.views.repositories.import_uploaded_unit')
+    def test_post_checksum_missing_type(self, mock_import):
+        """
+        Test that a checksum without a checksum type is rejected.
+        """
+        mock_request = mock.MagicMock()
+        mock_request.body = json.dumps({'upload_id': 'mock_id', 'unit_type_id': 'mock_type',
+                                        'unit_key': 'mock_key', 'checksum': 'abc'})
+        repo_import = RepoImportUpload()
+
+        self.assertRaises(exceptions.MissingValue, repo_import.post, mock_request, 'mock_repo')
+        self.assertFalse(mock_import.apply_async_with_reservation.called)
+
     @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
                 new=assert_auth_UPDATE())
     def test_post_missing_required_params(self):
@@ -35,8 +35,8 @@ class TestSearchView(unittest.TestCase):
                                side_effect=FakeSearchView._generate_response) as _generate_response:
             results = view.get(request)
 
-        self.assertEqual(type(results), http.HttpResponse)
-        self.assertEqual(results.content, '["big money", "bigger money"]')
+        self.assertEqual(type(results), http.StreamingHttpResponse)
+        self.assertEqual(''.join(results.streaming_content), '["big money", "bigger money"]')
         self.assertEqual(results.status_code, 200)
 
         _generate_response.assert_called_once_with({}, {})
@@ -82,8 +82,8 @@ class TestSearchView(unittest.TestCase):
                                side_effect=FakeSearchView._generate_response) as _generate_response:
             results = view.get(request)
 
-        self.assertEqual(type(results), http.HttpResponse)
-        self.assertEqual(results.content, '["big money", "bigger money"]')
+        self.assertEqual(type(results), http.StreamingHttpResponse)
+        self.assertEqual(''.join(results.streaming_content), '["big money", "bigger money"]')
         self.assertEqual(results.status_code, 200)
         _generate_response.assert_called_once_with({'filters': {"name": "admin"}}, {})
         from_client_input.assert_called_once_with({'filters': {"name": "admin"}})
@@ -115,14 +115,15 @@ class TestSearchView(unittest.TestCase):
         request.GET = http.QueryDict('field=name&field=id&filters={"name":"admin"}')
         from_client_input.return_value = {}
         view = FakeSearchView()
+        view.model.objects.find_by_criteria.return_value = ['content']
         view.model.SERIALIZER.return_value.data = [{'serialized': 'content'}]
 
         with mock.patch.object(FakeSearchView, '_generate_response',
                                side_effect=FakeSearchView._generate_response) as _generate_response:
             results = view.get(request)
 
-        self.assertEqual(type(results), http.HttpResponse)
-        self.assertEqual(results.content, '[{"serialized": "content"}]')
+        self.assertEqual(type(results), http.StreamingHttpResponse)
+        self.assertEqual(''.join(results.streaming_content), '[{"serialized": "content"}]')
         self.assertEqual(results.status_code, 200)
 
         _generate_response.assert_called_once_with(
@@ -149,8 +150,8 @@ class TestSearchView(unittest.TestCase):
                                side_effect=FakeSearchView._generate_response) as _generate_response:
             results = view.post(request)
 
-        self.assertEqual(type(results), http.HttpResponse)
-        self.assertEqual(results.content, '["big money", "bigger money"]')
+        self.assertEqual(type(results), http.StreamingHttpResponse)
+        self.assertEqual(''.join(results.streaming_content), '["big money", "bigger money"]')
         self.assertEqual(results.status_code, 200)
         _generate_response.assert_called_once_with({'filters': {'money': {'$gt': 1000000}}}, {})
 
@@ -184,8 +185,8 @@ class TestSearchView(unittest.TestCase):
 
         results = FakeSearchView._generate_response(query, {})
 
-        self.assertEqual(type(results), http.HttpResponse)
-        self.assertEqual(results.content, '["big money", "bigger money"]')
+        self.assertEqual(type(results), http.StreamingHttpResponse)
+        self.assertEqual(''.join(results.streaming_content), '["big money", "bigger money"]')
         self.assertEqual(results.status_code, 200)
         self.assertEqual(
             FakeSearchView.model.objects.find_by_criteria.mock_calls[0][1][0]['fields'], None)
@@ -215,7 +216,9 @@ class TestSearchView(unittest.TestCase):
         self.assertEqual(
             FakeSearchView.model.objects.find_by_criteria.mock_calls[0][1][0]['filters'],
             {'money': {'$gt': 1000000}})
-        FakeSearchView.response_builder.assert_called_once_with(['big money', 'bigger money'])
+        self.assertEqual(FakeSearchView.response_builder.call_count, 1)
+        self.assertEqual(list(FakeSearchView.response_builder.call_args[0][0]),
+                         ['big money', 'bigger money'])
 
     def test__generate_response_with_dumb_model(self):
         """
@@ -230,8 +233,8 @@ class TestSearchView(unittest.TestCase):
 
         results = FakeSearchView._generate_response(query, {})
 
-        self.assertEqual(type(results), http.HttpResponse)
-        self.assertEqual(results.content, '["big money", "bigger money"]')
+        self.assertEqual(type(results), http.StreamingHttpResponse)
+        self.assertEqual(''.join(results.streaming_content), '["big money", "bigger money"]')
         self.assertEqual(results.status_code, 200)
         self.assertEqual(
             FakeSearchView.manager.find_by_criteria.mock_calls[0][1][0]['fields'], None)
@@ -253,8 +256,8 @@ class TestSearchView(unittest.TestCase):
 
         results = FakeSearchView._generate_response(query, {})
 
-        self.assertEqual(type(results), http.HttpResponse)
-        self.assertEqual(results.content, '["big money", "bigger money"]')
+        self.assertEqual(type(results), http.StreamingHttpResponse)
+        self.assertEqual(''.join(results.streaming_content), '["big money", "bigger money"]')
         self.assertEqual(results.status_code, 200)
         self.assertEqual(
             FakeSearchView.model.objects.find_by_criteria.mock_calls[0][1][0]['fields'],
@@ -277,8 +280,8 @@ class TestSearchView(unittest.TestCase):
 
         results = FakeSearchView._generate_response(query, {})
 
-        self.assertEqual(type(results), http.HttpResponse)
-        self.assertEqual(results.content, '["big money", "bigger money"]')
+        self.assertEqual(type(results), http.StreamingHttpResponse)
+        self.assertEqual(''.join(results.streaming_content), '["big money", "bigger money"]')
         self.assertEqual(results.status_code, 200)
         self.assertEqual(
             FakeSearchView.model.objects.find_by_criteria.mock_calls[0][1][0]['fields'], ['cash'])
@@ -300,8 +303,8 @@ class TestSearchView(unittest.TestCase):
 
         results = FakeSearchView._generate_response(query, {})
 
-        self.assertEqual(type(results), http.HttpResponse)
-        self.assertEqual(results.content, '["biggest money", "unreal money"]')
+        self.assertEqual(type(results), http.StreamingHttpResponse)
+        self.assertEqual(''.join(results.streaming_content), '["biggest money", "unreal money"]')
         self.assertEqual(results.status_code, 200)
         self.assertEqual(
             FakeSearchView.model.objects.find_by_criteria.mock_calls[0][1][0]['fields'], None)
@@ -335,7 +338,7 @@ class TestSearchView(unittest.TestCase):
         m_method = mock.MagicMock(return_value=['list', 'of', 'things'])
 
         results = FakeSearchView.get_results({'search': 'q'}, m_method, {'additional': 'options'})
-        self.assertEqual(results, [m_serial(), m_serial(), m_serial()])
+        self.assertEqual(list(results), [m_serial(), m_serial(), m_serial()])
 
     def test_get_results_model_serializer(self):
         """
@@ -347,10 +350,11 @@ class TestSearchView(unittest.TestCase):
             model = mock.MagicMock()
             model.SERIALIZER = m_serial
 
+        m_serial.return_value.data = ['serialized', 'things']
         m_method = mock.MagicMock(return_value=['list', 'of', 'things'])
 
         results = FakeSearchView.get_results({'search': 'q'}, m_method, {'additional': 'options'})
-        self.assertEqual(results, m_serial.return_value.data)
+        self.assertEqual(list(results), ['serialized', 'things'])
         m_serial.assert_called_once_with(['list', 'of', 'things'], multiple=True)
 
     @mock.patch('pulp.server.webservices.views.search._trim_results')
@@ -365,10 +369,11 @@ class TestSearchView(unittest.TestCase):
             model = m_model
             model.SERIALIZER = m_serial
 
+        m_serial.return_value.data = ['serialized', 'things']
         m_method = mock.MagicMock(return_value=['list', 'of', 'things'])
 
         results = FakeSearchView.get_results({'fields': ['f1', 'f2']}, m_method, {})
-        self.assertEqual(results, m_serial.return_value.data)
+        self.assertEqual(list(results), ['serialized', 'things'])
         m_serial.assert_called_once_with(['list', 'of', 'things'], multiple=True)
         m_trim.assert_called_once_with(m_model, m_serial().data, ['f1', 'f2'])
 
@@ -45,7 +45,7 @@ class TestTaskSearchView(unittest.TestCase):
         Ensure that the TaskSearchView class has the correct class attributes.
         """
         self.assertEqual(TaskSearchView.response_builder,
-                         util.generate_json_response_with_pulp_encoder)
+                         util.generate_streaming_json_response_with_pulp_encoder)
         self.assertEqual(TaskSearchView.model, model.TaskStatus)
         self.assertEqual(TaskSearchView.serializer, task_serializer)
 
@@ -22,7 +22,7 @@ class TestUserSearchView(unittest.TestCase):
         Assert that the class attributes are set correctly.
         """
         self.assertEqual(UserSearchView.response_builder,
-                         util.generate_json_response_with_pulp_encoder)
+                         util.generate_streaming_json_response_with_pulp_encoder)
         self.assertEqual(UserSearchView.model, model.User)
         self.assertEqual(UserSearchView.model.SERIALIZER, serializers.User)
 
@@ -2,7 +2,7 @@ import httplib
 import json
 import mock
 
-from django.http import HttpResponse, HttpResponseNotFound
+from django.http import HttpResponse, HttpResponseNotFound, StreamingHttpResponse
 
 from pulp.common.compat import unittest
 from pulp.server.exceptions import InputEncodingError, PulpCodedValidationException
@@ -58,6 +58,57 @@ class TestResponseGenerators(unittest.TestCase):
         util.generate_json_response_with_pulp_encoder(test_content)
         mock_json.dumps.assert_called_once_with(test_content, default=pulp_json_encoder)
 
+    def test_generate_streaming_json_response(self):
+        """
+        Make sure that the streamed content is the same as the serialized list of items.
+        """
+        test_content = [{'foo': 'bar'}, {'id': 1}, 'baz']
+        response = util.generate_streaming_json_response(iter(test_content))
+        self.assertTrue(isinstance(response, StreamingHttpResponse))
+        self.assertEqual(response.status_code, httplib.OK)
+        self.assertEqual(response._headers.get('content-type'),
+                         ('Content-Type', 'application/json; charset=utf-8'))
+        self.assertEqual(''.join(response.streaming_content), json.dumps(test_content))
+
+    def test_generate_streaming_json_response_empty(self):
+        """
+        Test that no items are streamed as an empty array.
+        """
+        response = util.generate_streaming_json_response(iter([]))
+        self.assertEqual(''.join(response.streaming_content), '[]')
+
+    @mock.patch('pulp.server.webservices.views.util.STREAM_CHUNK_SIZE', 10)
+    def test_generate_streaming_json_response_chunks(self):
+        """
+        Test that the serialized items are streamed in several chunks.
+        """
+        test_content = ['item-%d' % i for i in range(10)]
+        response = util.generate_streaming_json_response(iter(test_content))
+        chunks = list(response.streaming_content)
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(''.join(chunks), json.dumps(test_content))
+
+    def test_generate_streaming_json_response_error(self):
+        """
+        Test that an error raised by the first item is raised before the response is returned.
+        """
+        def items():
+            raise PulpCodedValidationException()
+            yield
+
+        self.assertRaises(PulpCodedValidationException,
+                          util.generate_streaming_json_response, items())
+
+    @mock.patch('pulp.server.webservices.views.util.json')
+    def test_generate_streaming_json_response_with_pulp_encoder(self, mock_json):
+        """
+        Ensure that the shortcut function uses the specified encoder.
+        """
+        mock_json.dumps.return_value = '{}'
+        test_content = {'foo': 'bar'}
+        util.generate_streaming_json_response_with_pulp_encoder([test_content])
+        mock_json.dumps.assert_called_once_with(test_content, default=pulp_json_encoder)
+
     @mock.patch('pulp.server.webservices.views.util.iri_to_uri')
     def test_generate_redirect_response(self, mock_iri_to_uri):
         """
@@ -1,5 +1,6 @@
 import sys
 
+from collections import OrderedDict
 from gettext import gettext as _
 from logging import getLogger
 from threading import RLock
@@ -19,33 +20,50 @@ class Cache(object):
     """
     Generic object cache.
 
+    The inventory is kept in least recently used order, so that objects are
+    looked up in constant time and eviction only needs to inspect the least
+    recently used objects. Eviction is done when objects are added.
+
     Attributes:
         eviction_threshold (timedelta): How long an unrequested item will be cached.
+        max_entries (int): The maximum number of cached objects. Busy objects
+            are never evicted, so the cache may grow beyond this when they are
+            all busy.
+        hits (int): The number of lookups that found the object in the cache.
+        misses (int): The number of lookups that did not find the object in the cache.
+        evictions (int): The number of objects evicted from the cache.
         _lock (RLock): The object mutex.
-        _inventory (dict): The inventory of cached objects.
-            Each value is an Item.
+        _inventory (OrderedDict): The inventory of cached objects, least
+            recently requested first. Each value is an Item.
     """
 
-    def __init__(self, eviction_threshold=None):
+    def __init__(self, eviction_threshold=None, max_entries=1000):
         """
         Args:
             eviction_threshold (timedelta): How long an unrequested item will be cached.
+            max_entries (int): The maximum number of cached objects.
 
         """
         self.eviction_threshold = eviction_threshold or timedelta(hours=4)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
         self._lock = RLock()
-        self._inventory = {}
+        self._inventory = OrderedDict()
 
     def add(self, key, object_):
         """
-        Add an object to the cache.
+        Add an object to the cache, evicting unused cached objects.
 
         Args:
             key (hashable): The caching key.
             object_ (object): An object to be cached.
         """
         with self._lock:
+            self._inventory.pop(key, None)
             self._inventory[key] = Item(object_)
+            self.evict()
 
     def purge(self, key):
         """
@@ -72,40 +90,54 @@ class Cache(object):
         """
         with self._lock:
             try:
-                item = self._inventory[key]
+                item = self._inventory.pop(key)
             except KeyError:
+                self.misses += 1
                 raise NotCached()
+            self._inventory[key] = item
             item.touch()
-            self.evict()
+            self.hits += 1
             return item.object
 
     def evict(self):
         """
-        Evict all unused cached objects.
+        Evict unused cached objects that have not been requested within the
+        eviction threshold, then the least recently requested unused objects
+        while there are more than max_entries.
+
+        Busy objects are not evicted. They are marked as requested instead,
+        since they are still in use.
 
         Returns:
             list: The evicted objects.
         """
-        busy = []
+        busy = 0
         evicted = []
         now = Item.now()
         with self._lock:
-            for key, item in self._inventory.items():
-                duration = (now - item.last_requested)
+            # Each item is inspected at most once; busy items are moved to the end.
+            for _n in xrange(len(self._inventory)):
+                key, item = next(self._inventory.iteritems())
+                expired = (now - item.last_requested) >= self.eviction_threshold
+                if not expired and len(self._inventory) <= self.max_entries:
+                    # Every item after this one was requested more recently.
+                    break
+                del self._inventory[key]
                 if item.busy:
-                    busy.append(item.object)
-                    continue
-                if duration < self.eviction_threshold:
+                    busy += 1
+                    item.touch()
+                    self._inventory[key] = item
                     continue
-                self.purge(key)
                 evicted.append(item.object)
-        log.debug(
-            _('Cache.evict(): %(t)d total, %(e)d evicted, %(b)d busy'),
-            {
-                't': len(self._inventory),
-                'e': len(evicted),
-                'b': len(busy)
-            })
+            self.evictions += len(evicted)
+        if evicted:
+            log.debug(
+                _('Cache.evict(): %(t)d total, %(e)d evicted, %(b)d busy'),
+                {
+                    't': len(self._inventory),
+                    'e': len(evicted),
+                    'b': busy
+                })
         return evicted
 
     def __contains__(self, key):
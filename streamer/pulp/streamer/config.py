@@ -9,6 +9,10 @@ DEFAULT_VALUES = {
         'port': '8751',
         'interfaces': 'localhost',
         'cache_timeout': '86400',
+        'session_cache_max_entries': '1000',
+        'spool_dir': '/var/cache/pulp/streamer',
+        'spool_timeout': '3600',
+        'spool_max_size': '10737418240',
     },
 }
 
@@ -1,15 +1,18 @@
 import logging
 
 from gettext import gettext as _
-from httplib import NOT_FOUND, INTERNAL_SERVER_ERROR
+from httplib import NOT_FOUND, INTERNAL_SERVER_ERROR, PARTIAL_CONTENT
+from threading import Event
 from urlparse import urlparse
 
 from mongoengine import DoesNotExist, NotUniqueError
 from nectar.listener import AggregatingEventListener
 from requests import Session
 from twisted.internet import reactor
+from twisted.internet.interfaces import IPushProducer
 from twisted.web.resource import Resource
 from twisted.web.server import NOT_DONE_YET
+from zope.interface import implementer
 
 from pulp.plugins.loader import api as plugin_api
 from pulp.server.constants import PULP_STREAM_REQUEST_HEADER
@@ -19,6 +22,7 @@ from pulp.server.db.model import DeferredDownload, LazyCatalogEntry
 from pulp.server.controllers import repository as repo_controller
 from pulp.plugins.loader.exceptions import PluginNotFound
 from pulp.streamer.cache import Cache, NotCached
+from pulp.streamer.spool import SpoolFailed, SpoolWriter, parse_range, response_headers
 
 logger = logging.getLogger(__name__)
 
@@ -103,16 +107,22 @@ class Streamer(Resource):
     # Ensure self.getChild isn't called as this has no child resources
     isLeaf = True
 
-    def __init__(self, config):
+    def __init__(self, config, spool_cache=None):
         """
         Initialize a streamer instance.
 
         :param config: The configuration for this streamer instance.
         :type  config: ConfigParser.SafeConfigParser
+        :param spool_cache: The cache used to share downloads between requests for the
+                            same content. Each request downloads the content itself when
+                            not provided.
+        :type  spool_cache: pulp.streamer.spool.SpoolCache
         """
         Resource.__init__(self)
         self.config = config
-        self.session_cache = SessionCache()
+        self.session_cache = SessionCache(
+            max_entries=config.getint('streamer', 'session_cache_max_entries'))
+        self.spool_cache = spool_cache
 
     def render_GET(self, request):
         """
@@ -139,35 +149,118 @@ class Streamer(Resource):
         Download the requested content using the content unit catalog and dispatch
         a celery task that causes Pulp to download the newly cached unit.
 
+        When spooling is enabled, only the first of the concurrent requests for the
+        same content downloads it. The other requests, and the requests made after the
+        download completed, are served from the spool file it is written to.
+
         :param request: The original twisted client HTTP request being handled by the streamer.
         :type  request: twisted.web.server.Request
         """
         with Responder(request) as responder:
+            spool = None
             try:
                 path = urlparse(request.uri).path
-                q_set = LazyCatalogEntry.objects.filter(path=path)
-                q_set = q_set.order_by('-_id', '-revision')
-                count = q_set.count()
-                if not count:
-                    logger.error(_('No catalog entry found. path={p}'.format(p=path)))
-                    request.setResponseCode(NOT_FOUND)
-                    return
-                for entry in q_set.all():
-                    logger.info('Trying URL: {url}'.format(url=entry.url))
-                    try:
-                        last_report = self._download(request, entry, responder)
-                        self._on_succeeded(entry, request, last_report)
-                        return
-                    except (DownloadFailed, DoesNotExist, PluginNotFound):
-                        # try another
-                        continue
-                # Failed
-                self._on_all_failed(request)
+                if self.spool_cache is not None:
+                    spool, created = self.spool_cache.acquire(path)
+                    if not created:
+                        if self._serve_spool(request, spool, responder):
+                            return
+                        # The download failed before any data was sent, so try it ourselves.
+                        spool = None
+                self._fetch(request, path, responder, spool)
             except Exception:
                 logger.exception(_('An unexpected error occurred: {url}').format(url=request.uri))
                 request.setResponseCode(INTERNAL_SERVER_ERROR)
                 request.setHeader('Content-Length', '0')
 
+    def _fetch(self, request, path, responder, spool=None):
+        """
+        Download the requested content, trying each of its catalog entries until
+        one of them succeeds.
+
+        :param request: The original twisted client HTTP request being handled by the streamer.
+        :type  request: twisted.web.server.Request
+        :param path: The requested path.
+        :type  path: str
+        :param responder: The responder for the request.
+        :type  responder: Responder
+        :param spool: The spool the content is also written to, if any.
+        :type  spool: pulp.streamer.spool.Spool
+        """
+        try:
+            q_set = LazyCatalogEntry.objects.filter(path=path)
+            q_set = q_set.order_by('-_id', '-revision')
+            count = q_set.count()
+            if not count:
+                logger.error(_('No catalog entry found. path={p}'.format(p=path)))
+                request.setResponseCode(NOT_FOUND)
+                return
+            writer = responder if spool is None else SpoolWriter(spool, responder)
+            for entry in q_set.all():
+                logger.info('Trying URL: {url}'.format(url=entry.url))
+                try:
+                    last_report = self._download(request, entry, writer)
+                    if spool is not None:
+                        spool.complete(entry, response_headers(request))
+                    self._on_succeeded(entry, request, last_report)
+                    return
+                except (DownloadFailed, DoesNotExist, PluginNotFound):
+                    if spool is not None and not spool.reset():
+                        # Data of the failed download has been sent, which the
+                        # spool cannot be shared with.
+                        spool.fail()
+                        spool = None
+                        writer = responder
+                    # try another
+                    continue
+            # Failed
+            self._on_all_failed(request)
+        finally:
+            if spool is not None and spool.state == spool.DOWNLOADING:
+                spool.fail()
+
+    def _serve_spool(self, request, spool, responder):
+        """
+        Serve the requested content from the spool of another request for it.
+
+        A single byte range is served when requested and the download is complete.
+
+        :param request: The original twisted client HTTP request being handled by the streamer.
+        :type  request: twisted.web.server.Request
+        :param spool: The spool to read.
+        :type  spool: pulp.streamer.spool.Spool
+        :param responder: The responder for the request.
+        :type  responder: Responder
+        :return: False when the download failed before any data was sent.
+        :rtype: bool
+        """
+        try:
+            headers = spool.wait()
+        except SpoolFailed:
+            return False
+        for name, values in headers:
+            request.responseHeaders.setRawHeaders(name, values)
+        start, end = 0, None
+        if spool.state == spool.COMPLETE:
+            byte_range = parse_range(request.getHeader('Range'), spool.size)
+            if byte_range:
+                start, end = byte_range
+                request.setResponseCode(PARTIAL_CONTENT)
+                request.setHeader('Content-Range', 'bytes {s}-{e}/{n}'.format(
+                    s=start, e=end, n=spool.size))
+                request.setHeader('Content-Length', str(end - start + 1))
+        try:
+            for data in spool.read(start, end):
+                if responder.stopped:
+                    # The client disconnected.
+                    return True
+                responder.write(data)
+        except SpoolFailed:
+            logger.error(_('Download failed while streaming: {url}').format(url=request.uri))
+            return True
+        self._on_succeeded(spool.entry, request, None)
+        return True
+
     def _on_succeeded(self, entry, request, report):
         """
         The download succeeded.
@@ -302,10 +395,15 @@ class Streamer(Resource):
             pass
 
 
+@implementer(IPushProducer)
 class Responder(object):
     """
     This class provides an object that can be provided to Nectar instead of a
     file which forwards all write calls to the Twisted Request.
+
+    The responder is registered as the producer of the request, so that writes
+    block while Twisted has paused it because the client is not reading the
+    data as fast as it is written, and are dropped once the client disconnected.
     """
 
     def __init__(self, request):
@@ -316,6 +414,10 @@ class Responder(object):
         :type  request: twisted.web.server.Request
         """
         self.request = request
+        self.stopped = False
+        self._registered = False
+        self._producing = Event()
+        self._producing.set()
 
     def __enter__(self):
         """
@@ -324,8 +426,41 @@ class Responder(object):
         :return: The instance of the class.
         :rtype:  Responder
         """
+        reactor.callFromThread(self.register)
         return self
 
+    def register(self):
+        """
+        Register the responder as the producer of the request.
+
+        This must be called in the reactor thread.
+        """
+        if self.request.channel is None:
+            # The client already disconnected.
+            self.stopProducing()
+            return
+        self.request.registerProducer(self, True)
+        self._registered = True
+
+    def pauseProducing(self):
+        """
+        Called by Twisted when its write buffer is full; writes block until resumed.
+        """
+        self._producing.clear()
+
+    def resumeProducing(self):
+        """
+        Called by Twisted when its write buffer has been sent to the client.
+        """
+        self._producing.set()
+
+    def stopProducing(self):
+        """
+        Called by Twisted when the client disconnected; further writes are dropped.
+        """
+        self.stopped = True
+        self._producing.set()
+
     def __exit__(self, exc_type, exc_value, traceback):
         """
         Closes the Responder, which invokes the
@@ -356,11 +491,14 @@ class Responder(object):
 
         If finish is called after the client disconnects, a RuntimeError is
         raised and Twisted logs the stack trace. Clients disconnecting before
-        Twisted gets around to calling ``finish`` is not uncommon. Ultimately
-        there should be a handler that stops streaming if the client disconnects,
-        but that is tricky with the current implementation's use of threads.
+        Twisted gets around to calling ``finish`` is not uncommon.
+
+        The responder is unregistered as the producer of the request first.
         """
         try:
+            if self._registered and self.request.channel is not None:
+                self.request.unregisterProducer()
+            self._registered = False
             self.request.finish()
         except RuntimeError as e:
             logger.debug(str(e))
@@ -370,9 +508,16 @@ class Responder(object):
         Forward the data to the request.write method, which writes data to
         the transport (if not responding to a HEAD request).
 
+        This blocks while the responder is paused, so that the data read from
+        the download or spool is not buffered in memory faster than the client
+        reads it.
+
         :param data: A string to write to the response.
         :type  data: str
         """
+        self._producing.wait()
+        if self.stopped:
+            return
         reactor.callFromThread(self.request.write, data)
 
 
@@ -0,0 +1,480 @@
+import errno
+import os
+import tempfile
+import time
+
+from gettext import gettext as _
+from logging import getLogger
+from threading import Condition, RLock
+
+log = getLogger(__name__)
+
+
+# The number of bytes read from a spool file at a time.
+CHUNK_SIZE = 65536
+# The minimum number of seconds between two sweeps for expired spools.
+SWEEP_INTERVAL = 60
+
+
+class SpoolFailed(Exception):
+    """
+    The download being spooled failed.
+    """
+    pass
+
+
+class Spool(object):
+    """
+    The content of a single download, written to a spool file as it is
+    downloaded so that it can be read by any number of concurrent readers,
+    and served again once the download is complete.
+
+    Attributes:
+        path (str): The path of the spool file.
+        entry (LazyCatalogEntry): The catalog entry the content was downloaded for.
+        headers (list): The response headers as (name, values) tuples.
+        size (int): The number of bytes written to the spool file.
+        state (str): One of DOWNLOADING, COMPLETE or FAILED.
+        last_used (float): When the spool was last requested.
+        reserved (int): The number of bytes reserved in the spool cache.
+        _condition (Condition): Notified whenever the spool changes.
+        _file (file): The spool file being written.
+        _cache (SpoolCache): The cache the spool belongs to, if any.
+    """
+
+    DOWNLOADING = 'downloading'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+
+    def __init__(self, path, fp, cache=None):
+        """
+        Args:
+            path (str): The path of the spool file.
+            fp (file): The spool file, open for writing.
+            cache (SpoolCache): The cache the spool belongs to, if any.
+        """
+        self.path = path
+        self.entry = None
+        self.headers = None
+        self.size = 0
+        self.state = self.DOWNLOADING
+        self.last_used = time.time()
+        self.reserved = 0
+        self._condition = Condition()
+        self._file = fp
+        self._cache = cache
+
+    def reserve(self, size):
+        """
+        Reserve space in the spool cache for the spool to grow to a size.
+
+        Args:
+            size (int): The number of bytes the spool is about to hold.
+
+        Returns:
+            bool: False when the spool cache cannot hold that many bytes.
+        """
+        if self._cache is None or size <= self.reserved:
+            return True
+        return self._cache.reserve(self, size - self.reserved)
+
+    def write(self, data, headers):
+        """
+        Append data to the spool file.
+
+        Args:
+            data (str): The downloaded data.
+            headers (list): The response headers as (name, values) tuples.
+                Only used by the first write.
+        """
+        self._file.write(data)
+        self._file.flush()
+        with self._condition:
+            if self.headers is None:
+                self.headers = headers
+            self.size += len(data)
+            self._condition.notify_all()
+
+    def reset(self):
+        """
+        Prepare the spool for another download attempt.
+
+        Returns:
+            bool: False when data has already been written, in which case
+                the spool cannot be reused.
+        """
+        with self._condition:
+            if self.size:
+                return False
+            self.headers = None
+            return True
+
+    def complete(self, entry, headers):
+        """
+        Mark the download complete.
+
+        Args:
+            entry (LazyCatalogEntry): The catalog entry the content was downloaded for.
+            headers (list): The response headers as (name, values) tuples.
+                Only used when no data has been written.
+        """
+        self._file.close()
+        with self._condition:
+            if self.state != self.DOWNLOADING:
+                return
+            if self.headers is None:
+                self.headers = headers
+            self.entry = entry
+            self.state = self.COMPLETE
+            self._condition.notify_all()
+
+    def fail(self):
+        """
+        Mark the download failed and delete the spool file.
+        Readers that are still reading it are not affected by the deletion.
+        """
+        with self._condition:
+            if self.state == self.FAILED:
+                return
+            self.state = self.FAILED
+            self._condition.notify_all()
+        self._file.close()
+        self.remove()
+
+    def remove(self):
+        """
+        Delete the spool file.
+        """
+        try:
+            os.unlink(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                log.warning(_('Unable to remove spool file {p}: {e}').format(p=self.path, e=e))
+
+    def wait(self):
+        """
+        Wait until data has been written or the download is complete.
+
+        Returns:
+            list: The response headers as (name, values) tuples.
+
+        Raises:
+            SpoolFailed: When the download failed.
+        """
+        with self._condition:
+            while self.state == self.DOWNLOADING and not self.size:
+                self._condition.wait()
+            if self.state == self.FAILED:
+                raise SpoolFailed()
+            return self.headers or []
+
+    def read(self, start=0, end=None):
+        """
+        Read the content, waiting for data that has not been downloaded yet.
+
+        Args:
+            start (int): The offset of the first byte to read.
+            end (int): The offset of the last byte to read, or None to read
+                until the end of the content.
+
+        Returns:
+            generator: Chunks of data.
+
+        Raises:
+            SpoolFailed: When the download failed.
+        """
+        try:
+            fp = open(self.path, 'rb')
+        except IOError:
+            raise SpoolFailed()
+        with fp:
+            fp.seek(start)
+            offset = start
+            while end is None or offset <= end:
+                with self._condition:
+                    while self.state == self.DOWNLOADING and offset >= self.size:
+                        self._condition.wait()
+                    if self.state == self.FAILED:
+                        raise SpoolFailed()
+                    available = self.size
+                if offset >= available:
+                    return
+                stop = available if end is None else min(available, end + 1)
+                while offset < stop:
+                    data = fp.read(min(CHUNK_SIZE, stop - offset))
+                    if not data:
+                        return
+                    offset += len(data)
+                    yield data
+
+    def touch(self):
+        """
+        Update the last_used timestamp.
+        """
+        self.last_used = time.time()
+
+
+class SpoolWriter(object):
+    """
+    A file-like object that Nectar writes to, which forwards the data to both
+    a Responder and a Spool.
+
+    If writing to the spool fails, or the spool cache cannot hold the data, the
+    spool is failed and the data continues to be forwarded to the responder only.
+    The space announced by the Content-Length header is reserved by the first
+    write, so that content too large for the cache is not spooled at all.
+    """
+
+    def __init__(self, spool, responder):
+        """
+        Args:
+            spool (Spool): The spool to write to.
+            responder (pulp.streamer.server.Responder): The responder to write to.
+        """
+        self.spool = spool
+        self.responder = responder
+
+    def write(self, data):
+        """
+        Forward the data to the spool and the responder.
+
+        Args:
+            data (str): The downloaded data.
+        """
+        if self.spool.state == Spool.DOWNLOADING:
+            headers = None
+            size = self.spool.size + len(data)
+            if self.spool.headers is None:
+                headers = response_headers(self.responder.request)
+                size = max(size, content_length(headers))
+            if not self.spool.reserve(size):
+                log.info(_('Spool size limit reached, not spooling {p}').format(
+                    p=self.responder.request.uri))
+                self.spool.fail()
+            else:
+                try:
+                    self.spool.write(data, headers)
+                except (IOError, OSError) as e:
+                    log.warning(_('Unable to write spool file {p}: {e}').format(
+                        p=self.spool.path, e=e))
+                    self.spool.fail()
+        self.responder.write(data)
+
+
+class SpoolCache(object):
+    """
+    The spools of the content being streamed, keyed by request path.
+
+    The first request for a path downloads the content into a new spool,
+    while concurrent and subsequent requests for the same path read it from
+    the spool. Spools that have not been requested within the timeout are
+    deleted, as are the spools of failed downloads.
+
+    When a maximum size is set, the least recently requested complete spools
+    are deleted to make room for new data. Content that does not fit once
+    they have been deleted is not spooled.
+
+    Attributes:
+        directory (str): The directory spool files are written to.
+        timeout (int): How long (seconds) an unrequested spool is kept.
+        max_size (int): The maximum number of bytes spooled, or 0 for no limit.
+        _lock (RLock): The object mutex.
+        _spools (dict): Spools keyed by request path.
+        _size (int): The number of bytes reserved by the spools.
+        _last_sweep (float): When expired spools were last deleted.
+    """
+
+    def __init__(self, directory, timeout, max_size=0):
+        """
+        Any spool files left in the directory by a previous run are deleted.
+
+        Args:
+            directory (str): The directory spool files are written to.
+            timeout (int): How long (seconds) an unrequested spool is kept.
+            max_size (int): The maximum number of bytes spooled, or 0 for no limit.
+
+        Raises:
+            OSError: When the directory cannot be created.
+        """
+        self.directory = directory
+        self.timeout = timeout
+        self.max_size = max_size
+        self._lock = RLock()
+        self._spools = {}
+        self._size = 0
+        self._last_sweep = time.time()
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        for name in os.listdir(directory):
+            if name.endswith('.spool'):
+                Spool(os.path.join(directory, name), None).remove()
+
+    def acquire(self, key):
+        """
+        Get the spool for a request path.
+
+        Args:
+            key (str): The request path.
+
+        Returns:
+            tuple: The spool and whether it was created. The caller is
+                expected to download the content of a spool it created.
+                The spool is None when the cache is full, in which case
+                the content is not spooled.
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep >= SWEEP_INTERVAL:
+                self._sweep(now)
+            spool = self._spools.get(key)
+            if spool is not None and spool.state != Spool.FAILED:
+                spool.touch()
+                return spool, False
+            if self.max_size and not self._evict(1):
+                return None, True
+            fd, path = tempfile.mkstemp(suffix='.spool', dir=self.directory)
+            spool = Spool(path, os.fdopen(fd, 'wb'), self)
+            self._discard(key)
+            self._spools[key] = spool
+            return spool, True
+
+    def reserve(self, spool, nbytes):
+        """
+        Reserve space for a spool to grow, deleting the least recently
+        requested complete spools as needed.
+
+        Args:
+            spool (Spool): The growing spool.
+            nbytes (int): The number of bytes to reserve.
+
+        Returns:
+            bool: False when the space cannot be reserved.
+        """
+        with self._lock:
+            if spool.state == Spool.FAILED:
+                return False
+            if self.max_size and not self._evict(nbytes):
+                return False
+            self._size += nbytes
+            spool.reserved += nbytes
+            return True
+
+    def _evict(self, nbytes):
+        """
+        Delete the failed spools and the least recently requested complete
+        spools until there is room for a number of bytes.
+
+        Args:
+            nbytes (int): The number of bytes to make room for.
+
+        Returns:
+            bool: False when there is not enough room once all of the
+                failed and complete spools have been deleted.
+        """
+        if self._size + nbytes <= self.max_size:
+            return True
+        spools = [(s.state != Spool.FAILED, s.last_used, k) for k, s in self._spools.items()
+                  if s.state != Spool.DOWNLOADING]
+        for failed, last_used, key in sorted(spools):
+            self._discard(key)
+            if self._size + nbytes <= self.max_size:
+                return True
+        return False
+
+    def _sweep(self, now):
+        """
+        Delete the failed spools and the complete spools that have not been
+        requested within the timeout.
+
+        Args:
+            now (float): The current time.
+        """
+        self._last_sweep = now
+        for key, spool in self._spools.items():
+            if spool.state == Spool.FAILED:
+                self._discard(key)
+            elif spool.state == Spool.COMPLETE and now - spool.last_used >= self.timeout:
+                self._discard(key)
+
+    def _discard(self, key):
+        """
+        Remove a spool from the cache, releasing the space reserved by it.
+        The spool file of a complete spool is deleted, while readers that are
+        still reading it are not affected by the deletion.
+
+        Args:
+            key (str): The request path.
+        """
+        spool = self._spools.pop(key, None)
+        if spool is None:
+            return
+        self._size -= spool.reserved
+        spool.reserved = 0
+        if spool.state == Spool.COMPLETE:
+            spool.remove()
+
+
+def response_headers(request):
+    """
+    Get the response headers that have been set on a request.
+
+    Args:
+        request (twisted.web.server.Request): An HTTP request.
+
+    Returns:
+        list: The response headers as (name, values) tuples.
+    """
+    return list(request.responseHeaders.getAllRawHeaders())
+
+
+def content_length(headers):
+    """
+    Get the Content-Length of a response.
+
+    Args:
+        headers (list): The response headers as (name, values) tuples.
+
+    Returns:
+        int: The Content-Length, or 0 when it is missing or invalid.
+    """
+    for name, values in headers:
+        if name.lower() == 'content-length' and values:
+            try:
+                return int(values[-1])
+            except ValueError:
+                return 0
+    return 0
+
+
+def parse_range(header, size):
+    """
+    Parse the single byte range of a Range request header.
+
+    Args:
+        header (str): The Range header, if any.
+        size (int): The size of the content.
+
+    Returns:
+        tuple: The offsets of the first and last bytes of the range, or None
+            when there is no range, or when it is not a single satisfiable
+            byte range, in which case the whole content is served.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, sep, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if not first:
+            # The suffix of the content.
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if not sep or start > end or start >= size:
+        return None
+    return start, end
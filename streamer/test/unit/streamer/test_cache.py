@@ -22,8 +22,9 @@ class TestCache(TestCase):
 
     @patch(MODULE + '.Item.now')
     def test_add(self, now):
+        now.return_value = 1
         t1 = Mock()
-        cache = Cache()
+        cache = Cache(3)
         cache.add('t1', t1)
         item = cache._inventory['t1']
         self.assertEqual(item.object, t1)
@@ -41,18 +42,27 @@ class TestCache(TestCase):
     @patch(MODULE + '.Item.now')
     def test_get(self, now):
         t1 = Mock()
-        now.side_effect = [1, 2, 3]
+        now.side_effect = [1, 1, 2]
         key = 't1'
-        cache = Cache()
+        cache = Cache(3)
         cache.add(key, t1)
         gotten = cache.get(key)
         self.assertEqual(cache._inventory[key].last_requested, 2)
         self.assertEqual(gotten, t1)
         self.assertRaises(NotCached, cache.get, 'xx')
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_get_most_recently_used_last(self):
+        cache = Cache()
+        cache.add('t1', Mock())
+        cache.add('t2', Mock())
+        cache.get('t1')
+        self.assertEqual(list(cache._inventory), ['t2', 't1'])
 
     @patch(MODULE + '.Item.now')
     def test_evict(self, now):
-        now.side_effect = [1, 2, 3, 4]
+        now.side_effect = [1, 1, 2, 3, 4]
         key = 't1'
         cache = Cache(3)
         cache.add(key, Mock(key=key))
@@ -65,13 +75,53 @@ class TestCache(TestCase):
         evicted = cache.evict()
         self.assertFalse('t1' in cache)
         self.assertEqual([obj.key for obj in evicted], [key])
+        self.assertEqual(cache.evictions, 1)
+
+    @patch(MODULE + '.Item.now')
+    def test_evict_on_add(self, now):
+        now.side_effect = [1, 1, 5, 5]
+        cache = Cache(3)
+        cache.add('t1', Mock())
+        cache.add('t2', Mock())
+        self.assertFalse('t1' in cache)
+        self.assertTrue('t2' in cache)
+
+    @patch(MODULE + '.Item.now')
+    def test_evict_stops_at_recent_item(self, now):
+        now.side_effect = [1, 1, 2, 2, 3]
+        cache = Cache(3)
+        cache.add('t1', Mock())
+        cache.add('t2', Mock())
+        # t1 is not expired, so t2 is not inspected
+        with patch(MODULE + '.Item.busy') as busy:
+            self.assertEqual(cache.evict(), [])
+            self.assertFalse(busy.called)
+
+    def test_max_entries(self):
+        cache = Cache(max_entries=2)
+        cache.add('t1', Mock())
+        cache.add('t2', Mock())
+        cache.get('t1')
+        cache.add('t3', Mock())
+        self.assertEqual(list(cache._inventory), ['t1', 't3'])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_max_entries_busy(self):
+        t1 = Mock()  # hold ref to make it busy.
+        cache = Cache(max_entries=1)
+        cache.add('t1', t1)
+        cache.add('t2', Mock())
+        # both are busy while t2 is being added
+        self.assertEqual(list(cache._inventory), ['t1', 't2'])
+        cache.evict()
+        self.assertEqual(list(cache._inventory), ['t1'])
 
     @patch(MODULE + '.Item.now')
     def test_evict_busy(self, now):
-        now.side_effect = [1, 2, 3, 4]
+        now.side_effect = range(10)
         key = 't1'
         t1 = Mock()  # hold ref to make it busy.
-        cache = Cache(0)
+        cache = Cache(1)
         cache.add(key, t1)
         cache.evict()
         self.assertTrue('t1' in cache)
@@ -1,4 +1,5 @@
-from httplib import NOT_FOUND, INTERNAL_SERVER_ERROR
+from httplib import NOT_FOUND, INTERNAL_SERVER_ERROR, PARTIAL_CONTENT
+from threading import Thread
 
 from mock import Mock, patch, call
 from mongoengine import DoesNotExist, NotUniqueError
@@ -11,6 +12,7 @@ from pulp.server import constants
 from pulp.streamer.server import (
     Responder, SessionCache, Streamer, DownloadListener, DownloadFailed, HOP_BY_HOP_HEADERS
 )
+from pulp.streamer.spool import Spool, SpoolFailed
 
 
 MODULE_PREFIX = 'pulp.streamer.server.'
@@ -75,6 +77,15 @@ class TestListener(unittest.TestCase):
 
 class TestStreamer(unittest.TestCase):
 
+    def test_init_session_cache_max_entries(self):
+        config = Mock()
+        config.getint.return_value = 10
+
+        streamer = Streamer(config)
+
+        config.getint.assert_called_once_with('streamer', 'session_cache_max_entries')
+        self.assertEqual(streamer.session_cache.max_entries, 10)
+
     @patch(MODULE_PREFIX + 'reactor')
     def test_render_GET(self, reactor):
         request = Mock()
@@ -210,6 +221,264 @@ class TestStreamer(unittest.TestCase):
         # validation
         request.setResponseCode.assert_called_once_with(INTERNAL_SERVER_ERROR)
 
+    @patch(MODULE_PREFIX + 'Responder')
+    @patch(MODULE_PREFIX + 'SpoolWriter')
+    @patch(MODULE_PREFIX + 'Streamer._on_succeeded')
+    @patch(MODULE_PREFIX + 'Streamer._download')
+    @patch(MODULE_PREFIX + 'LazyCatalogEntry')
+    @patch(MODULE_PREFIX + 'reactor', Mock())
+    def test_handle_get_spooled(self, model, _download, _on_succeeded, writer, responder):
+        """
+        The first request for the content downloads it into the spool.
+        """
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        request.responseHeaders.getAllRawHeaders.return_value = iter([('A', ['1'])])
+        responder.return_value.__enter__.return_value = responder.return_value
+        report = DownloadReport('', '')
+        _download.side_effect = SideEffect(DownloadFailed(report), report)
+        catalog = [Mock(url='url-a'), Mock(url='url-b')]
+        model.objects.filter.return_value.order_by.return_value.all.return_value = catalog
+        model.objects.filter.return_value.order_by.return_value.count.return_value = len(catalog)
+        spool = Mock(state=Spool.DOWNLOADING, DOWNLOADING=Spool.DOWNLOADING)
+        spool.reset.return_value = True
+        spool_cache = Mock()
+        spool_cache.acquire.return_value = (spool, True)
+
+        # test
+        streamer = Streamer(Mock(), spool_cache)
+        streamer._handle_get(request)
+
+        # validation
+        spool_cache.acquire.assert_called_once_with('/content/bear.rpm')
+        writer.assert_called_once_with(spool, responder.return_value)
+        self.assertEqual(
+            _download.call_args_list,
+            [
+                call(request, catalog[0], writer.return_value),
+                call(request, catalog[1], writer.return_value)
+            ])
+        spool.reset.assert_called_once_with()
+        spool.complete.assert_called_once_with(catalog[1], [('A', ['1'])])
+        _on_succeeded.assert_called_once_with(catalog[1], request, report)
+
+    @patch(MODULE_PREFIX + 'Responder')
+    @patch(MODULE_PREFIX + 'SpoolWriter')
+    @patch(MODULE_PREFIX + 'Streamer._on_all_failed')
+    @patch(MODULE_PREFIX + 'Streamer._download')
+    @patch(MODULE_PREFIX + 'LazyCatalogEntry')
+    @patch(MODULE_PREFIX + 'reactor', Mock())
+    def test_handle_get_spooled_partially(self, model, _download, _on_all_failed, writer,
+                                          responder):
+        """
+        A download fails after data was written to the spool, so the spool is
+        failed and the next download is not spooled.
+        """
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        responder.return_value.__enter__.return_value = responder.return_value
+        report = DownloadReport('', '')
+        _download.side_effect = SideEffect(DownloadFailed(report), DownloadFailed(report))
+        catalog = [Mock(url='url-a'), Mock(url='url-b')]
+        model.objects.filter.return_value.order_by.return_value.all.return_value = catalog
+        model.objects.filter.return_value.order_by.return_value.count.return_value = len(catalog)
+        spool = Mock(state=Spool.DOWNLOADING, DOWNLOADING=Spool.DOWNLOADING)
+        spool.reset.return_value = False
+        spool_cache = Mock()
+        spool_cache.acquire.return_value = (spool, True)
+
+        # test
+        streamer = Streamer(Mock(), spool_cache)
+        streamer._handle_get(request)
+
+        # validation
+        self.assertEqual(
+            _download.call_args_list,
+            [
+                call(request, catalog[0], writer.return_value),
+                call(request, catalog[1], responder.return_value)
+            ])
+        spool.fail.assert_called_once_with()
+        _on_all_failed.assert_called_once_with(request)
+
+    @patch(MODULE_PREFIX + 'Responder')
+    @patch(MODULE_PREFIX + 'LazyCatalogEntry')
+    @patch(MODULE_PREFIX + 'reactor', Mock())
+    def test_handle_get_spooled_failed_badly(self, model, responder):
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        model.objects.filter.side_effect = ValueError()
+        spool = Mock(state=Spool.DOWNLOADING, DOWNLOADING=Spool.DOWNLOADING)
+        spool_cache = Mock()
+        spool_cache.acquire.return_value = (spool, True)
+
+        # test
+        streamer = Streamer(Mock(), spool_cache)
+        streamer._handle_get(request)
+
+        # validation
+        spool.fail.assert_called_once_with()
+        request.setResponseCode.assert_called_once_with(INTERNAL_SERVER_ERROR)
+
+    @patch(MODULE_PREFIX + 'Responder')
+    @patch(MODULE_PREFIX + 'Streamer._fetch')
+    @patch(MODULE_PREFIX + 'Streamer._serve_spool')
+    @patch(MODULE_PREFIX + 'reactor', Mock())
+    def test_handle_get_from_spool(self, _serve_spool, _fetch, responder):
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        responder.return_value.__enter__.return_value = responder.return_value
+        spool = Mock()
+        spool_cache = Mock()
+        spool_cache.acquire.return_value = (spool, False)
+        _serve_spool.return_value = True
+
+        # test
+        streamer = Streamer(Mock(), spool_cache)
+        streamer._handle_get(request)
+
+        # validation
+        _serve_spool.assert_called_once_with(request, spool, responder.return_value)
+        self.assertFalse(_fetch.called)
+
+    @patch(MODULE_PREFIX + 'Responder')
+    @patch(MODULE_PREFIX + 'Streamer._fetch')
+    @patch(MODULE_PREFIX + 'Streamer._serve_spool')
+    @patch(MODULE_PREFIX + 'reactor', Mock())
+    def test_handle_get_from_failed_spool(self, _serve_spool, _fetch, responder):
+        """
+        The spooled download failed before any data was sent, so the content is fetched.
+        """
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        responder.return_value.__enter__.return_value = responder.return_value
+        spool_cache = Mock()
+        spool_cache.acquire.return_value = (Mock(), False)
+        _serve_spool.return_value = False
+
+        # test
+        streamer = Streamer(Mock(), spool_cache)
+        streamer._handle_get(request)
+
+        # validation
+        _fetch.assert_called_once_with(
+            request, '/content/bear.rpm', responder.return_value, None)
+
+    @patch(MODULE_PREFIX + 'Responder')
+    @patch(MODULE_PREFIX + 'Streamer._fetch')
+    @patch(MODULE_PREFIX + 'Streamer._serve_spool')
+    @patch(MODULE_PREFIX + 'reactor', Mock())
+    def test_handle_get_spool_cache_full(self, _serve_spool, _fetch, responder):
+        """
+        The spool cache is full, so the content is fetched without being spooled.
+        """
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        responder.return_value.__enter__.return_value = responder.return_value
+        spool_cache = Mock()
+        spool_cache.acquire.return_value = (None, True)
+
+        # test
+        streamer = Streamer(Mock(), spool_cache)
+        streamer._handle_get(request)
+
+        # validation
+        self.assertFalse(_serve_spool.called)
+        _fetch.assert_called_once_with(
+            request, '/content/bear.rpm', responder.return_value, None)
+
+    @patch(MODULE_PREFIX + 'Streamer._on_succeeded')
+    def test_serve_spool(self, _on_succeeded):
+        request = Mock()
+        request.getHeader.return_value = None
+        responder = Mock(stopped=False)
+        spool = Mock(state=Spool.DOWNLOADING, COMPLETE=Spool.COMPLETE)
+        spool.wait.return_value = [('Content-Length', ['6'])]
+        spool.read.return_value = iter(['abc', 'def'])
+
+        # test
+        streamer = Streamer(Mock())
+        served = streamer._serve_spool(request, spool, responder)
+
+        # validation
+        self.assertTrue(served)
+        request.responseHeaders.setRawHeaders.assert_called_once_with('Content-Length', ['6'])
+        spool.read.assert_called_once_with(0, None)
+        self.assertEqual(responder.write.call_args_list, [call('abc'), call('def')])
+        self.assertFalse(request.setResponseCode.called)
+        _on_succeeded.assert_called_once_with(spool.entry, request, None)
+
+    @patch(MODULE_PREFIX + 'Streamer._on_succeeded')
+    def test_serve_spool_range(self, _on_succeeded):
+        request = Mock()
+        request.getHeader.return_value = 'bytes=2-3'
+        responder = Mock(stopped=False)
+        spool = Mock(state=Spool.COMPLETE, COMPLETE=Spool.COMPLETE, size=6)
+        spool.wait.return_value = []
+        spool.read.return_value = iter(['cd'])
+
+        # test
+        streamer = Streamer(Mock())
+        streamer._serve_spool(request, spool, responder)
+
+        # validation
+        request.getHeader.assert_called_once_with('Range')
+        request.setResponseCode.assert_called_once_with(PARTIAL_CONTENT)
+        request.setHeader.assert_has_calls(
+            [call('Content-Range', 'bytes 2-3/6'), call('Content-Length', '2')])
+        spool.read.assert_called_once_with(2, 3)
+        responder.write.assert_called_once_with('cd')
+
+    @patch(MODULE_PREFIX + 'Streamer._on_succeeded')
+    def test_serve_spool_client_disconnected(self, _on_succeeded):
+        request = Mock()
+        request.getHeader.return_value = None
+        responder = Mock(stopped=False)
+        spool = Mock(state=Spool.DOWNLOADING, COMPLETE=Spool.COMPLETE)
+        spool.wait.return_value = []
+
+        def write(data):
+            responder.stopped = True
+
+        responder.write.side_effect = write
+        spool.read.return_value = iter(['abc', 'def'])
+
+        # test
+        streamer = Streamer(Mock())
+        served = streamer._serve_spool(request, spool, responder)
+
+        # validation
+        self.assertTrue(served)
+        responder.write.assert_called_once_with('abc')
+        self.assertFalse(_on_succeeded.called)
+
+    def test_serve_spool_failed(self):
+        spool = Mock()
+        spool.wait.side_effect = SpoolFailed()
+
+        # test
+        streamer = Streamer(Mock())
+        served = streamer._serve_spool(Mock(), spool, Mock())
+
+        # validation
+        self.assertFalse(served)
+
+    @patch(MODULE_PREFIX + 'Streamer._on_succeeded')
+    def test_serve_spool_failed_while_reading(self, _on_succeeded):
+        request = Mock()
+        responder = Mock(stopped=False)
+        spool = Mock(state=Spool.DOWNLOADING, COMPLETE=Spool.COMPLETE)
+        spool.wait.return_value = []
+
+        def read(start, end):
+            yield 'abc'
+            raise SpoolFailed()
+
+        spool.read.side_effect = read
+
+        # test
+        streamer = Streamer(Mock())
+        served = streamer._serve_spool(request, spool, responder)
+
+        # validation
+        self.assertTrue(served)
+        responder.write.assert_called_once_with('abc')
+        self.assertFalse(_on_succeeded.called)
+
     @patch(MODULE_PREFIX + 'Streamer._insert_deferred')
     def test_on_succeeded_client_requested(self, _insert_deferred):
         entry = Mock(url='url-a')
@@ -277,7 +546,7 @@ class TestStreamer(unittest.TestCase):
             ],
             failed_reports=[])
         downloader = Mock(event_listener=listener)
-        responder = Mock()
+        responder = Mock(stopped=False)
         entry = Mock(url='url-a')
         _get_unit.return_value = unit
         _get_downloader.return_value = downloader
@@ -313,7 +582,7 @@ class TestStreamer(unittest.TestCase):
             ])
         downloader = Mock(event_listener=listener)
         downloader.config.finalize.side_effect = ValueError()
-        responder = Mock()
+        responder = Mock(stopped=False)
         entry = Mock(url='url-a')
         _get_unit.return_value = unit
         _get_downloader.return_value = downloader
@@ -423,13 +692,32 @@ class TestStreamer(unittest.TestCase):
 
 class TestResponder(unittest.TestCase):
 
-    def test_enter(self):
+    @patch(MODULE_PREFIX + 'reactor')
+    def test_enter(self, mock_reactor):
         """
-        `__enter__` returns the instance of the class.
+        `__enter__` returns the instance of the class and registers it as a producer.
         """
         responder = Responder(Mock())
         result = responder.__enter__()
         self.assertTrue(responder is result)
+        mock_reactor.callFromThread.assert_called_once_with(responder.register)
+
+    def test_register(self):
+        """
+        `register` registers the responder as a push producer of the request.
+        """
+        responder = Responder(Mock())
+        responder.register()
+        responder.request.registerProducer.assert_called_once_with(responder, True)
+
+    def test_register_disconnected(self):
+        """
+        `register` stops the responder when the client already disconnected.
+        """
+        responder = Responder(Mock(channel=None))
+        responder.register()
+        self.assertFalse(responder.request.registerProducer.called)
+        self.assertTrue(responder.stopped)
 
     def test_exit(self):
         """
@@ -455,6 +743,16 @@ class TestResponder(unittest.TestCase):
         responder = Responder(Mock())
         responder.finish()
         responder.request.finish.assert_called_once_with()
+        self.assertFalse(responder.request.unregisterProducer.called)
+
+    def test_finish_unregisters(self):
+        """Assert the responder is unregistered as a producer before the request is finished"""
+        request = Mock()
+        responder = Responder(request)
+        responder.register()
+        responder.finish()
+        self.assertEqual([c[0] for c in request.method_calls],
+                         ['registerProducer', 'unregisterProducer', 'finish'])
 
     @patch(MODULE_PREFIX + 'logger')
     def test_finish_exception(self, mock_logger):
@@ -475,6 +773,36 @@ class TestResponder(unittest.TestCase):
         mock_reactor.callFromThread.assert_called_once_with(responder.request.write,
                                                             'some data')
 
+    @patch(MODULE_PREFIX + 'reactor')
+    def test_write_paused(self, mock_reactor):
+        """
+        `write` blocks while the responder is paused.
+        """
+        responder = Responder(Mock())
+        responder.pauseProducing()
+        writer = Thread(target=responder.write, args=('some data',))
+        writer.start()
+        writer.join(0.1)
+        self.assertTrue(writer.is_alive())
+        self.assertFalse(mock_reactor.callFromThread.called)
+
+        responder.resumeProducing()
+        writer.join(5)
+        self.assertFalse(writer.is_alive())
+        mock_reactor.callFromThread.assert_called_once_with(responder.request.write,
+                                                            'some data')
+
+    @patch(MODULE_PREFIX + 'reactor')
+    def test_write_stopped(self, mock_reactor):
+        """
+        `write` drops the data once the client disconnected, even when paused.
+        """
+        responder = Responder(Mock())
+        responder.pauseProducing()
+        responder.stopProducing()
+        responder.write('some data')
+        self.assertFalse(mock_reactor.callFromThread.called)
+
     @patch(MODULE_PREFIX + 'reactor')
     def test_with(self, mock_reactor):
         """
@@ -485,8 +813,9 @@ class TestResponder(unittest.TestCase):
             r.write('some data')
 
         mock_calls = mock_reactor.callFromThread.call_args_list
-        self.assertEqual((mock_request.write, 'some data'), mock_calls[0][0])
-        self.assertEqual((r.finish,), mock_calls[1][0])
+        self.assertEqual((r.register,), mock_calls[0][0])
+        self.assertEqual((mock_request.write, 'some data'), mock_calls[1][0])
+        self.assertEqual((r.finish,), mock_calls[2][0])
 
 
 class TestSessionCache(unittest.TestCase):
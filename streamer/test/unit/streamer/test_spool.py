@@ -0,0 +1,320 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from mock import Mock, patch
+
+from pulp.common.compat import unittest
+from pulp.streamer.spool import (
+    Spool, SpoolCache, SpoolFailed, SpoolWriter, content_length, parse_range, response_headers
+)
+
+
+MODULE_PREFIX = 'pulp.streamer.spool.'
+
+
+class SpoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = SpoolCache(self.directory, 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class TestSpool(SpoolTests):
+
+    def test_read_complete(self):
+        spool, created = self.cache.acquire('/a')
+        spool.write('abc', [('Content-Type', ['text/plain'])])
+        spool.write('def', [])
+        spool.complete('entry', [])
+
+        # validation
+        self.assertTrue(created)
+        self.assertEqual(spool.state, Spool.COMPLETE)
+        self.assertEqual(spool.entry, 'entry')
+        self.assertEqual(spool.wait(), [('Content-Type', ['text/plain'])])
+        self.assertEqual(''.join(spool.read()), 'abcdef')
+        self.assertEqual(''.join(spool.read(2, 3)), 'cd')
+        self.assertEqual(''.join(spool.read(4)), 'ef')
+
+    def test_read_while_downloading(self):
+        spool, created = self.cache.acquire('/a')
+        spool.write('abc', [])
+        read = []
+
+        def reader():
+            read.append(''.join(spool.read()))
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        spool.write('def', [])
+        spool.complete('entry', [])
+        thread.join(5)
+
+        # validation
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(read, ['abcdef'])
+
+    def test_read_failed(self):
+        spool, created = self.cache.acquire('/a')
+        spool.write('abc', [])
+        data = spool.read()
+        self.assertEqual(next(data), 'abc')
+        spool.fail()
+
+        # validation
+        self.assertRaises(SpoolFailed, next, data)
+        self.assertRaises(SpoolFailed, spool.wait)
+        self.assertFalse(os.path.exists(spool.path))
+
+    def test_complete_empty(self):
+        spool, created = self.cache.acquire('/a')
+        spool.complete('entry', [('Content-Length', ['0'])])
+
+        # validation
+        self.assertEqual(spool.wait(), [('Content-Length', ['0'])])
+        self.assertEqual(''.join(spool.read()), '')
+
+    def test_complete_failed(self):
+        spool, created = self.cache.acquire('/a')
+        spool.fail()
+        spool.complete('entry', [])
+
+        # validation
+        self.assertEqual(spool.state, Spool.FAILED)
+        self.assertEqual(spool.entry, None)
+
+    def test_reset(self):
+        spool, created = self.cache.acquire('/a')
+        spool.headers = []
+        self.assertTrue(spool.reset())
+        self.assertEqual(spool.headers, None)
+        spool.write('abc', [])
+        self.assertFalse(spool.reset())
+
+
+class TestSpoolCache(SpoolTests):
+
+    def test_init_removes_old_spools(self):
+        path = os.path.join(self.directory, 'old.spool')
+        open(path, 'w').close()
+        SpoolCache(self.directory, 10)
+        self.assertFalse(os.path.exists(path))
+
+    def test_init_creates_directory(self):
+        directory = os.path.join(self.directory, 'a', 'b')
+        SpoolCache(directory, 10)
+        self.assertTrue(os.path.isdir(directory))
+
+    def test_acquire_shared(self):
+        spool, created = self.cache.acquire('/a')
+        shared, shared_created = self.cache.acquire('/a')
+        other, other_created = self.cache.acquire('/b')
+
+        # validation
+        self.assertTrue(created)
+        self.assertFalse(shared_created)
+        self.assertTrue(shared is spool)
+        self.assertTrue(other_created)
+        self.assertFalse(other is spool)
+
+    def test_acquire_failed(self):
+        spool, created = self.cache.acquire('/a')
+        spool.fail()
+        replaced, replaced_created = self.cache.acquire('/a')
+
+        # validation
+        self.assertTrue(replaced_created)
+        self.assertFalse(replaced is spool)
+
+    @patch(MODULE_PREFIX + 'time')
+    def test_sweep(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.cache = SpoolCache(self.directory, 30)
+        expired, created = self.cache.acquire('/expired')
+        expired.complete('entry', [])
+        downloading, created = self.cache.acquire('/downloading')
+        failed, created = self.cache.acquire('/failed')
+        failed.fail()
+        mock_time.time.return_value = 1040
+        recent, created = self.cache.acquire('/recent')
+        recent.complete('entry', [])
+
+        # test
+        mock_time.time.return_value = 1060
+        self.cache.acquire('/other')
+
+        # validation
+        self.assertEqual(sorted(self.cache._spools), ['/downloading', '/other', '/recent'])
+        self.assertFalse(os.path.exists(expired.path))
+        self.assertTrue(os.path.exists(recent.path))
+
+    @patch(MODULE_PREFIX + 'time')
+    def test_reserve_evicts_oldest(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.cache = SpoolCache(self.directory, 3600, 10)
+        oldest, created = self.cache.acquire('/oldest')
+        self.assertTrue(oldest.reserve(4))
+        oldest.complete('entry', [])
+        mock_time.time.return_value = 1010
+        newest, created = self.cache.acquire('/newest')
+        self.assertTrue(newest.reserve(4))
+        newest.complete('entry', [])
+        downloading, created = self.cache.acquire('/downloading')
+
+        # test
+        reserved = downloading.reserve(5)
+
+        # validation
+        self.assertTrue(reserved)
+        self.assertEqual(sorted(self.cache._spools), ['/downloading', '/newest'])
+        self.assertFalse(os.path.exists(oldest.path))
+        self.assertTrue(os.path.exists(newest.path))
+        self.assertEqual(self.cache._size, 9)
+        self.assertEqual(downloading.reserved, 5)
+
+    def test_reserve_full(self):
+        self.cache = SpoolCache(self.directory, 3600, 10)
+        spool, created = self.cache.acquire('/a')
+        self.assertTrue(spool.reserve(8))
+        other, created = self.cache.acquire('/b')
+
+        # test
+        reserved = other.reserve(3)
+
+        # validation
+        self.assertFalse(reserved)
+        self.assertEqual(self.cache._size, 8)
+        self.assertEqual(other.reserved, 0)
+        self.assertEqual(sorted(self.cache._spools), ['/a', '/b'])
+
+    def test_reserve_unlimited(self):
+        spool, created = self.cache.acquire('/a')
+        self.assertTrue(spool.reserve(1 << 40))
+        self.assertTrue(spool.reserve(1 << 30))
+        self.assertEqual(spool.reserved, 1 << 40)
+
+    def test_reserve_failed(self):
+        spool, created = self.cache.acquire('/a')
+        spool.fail()
+        self.assertFalse(spool.reserve(1))
+
+    def test_acquire_full(self):
+        self.cache = SpoolCache(self.directory, 3600, 10)
+        spool, created = self.cache.acquire('/a')
+        self.assertTrue(spool.reserve(10))
+
+        # test
+        other, other_created = self.cache.acquire('/b')
+
+        # validation
+        self.assertTrue(other is None)
+        self.assertTrue(other_created)
+        self.assertEqual(list(self.cache._spools), ['/a'])
+
+    def test_acquire_failed_released(self):
+        self.cache = SpoolCache(self.directory, 3600, 10)
+        spool, created = self.cache.acquire('/a')
+        self.assertTrue(spool.reserve(10))
+        spool.fail()
+
+        # test
+        replaced, created = self.cache.acquire('/a')
+
+        # validation
+        self.assertFalse(replaced is None)
+        self.assertEqual(self.cache._size, 0)
+
+
+class TestSpoolWriter(SpoolTests):
+
+    def test_write(self):
+        spool, created = self.cache.acquire('/a')
+        responder = Mock()
+        responder.request.responseHeaders.getAllRawHeaders.return_value = iter(
+            [('Content-Length', ['3'])])
+
+        # test
+        SpoolWriter(spool, responder).write('abc')
+
+        # validation
+        responder.write.assert_called_once_with('abc')
+        self.assertEqual(spool.size, 3)
+        self.assertEqual(spool.headers, [('Content-Length', ['3'])])
+
+    def test_write_reserves_content_length(self):
+        self.cache = SpoolCache(self.directory, 3600, 10)
+        spool, created = self.cache.acquire('/a')
+        responder = Mock()
+        responder.request.responseHeaders.getAllRawHeaders.return_value = iter(
+            [('Content-Length', ['6'])])
+
+        # test
+        SpoolWriter(spool, responder).write('abc')
+
+        # validation
+        self.assertEqual(spool.reserved, 6)
+        self.assertEqual(spool.size, 3)
+        self.assertEqual(self.cache._size, 6)
+
+    def test_write_too_large(self):
+        self.cache = SpoolCache(self.directory, 3600, 10)
+        spool, created = self.cache.acquire('/a')
+        responder = Mock()
+        responder.request.responseHeaders.getAllRawHeaders.return_value = iter(
+            [('Content-Length', ['11'])])
+
+        # test
+        SpoolWriter(spool, responder).write('abc')
+
+        # validation
+        self.assertEqual(spool.state, Spool.FAILED)
+        self.assertEqual(spool.size, 0)
+        self.assertFalse(os.path.exists(spool.path))
+        responder.write.assert_called_once_with('abc')
+
+    def test_write_spool_failed(self):
+        spool = Mock(state=Spool.DOWNLOADING, headers=[], size=0)
+        spool.write.side_effect = IOError()
+        responder = Mock()
+
+        # test
+        SpoolWriter(spool, responder).write('abc')
+
+        # validation
+        spool.fail.assert_called_once_with()
+        responder.write.assert_called_once_with('abc')
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_response_headers(self):
+        request = Mock()
+        request.responseHeaders.getAllRawHeaders.return_value = iter([('A', ['1'])])
+        self.assertEqual(response_headers(request), [('A', ['1'])])
+
+    def test_content_length(self):
+        self.assertEqual(content_length([('Content-Length', ['42'])]), 42)
+        self.assertEqual(content_length([('content-length', ['42'])]), 42)
+        self.assertEqual(content_length([('Content-Length', ['x'])]), 0)
+        self.assertEqual(content_length([('Content-Type', ['text/plain'])]), 0)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=10-', 100), (10, 99))
+        self.assertEqual(parse_range('bytes=90-200', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-200', 100), (0, 99))
+
+    def test_parse_range_ignored(self):
+        self.assertEqual(parse_range(None, 100), None)
+        self.assertEqual(parse_range('items=0-9', 100), None)
+        self.assertEqual(parse_range('bytes=0-9,20-29', 100), None)
+        self.assertEqual(parse_range('bytes=a-b', 100), None)
+        self.assertEqual(parse_range('bytes=10', 100), None)
+        self.assertEqual(parse_range('bytes=9-0', 100), None)
+        self.assertEqual(parse_range('bytes=100-', 100), None)